@@ -0,0 +1,110 @@
+#!/usr/bin/env python2.7
+
+from sts.experiments.benchmark import run_benchmark, find_regressions, default_cases, default_controller_cmdline, topology_classes
+from sts.util.convenience import timestamp_string
+
+import json
+import sys
+import argparse
+import logging
+import logging.config
+
+description = """
+Measure the Fuzzer's throughput (rounds, messages and packets per second) and
+where its time goes, on MeshTopology and FatTree at several sizes, and
+optionally compare the results with an earlier run.
+Example usage:
+
+$ %s -r 200 -b experiments/benchmark_old/benchmark.json
+""" % (sys.argv[0])
+
+def parse_cases(cases):
+  ''' "mesh:2,fat_tree:4" -> [("mesh", 2), ("fat_tree", 4)] '''
+  parsed = []
+  for case in cases.split(","):
+    (topology, size) = case.split(":")
+    if topology not in topology_classes:
+      raise argparse.ArgumentTypeError("unknown topology %s" % topology)
+    parsed.append((topology, int(size)))
+  return parsed
+
+parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
+                                 description=description)
+
+parser.add_argument('-v', '--verbose', action="count", default=0,
+                    help='''increase verbosity''')
+
+parser.add_argument('-L', '--log-config',
+                    metavar="FILE", dest="log_config",
+                    help='''choose a python log configuration file''')
+
+parser.add_argument('-c', '--cases', type=parse_cases, default=default_cases,
+                    help='''comma-separated topology:size cases, where '''
+                         '''topology is one of %s (default: %s)''' %
+                         (", ".join(sorted(topology_classes)),
+                          ",".join("%s:%d" % c for c in default_cases)))
+
+parser.add_argument('-r', '--rounds', type=int, default=200,
+                    help='''rounds per case''')
+
+parser.add_argument('-s', '--seed', type=int, default=1,
+                    help='''random seed''')
+
+parser.add_argument('-x', '--controller-cmdline', dest="controller_cmdline",
+                    default=default_controller_cmdline,
+                    help='''controller command line''')
+
+parser.add_argument('-w', '--controller-cwd', dest="controller_cwd",
+                    default="pox",
+                    help='''controller working directory''')
+
+parser.add_argument('--no-quiescence', dest="advance_on_quiescence",
+                    action="store_false", default=True,
+                    help='''always sleep for the full delay between rounds''')
+
+parser.add_argument('-b', '--baseline', default=None,
+                    help='''benchmark.json of an earlier run to compare with''')
+
+parser.add_argument('-t', '--tolerance', type=float, default=0.1,
+                    help='''fraction by which a throughput may drop below '''
+                         '''the baseline''')
+
+parser.add_argument('-o', '--results-dir', dest="results_dir", default=None,
+                    help='''results directory (default: '''
+                         '''experiments/benchmark_<timestamp>)''')
+
+args = parser.parse_args()
+
+if args.log_config:
+  logging.config.fileConfig(args.log_config)
+else:
+  logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+
+results_dir = args.results_dir
+if results_dir is None:
+  results_dir = "experiments/benchmark_%s" % timestamp_string()
+
+results = run_benchmark(results_dir, cases=args.cases, rounds=args.rounds,
+                        seed=args.seed,
+                        controller_cmdline=args.controller_cmdline,
+                        controller_cwd=args.controller_cwd,
+                        advance_on_quiescence=args.advance_on_quiescence)
+
+for case in results['cases']:
+  phases = sorted(case['phases'].iteritems(), key=lambda (_, s): -s)
+  print "%s(%d): %.1f rounds/s, %.1f messages/s, %.1f packets/s" % \
+        (case['topology'], case['size'], case['rounds_per_second'],
+         case['messages_per_second'], case['packets_per_second'])
+  print "  " + ", ".join("%s %.1f%%" % (phase, 100 * seconds / case['seconds'])
+                         for (phase, seconds) in phases)
+print "Results written to %s/benchmark.json" % results_dir
+
+if args.baseline:
+  with open(args.baseline) as baseline_file:
+    baseline = json.load(baseline_file)
+  regressions = find_regressions(baseline, results, tolerance=args.tolerance)
+  for (topology, size, metric, old, new) in regressions:
+    print "Regression: %s(%d) %s dropped from %.1f to %.1f" % \
+          (topology, size, metric, old, new)
+  if regressions:
+    sys.exit(1)
@@ -22,6 +22,21 @@ def port_used(address='127.0.0.1', port=6633):
     # TODO(cs): catch specific errors
     return True
 
+def free_ports(address='127.0.0.1'):
+  ''' Generate distinct ports that the OS reports as free, e.g. for
+  ControllerConfig.relocate '''
+  handed_out = set()
+  while True:
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+      s.bind((address, 0))
+      port = s.getsockname()[1]
+    finally:
+      s.close()
+    if port not in handed_out:
+      handed_out.add(port)
+      yield port
+
 # TODO(cs): this function don't appear to be invoked?
 def find_port(port_spec):
   if isinstance(port_spec, int):
@@ -127,6 +142,60 @@ class ControllerConfig(object):
     self.config_template = config_template
     self.additional_ports = additional_ports
 
+  def relocate(self, port_gen, address_suffix):
+    '''
+    Move this controller to sockets of its own, so that it doesn't collide
+    with other controllers booted from the same config (e.g. by parallel
+    fuzzer runs): its TCP port, additional ports and sync port are taken from
+    port_gen, and a Unix domain socket address has address_suffix appended.
+    Occurrences of the old address or port in cmdline (as --flag=value, with
+    the address relative to cwd) are rewritten too. Raises ValueError,
+    leaving the config unchanged, if cmdline names the Unix domain socket
+    in some other way, or the sync URI has no port.
+    '''
+    tokens = self.cmdline.split()
+    cwd = self.cwd if self.cwd else "."
+    def rewrite(matches, new_value):
+      for (i, token) in enumerate(tokens):
+        if "=" in token:
+          (flag, value) = token.split("=", 1)
+          if matches(value):
+            tokens[i] = "%s=%s" % (flag, new_value(value))
+
+    if self.port is None:
+      # Unix domain socket
+      address = self.address + address_suffix
+      rewrite(lambda path: (os.path.normpath(os.path.join(cwd, path)) ==
+                            os.path.normpath(self.address)),
+              lambda path: path + address_suffix)
+      socket_name = os.path.basename(self.address)
+      if [ t for t in tokens if socket_name in t and address_suffix not in t ]:
+        raise ValueError("Cannot relocate %s: %s names its socket %s" %
+                         (self.label, self.cmdline, self.address))
+      port = None
+      server_info = address
+    else:
+      address = self.address
+      port = port_gen.next()
+      rewrite(lambda value: value == str(self.port), lambda _: str(port))
+      server_info = (address, port)
+
+    sync = self.sync
+    if sync:
+      sync_match = re.match(r'(.*:)\d+$', sync)
+      if sync_match is None:
+        raise ValueError("Cannot relocate %s: no port in sync URI %s" %
+                         (self.label, sync))
+      sync = "%s%d" % (sync_match.group(1), port_gen.next())
+
+    self.cmdline = " ".join(tokens)
+    self.address = address
+    self.port = port
+    self._server_info = server_info
+    self.sync = sync
+    self.additional_ports = dict((name, port_gen.next())
+                                 for name in sorted(self.additional_ports))
+
   @property
   def cid(self):
     ''' Return this controller's id '''
@@ -18,7 +18,14 @@ name_to_invariant_check = {
   "InvariantChecker.check_liveness" :  InvariantChecker.check_liveness,
   "InvariantChecker.check_loops" :  InvariantChecker.check_loops,
   "InvariantChecker.python_check_connectivity" :  InvariantChecker.python_check_connectivity,
+  "InvariantChecker.atomic_check_connectivity" :  InvariantChecker.atomic_check_connectivity,
   "InvariantChecker.check_connectivity" :  InvariantChecker.check_connectivity,
   "InvariantChecker.check_blackholes" :  InvariantChecker.check_blackholes,
   "InvariantChecker.check_correspondence" :  InvariantChecker.check_correspondence,
 }
+
+# Checks that fetch the controllers' snapshots (needed when the Fuzzer checks
+# invariants asynchronously)
+checks_needing_controller_snapshots = set([
+  "InvariantChecker.check_correspondence",
+])
@@ -0,0 +1,83 @@
+#!/usr/bin/env python2.7
+
+from sts.experiments.farm import FuzzerFarm
+from sts.util.convenience import timestamp_string
+
+import signal
+import sys
+import argparse
+import logging
+import logging.config
+
+description = """
+Run many fuzzing runs of the same config in parallel, each with its own random
+seed and controller ports, and deduplicate the invariant violations they find.
+Example usage:
+
+$ %s -c config.fuzz_pox_fattree -j 8 -r 100
+""" % (sys.argv[0])
+
+parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
+                                 description=description)
+
+parser.add_argument('-c', '--config',
+                    default='config.fuzz_pox_fattree',
+                    help='''experiment config module in the config/ '''
+                         '''subdirectory, e.g. config.fat_tree''')
+
+parser.add_argument('-v', '--verbose', action="count", default=0,
+                    help='''increase verbosity''')
+
+parser.add_argument('-L', '--log-config',
+                    metavar="FILE", dest="log_config",
+                    help='''choose a python log configuration file''')
+
+parser.add_argument('-j', '--workers', type=int, default=None,
+                    help='''number of runs at a time (default: number of CPUs)''')
+
+parser.add_argument('-r', '--runs', type=int, default=None,
+                    help='''total number of runs (default: until interrupted)''')
+
+parser.add_argument('-s', '--seed', type=int, default=None,
+                    help='''random seed of the first run; run n uses seed + n''')
+
+parser.add_argument('-P', '--base-port', dest="base_port", type=int,
+                    default=6633,
+                    help='''first controller port''')
+
+parser.add_argument('--ports-per-worker', dest="ports_per_worker", type=int,
+                    default=100,
+                    help='''controller ports reserved for each worker''')
+
+parser.add_argument('-o', '--results-dir', dest="results_dir", default=None,
+                    help='''farm results directory (default: '''
+                         '''experiments/farm_<timestamp>)''')
+
+args = parser.parse_args()
+
+if args.log_config:
+  logging.config.fileConfig(args.log_config)
+else:
+  logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+
+results_dir = args.results_dir
+if results_dir is None:
+  results_dir = "experiments/farm_%s" % timestamp_string()
+
+farm = FuzzerFarm(args.config, results_dir, num_workers=args.workers,
+                  num_runs=args.runs, base_seed=args.seed,
+                  base_port=args.base_port,
+                  ports_per_worker=args.ports_per_worker,
+                  verbose=args.verbose)
+
+def handle_int(signal, frame):
+  print >> sys.stderr, "Caught signal %d, stopping the farm" % signal
+  sys.exit(13)
+
+signal.signal(signal.SIGINT, handle_int)
+signal.signal(signal.SIGTERM, handle_int)
+
+violation_index = farm.run()
+print "%d runs, %d rounds, %d distinct violations (see %s/violations.json)" % \
+      (farm.runs_completed, farm.total_rounds,
+       len(violation_index.violations), results_dir)
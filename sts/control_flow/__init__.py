@@ -3,4 +3,6 @@ from sts.control_flow.interactive import *
 from sts.control_flow.peeker import Peeker
 from sts.control_flow.replayer import *
 from sts.control_flow.fuzzer import *
+from sts.control_flow.coverage_fuzzer import *
+from sts.control_flow.branching_fuzzer import *
 from sts.control_flow.mcs_finder import *
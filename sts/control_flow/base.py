@@ -156,9 +156,15 @@ class RecordingSyncCallback(STSSyncCallback):
   def __init__(self, input_logger, record_deterministic_values=False):
     self.input_logger = input_logger
     self.record_deterministic_values = record_deterministic_values
+    # Optional sts.control_flow.coverage_fuzzer.Coverage to report state
+    # changes to
+    self.coverage = None
 
   def state_change(self, sync_type, xid, controller, time, fingerprint, name, value):
     # TODO(cs): xid arguably shouldn't be known to STS
+    if self.coverage is not None:
+      self.coverage.observe_state_change(controller.cid, fingerprint, name,
+                                         value)
     if self.input_logger is not None:
       self.input_logger.log_input_event(ControllerStateChange(controller.cid,
                                                               fingerprint,
@@ -0,0 +1,350 @@
+'''
+Checkpointing and branch exploration.
+
+To explore alternatives to a run, the plain Fuzzer has to start over from
+round 0. BranchingFuzzer instead periodically checkpoints the running
+simulation, and explores several continuations ("branches") from each
+checkpoint without replaying the prefix that led there.
+
+A checkpoint forks STS together with its controllers: each controller is asked
+to fork through the sync protocol (see POXSyncProtocolSpeaker._fork in
+sts.syncproto.pox_syncer), then STS forks itself. The forked copies run the
+branch over the sockets of the originals, which wait until the branch is done
+and then pick up from the checkpoint.
+
+Requirements and limitations:
+  - every live controller must be connected through the sync protocol and
+    handle Fork requests (i.e. run pox_syncer)
+  - checkpoints are only taken while the connections are quiescent, and each
+    branch waits for quiescence before it ends, so that the shared byte
+    streams are left at message boundaries. If a branch can't, the fuzzer
+    stops rather than resume from a corrupted checkpoint
+  - controllers are not crashed or rebooted within branches
+  - branches are explored one after the other, since a controller and its
+    copy can't use the same sockets at once
+  - the original controllers' timers keep running while they wait, so
+    timeouts (e.g. of link discovery) may fire once they resume
+'''
+
+from sts.control_flow.fuzzer import Fuzzer
+from sts.util.console import msg
+
+import cPickle as pickle
+import errno
+import json
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+import logging
+
+log = logging.getLogger("branching_fuzzer")
+
+def exploration_throughput(main_rounds, main_seconds, checkpoints,
+                           branching_seconds):
+  '''
+  Compare the throughput of exploring the given branches from checkpoints
+  with that of exploring them by restarting the simulation. The latter is
+  estimated from the speed of the main run: every branch would first have to
+  replay the rounds up to its checkpoint (not counting the time to restart
+  the controllers).
+
+  checkpoints: [{ 'round' : round of the checkpoint,
+                  'branches' : [{ 'rounds' : rounds explored, ... }] }]
+  '''
+  def rate(rounds, seconds):
+    return rounds / seconds if seconds > 0 else None
+
+  branch_rounds = 0
+  prefix_rounds = 0
+  for checkpoint in checkpoints:
+    for branch in checkpoint['branches']:
+      branch_rounds += branch['rounds']
+      prefix_rounds += checkpoint['round']
+  seconds_per_round = main_seconds / main_rounds if main_rounds > 0 else 0.0
+  restart_seconds = (branch_rounds + prefix_rounds) * seconds_per_round
+  return { 'main_run' : { 'rounds' : main_rounds,
+                          'seconds' : main_seconds,
+                          'rounds_per_second' : rate(main_rounds,
+                                                     main_seconds) },
+           'with_checkpointing' : { 'rounds' : branch_rounds,
+                                    'seconds' : branching_seconds,
+                                    'rounds_per_second' :
+                                      rate(branch_rounds, branching_seconds) },
+           'without_checkpointing' : { 'rounds' : branch_rounds,
+                                       'replayed_rounds' : prefix_rounds,
+                                       'seconds' : restart_seconds,
+                                       'rounds_per_second' :
+                                         rate(branch_rounds, restart_seconds),
+                                       'estimated' : True } }
+
+class ForkedControllerProcess(object):
+  ''' Stands in for a controller's Popen within a branch, where the
+  controller is a forked copy of the original, and not our child '''
+  def __init__(self, pid):
+    self.pid = pid
+
+  def poll(self):
+    try:
+      os.kill(self.pid, 0)
+    except OSError:
+      return -1
+    return None
+
+class BranchingFuzzer(Fuzzer):
+  '''
+  A Fuzzer that, every checkpoint_interval rounds (once initialized),
+  checkpoints the simulation and explores num_branches branches of
+  branch_rounds rounds from the checkpoint, each with its own random seed,
+  before carrying on with the main run.
+
+  checkpoint_timeout bounds how long to wait for the connections to go
+  quiescent (for quiescence_interval seconds) at a checkpoint, and at the end
+  of a branch. fork_timeout bounds how long to wait for the controllers to
+  fork.
+
+  When an input_logger is given, the branches from the checkpoint taken in
+  round r are recorded in checkpoint_<r>/branch_<n> subdirectories of the
+  results dir. Each branch's trace starts with the main run's events up to
+  the checkpoint, so that it can be replayed (and minimized) on its own.
+  The branches explored, and the exploration throughput with and without
+  checkpointing (see exploration_throughput), are written to branches.json in
+  the results dir.
+
+  Takes the same keyword arguments as Fuzzer.
+  '''
+  def __init__(self, simulation_cfg, checkpoint_interval=50, num_branches=4,
+               branch_rounds=20, checkpoint_timeout=2.0, fork_timeout=10,
+               **kwargs):
+    Fuzzer.__init__(self, simulation_cfg, **kwargs)
+    self.checkpoint_interval = checkpoint_interval
+    self.num_branches = num_branches
+    self.branch_rounds = branch_rounds
+    self.checkpoint_timeout = checkpoint_timeout
+    self.fork_timeout = fork_timeout
+    self.results_dir = None
+    self._configured_dataplane_trace_path = \
+        simulation_cfg._dataplane_trace_path
+    # [{ 'round' : r, 'branches' : [results of _explore_branch] }]
+    self.checkpoints = []
+    self._checkpointing = True
+    self._start_time = None
+    self._branching_seconds = 0.0
+    # In a forked copy: the branch being explored
+    self._branch = None
+    self._branch_pipe = None
+    self._branch_controller_pids = []
+    # [(round, controllers with violations)]
+    self._violations = []
+
+  def init_results(self, results_dir):
+    Fuzzer.init_results(self, results_dir)
+    self.results_dir = results_dir
+
+  def simulate(self):
+    self._start_time = time.time()
+    try:
+      simulation = Fuzzer.simulate(self)
+    except BaseException:
+      if self._branch is None:
+        raise
+      log.error("Branch %d failed:\n%s" % (self._branch['branch'],
+                                           traceback.format_exc()))
+      self._end_branch(None)
+    if self._branch is not None:
+      self._end_branch(simulation)
+    self._report()
+    return simulation
+
+  def _handle_violations(self, controllers_with_violations, round=-1):
+    if controllers_with_violations != []:
+      self._violations.append((self.logical_time if round == -1 else round,
+                               controllers_with_violations))
+    return Fuzzer._handle_violations(self, controllers_with_violations,
+                                     round=round)
+
+  def check_controllers(self):
+    # A branch must not kill the controllers it shares with the main run
+    if self._branch is None:
+      Fuzzer.check_controllers(self)
+
+  def _wait_for_next_round(self):
+    Fuzzer._wait_for_next_round(self)
+    if (self._branch is None and self._checkpointing and
+        not self._initializing() and
+        (self.logical_time % self.checkpoint_interval) == 0):
+      self._explore_branches()
+
+  def _wait_for_quiescence(self):
+    io_master = self.simulation.io_master
+    return (io_master.sleep_until_idle(self.checkpoint_timeout,
+                                       self.quiescence_interval) and
+            io_master.buffers_empty())
+
+  def _stop(self, reason):
+    ''' Give up on checkpointing, and end the run after this round '''
+    msg.fail("%s: ending the run" % reason)
+    self._checkpointing = False
+    self._end_time = self.logical_time
+
+  def _explore_branches(self):
+    controllers = list(self.simulation.controller_manager.live_controllers)
+    if [ c for c in controllers if c.sync_connection is None ] != []:
+      log.warn("Not all controllers are connected through the sync protocol; "
+               "disabling checkpoints")
+      self._checkpointing = False
+      return
+    if not self._wait_for_quiescence():
+      log.info("Round %d: connections not quiescent; skipping checkpoint" %
+               self.logical_time)
+      return
+    start = time.time()
+    checkpoint = { 'round' : self.logical_time, 'branches' : [] }
+    self.checkpoints.append(checkpoint)
+    msg.event("Checkpoint at round %d: exploring %d branches" %
+              (self.logical_time, self.num_branches))
+    for index in xrange(self.num_branches):
+      result = self._explore_branch(index, controllers)
+      if self._branch is not None:
+        # We're the forked copy: go on with the branch
+        return
+      if result is None:
+        break
+      checkpoint['branches'].append(result)
+      log.info("Branch %d from round %d: %d rounds, %d violations" %
+               (index, self.logical_time, result['rounds'],
+                len(result['violations'])))
+      if not result['quiescent']:
+        self._stop("Branch %d did not leave the connections quiescent" % index)
+        break
+    self._branching_seconds += time.time() - start
+    self._report()
+
+  def _fork_controllers(self, controllers):
+    ''' Return the PIDs of the controllers' forked copies, or None '''
+    requests = [ (c, c.sync_connection.request_fork()) for c in controllers ]
+    pids = []
+    try:
+      for (controller, request) in requests:
+        pids.append(controller.sync_connection.wait_for_fork(request,
+                      timeout=self.fork_timeout))
+    except socket.timeout:
+      self._kill(pids)
+      self._stop("Controller %s did not fork" % controller.cid)
+      return None
+    return pids
+
+  def _kill(self, pids):
+    for pid in pids:
+      try:
+        os.kill(pid, signal.SIGKILL)
+      except OSError as e:
+        if e.errno != errno.ESRCH:
+          raise
+
+  def _explore_branch(self, index, controllers):
+    '''
+    Fork off branch index from the current round. In the parent, wait for the
+    branch and return its result (None on failure); in the forked copy,
+    return None with self._branch set.
+    '''
+    seed = self.random.randint(0, sys.maxint)
+    if self._input_logger is not None:
+      # The branch's trace starts with a copy of ours
+      self._input_logger.flush()
+    controller_pids = self._fork_controllers(controllers)
+    if controller_pids is None:
+      return None
+    (read_fd, write_fd) = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+      os.close(read_fd)
+      self._start_branch(index, seed, controllers, controller_pids, write_fd)
+      return None
+    os.close(write_fd)
+    try:
+      with os.fdopen(read_fd) as pipe:
+        data = pipe.read()
+      os.waitpid(pid, 0)
+    except BaseException:
+      log.warn("Interrupted branch %d; the controllers may not resume "
+               "cleanly" % index)
+      self._kill([pid] + controller_pids)
+      os.waitpid(pid, 0)
+      raise
+    if data == "":
+      self._kill(controller_pids)
+      self._stop("Branch %d died" % index)
+      return None
+    return pickle.loads(data)
+
+  def _start_branch(self, index, seed, controllers, controller_pids, pipe):
+    # The main run handles ^C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    checkpoint_round = self.logical_time
+    self._branch = { 'branch' : index, 'seed' : seed,
+                     'checkpoint_round' : checkpoint_round,
+                     'start_time' : time.time(), 'results_dir' : None }
+    self._branch_pipe = pipe
+    self._branch_controller_pids = controller_pids
+    for (controller, pid) in zip(controllers, controller_pids):
+      controller.process = ForkedControllerProcess(pid)
+    self.random.seed(seed)
+    self._violations = []
+    # Any pending invariant checks belong to the main run
+    self._pending_checks = []
+    self._end_time = checkpoint_round + self.branch_rounds
+    if self._input_logger is not None and self.results_dir is not None:
+      branch_dir = os.path.join(self.results_dir,
+                                "checkpoint_%d" % checkpoint_round,
+                                "branch_%d" % index)
+      if not os.path.exists(branch_dir):
+        os.makedirs(branch_dir)
+      self._branch['results_dir'] = branch_dir
+      self._input_logger.branch(branch_dir)
+      self.simulation.god_scheduler.openflow_sidelog = \
+          self._input_logger.openflow_sidelog
+      self.simulation_cfg._dataplane_trace_path = \
+          self._configured_dataplane_trace_path
+      self.simulation_cfg.set_dataplane_trace_path(
+          self._input_logger.dp_trace_path)
+    if self.violation_buckets is not None:
+      self.violation_buckets.branch(self._branch['results_dir'])
+    msg.event("Exploring branch %d from round %d (seed %d)" %
+              (index, checkpoint_round, seed))
+
+  def _end_branch(self, simulation):
+    ''' Hand the shared connections back to the main run, report the result,
+    and exit '''
+    result = dict(self._branch)
+    result['rounds'] = self.logical_time - result['checkpoint_round']
+    result['seconds'] = time.time() - result.pop('start_time')
+    result['violations'] = self._violations
+    result['exit_code'] = simulation.exit_code if simulation else None
+    result['quiescent'] = (simulation is not None and
+                           self._wait_for_quiescence())
+    try:
+      self._kill(self._branch_controller_pids)
+      with os.fdopen(self._branch_pipe, 'w') as pipe:
+        pickle.dump(result, pipe, pickle.HIGHEST_PROTOCOL)
+    finally:
+      os._exit(0)
+
+  def _report(self):
+    if self._start_time is None:
+      return
+    main_seconds = (time.time() - self._start_time - self._branching_seconds)
+    throughput = exploration_throughput(self.logical_time, main_seconds,
+                                        self.checkpoints,
+                                        self._branching_seconds)
+    log.info("Explored %d branch rounds at %s rounds/s with checkpointing, "
+             "vs. an estimated %s rounds/s without" %
+             (throughput['with_checkpointing']['rounds'],
+              throughput['with_checkpointing']['rounds_per_second'],
+              throughput['without_checkpointing']['rounds_per_second']))
+    if self.results_dir is not None:
+      throughput['checkpoints'] = self.checkpoints
+      with open(os.path.join(self.results_dir, "branches.json"), 'w') as output:
+        json.dump(throughput, output)
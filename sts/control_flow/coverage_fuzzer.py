@@ -0,0 +1,313 @@
+'''
+Coverage-guided fuzzing.
+
+The plain Fuzzer samples inputs independently at every round, so it spends
+most rounds rediscovering the same controller states. CoverageGuidedFuzzer
+instead runs the simulation in epochs. It keeps a corpus of the input
+sequences that led the controllers into states no earlier epoch reached, and
+starts each epoch by re-injecting a mutated entry of the corpus before fuzzing
+on from there.
+
+Coverage is measured by:
+  - the controller state changes delivered through the sync protocol (by
+    fingerprint and name, and optionally by value)
+  - optionally, the sequences of the last n OpenFlow message types exchanged
+    on each connection
+'''
+
+from sts.control_flow.fuzzer import Fuzzer
+from sts.event_dag import EventDag
+from sts.replay_event import *
+
+from collections import deque
+import copy
+import json
+import os
+import time
+import logging
+
+log = logging.getLogger("coverage_fuzzer")
+
+def fresh_copy(event):
+  ''' Return a copy of the input event with a new label, for injecting it
+  again '''
+  clone = copy.copy(event)
+  clone.label = Event.new_label(clone.label[0])
+  clone.time = SyncTime.now()
+  clone.round = -1
+  clone.dependent_labels = []
+  return clone
+
+class Coverage(object):
+  ''' The controller states (and OpenFlow message sequences) observed so far '''
+  def __init__(self, openflow_sequence_length=0, include_state_values=False):
+    # 0 disables OpenFlow message type coverage
+    self.openflow_sequence_length = openflow_sequence_length
+    self.include_state_values = include_state_values
+    self.keys = set()
+    # { (dpid, controller id) -> deque of the last (direction, ofp type)s }
+    self._connection2history = {}
+    self._new_keys = 0
+    # [(round, epoch time, coverage)]
+    self.growth = []
+
+  def __len__(self):
+    return len(self.keys)
+
+  def observe(self, key):
+    ''' Return whether key has not been observed before '''
+    if key in self.keys:
+      return False
+    self.keys.add(key)
+    self._new_keys += 1
+    return True
+
+  def observe_state_change(self, controller_id, fingerprint, name, value):
+    key = ("state", str(name), str(fingerprint))
+    if self.include_state_values:
+      key += (str(value),)
+    return self.observe(key)
+
+  def observe_openflow(self, dpid, controller_id, direction, ofp_type):
+    if self.openflow_sequence_length <= 0:
+      return False
+    connection = (dpid, controller_id)
+    if connection not in self._connection2history:
+      self._connection2history[connection] = \
+          deque(maxlen=self.openflow_sequence_length)
+    history = self._connection2history[connection]
+    history.append((direction, ofp_type))
+    return self.observe(("openflow",) + tuple(history))
+
+  def reset_connections(self):
+    ''' Forget the message histories, e.g. when the simulation restarts '''
+    self._connection2history = {}
+
+  def take_new(self):
+    ''' Return how many keys were observed for the first time since the last
+    call '''
+    new_keys = self._new_keys
+    self._new_keys = 0
+    return new_keys
+
+  def record_growth(self, round):
+    self.growth.append((round, time.time(), len(self.keys)))
+
+class CorpusEntry(object):
+  def __init__(self, inputs, dp_events, new_coverage, epoch):
+    # Input events (not injected themselves: see fresh_copy), with round set
+    # to the round of the epoch they were injected in
+    self.inputs = inputs
+    # { label of a TrafficInjection -> its dataplane events }
+    self.dp_events = dp_events
+    self.new_coverage = new_coverage
+    self.epoch = epoch
+    self.picks = 0
+
+class Corpus(object):
+  '''
+  Input sequences that reached new coverage. Entries are chosen with
+  probability proportional to the coverage they found, discounted by how often
+  they have been chosen already, and mutated by dropping inputs (failures
+  together with their recoveries) or a suffix.
+  '''
+  def __init__(self, random, max_entries=1000):
+    self.random = random
+    self.max_entries = max_entries
+    self.entries = []
+
+  def __len__(self):
+    return len(self.entries)
+
+  def add(self, inputs, dp_events, new_coverage, epoch):
+    entry = CorpusEntry(inputs, dp_events, new_coverage, epoch)
+    self.entries.append(entry)
+    if len(self.entries) > self.max_entries:
+      # Evict the least productive entry
+      self.entries.remove(min(self.entries,
+                              key=lambda e: e.new_coverage / (1.0 + e.picks)))
+    return entry
+
+  def choose(self):
+    ''' Return an entry, or None if the corpus is empty '''
+    if self.entries == []:
+      return None
+    weights = [ e.new_coverage / (1.0 + e.picks) for e in self.entries ]
+    point = self.random.random() * sum(weights)
+    for (entry, weight) in zip(self.entries, weights):
+      point -= weight
+      if point < 0:
+        break
+    entry.picks += 1
+    return entry
+
+  def mutate(self, entry):
+    ''' Return a mutated copy of entry's inputs '''
+    if entry.inputs == []:
+      return []
+    # The dag views below need failures to know their recoveries; don't
+    # clobber the dependencies of the stored inputs
+    inputs = []
+    for event in entry.inputs:
+      event = copy.copy(event)
+      event.dependent_labels = []
+      inputs.append(event)
+    dag = EventDag(inputs)
+    dag.mark_invalid_input_sequences()
+    atomic_inputs = dag.atomic_input_events
+    if self.random.random() < 0.5:
+      # Drop a suffix
+      kept = atomic_inputs[:self.random.randint(1, len(atomic_inputs))]
+    else:
+      # Drop a few inputs
+      drops = self.random.randint(1, max(1, len(atomic_inputs) / 4))
+      dropped = set(self.random.sample(range(len(atomic_inputs)), drops))
+      kept = [ e for (i, e) in enumerate(atomic_inputs) if i not in dropped ]
+    # Also updates the locations of host migrations that follow dropped ones
+    return dag.atomic_input_subset(kept).events
+
+class CoverageGuidedFuzzer(Fuzzer):
+  '''
+  A Fuzzer that restarts the simulation every epoch_rounds rounds, and begins
+  each epoch after the first by re-injecting a mutated input sequence from its
+  corpus. Stops after max_epochs epochs (None: until interrupted), or when an
+  invariant violation halts an epoch.
+
+  When an input_logger is given, epoch 0 is recorded in the results dir and
+  each later epoch n in its own epoch_<n> subdirectory, so that every epoch
+  can be replayed (and minimized) on its own. Coverage growth is written to
+  coverage.json in the results dir after each epoch.
+
+  Takes the same keyword arguments as Fuzzer, except steps.
+  '''
+  # Inputs that are not re-injected from the corpus: the Fuzzer decides
+  # these afresh each round
+  _not_reinjected = set([CheckInvariants, WaitTime, DataplaneDrop])
+
+  def __init__(self, simulation_cfg, epoch_rounds=100, max_epochs=None,
+               openflow_sequence_length=0, include_state_values=False,
+               **kwargs):
+    Fuzzer.__init__(self, simulation_cfg, steps=epoch_rounds, **kwargs)
+    self.epoch_rounds = epoch_rounds
+    self.max_epochs = max_epochs
+    self.coverage = Coverage(openflow_sequence_length=openflow_sequence_length,
+                             include_state_values=include_state_values)
+    self.sync_callback.coverage = self.coverage
+    self.corpus = Corpus(self.random)
+    self.epoch = 0
+    self.total_rounds = 0
+    self.results_dir = None
+    self._configured_dataplane_trace_path = \
+        simulation_cfg._dataplane_trace_path
+    # Inputs injected so far this epoch, and their dataplane events
+    self._epoch_inputs = []
+    self._epoch_dp_events = {}
+    # The mutated corpus entry still to be injected this epoch
+    self._pending_inputs = []
+    self._pending_dp_events = {}
+
+  def init_results(self, results_dir):
+    Fuzzer.init_results(self, results_dir)
+    self.results_dir = results_dir
+
+  def simulate(self):
+    while True:
+      simulation = Fuzzer.simulate(self)
+      self.total_rounds += self.logical_time
+      self._end_epoch()
+      self.epoch += 1
+      if (simulation.exit_code != 0 or
+          (self.max_epochs is not None and self.epoch >= self.max_epochs)):
+        return simulation
+      simulation.clean_up()
+      self._start_epoch()
+
+  def _start_epoch(self):
+    self.logical_time = 0
+    self._pending_all_to_all = self.initialization_rounds != 0
+    self._all_to_all_iterations = 0
+    self._epoch_inputs = []
+    self._epoch_dp_events = {}
+    self.coverage.reset_connections()
+    # Each epoch records its own dataplane trace (see Fuzzer.simulate)
+    self.simulation_cfg._dataplane_trace_path = \
+        self._configured_dataplane_trace_path
+    if self._input_logger is not None and self.results_dir is not None:
+      self._input_logger.open(os.path.join(self.results_dir,
+                                           "epoch_%d" % self.epoch))
+    entry = self.corpus.choose()
+    if entry is not None:
+      self._pending_inputs = self.corpus.mutate(entry)
+      self._pending_dp_events = entry.dp_events
+      log.info("Epoch %d: re-injecting %d of the %d inputs of a corpus entry "
+               "from epoch %d" % (self.epoch, len(self._pending_inputs),
+                                  len(entry.inputs), entry.epoch))
+
+  def _end_epoch(self):
+    self._maybe_add_to_corpus()
+    self.coverage.record_growth(self.total_rounds)
+    log.info("Epoch %d done: coverage %d after %d rounds, corpus size %d" %
+             (self.epoch, len(self.coverage), self.total_rounds,
+              len(self.corpus)))
+    if self.results_dir is not None:
+      with open(os.path.join(self.results_dir, "coverage.json"), 'w') as output:
+        json.dump({ 'coverage' : len(self.coverage),
+                    'epochs' : self.epoch + 1,
+                    'rounds' : self.total_rounds,
+                    'corpus' : len(self.corpus),
+                    'growth' : self.coverage.growth }, output)
+
+  def _maybe_add_to_corpus(self):
+    new_coverage = self.coverage.take_new()
+    if new_coverage == 0:
+      return
+    self.coverage.record_growth(self.total_rounds + self.logical_time)
+    if self._epoch_inputs != []:
+      self.corpus.add(list(self._epoch_inputs), dict(self._epoch_dp_events),
+                      new_coverage, self.epoch)
+
+  def _log_input_event(self, event, **kws):
+    if (isinstance(event, InputEvent) and not self._initializing() and
+        type(event) not in self._not_reinjected):
+      recorded = copy.copy(event)
+      recorded.round = self.logical_time
+      self._epoch_inputs.append(recorded)
+      if kws.get('dp_event') is not None:
+        self._epoch_dp_events[event.label] = [kws['dp_event']]
+      elif kws.get('dp_events') is not None:
+        self._epoch_dp_events[event.label] = kws['dp_events']
+    elif type(event) == ControlMessageReceive or type(event) == ControlMessageSend:
+      self.coverage.observe_openflow(event.dpid, event.controller_id,
+                                     type(event).__name__,
+                                     event.fingerprint[1].ofp_type)
+    Fuzzer._log_input_event(self, event, **kws)
+
+  def trigger_events(self):
+    self._maybe_add_to_corpus()
+    if self._pending_inputs == []:
+      Fuzzer.trigger_events(self)
+      return
+    # Let the pending messages and packets through as usual, but take the
+    # inputs from the corpus entry
+    self.check_dataplane()
+    self.check_pending_messages()
+    while (self._pending_inputs != [] and
+           self._pending_inputs[0].round <= self.logical_time):
+      self._reinject(self._pending_inputs.pop(0))
+
+  def _reinject(self, event):
+    dp_events = self._pending_dp_events.get(event.label)
+    event = fresh_copy(event)
+    try:
+      if type(event) == TrafficInjection:
+        for dp_event in dp_events:
+          host = [ h for h in self.simulation.topology.hosts
+                   if dp_event.interface in h.interfaces ][0]
+          host.send(dp_event.interface, dp_event.packet)
+      else:
+        event.proceed(self.simulation)
+    except Exception as e:
+      # Dropping earlier inputs may have invalidated this one
+      log.warn("Skipping %s: %s" % (str(event), str(e)))
+      return
+    self._log_input_event(event, dp_events=dp_events)
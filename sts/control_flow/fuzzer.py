@@ -8,11 +8,13 @@ Three control flow types for running the simulation forward.
 
 from sts.control_flow.interactive import Interactive
 from sts.topology import BufferedPatchPanel
-from sts.traffic_generator import TrafficGenerator
+from sts.traffic_generator import TrafficGenerator, TrafficMatrix, MatrixTrafficGenerator
 from sts.util.console import msg
+from sts.util.convenience import sample_independently
 from sts.replay_event import *
 from pox.lib.util import TimeoutError
-from config.invariant_checks import name_to_invariant_check
+from config.invariant_checks import name_to_invariant_check, checks_needing_controller_snapshots
+from sts.invariant_checker import AsyncInvariantCheck
 
 from sts.control_flow.base import ControlFlow, RecordingSyncCallback
 
@@ -40,7 +42,10 @@ class Fuzzer(ControlFlow):
                halt_on_violation=False, log_invariant_checks=True,
                delay_startup=True, print_buffers=True,
                record_deterministic_values=False,
-               mock_link_discovery=False, initialization_rounds=0):
+               mock_link_discovery=False, initialization_rounds=0,
+               advance_on_quiescence=False, quiescence_interval=0.02,
+               async_invariant_checks=False, max_pending_checks=2,
+               traffic_matrix=None, traffic_rate=1000, violation_buckets=None):
     ControlFlow.__init__(self, simulation_cfg)
     self.sync_callback = RecordingSyncCallback(input_logger,
                            record_deterministic_values=record_deterministic_values)
@@ -53,6 +58,14 @@ class Fuzzer(ControlFlow):
     self.invariant_check_name = invariant_check_name
     self.invariant_check = name_to_invariant_check[invariant_check_name]
     self.log_invariant_checks = log_invariant_checks
+    # If set, invariant checks run in a worker process against a snapshot of
+    # the simulation (see AsyncInvariantCheck) while fuzzing continues, and
+    # their violations are logged with the round the snapshot was taken in.
+    # At most max_pending_checks run at a time; beyond that, the fuzzer waits
+    # for the oldest.
+    self.async_invariant_checks = async_invariant_checks
+    self.max_pending_checks = max_pending_checks
+    self._pending_checks = []
     self.traffic_inject_interval = traffic_inject_interval
     # Make execution deterministic to allow the user to easily replay
     if random_seed is None:
@@ -61,13 +74,30 @@ class Fuzzer(ControlFlow):
     self.random_seed = random_seed
     self.random = random.Random(random_seed)
     self.traffic_generator = TrafficGenerator(self.random)
+    # If set, the name of a TrafficMatrix model ("all_to_all", "gravity" or
+    # "hotspot"): rather than pinging from random hosts, send traffic_rate
+    # packets per second between the hosts as the model prescribes, in
+    # batches each logged as a single TrafficInjection.
+    self.traffic_matrix = traffic_matrix
+    self.traffic_rate = traffic_rate
+    self.matrix_traffic_generator = None
 
     self.delay = delay
+    # If set, end each round as soon as no message has been in flight between
+    # STS and the controllers or switches for quiescence_interval seconds,
+    # rather than always after delay seconds. delay still bounds the round.
+    # (Whatever is then held in the GodScheduler and BufferedPatchPanel waits
+    # on the next round's decisions, so waiting longer would not help.)
+    self.advance_on_quiescence = advance_on_quiescence
+    self.quiescence_interval = quiescence_interval
     self.steps = steps
     self.params = object()
     self._load_fuzzer_params(fuzzer_params)
     self._input_logger = input_logger
     self.halt_on_violation = halt_on_violation
+    # If set, a ViolationBuckets that tells new violations from duplicates,
+    # and keeps a superlog snapshot of the first of each bucket
+    self.violation_buckets = violation_buckets
     self.delay_startup = delay_startup
     self.print_buffers = print_buffers
     self.mock_link_discovery = mock_link_discovery
@@ -88,12 +118,15 @@ class Fuzzer(ControlFlow):
     self.logical_time = 0
 
   def _log_input_event(self, event, **kws):
+    if self.violation_buckets is not None:
+      self.violation_buckets.observe_input(event, self.logical_time)
     if self._input_logger is not None:
       if self._initializing():
         # Tell MCSFinder never to prune this event
         event.prunable = False
 
-      event.round = self.logical_time
+      if event.round == -1:
+        event.round = self.logical_time
       self._input_logger.log_input_event(event, **kws)
 
   def _load_fuzzer_params(self, fuzzer_params_path):
@@ -111,6 +144,8 @@ class Fuzzer(ControlFlow):
   def init_results(self, results_dir):
     if self._input_logger:
       self._input_logger.open(results_dir)
+    if self.violation_buckets is not None:
+      self.violation_buckets.init_results(results_dir)
     params_file = re.sub(r'\.pyc$', '.py', self.params.__file__)
     # Move over our fuzzer params
     # TODO(cs): need to modify copied config file to point to the new fuzzer
@@ -128,15 +163,24 @@ class Fuzzer(ControlFlow):
     self.simulation = self.simulation_cfg.bootstrap(self.sync_callback)
     assert(isinstance(self.simulation.patch_panel, BufferedPatchPanel))
     self.traffic_generator.set_hosts(self.simulation.topology.hosts)
+    if self.traffic_matrix is not None:
+      matrix = TrafficMatrix.from_name(self.traffic_matrix,
+                                       self.simulation.topology.hosts,
+                                       self.traffic_rate, random=self.random)
+      self.matrix_traffic_generator = MatrixTrafficGenerator(matrix,
+                                                             self.random)
     if self._input_logger is not None:
       self.simulation_cfg.set_dataplane_trace_path(self._input_logger.dp_trace_path)
+      self.simulation.god_scheduler.openflow_sidelog = \
+          self._input_logger.openflow_sidelog
     return self.loop()
 
   def loop(self):
+    # (An attribute, so that subclasses may end the loop early)
     if self.steps:
-      end_time = self.logical_time + self.steps
+      self._end_time = self.logical_time + self.steps
     else:
-      end_time = sys.maxint
+      self._end_time = sys.maxint
 
     self.interrupted = False
     old_interrupt = None
@@ -163,7 +207,7 @@ class Fuzzer(ControlFlow):
 
       sent_self_packets = False
 
-      while self.logical_time < end_time:
+      while self.logical_time < self._end_time:
         self.logical_time += 1
         try:
           if not self._initializing():
@@ -190,7 +234,7 @@ class Fuzzer(ControlFlow):
             self.check_dataplane(pass_through=True)
 
           msg.event("Round %d completed." % self.logical_time)
-          time.sleep(self.delay)
+          self._wait_for_next_round()
         except KeyboardInterrupt as e:
           if self.interrupted:
             interactive = Interactive(self.simulation_cfg, self._input_logger)
@@ -199,18 +243,35 @@ class Fuzzer(ControlFlow):
           else:
             raise e
 
+      if self._pending_checks != []:
+        log.info("Waiting for %d invariant checks" % len(self._pending_checks))
+        if self._collect_invariant_checks(block=True):
+          self.simulation.set_exit_code(5)
+
       log.info("Terminating fuzzing after %d rounds" % self.logical_time)
       if self.print_buffers:
         self._print_buffers()
 
     finally:
+      for check in self._pending_checks:
+        check.kill()
+      self._pending_checks = []
       if self.old_interrupt:
         signal.signal(signal.SIGINT, self.old_interrupt)
+      if self.violation_buckets is not None:
+        self.violation_buckets.close()
       if self._input_logger is not None:
         self._input_logger.close(self, self.simulation_cfg)
 
     return self.simulation
 
+  def _wait_for_next_round(self):
+    if self.advance_on_quiescence:
+      self.simulation.io_master.sleep_until_idle(self.delay,
+                                                 self.quiescence_interval)
+    else:
+      time.sleep(self.delay)
+
   def _send_initialization_packet(self, host, self_pkt=False):
     traffic_type = "icmp_ping"
     dp_event = self.traffic_generator.generate(traffic_type, host, self_pkt=self_pkt)
@@ -234,28 +295,78 @@ class Fuzzer(ControlFlow):
       self._input_logger.dump_buffered_events(buffered_events)
 
   def maybe_check_invariant(self):
+    if (self.async_invariant_checks and
+        self._collect_invariant_checks()):
+      return True
     if (self.check_interval is not None and
         (self.logical_time % self.check_interval) == 0):
       # Time to run correspondence!
-      # TODO(cs): may need to revert to threaded version if runtime is too
-      # long
       def do_invariant_check():
         if self.log_invariant_checks:
           self._log_input_event(CheckInvariants(invariant_check_name=self.invariant_check_name,
                                                 fail_on_error=self.halt_on_violation))
 
-        controllers_with_violations = self.invariant_check(self.simulation)
+        if self.async_invariant_checks:
+          if len(self._pending_checks) >= self.max_pending_checks:
+            log.info("Waiting for the invariant check of round %d" %
+                     self._pending_checks[0].round)
+            if self._collect_invariant_checks(block_on_oldest=True):
+              return True
+          self._pending_checks.append(
+            AsyncInvariantCheck(self.invariant_check, self.simulation,
+                                self.logical_time,
+                                fetch_controller_snapshots=
+                                  self.invariant_check_name in
+                                  checks_needing_controller_snapshots))
+          return False
 
-        if controllers_with_violations != []:
-          msg.fail("The following controllers had correctness violations!: %s"
-                   % str(controllers_with_violations))
-          self._log_input_event(InvariantViolation(controllers_with_violations))
-          if self.halt_on_violation:
-            return True
-        else:
-          msg.interactive("No correctness violations!")
+        controllers_with_violations = self.invariant_check(self.simulation)
+        return self._handle_violations(controllers_with_violations)
       return do_invariant_check()
 
+  def _handle_violations(self, controllers_with_violations, round=-1):
+    ''' Log the result of an invariant check. Return whether to halt '''
+    if controllers_with_violations != []:
+      msg.fail("The following controllers had correctness violations!: %s"
+               % str(controllers_with_violations))
+      self._log_input_event(InvariantViolation(controllers_with_violations,
+                                               round=round))
+      if self.violation_buckets is not None:
+        self._bucket_violations(controllers_with_violations,
+                                round if round != -1 else self.logical_time)
+      if self.halt_on_violation:
+        return True
+    else:
+      msg.interactive("No correctness violations!")
+    return False
+
+  def _bucket_violations(self, violations, round):
+    (bucket, new) = self.violation_buckets.add(self.invariant_check_name,
+                                               violations, round)
+    if new:
+      log.info("New violation bucket %s" % bucket['id'])
+      self.violation_buckets.snapshot(bucket, self, self._input_logger,
+                                      self.simulation_cfg)
+    else:
+      log.info("Violation is a duplicate of bucket %s (%d so far)" %
+               (bucket['id'], bucket['count']))
+
+  def _collect_invariant_checks(self, block=False, block_on_oldest=False):
+    '''
+    Handle the results of finished asynchronous invariant checks, in the order
+    they were started. If block, wait for all of them; if block_on_oldest,
+    wait for (at least) the oldest. Return whether to halt.
+    '''
+    while self._pending_checks != []:
+      check = self._pending_checks[0]
+      if not (block or block_on_oldest or check.done()):
+        break
+      block_on_oldest = False
+      self._pending_checks.pop(0)
+      if self._handle_violations(check.result(), round=check.round):
+        return True
+    return False
+
   def maybe_inject_trace_event(self):
     if (self.simulation.dataplane_trace and
         (self.logical_time % self.traffic_inject_interval) == 0):
@@ -272,6 +383,11 @@ class Fuzzer(ControlFlow):
     self.check_controllers()
     self.check_migrations()
 
+  def _sample(self, entities, rate):
+    ''' Return the entities that this round's independent draws, each
+    succeeding with probability rate, select '''
+    return sample_independently(self.random, entities, rate)
+
   def check_dataplane(self, pass_through=False):
     ''' Decide whether to delay, drop, or deliver packets '''
     for dp_event in self.simulation.patch_panel.queued_dataplane_events:
@@ -304,44 +420,47 @@ class Fuzzer(ControlFlow):
 
   def check_tcp_connections(self):
     ''' Decide whether to block or unblock control channels '''
-    for (switch, connection) in self.simulation.topology.unblocked_controller_connections:
-      if self.random.random() < self.params.controlplane_block_rate:
-        self.simulation.topology.block_connection(connection)
-        self._log_input_event(ControlChannelBlock(switch.dpid,
-                              connection.get_controller_id()))
-
-    for (switch, connection) in self.simulation.topology.blocked_controller_connections:
-      if self.random.random() < self.params.controlplane_unblock_rate:
-        self.simulation.topology.unblock_connection(connection)
-        self._log_input_event(ControlChannelUnblock(switch.dpid,
-                              controller_id=connection.get_controller_id()))
+    for (switch, connection) in self._sample(self.simulation.topology.unblocked_controller_connections,
+                                             self.params.controlplane_block_rate):
+      self.simulation.topology.block_connection(connection)
+      self._log_input_event(ControlChannelBlock(switch.dpid,
+                            connection.get_controller_id()))
+
+    for (switch, connection) in self._sample(self.simulation.topology.blocked_controller_connections,
+                                             self.params.controlplane_unblock_rate):
+      self.simulation.topology.unblock_connection(connection)
+      self._log_input_event(ControlChannelUnblock(switch.dpid,
+                            controller_id=connection.get_controller_id()))
 
   def check_pending_messages(self, pass_through=False):
     for pending_receipt in self.simulation.god_scheduler.pending_receives():
       # TODO(cs): this is a really dumb way to fuzz packet receipt scheduling
       if (self.random.random() < self.params.ofp_message_receipt_rate or
           pass_through):
-        self.simulation.god_scheduler.schedule(pending_receipt)
-        self._log_input_event(ControlMessageReceive(pending_receipt.dpid,
-                                                    pending_receipt.controller_id,
-                                                    pending_receipt.fingerprint))
+        event = ControlMessageReceive(pending_receipt.dpid,
+                                      pending_receipt.controller_id,
+                                      pending_receipt.fingerprint)
+        self.simulation.god_scheduler.schedule(pending_receipt,
+                                               label=event.label)
+        self._log_input_event(event)
     for pending_send in self.simulation.god_scheduler.pending_sends():
       if (self.random.random() < self.params.ofp_message_send_rate or
           pass_through):
-        self.simulation.god_scheduler.schedule(pending_send)
-        self._log_input_event(ControlMessageSend(pending_send.dpid,
-                                                 pending_send.controller_id,
-                                                 pending_send.fingerprint))
+        event = ControlMessageSend(pending_send.dpid,
+                                   pending_send.controller_id,
+                                   pending_send.fingerprint)
+        self.simulation.god_scheduler.schedule(pending_send, label=event.label)
+        self._log_input_event(event)
 
   def check_switch_crashes(self):
     ''' Decide whether to crash or restart switches, links and controllers '''
     def crash_switches():
       crashed_this_round = set()
-      for software_switch in list(self.simulation.topology.live_switches):
-        if self.random.random() < self.params.switch_failure_rate:
-          crashed_this_round.add(software_switch)
-          self.simulation.topology.crash_switch(software_switch)
-          self._log_input_event(SwitchFailure(software_switch.dpid))
+      for software_switch in self._sample(self.simulation.topology.live_switches,
+                                          self.params.switch_failure_rate):
+        crashed_this_round.add(software_switch)
+        self.simulation.topology.crash_switch(software_switch)
+        self._log_input_event(SwitchFailure(software_switch.dpid))
       return crashed_this_round
 
     def restart_switches(crashed_this_round):
@@ -349,15 +468,15 @@ class Fuzzer(ControlFlow):
       down_controller_ids = map(lambda c: c.cid,
                                 self.simulation.controller_manager.down_controllers)
 
-      for software_switch in list(self.simulation.topology.failed_switches):
-        if software_switch in crashed_this_round:
-          continue
-        if self.random.random() < self.params.switch_recovery_rate:
-          connected = self.simulation.topology\
-                          .recover_switch(software_switch,
-                                          down_controller_ids=down_controller_ids)
-          if connected:
-            self._log_input_event(SwitchRecovery(software_switch.dpid))
+      failed_switches = [ s for s in self.simulation.topology.failed_switches
+                          if s not in crashed_this_round ]
+      for software_switch in self._sample(failed_switches,
+                                          self.params.switch_recovery_rate):
+        connected = self.simulation.topology\
+                        .recover_switch(software_switch,
+                                        down_controller_ids=down_controller_ids)
+        if connected:
+          self._log_input_event(SwitchRecovery(software_switch.dpid))
 
     crashed_this_round = crash_switches()
     try:
@@ -369,85 +488,90 @@ class Fuzzer(ControlFlow):
     def sever_links():
       # TODO(cs): model administratively down links? (OFPPC_PORT_DOWN)
       cut_this_round = set()
-      for link in list(self.simulation.topology.live_links):
-        if self.random.random() < self.params.link_failure_rate:
-          cut_this_round.add(link)
-          self.simulation.topology.sever_link(link)
-          self._log_input_event(LinkFailure(
-                                link.start_software_switch.dpid,
-                                link.start_port.port_no,
-                                link.end_software_switch.dpid,
-                                link.end_port.port_no))
+      for link in self._sample(self.simulation.topology.live_links,
+                               self.params.link_failure_rate):
+        cut_this_round.add(link)
+        self.simulation.topology.sever_link(link)
+        self._log_input_event(LinkFailure(
+                              link.start_software_switch.dpid,
+                              link.start_port.port_no,
+                              link.end_software_switch.dpid,
+                              link.end_port.port_no))
       return cut_this_round
 
     def repair_links(cut_this_round):
-      for link in list(self.simulation.topology.cut_links):
-        if link in cut_this_round:
-          continue
-        if self.random.random() < self.params.link_recovery_rate:
-          self.simulation.topology.repair_link(link)
-          self._log_input_event(LinkRecovery(
-                                link.start_software_switch.dpid,
-                                link.start_port.port_no,
-                                link.end_software_switch.dpid,
-                                link.end_port.port_no))
+      cut_links = [ l for l in self.simulation.topology.cut_links
+                    if l not in cut_this_round ]
+      for link in self._sample(cut_links, self.params.link_recovery_rate):
+        self.simulation.topology.repair_link(link)
+        self._log_input_event(LinkRecovery(
+                              link.start_software_switch.dpid,
+                              link.start_port.port_no,
+                              link.end_software_switch.dpid,
+                              link.end_port.port_no))
 
 
     cut_this_round = sever_links()
     repair_links(cut_this_round)
 
   def fuzz_traffic(self):
-    if not self.simulation.dataplane_trace:
-      # randomly generate messages from switches
-      for host in self.simulation.topology.hosts:
-        if self.random.random() < self.params.traffic_generation_rate:
-          if len(host.interfaces) > 0:
-            msg.event("injecting a random packet")
-            traffic_type = "icmp_ping"
-            # Generates a packet, and feeds it to the software_switch
-            dp_event = self.traffic_generator.generate(traffic_type, host)
-            self._log_input_event(TrafficInjection(), dp_event=dp_event)
+    if self.simulation.dataplane_trace:
+      return
+    if self.matrix_traffic_generator is not None:
+      for dp_events in self.matrix_traffic_generator.generate_batch():
+        self._log_input_event(TrafficInjection(count=len(dp_events)),
+                              dp_events=dp_events)
+      return
+    # randomly generate messages from switches
+    for host in self._sample(self.simulation.topology.hosts,
+                             self.params.traffic_generation_rate):
+      if len(host.interfaces) > 0:
+        msg.event("injecting a random packet")
+        traffic_type = "icmp_ping"
+        # Generates a packet, and feeds it to the software_switch
+        dp_event = self.traffic_generator.generate(traffic_type, host)
+        self._log_input_event(TrafficInjection(), dp_event=dp_event)
 
   def check_controllers(self):
     def crash_controllers():
       crashed_this_round = set()
-      for controller in self.simulation.controller_manager.live_controllers:
-        if self.random.random() < self.params.controller_crash_rate:
-          crashed_this_round.add(controller)
-          controller.kill()
-          self._log_input_event(ControllerFailure(controller.cid))
+      for controller in self._sample(self.simulation.controller_manager.live_controllers,
+                                     self.params.controller_crash_rate):
+        crashed_this_round.add(controller)
+        controller.kill()
+        self._log_input_event(ControllerFailure(controller.cid))
       return crashed_this_round
 
     def reboot_controllers(crashed_this_round):
-      for controller in self.simulation.controller_manager.down_controllers:
-        if controller in crashed_this_round:
-          continue
-        if self.random.random() < self.params.controller_recovery_rate:
-          controller.start()
-          self._log_input_event(ControllerRecovery(controller.cid))
+      down_controllers = [ c for c in self.simulation.controller_manager.down_controllers
+                           if c not in crashed_this_round ]
+      for controller in self._sample(down_controllers,
+                                     self.params.controller_recovery_rate):
+        controller.start()
+        self._log_input_event(ControllerRecovery(controller.cid))
 
     crashed_this_round = crash_controllers()
     reboot_controllers(crashed_this_round)
 
   def check_migrations(self):
-    for access_link in list(self.simulation.topology.access_links):
-      if self.random.random() < self.params.host_migration_rate:
-        old_ingress_dpid = access_link.switch.dpid
-        old_ingress_port_no = access_link.switch_port.port_no
-        live_edge_switches = list(self.simulation.topology.live_edge_switches)
-        if len(live_edge_switches) > 0:
-          new_switch = random.choice(live_edge_switches)
-          new_switch_dpid = new_switch.dpid
-          new_port_no = max(new_switch.ports.keys()) + 1
-          msg.event("Migrating host %s" % str(access_link.host))
-          self.simulation.topology.migrate_host(old_ingress_dpid,
-                                                old_ingress_port_no,
-                                                new_switch_dpid,
-                                                new_port_no)
-          self._log_input_event(HostMigration(old_ingress_dpid,
+    for access_link in self._sample(self.simulation.topology.access_links,
+                                    self.params.host_migration_rate):
+      old_ingress_dpid = access_link.switch.dpid
+      old_ingress_port_no = access_link.switch_port.port_no
+      live_edge_switches = list(self.simulation.topology.live_edge_switches)
+      if len(live_edge_switches) > 0:
+        new_switch = random.choice(live_edge_switches)
+        new_switch_dpid = new_switch.dpid
+        new_port_no = max(new_switch.ports.keys()) + 1
+        msg.event("Migrating host %s" % str(access_link.host))
+        self.simulation.topology.migrate_host(old_ingress_dpid,
                                               old_ingress_port_no,
                                               new_switch_dpid,
-                                              new_port_no,
-                                              access_link.host.name))
-          self._send_initialization_packet(access_link.host, self_pkt=True)
+                                              new_port_no)
+        self._log_input_event(HostMigration(old_ingress_dpid,
+                                            old_ingress_port_no,
+                                            new_switch_dpid,
+                                            new_port_no,
+                                            access_link.host.name))
+        self._send_initialization_packet(access_link.host, self_pkt=True)
 
@@ -234,6 +234,9 @@ class Interactive(ControlFlow):
   def simulate(self, simulation=None, bound_objects=()):
     if simulation is None:
       self.simulation = self.simulation_cfg.bootstrap(self.sync_callback)
+      if self._input_logger is not None:
+        self.simulation.god_scheduler.openflow_sidelog = \
+            self._input_logger.openflow_sidelog
       # Always connect to controllers explicitly
       self.simulation.connect_to_controllers()
       self._log_input_event(ConnectToControllers())
@@ -591,15 +594,17 @@ class Interactive(ControlFlow):
     for pending_receipt in self.simulation.god_scheduler.pending_receives():
       # For now, just schedule FIFO.
       # TODO(cs): make this interactive
-      self.simulation.god_scheduler.schedule(pending_receipt)
-      self._log_input_event(ControlMessageReceive(pending_receipt.dpid,
-                                                  pending_receipt.controller_id,
-                                                  pending_receipt.fingerprint))
+      event = ControlMessageReceive(pending_receipt.dpid,
+                                    pending_receipt.controller_id,
+                                    pending_receipt.fingerprint)
+      self.simulation.god_scheduler.schedule(pending_receipt, label=event.label)
+      self._log_input_event(event)
     for pending_send in self.simulation.god_scheduler.pending_sends():
-      self.simulation.god_scheduler.schedule(pending_send)
-      self._log_input_event(ControlMessageSend(pending_send.dpid,
-                                               pending_send.controller_id,
-                                               pending_send.fingerprint))
+      event = ControlMessageSend(pending_send.dpid,
+                                 pending_send.controller_id,
+                                 pending_send.fingerprint)
+      self.simulation.god_scheduler.schedule(pending_send, label=event.label)
+      self._log_input_event(event)
 
   # TODO(cs): add support for control channel blocking + link,
   # controller failures, god scheduling
@@ -342,6 +342,7 @@ class MCSFinder(ControlFlow):
     time.sleep(self.end_wait_seconds)
     violations = self.invariant_check(simulation)
     simulation.clean_up()
+    self.simulation = simulation
     return violations
 
   def _optimize_event_dag(self):
@@ -495,3 +496,55 @@ class EfficientMCSFinder(MCSFinder):
     return (left_result.insert_atomic_inputs(right_result.atomic_input_events),
             total_inputs_pruned)
 
+
+class PrefixFinder(MCSFinder):
+  ''' Finds the shortest prefix of the superlog's input events that still
+  causes the violation, by binary search over the prefix length: O(log n)
+  replays, as opposed to the O(n) or more of MCS minimization, which can
+  then start from the (written out) prefix trace rather than the whole
+  superlog. Assumes that once a prefix causes the violation, so do all
+  longer ones.
+  '''
+  def simulate(self, check_reproducability=True):
+    self._runtime_stats.set_dag_stats(self.dag)
+
+    self.dag.mark_invalid_input_sequences()
+    self.dag = self.dag.filter_unsupported_input_types()
+
+    if len(self.dag) == 0:
+      raise RuntimeError("No supported input types?")
+
+    inputs = self.dag.input_events
+    if check_reproducability:
+      self._runtime_stats.record_replay_start()
+      reproduced = self._check_violation(self.dag, len(inputs))
+      self._runtime_stats.record_replay_end()
+      if not reproduced:
+        msg.fail("Unable to reproduce correctness violation!")
+        sys.exit(5)
+      self.log("Violation reproduced successfully! Proceeding with truncation")
+      Replayer.total_replays = 0
+      Replayer.total_inputs_replayed = 0
+
+    self._runtime_stats.record_prune_start()
+    # The longest prefix known not to cause the violation, and the shortest
+    # known to
+    (good, bad) = (0, len(inputs))
+    while bad - good > 1:
+      middle = (good + bad) / 2
+      self._runtime_stats.record_iteration_size(middle)
+      if self._check_violation(self.dag.input_subset(inputs[:middle]), middle):
+        bad = middle
+      else:
+        good = middle
+    self.dag = self.dag.input_subset(inputs[:bad])
+
+    self._runtime_stats.record_prune_end()
+    self._dump_runtime_stats()
+    self.log("Shortest violating prefix: %d of %d inputs" %
+             (len(self.dag.input_events), len(inputs)))
+    if self.mcs_trace_path is not None:
+      self._dump_mcs_trace()
+    self.log("=== Total replays: %d ===" % Replayer.total_replays)
+
+    return self.simulation
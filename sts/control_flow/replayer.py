@@ -209,11 +209,14 @@ class DataplaneChecker(object):
     # in the pruned run.
     self.events = list(event_dag.events)
     self.stats = DataplaneCheckerStats(self.events)
+    # Compacted dataplane events (count > 1) stand for count identical
+    # events. Maps such an event to the number of its events not yet matched
+    self.remaining = {}
     # The current sequence of dataplane events we expect within the current
     # window
     self.current_dp_fingerprints = []
-    # Mapping from fingerprint in current_dp_fingerprints to the index of the
-    # event in self.events
+    # Mapping from fingerprint in current_dp_fingerprints to the indices of
+    # the events in self.events with that fingerprint, in order
     self.fingerprint_2_event_idx = {}
     self.slop_buffer = slop_buffer
 
@@ -235,9 +238,20 @@ class DataplaneChecker(object):
     # Flush this event from both our current window and our events list, so
     # that we don't accidentally conflate distinct dp_events with the same
     # fingerprint
-    self.current_dp_fingerprints.remove(event_fingerprint)
-    event_idx = self.fingerprint_2_event_idx[event_fingerprint]
-    self.events.pop(event_idx)
+    event_idx = self.fingerprint_2_event_idx[event_fingerprint][0]
+    event = self.events[event_idx]
+    remaining = self.remaining.get(event, event.count) - 1
+    if remaining > 0:
+      # Only one of the run's events has been matched
+      self.remaining[event] = remaining
+    else:
+      self.remaining.pop(event, None)
+      self.current_dp_fingerprints.remove(event_fingerprint)
+      self.events.pop(event_idx)
+      # Keep the window's indices pointing at the same events
+      for indices in self.fingerprint_2_event_idx.itervalues():
+        indices[:] = [ i - 1 if i > event_idx else i
+                       for i in indices if i != event_idx ]
     # First element of the tuple is the Event class name
     if event_fingerprint[0] == "DataplanePermit":
       return False
@@ -261,7 +275,7 @@ class DataplaneChecker(object):
           type(self.events[i]) == DataplaneDrop):
         fingerprint = self.events[i].fingerprint
         self.current_dp_fingerprints.append(fingerprint)
-        self.fingerprint_2_event_idx[fingerprint] = i
+        self.fingerprint_2_event_idx.setdefault(fingerprint, []).append(i)
 
   def check_dataplane(self, current_round, simulation):
     ''' Check dataplane events for before playing then next event.
@@ -279,7 +293,8 @@ class DataplaneCheckerStats(object):
   ''' Tracks how many drops we actually performed vs. how many we expected to
   perform '''
   def __init__(self, events):
-    self.expected_drops = [e.fingerprint for e in events if type(e) == DataplaneDrop]
+    self.expected_drops = [e.fingerprint for e in events if type(e) == DataplaneDrop
+                           for _ in xrange(e.count)]
     self.actual_drops = []
 
   def record_drop(self, fingerprint):
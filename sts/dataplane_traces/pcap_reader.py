@@ -0,0 +1,318 @@
+'''
+Streaming import of packet captures (pcap and pcapng) into dataplane traces.
+
+Captures are read record by record with buffered reads, so memory use does
+not depend on the size of the capture. The addresses in the capture are
+mapped onto the host interfaces of an STS topology: each distinct source MAC
+address is assigned an interface, round robin in order of first appearance,
+and the MAC and IPv4 addresses in each frame (Ethernet, IPv4 and ARP headers)
+are rewritten to that interface's. IPv4, TCP and UDP checksums are updated
+incrementally, so truncated captures are handled too.
+'''
+
+import struct
+
+import logging
+log = logging.getLogger("pcap_reader")
+
+LINKTYPE_ETHERNET = 1
+
+_PCAP_MAGIC_USEC = 0xa1b2c3d4
+_PCAP_MAGIC_NSEC = 0xa1b23c4d
+_PCAPNG_SECTION_HEADER = 0x0a0d0d0a
+_PCAPNG_BYTE_ORDER_MAGIC = 0x1a2b3c4d
+_PCAPNG_INTERFACE_DESCRIPTION = 1
+_PCAPNG_SIMPLE_PACKET = 3
+_PCAPNG_ENHANCED_PACKET = 6
+_PCAPNG_OPTION_TSRESOL = 9
+
+_ETH_TYPE_IP = 0x0800
+_ETH_TYPE_ARP = 0x0806
+_ETH_TYPE_VLAN = 0x8100
+_IP_PROTOCOL_TCP = 6
+_IP_PROTOCOL_UDP = 17
+
+def read_capture(capture):
+  '''
+  Given a file object open on a pcap or pcapng capture, yield a (timestamp,
+  link type, frame) tuple for each packet. Timestamps are in seconds since the
+  epoch, or None if the capture doesn't record them.
+  '''
+  magic = capture.read(4)
+  if len(magic) < 4:
+    return
+  if struct.unpack("<I", magic)[0] == _PCAPNG_SECTION_HEADER:
+    records = _read_pcapng(capture, magic)
+  else:
+    records = _read_pcap(capture, magic)
+  for record in records:
+    yield record
+
+def _read_exactly(capture, length):
+  data = capture.read(length)
+  if len(data) < length:
+    raise EOFError("Truncated capture")
+  return data
+
+def _read_pcap(capture, magic):
+  for endian in ("<", ">"):
+    magic_number = struct.unpack(endian + "I", magic)[0]
+    if magic_number in (_PCAP_MAGIC_USEC, _PCAP_MAGIC_NSEC):
+      break
+  else:
+    raise ValueError("Not a pcap or pcapng capture")
+  resolution = 1e-9 if magic_number == _PCAP_MAGIC_NSEC else 1e-6
+  (_, _, _, _, _, linktype) = struct.unpack(endian + "HHiIII",
+                                            _read_exactly(capture, 20))
+  record_header = struct.Struct(endian + "IIII")
+  while True:
+    header = capture.read(record_header.size)
+    if len(header) == 0:
+      return
+    if len(header) < record_header.size:
+      log.warn("Capture ends in a truncated record")
+      return
+    (seconds, fraction, captured_length, _) = record_header.unpack(header)
+    frame = capture.read(captured_length)
+    if len(frame) < captured_length:
+      log.warn("Capture ends in a truncated record")
+      return
+    yield (seconds + fraction * resolution, linktype, frame)
+
+def _read_pcapng(capture, magic):
+  endian = "<"
+  # (link type, timestamp resolution) per interface in the current section
+  interfaces = []
+  block_type = struct.unpack("<I", magic)[0]
+  while True:
+    if block_type is None:
+      magic = capture.read(4)
+      if len(magic) == 0:
+        return
+      if len(magic) < 4:
+        log.warn("Capture ends in a truncated block")
+        return
+      block_type = struct.unpack(endian + "I", magic)[0]
+    if block_type == _PCAPNG_SECTION_HEADER:
+      length_bytes = _read_exactly(capture, 4)
+      byte_order = _read_exactly(capture, 4)
+      if struct.unpack("<I", byte_order)[0] == _PCAPNG_BYTE_ORDER_MAGIC:
+        endian = "<"
+      elif struct.unpack(">I", byte_order)[0] == _PCAPNG_BYTE_ORDER_MAGIC:
+        endian = ">"
+      else:
+        raise ValueError("Bad pcapng byte order magic")
+      block_length = struct.unpack(endian + "I", length_bytes)[0]
+      body = _read_exactly(capture, block_length - 12)
+      interfaces = []
+    else:
+      block_length = struct.unpack(endian + "I", _read_exactly(capture, 4))[0]
+      if block_length < 12:
+        raise ValueError("Bad pcapng block length %d" % block_length)
+      # The body includes the trailing copy of the block length
+      body = _read_exactly(capture, block_length - 8)
+
+    if block_type == _PCAPNG_INTERFACE_DESCRIPTION:
+      (linktype, _, _) = struct.unpack_from(endian + "HHI", body)
+      interfaces.append((linktype, _pcapng_tsresol(body[8:-4], endian)))
+    elif block_type == _PCAPNG_ENHANCED_PACKET:
+      (interface_id, high, low, captured_length, _) = \
+          struct.unpack_from(endian + "IIIII", body)
+      (linktype, resolution) = interfaces[interface_id]
+      yield (((high << 32) | low) * resolution, linktype,
+             body[20:20 + captured_length])
+    elif block_type == _PCAPNG_SIMPLE_PACKET:
+      (original_length,) = struct.unpack_from(endian + "I", body)
+      (linktype, _) = interfaces[0]
+      snap_length = len(body) - 8
+      yield (None, linktype, body[4:4 + min(original_length, snap_length)])
+    block_type = None
+
+def _pcapng_tsresol(options, endian):
+  ''' The timestamp resolution, in seconds, given an IDB's options '''
+  ofs = 0
+  while ofs + 4 <= len(options):
+    (code, length) = struct.unpack_from(endian + "HH", options, ofs)
+    if code == 0:
+      break
+    if code == _PCAPNG_OPTION_TSRESOL and length >= 1:
+      value = ord(options[ofs + 4])
+      if value & 0x80:
+        return 2 ** -(value & 0x7f)
+      return 10 ** -value
+    ofs += 4 + ((length + 3) & ~3)
+  return 1e-6
+
+def _update_checksum(frame, checksum_ofs, old, new):
+  '''
+  Incrementally update the 16 bit one's complement checksum at checksum_ofs
+  of bytearray frame after old (a str of even length) was replaced by new
+  (RFC 1624).
+  '''
+  if checksum_ofs + 2 > len(frame):
+    return
+  checksum = (frame[checksum_ofs] << 8) | frame[checksum_ofs + 1]
+  total = ~checksum & 0xffff
+  for i in xrange(0, len(old), 2):
+    total += ~((ord(old[i]) << 8) | ord(old[i + 1])) & 0xffff
+    total += (ord(new[i]) << 8) | ord(new[i + 1])
+  while total >> 16:
+    total = (total & 0xffff) + (total >> 16)
+  checksum = ~total & 0xffff
+  frame[checksum_ofs] = checksum >> 8
+  frame[checksum_ofs + 1] = checksum & 0xff
+
+class HostMapper(object):
+  '''
+  Maps the addresses in captured Ethernet frames onto the host interfaces of a
+  topology, and rewrites frames accordingly.
+  '''
+  def __init__(self, hosts):
+    # (interface, raw MAC, raw IPv4 address or None)
+    self.interfaces = []
+    for host in hosts:
+      for interface in host.interfaces:
+        ip = interface.ips[0].toRaw() if len(interface.ips) > 0 else None
+        self.interfaces.append((interface, interface.hw_addr.toRaw(), ip))
+    if len(self.interfaces) == 0:
+      raise ValueError("Topology has no host interfaces")
+    # capture MAC -> index into self.interfaces
+    self.mac2index = {}
+    # capture IP -> raw IP of a host interface
+    self.ip_map = {}
+
+  def _index(self, mac):
+    if mac not in self.mac2index:
+      self.mac2index[mac] = len(self.mac2index) % len(self.interfaces)
+    return self.mac2index[mac]
+
+  def _map_mac(self, mac):
+    if ord(mac[0]) & 0x01:
+      # Broadcast and multicast addresses are kept
+      return mac
+    return self.interfaces[self._index(mac)][1]
+
+  def _map_ip(self, ip, mac):
+    ''' Map capture ip, seen together with capture mac '''
+    if ip not in self.ip_map:
+      if ord(mac[0]) & 0x01 or ord(ip[0]) >= 224 or ip == "\x00\x00\x00\x00":
+        # Multicast, broadcast and unspecified addresses are kept
+        return ip
+      host_ip = self.interfaces[self._index(mac)][2]
+      if host_ip is None:
+        return ip
+      self.ip_map[ip] = host_ip
+    return self.ip_map[ip]
+
+  def map_frame(self, frame):
+    '''
+    Return (interface, rewritten frame) for a captured Ethernet frame, or None
+    if the frame can't be injected (it's truncated, or its source and
+    destination map onto the same interface).
+    '''
+    if len(frame) < 14:
+      return None
+    src_mac = frame[6:12]
+    dst_mac = frame[0:6]
+    interface_index = self._index(src_mac)
+    if not (ord(dst_mac[0]) & 0x01) and self._index(dst_mac) == interface_index:
+      return None
+    rewritten = bytearray(frame)
+    rewritten[0:6] = self._map_mac(dst_mac)
+    rewritten[6:12] = self._map_mac(src_mac)
+
+    ofs = 12
+    (eth_type,) = struct.unpack_from("!H", frame, ofs)
+    while eth_type == _ETH_TYPE_VLAN and len(frame) >= ofs + 6:
+      ofs += 4
+      (eth_type,) = struct.unpack_from("!H", frame, ofs)
+    ofs += 2
+    if eth_type == _ETH_TYPE_IP:
+      self._rewrite_ipv4(frame, rewritten, ofs, src_mac, dst_mac)
+    elif eth_type == _ETH_TYPE_ARP:
+      self._rewrite_arp(frame, rewritten, ofs)
+    return (self.interfaces[interface_index][0], str(rewritten))
+
+  def _rewrite_ipv4(self, frame, rewritten, ofs, src_mac, dst_mac):
+    if len(frame) < ofs + 20:
+      return
+    header_length = (ord(frame[ofs]) & 0x0f) * 4
+    protocol = ord(frame[ofs + 9])
+    old_ips = frame[ofs + 12:ofs + 20]
+    new_ips = (self._map_ip(old_ips[0:4], src_mac) +
+               self._map_ip(old_ips[4:8], dst_mac))
+    if new_ips == old_ips:
+      return
+    rewritten[ofs + 12:ofs + 20] = new_ips
+    _update_checksum(rewritten, ofs + 10, old_ips, new_ips)
+    # The TCP and UDP checksums cover the addresses too. Only the first
+    # fragment carries the transport header.
+    (fragment,) = struct.unpack_from("!H", frame, ofs + 6)
+    if fragment & 0x1fff != 0:
+      return
+    transport = ofs + header_length
+    if protocol == _IP_PROTOCOL_TCP:
+      _update_checksum(rewritten, transport + 16, old_ips, new_ips)
+    elif protocol == _IP_PROTOCOL_UDP:
+      if (len(frame) >= transport + 8 and
+          frame[transport + 6:transport + 8] == "\x00\x00"):
+        # No checksum
+        return
+      _update_checksum(rewritten, transport + 6, old_ips, new_ips)
+
+  def _rewrite_arp(self, frame, rewritten, ofs):
+    # Ethernet/IPv4 ARP only
+    if (len(frame) < ofs + 28 or
+        frame[ofs:ofs + 6] != "\x00\x01\x08\x00\x06\x04"):
+      return
+    sender_mac = frame[ofs + 8:ofs + 14]
+    target_mac = frame[ofs + 18:ofs + 24]
+    rewritten[ofs + 14:ofs + 18] = self._map_ip(frame[ofs + 14:ofs + 18],
+                                                sender_mac)
+    rewritten[ofs + 8:ofs + 14] = self._map_mac(sender_mac)
+    if target_mac != "\x00" * 6:
+      rewritten[ofs + 24:ofs + 28] = self._map_ip(frame[ofs + 24:ofs + 28],
+                                                  target_mac)
+      rewritten[ofs + 18:ofs + 24] = self._map_mac(target_mac)
+    elif frame[ofs + 24:ofs + 28] in self.ip_map:
+      rewritten[ofs + 24:ofs + 28] = self.ip_map[frame[ofs + 24:ofs + 28]]
+
+class CaptureImportStats(object):
+  def __init__(self):
+    self.packets_read = 0
+    self.packets_written = 0
+    # Frames that aren't Ethernet
+    self.unsupported_link_type = 0
+    # Frames whose source and destination map onto the same interface
+    self.unmappable = 0
+
+  def __str__(self):
+    return ("%d packets read, %d written, %d skipped (not Ethernet), "
+            "%d skipped (unmappable)" %
+            (self.packets_read, self.packets_written,
+             self.unsupported_link_type, self.unmappable))
+
+def import_capture(capture_path, hosts, trace_writer, max_packets=None):
+  '''
+  Stream the packets of the capture at capture_path into trace_writer (a
+  sts.dataplane_traces.trace.RawTraceWriter), mapping their addresses onto
+  hosts. Return a CaptureImportStats.
+  '''
+  mapper = HostMapper(hosts)
+  stats = CaptureImportStats()
+  with open(capture_path, 'rb', 1 << 20) as capture:
+    for (timestamp, linktype, frame) in read_capture(capture):
+      if max_packets is not None and stats.packets_read >= max_packets:
+        break
+      stats.packets_read += 1
+      if linktype != LINKTYPE_ETHERNET:
+        stats.unsupported_link_type += 1
+        continue
+      mapped = mapper.map_frame(frame)
+      if mapped is None:
+        stats.unmappable += 1
+        continue
+      (interface, rewritten) = mapped
+      trace_writer.write_frame(interface, rewritten, timestamp)
+      stats.packets_written += 1
+  return stats
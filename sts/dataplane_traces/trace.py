@@ -1,28 +1,208 @@
+'''
+Dataplane traces: sequences of packets to inject at host interfaces.
+
+Traces are stored in a raw format: each event is a small fixed-size header
+(interface id, timestamp, frame length) followed by the raw Ethernet frame,
+and the interfaces are listed once in a table at the end of the file. Traces
+are memory-mapped when loaded, and each packet is only parsed when it is
+injected. Legacy traces (a pickled list of DataplaneEvents) can still be
+loaded.
+
+File layout (all integers little-endian):
+  - RAW_TRACE_MAGIC
+  - the events: (_event_header, frame) pairs
+  - the interface table, a json list of interfaces
+  - _footer: interface table offset, number of events, RAW_TRACE_MAGIC
+'''
+
+import json
+import mmap
+import math
 import pickle
+import struct
 from pox.lib.util import assert_type
 from pox.lib.packet.ethernet import *
+from pox.lib.addresses import EthAddr, IPAddr
 from sts.entities import HostInterface
 
 import logging
 log = logging.getLogger("dataplane_trace")
 
+RAW_TRACE_MAGIC = "STSDPT1\x00"
+# interface id, timestamp (seconds since the epoch, NaN if unknown), frame length
+_event_header = struct.Struct("<IdI")
+# interface table offset, number of events, magic
+_footer = struct.Struct("<QQ8s")
+
 class DataplaneEvent (object):
   '''
   Encapsulates a packet injected at a (switch.dpid, port) pair in the network
   Used for trace generation or replay debugging
   '''
-  def __init__ (self, interface, packet):
+  def __init__ (self, interface, packet, time=None):
     assert_type("interface", interface, HostInterface, none_ok=False)
     assert_type("packet", packet, ethernet, none_ok=False)
     self.interface = interface
     self.packet = packet
+    # When the packet was captured, in seconds since the epoch (optional)
+    self.time = time
+
+  def __setstate__(self, state):
+    # Legacy pickled traces predate the time field
+    self.__dict__.update(state)
+    if "time" not in state:
+      self.time = None
+
+def _interface_to_json(interface):
+  return {"hw_addr" : interface.hw_addr.toStr(),
+          "ips" : [ ip.toStr() for ip in interface.ips ],
+          "name" : interface.name}
+
+def _interface_from_json(json_hash):
+  return HostInterface(EthAddr(str(json_hash["hw_addr"])),
+                       [ IPAddr(str(ip)) for ip in json_hash["ips"] ],
+                       name=str(json_hash["name"]))
+
+class RawTraceWriter(object):
+  '''
+  Streams DataplaneEvents (or raw frames) to a raw dataplane trace. Nothing
+  but the interface table is kept in memory.
+  '''
+  def __init__(self, path):
+    self.path = path
+    self.output = open(path, 'wb')
+    self.output.write(RAW_TRACE_MAGIC)
+    self.interfaces = []
+    self._interface2id = {}
+    self.num_events = 0
+
+  def write_frame(self, interface, frame, time=None):
+    ''' Append a raw Ethernet frame (a str) injected at interface '''
+    if interface not in self._interface2id:
+      self._interface2id[interface] = len(self.interfaces)
+      self.interfaces.append(interface)
+    if time is None:
+      time = float("nan")
+    self.output.write(_event_header.pack(self._interface2id[interface],
+                                         time, len(frame)))
+    self.output.write(frame)
+    self.num_events += 1
+
+  def write(self, dp_event):
+    self.write_frame(dp_event.interface, dp_event.packet.pack(),
+                     getattr(dp_event, "time", None))
+
+  def copy(self, path):
+    ''' Return a writer for a new trace at path, which starts with the events
+    written so far. This writer is unaffected. '''
+    self.output.flush()
+    end = self.output.tell()
+    copy = RawTraceWriter(path)
+    with open(self.path, 'rb') as source:
+      source.seek(len(RAW_TRACE_MAGIC))
+      remaining = end - len(RAW_TRACE_MAGIC)
+      while remaining > 0:
+        chunk = source.read(min(remaining, 1 << 20))
+        copy.output.write(chunk)
+        remaining -= len(chunk)
+    copy.interfaces = list(self.interfaces)
+    copy._interface2id = dict(self._interface2id)
+    copy.num_events = self.num_events
+    return copy
+
+  def close(self):
+    interface_table_ofs = self.output.tell()
+    self.output.write(json.dumps([ _interface_to_json(interface)
+                                   for interface in self.interfaces ]))
+    self.output.write(_footer.pack(interface_table_ofs, self.num_events,
+                                   RAW_TRACE_MAGIC))
+    self.output.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+def is_raw_trace(path):
+  with open(path, 'rb') as tracefile:
+    return tracefile.read(len(RAW_TRACE_MAGIC)) == RAW_TRACE_MAGIC
+
+class RawTraceReader(object):
+  ''' Sequential access to the events of a memory-mapped raw trace '''
+  def __init__(self, path):
+    with open(path, 'rb') as tracefile:
+      self.data = mmap.mmap(tracefile.fileno(), 0, access=mmap.ACCESS_READ)
+    (interface_table_ofs, self.num_events, magic) = \
+        _footer.unpack_from(self.data, len(self.data) - _footer.size)
+    if magic != RAW_TRACE_MAGIC:
+      raise ValueError("%s is not a complete raw dataplane trace" % path)
+    self.interfaces = [ _interface_from_json(json_hash) for json_hash in
+                        json.loads(self.data[interface_table_ofs:
+                                             len(self.data) - _footer.size]) ]
+    self._end = interface_table_ofs
+    # Offset of the next event
+    self._cursor = len(RAW_TRACE_MAGIC)
+    self.events_read = 0
+
+  @property
+  def remaining(self):
+    return self.num_events - self.events_read
+
+  def next_frame(self):
+    ''' Return (interface, raw frame, time) for the next event, or None if
+    there are no more events '''
+    if self._cursor >= self._end:
+      return None
+    (interface_id, time, length) = _event_header.unpack_from(self.data,
+                                                             self._cursor)
+    start = self._cursor + _event_header.size
+    self._cursor = start + length
+    self.events_read += 1
+    if math.isnan(time):
+      time = None
+    return (self.interfaces[interface_id], self.data[start:self._cursor], time)
+
+  def next_event(self):
+    ''' Decode the next event into a DataplaneEvent, or return None '''
+    frame = self.next_frame()
+    if frame is None:
+      return None
+    (interface, raw, time) = frame
+    return DataplaneEvent(interface, ethernet(raw=raw), time=time)
+
+  def close(self):
+    self.data.close()
+
+class _PickledTraceReader(object):
+  ''' Sequential access to a legacy pickled trace '''
+  def __init__(self, path):
+    with file(path, 'r') as tracefile:
+      self.dataplane_trace = pickle.load(tracefile)
+    self.interfaces = set(dp_event.interface for dp_event in self.dataplane_trace)
+    self._cursor = 0
+
+  @property
+  def remaining(self):
+    return len(self.dataplane_trace) - self._cursor
+
+  def next_event(self):
+    if self._cursor >= len(self.dataplane_trace):
+      return None
+    dp_event = self.dataplane_trace[self._cursor]
+    # Don't hold on to injected events
+    self.dataplane_trace[self._cursor] = None
+    self._cursor += 1
+    return dp_event
 
 class Trace(object):
   '''Encapsulates a sequence of dataplane events to inject into a simulated network.'''
 
   def __init__(self, tracefile_path, topology):
-    with file(tracefile_path, 'r') as tracefile:
-      self.dataplane_trace = pickle.load(tracefile)
+    if is_raw_trace(tracefile_path):
+      self.reader = RawTraceReader(tracefile_path)
+    else:
+      self.reader = _PickledTraceReader(tracefile_path)
 
     # Hashmap used to inject packets from the dataplane_trace
     self.interface2host = {
@@ -34,18 +214,23 @@ class Trace(object):
     self._type_check_dataplane_trace()
 
   def _type_check_dataplane_trace(self):
-    for dp_event in self.dataplane_trace:
-      if dp_event.interface not in self.interface2host:
+    for interface in self.reader.interfaces:
+      if interface not in self.interface2host:
         raise RuntimeError("Dataplane trace does not type check (%s)" %
-                           str(dp_event.interface))
+                           str(interface))
+
+  @property
+  def remaining(self):
+    ''' The number of events not yet injected '''
+    return self.reader.remaining
 
   def inject_trace_event(self):
-    if len(self.dataplane_trace) == 0:
+    if self.reader.remaining == 0:
       log.warn("No more trace inputs to inject!")
       return
     else:
       log.info("Injecting trace input")
-      dp_event = self.dataplane_trace.pop(0)
+      dp_event = self.reader.next_event()
       if dp_event.interface not in self.interface2host:
         log.warn("Interface %s not present" % str(dp_event.interface))
         return
@@ -10,15 +10,16 @@ from pox.lib.packet.icmp import *
 from pox.lib.packet.arp import *
 import sts.topology as topo
 from collections import defaultdict
-import pickle
-from trace import DataplaneEvent
+from trace import DataplaneEvent, RawTraceWriter
 
 def write_trace_log(dataplane_events, filename):
   '''
-  Given a list of DataplaneEvents and a log filename, writes out a log.
-  For manual trace generation rather than replay logging
+  Given an iterable of DataplaneEvents and a log filename, writes out a (raw)
+  log. For manual trace generation rather than replay logging
   '''
-  pickle.dump(dataplane_events, file(filename, "w"))
+  with RawTraceWriter(filename) as writer:
+    for dp_event in dataplane_events:
+      writer.write(dp_event)
 
 def generate_example_trace():
   trace = []
@@ -305,16 +305,24 @@ class Host (EventMixin):
 
   def send(self, interface, packet):
     ''' Send a packet out a given interface '''
-    self.log.info("sending packet on interface %s: %s" % (interface.name, str(packet)))
+    # (Let logging format the packet only if the message is emitted)
+    self.log.info("sending packet on interface %s: %s", interface.name, packet)
     self.raiseEvent(DpPacketOut(self, packet, interface))
 
+  def send_batch(self, interface, packets):
+    ''' Send several packets out a given interface '''
+    self.log.info("sending %d packets on interface %s", len(packets),
+                  interface.name)
+    for packet in packets:
+      self.raiseEvent(DpPacketOut(self, packet, interface))
+
   def receive(self, interface, packet):
     '''
     Process an incoming packet from a switch
 
     Called by PatchPanel
     '''
-    self.log.info("received packet on interface %s: %s" % (interface.name, str(packet)))
+    self.log.info("received packet on interface %s: %s", interface.name, packet)
 
   @property
   def dpid(self):
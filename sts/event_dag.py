@@ -137,20 +137,44 @@ class EventDag(object):
     # PeekingEventDag's data
     self._prefix_trie = prefix_trie
     self._events_list = events
-    self._events_set = set(self._events_list)
-    self._label2event = {
-      event.label : event
-      for event in self._events_list
-    }
-    self._event2idx = {
-      event : i
-      for i, event in enumerate(self._events_list)
-    }
-    # TODO(cs): this should be moved to a dag transformer class
-    self._host2initial_location = {
-      host : migrations[0].old_location
-      for host, migrations in migrations_per_host(self._events_list).iteritems()
-    }
+    # The indices below are built on first use, so that wrapping a lazily
+    # decoded event list (e.g. a binary superlog's) doesn't decode every event
+    self._indices = None
+
+  def _build_indices(self):
+    if self._indices is None:
+      label2event = {
+        event.label : event
+        for event in self._events_list
+      }
+      event2idx = {
+        event : i
+        for i, event in enumerate(self._events_list)
+      }
+      # TODO(cs): this should be moved to a dag transformer class
+      host2initial_location = {
+        host : migrations[0].old_location
+        for host, migrations in migrations_per_host(self._events_list).iteritems()
+      }
+      self._indices = (set(event2idx), label2event, event2idx,
+                       host2initial_location)
+    return self._indices
+
+  @property
+  def _events_set(self):
+    return self._build_indices()[0]
+
+  @property
+  def _label2event(self):
+    return self._build_indices()[1]
+
+  @property
+  def _event2idx(self):
+    return self._build_indices()[2]
+
+  @property
+  def _host2initial_location(self):
+    return self._build_indices()[3]
 
   @property
   def events(self):
@@ -0,0 +1,238 @@
+'''
+A throughput benchmark for the Fuzzer.
+
+Runs a ProfiledFuzzer with a fixed seed against a lightweight controller (POX
+with l2_learning, from the pox/ checkout bundled with STS) on MeshTopology and
+FatTree at several sizes, and reports for each:
+  - rounds, OpenFlow messages (let through to the switches or controllers)
+    and dataplane packets (let through or dropped) per second
+  - where the time went, broken down by phase (see ProfiledFuzzer)
+
+Results are written as JSON, along with the commit they were measured at, so
+that throughput can be tracked across commits (see find_regressions).
+'''
+
+from config.experiment_config_lib import ControllerConfig
+from sts.control_flow.fuzzer import Fuzzer
+from sts.input_traces.input_logger import InputLogger
+from sts.replay_event import *
+from sts.simulation_state import SimulationConfig
+from sts.topology import MeshTopology, FatTree
+
+from collections import defaultdict
+import json
+import os
+import subprocess
+import time
+import logging
+
+log = logging.getLogger("benchmark")
+
+# POX with a learning switch: no discovery, no sync protocol
+default_controller_cmdline = ('''./pox.py --no-cli openflow.of_01 '''
+                              '''--address=__address__ --port=__port__ '''
+                              '''forwarding.l2_learning''')
+
+# (topology, size): the number of switches of a MeshTopology, or of pods of a
+# FatTree
+topology_classes = {
+  "mesh" : (MeshTopology, "num_switches"),
+  "fat_tree" : (FatTree, "num_pods")
+}
+default_cases = [("mesh", 2), ("mesh", 4), ("mesh", 8),
+                 ("fat_tree", 2), ("fat_tree", 4)]
+
+# The metrics find_regressions compares
+throughput_metrics = ["rounds_per_second", "messages_per_second",
+                      "packets_per_second"]
+
+class PhaseTimer(object):
+  '''
+  Accumulates the wall-clock time spent in named phases. Phases may nest; the
+  time spent in an inner phase is only charged to the inner phase.
+  '''
+  def __init__(self, clock=time.time):
+    self.clock = clock
+    self.seconds = defaultdict(float)
+    self._phases = []
+    self._last = None
+
+  def enter(self, phase):
+    now = self.clock()
+    if self._phases != []:
+      self.seconds[self._phases[-1]] += now - self._last
+    self._phases.append(phase)
+    self._last = now
+
+  def exit(self):
+    now = self.clock()
+    self.seconds[self._phases.pop()] += now - self._last
+    self._last = now
+
+  def timed(self, phase, f):
+    ''' Return f wrapped so that its calls are charged to phase '''
+    def timed_f(*args, **kwargs):
+      self.enter(phase)
+      try:
+        return f(*args, **kwargs)
+      finally:
+        self.exit()
+    return timed_f
+
+class ProfiledFuzzer(Fuzzer):
+  '''
+  A Fuzzer that times each phase of its rounds, and counts the messages and
+  packets it lets through. The phases:
+    - dataplane: forwarding (or dropping) buffered packets, i.e. the
+      switches' packet processing
+    - openflow: delivering buffered OpenFlow messages, i.e. the switches'
+      message processing
+    - failures: failing and recovering switches, links, controllers and
+      control channels, and migrating hosts
+    - traffic: generating traffic
+    - invariant_checks
+    - logging: logging input events
+    - sleep: waiting for the next round. STS handles socket IO (and the
+      controllers run) in the meantime
+    - other: everything else, e.g. booting the simulation
+
+  Takes the same keyword arguments as Fuzzer.
+  '''
+  _method2phase = {
+    'check_dataplane' : 'dataplane',
+    'check_pending_messages' : 'openflow',
+    'check_tcp_connections' : 'failures',
+    'check_switch_crashes' : 'failures',
+    'check_link_failures' : 'failures',
+    'check_controllers' : 'failures',
+    'check_migrations' : 'failures',
+    'fuzz_traffic' : 'traffic',
+    'maybe_inject_trace_event' : 'traffic',
+    'maybe_check_invariant' : 'invariant_checks',
+    '_log_input_event' : 'logging',
+    '_wait_for_next_round' : 'sleep',
+  }
+
+  def __init__(self, simulation_cfg, **kwargs):
+    Fuzzer.__init__(self, simulation_cfg, **kwargs)
+    self.timer = PhaseTimer()
+    self.messages = 0
+    self.packets = 0
+    for (method, phase) in self._method2phase.iteritems():
+      setattr(self, method, self.timer.timed(phase, getattr(self, method)))
+    self.seconds = 0.0
+
+  def _log_input_event(self, event, **kws):
+    if type(event) in (ControlMessageReceive, ControlMessageSend):
+      self.messages += 1
+    elif type(event) in (DataplanePermit, DataplaneDrop):
+      self.packets += 1
+    Fuzzer._log_input_event(self, event, **kws)
+
+  def simulate(self):
+    start = time.time()
+    self.timer.enter("other")
+    try:
+      return Fuzzer.simulate(self)
+    finally:
+      self.timer.exit()
+      self.seconds = time.time() - start
+
+  def stats(self):
+    def rate(count):
+      return count / self.seconds if self.seconds > 0 else 0.0
+    return { 'rounds' : self.logical_time,
+             'messages' : self.messages,
+             'packets' : self.packets,
+             'seconds' : self.seconds,
+             'rounds_per_second' : rate(self.logical_time),
+             'messages_per_second' : rate(self.messages),
+             'packets_per_second' : rate(self.packets),
+             'phases' : dict(self.timer.seconds) }
+
+def run_case(topology, size, results_dir, rounds=200, seed=1,
+             controller_cmdline=default_controller_cmdline,
+             controller_cwd="pox", **fuzzer_kwargs):
+  '''
+  Run the benchmark on one topology (see topology_classes), recording the
+  run in results_dir. Return the ProfiledFuzzer's stats.
+  '''
+  if topology not in topology_classes:
+    raise ValueError("Unknown topology %s" % topology)
+  (topology_class, size_param) = topology_classes[topology]
+  if not os.path.exists(results_dir):
+    os.makedirs(results_dir)
+  controllers = [ControllerConfig(controller_cmdline, cwd=controller_cwd)]
+  simulation_cfg = SimulationConfig(controller_configs=controllers,
+                                    topology_class=topology_class,
+                                    topology_params="%s=%d" % (size_param,
+                                                               size))
+  kwargs = { 'check_interval' : 5,
+             'invariant_check_name' : "InvariantChecker.check_loops",
+             'advance_on_quiescence' : True,
+             'print_buffers' : False }
+  kwargs.update(fuzzer_kwargs)
+  fuzzer = ProfiledFuzzer(simulation_cfg, steps=rounds, random_seed=seed,
+                          input_logger=InputLogger(), **kwargs)
+  fuzzer.init_results(results_dir)
+  simulation = None
+  try:
+    simulation = fuzzer.simulate()
+  finally:
+    if simulation_cfg.current_simulation is not None:
+      simulation_cfg.current_simulation.clean_up()
+  stats = fuzzer.stats()
+  stats.update({ 'topology' : topology, 'size' : size,
+                 'exit_code' : simulation.exit_code })
+  log.info("%s(%d): %.1f rounds/s, %.1f messages/s, %.1f packets/s" %
+           (topology, size, stats['rounds_per_second'],
+            stats['messages_per_second'], stats['packets_per_second']))
+  return stats
+
+def current_commit():
+  ''' Return the commit STS is checked out at, or None if unknown '''
+  try:
+    return subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                   cwd=os.path.dirname(__file__),
+                                   stderr=open(os.devnull, 'w')).strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+def run_benchmark(results_dir, cases=default_cases, rounds=200, seed=1,
+                  **kwargs):
+  '''
+  Run each (topology, size) case, and write the results to
+  results_dir/benchmark.json. Return the results.
+  '''
+  results = { 'commit' : current_commit(),
+              'time' : time.time(),
+              'rounds' : rounds,
+              'seed' : seed,
+              'cases' : [] }
+  for (topology, size) in cases:
+    case_dir = os.path.join(results_dir, "%s_%d" % (topology, size))
+    results['cases'].append(run_case(topology, size, case_dir, rounds=rounds,
+                                     seed=seed, **kwargs))
+  with open(os.path.join(results_dir, "benchmark.json"), 'w') as output:
+    json.dump(results, output, indent=2, sort_keys=True)
+  return results
+
+def find_regressions(baseline, results, tolerance=0.1):
+  '''
+  Compare benchmark results with a baseline (both as written by
+  run_benchmark). Return a (topology, size, metric, baseline value, value)
+  tuple for each throughput metric of each case run in both that dropped by
+  more than the given fraction.
+  '''
+  case2baseline = dict(((c['topology'], c['size']), c)
+                       for c in baseline['cases'])
+  regressions = []
+  for case in results['cases']:
+    key = (case['topology'], case['size'])
+    if key not in case2baseline:
+      continue
+    for metric in throughput_metrics:
+      old = case2baseline[key][metric]
+      if case[metric] < old * (1.0 - tolerance):
+        regressions.append(key + (metric, old, case[metric]))
+  return regressions
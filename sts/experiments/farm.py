@@ -0,0 +1,404 @@
+'''
+A fuzzing farm: runs many independent Fuzzer runs of the same experiment
+config in parallel, each in its own process with its own random seed and its
+own range of controller ports, and collects their invariant violations into
+one results tree.
+
+Results tree:
+  <results_dir>/runs/run_<n>/       the results dir of each run (superlog,
+                                    replay and MCS configs, simulator.out),
+                                    plus farm_run.json (seed, ports, rounds)
+  <results_dir>/violations.json     the distinct violations found, see
+                                    ViolationIndex
+  <results_dir>/violations/<id>/    one directory per distinct violation,
+                                    holding its violation.json and a copy of
+                                    the superlog and configs of the first run
+                                    that found it
+
+Violations are deduplicated by the invariant that was checked and the
+violation signature: the set of violations the check reported. Runs are
+independent processes that share nothing, so rounds per second scale with
+the number of workers up to the number of cores (as long as the controllers
+under test fit on the machine too).
+
+Each worker moves the config's controllers to sockets of its own (see
+isolate_controllers), since most configs hard-code their sync port and
+socket path. The farm refuses to run more than one worker at a time if the
+config can't be rewritten that way.
+'''
+
+import copy
+import glob
+import hashlib
+import itertools
+import json
+import os
+import random
+import re
+import shutil
+import signal
+import sys
+import time
+import multiprocessing
+
+import logging
+log = logging.getLogger("farm")
+
+# Files copied from a run's results dir into its violation's directory
+_violation_files = ["events.trace", "dataplane.trace", "replay_config.py",
+                    "mcs_config.py", "orig_config.py", "simulator.out"]
+
+def violation_signature(violations):
+  ''' The signature of the violations reported by one invariant check:
+  independent of their order and multiplicity '''
+  return sorted(set(str(v) for v in violations))
+
+def read_violations(superlog_path):
+  '''
+  Return the (invariant check name, violations, label, round) of each
+  InvariantViolation in the JSON superlog at superlog_path, and the last
+  round logged. The invariant check name is that of the last CheckInvariants
+  before the violation (None if there was none).
+  '''
+  violations = []
+  last_round = 0
+  invariant_check_name = None
+  if not os.path.exists(superlog_path):
+    return (violations, last_round)
+  with open(superlog_path) as superlog:
+    for line in superlog:
+      if line.strip() == "":
+        continue
+      try:
+        json_hash = json.loads(line)
+      except ValueError:
+        # The run was killed in the middle of a write
+        log.warn("Ignoring truncated line in %s" % superlog_path)
+        continue
+      last_round = max(last_round, json_hash.get('round', 0))
+      if json_hash['class'] == "CheckInvariants":
+        invariant_check_name = json_hash.get('invariant_check_name')
+      elif json_hash['class'] == "InvariantViolation":
+        violations.append((invariant_check_name, json_hash['violations'],
+                           json_hash['label'], json_hash.get('round', -1)))
+  return (violations, last_round)
+
+def run_trace_dirs(run_dir):
+  '''
+  Return (trace dir, prefix round) for each trace recorded by the Fuzzer run
+  in run_dir. If the prefix round is not None, the trace starts with a copy
+  of another's up to that round: only the rounds after it were run in it.
+  '''
+  # A CoverageGuidedFuzzer records each epoch after the first in its own
+  # subdirectory, a BranchingFuzzer each branch it explores
+  trace_dirs = ([run_dir] +
+                sorted(glob.glob(os.path.join(run_dir, "epoch_*"))) +
+                sorted(glob.glob(os.path.join(run_dir, "checkpoint_*",
+                                              "branch_*"))))
+  result = []
+  for trace_dir in trace_dirs:
+    prefix_round = None
+    # Branch traces start with a copy of the main run's, up to the
+    # checkpoint
+    checkpoint = re.search(r'checkpoint_(\d+)/branch_\d+$', trace_dir)
+    if checkpoint:
+      prefix_round = int(checkpoint.group(1))
+    result.append((trace_dir, prefix_round))
+  return result
+
+def read_run_violations(run_dir):
+  '''
+  Return the (invariant check name, violations, trace dir) of each
+  InvariantViolation found by the Fuzzer run in run_dir, and the number of
+  rounds it ran.
+  '''
+  violations = []
+  rounds = 0
+  for (trace_dir, prefix_round) in run_trace_dirs(run_dir):
+    (trace_violations, trace_rounds) = \
+        read_violations(os.path.join(trace_dir, "events.trace"))
+    if prefix_round is not None:
+      trace_violations = [ v for v in trace_violations
+                           if v[3] > prefix_round ]
+      trace_rounds = max(0, trace_rounds - prefix_round)
+    violations += [ (invariant, v, trace_dir)
+                    for (invariant, v, _, _) in trace_violations ]
+    rounds += trace_rounds
+  return (violations, rounds)
+
+class ViolationIndex(object):
+  '''
+  The distinct violations found so far. Each is a dict with keys:
+    id:         a short hash of the invariant and signature
+    invariant:  the name of the invariant check
+    signature:  see violation_signature
+    count:      the number of runs that found it
+    runs:       the results dirs of those runs (the epoch or branch dirs, for
+                coverage-guided or branching runs)
+  '''
+  def __init__(self):
+    self.violations = []
+    self._id2violation = {}
+
+  @staticmethod
+  def violation_id(invariant, signature):
+    return hashlib.sha1(json.dumps([invariant, signature])).hexdigest()[:12]
+
+  def add(self, invariant, violations, run_dir):
+    ''' Record that the run in run_dir found violations. Return (violation,
+    whether it is new) '''
+    signature = violation_signature(violations)
+    violation_id = self.violation_id(invariant, signature)
+    if violation_id in self._id2violation:
+      violation = self._id2violation[violation_id]
+      if run_dir not in violation['runs']:
+        violation['count'] += 1
+        violation['runs'].append(run_dir)
+      return (violation, False)
+    violation = { 'id' : violation_id, 'invariant' : invariant,
+                  'signature' : signature, 'count' : 1, 'runs' : [run_dir] }
+    self.violations.append(violation)
+    self._id2violation[violation_id] = violation
+    return (violation, True)
+
+  def dump(self, path):
+    with open(path, 'w') as output:
+      json.dump(self.violations, output, indent=2, sort_keys=True)
+
+def _import_config(config_name):
+  ''' Import config_name, as simulator.py does '''
+  if config_name.endswith('.py'):
+    config_name = config_name[:-3].replace("/", ".")
+  try:
+    return __import__(config_name, globals(), locals(), ["*"])
+  except ImportError as e:
+    try:
+      return __import__("config.%s" % config_name, globals(), locals(), ["*"])
+    except ImportError:
+      raise e
+
+def isolate_controllers(controller_configs, port_base):
+  '''
+  Move the controllers to the sockets of the worker slot starting at
+  port_base: ports from ControllerConfig._port_gen (which the caller points
+  at port_base), and Unix domain socket paths suffixed with port_base. See
+  ControllerConfig.relocate.
+  '''
+  from config.experiment_config_lib import ControllerConfig
+  for controller_config in controller_configs:
+    controller_config.relocate(ControllerConfig._port_gen, "_%d" % port_base)
+
+def _check_isolation(config_name, pipe):
+  ''' Body of check_isolation's process '''
+  from config.experiment_config_lib import ControllerConfig
+  error = None
+  try:
+    config = _import_config(config_name)
+    for controller_config in config.control_flow.simulation_cfg.controller_configs:
+      copy.copy(controller_config).relocate(ControllerConfig._port_gen, "_0")
+  except Exception as e:
+    error = "%s: %s" % (type(e).__name__, e)
+  pipe.send(error)
+  pipe.close()
+
+def check_isolation(config_name):
+  '''
+  Raise ValueError if the controllers of config_name can't be moved to
+  sockets of their own for each worker, so that parallel runs would share
+  them. The config is imported in a separate process, so that the workers
+  (forked from this one) still import it afresh.
+  '''
+  (receiver, sender) = multiprocessing.Pipe(False)
+  process = multiprocessing.Process(target=_check_isolation,
+                                    args=(config_name, sender))
+  process.start()
+  error = receiver.recv() if receiver.poll(60) else "no answer"
+  process.join()
+  if error is not None:
+    raise ValueError("Cannot give parallel runs of %s sockets of their own "
+                     "(%s); run a single worker" % (config_name, error))
+
+def run_fuzzer(config_name, results_dir, seed, port_base, verbose=False,
+               fuzzer_params=None, steps=None):
+  '''
+  Body of a farm worker process: run the control flow of config_name once,
+  with the given random seed, writing results to results_dir. Controllers are
+  moved to ports from port_base upward, and socket paths of their own (see
+  isolate_controllers). Exits the process with the simulation's exit code.
+
+  fuzzer_params, if given, is a dict of fuzzer parameters (see
+  config/fuzzer_params.py) overriding the config's, and steps the number of
+  rounds to run (for a CoverageGuidedFuzzer: the number of rounds of epochs).
+  '''
+  # Imported here: the farm itself never boots a simulation
+  from config.experiment_config_lib import ControllerConfig
+  import sts.experiments.setup as experiment_setup
+
+  # The config creates its ControllerConfigs (and so picks ports) on import
+  ControllerConfig._port_gen = itertools.count(port_base)
+  config = _import_config(config_name)
+  isolate_controllers(config.control_flow.simulation_cfg.controller_configs,
+                      port_base)
+  config.results_dir = results_dir
+  config.exp_name = os.path.basename(results_dir)
+  config.timestamp_results = False
+  setup_args = type("FarmArgs", (object,), { 'exp_name' : None,
+                                             'timestamp_results' : None,
+                                             'publish' : False })
+  experiment_setup.setup_experiment(setup_args, config)
+  logging.basicConfig(level=logging.DEBUG if verbose else logging.INFO)
+
+  simulator = config.control_flow
+  if hasattr(simulator, "random"):
+    simulator.random_seed = seed
+    # Shared with the Fuzzer's TrafficGenerator
+    simulator.random.seed(seed)
+  if fuzzer_params is not None:
+    for (name, value) in fuzzer_params.iteritems():
+      setattr(simulator.params, name, value)
+  if steps is not None:
+    if hasattr(simulator, "max_epochs"):
+      simulator.max_epochs = max(1, steps / simulator.epoch_rounds)
+    else:
+      simulator.steps = steps
+
+  # The farm terminates its workers when it is interrupted
+  def handle_term(signum, frame):
+    if simulator.simulation_cfg.current_simulation is not None:
+      simulator.simulation_cfg.current_simulation.clean_up()
+    sys.exit(13)
+  signal.signal(signal.SIGTERM, handle_term)
+
+  exit_code = 1
+  try:
+    simulator.init_results(results_dir)
+    simulation = simulator.simulate()
+    exit_code = simulation.exit_code
+  finally:
+    if simulator.simulation_cfg.current_simulation is not None:
+      simulator.simulation_cfg.current_simulation.clean_up()
+  sys.exit(exit_code)
+
+class FuzzerFarm(object):
+  '''
+  Runs num_runs Fuzzer runs of config_name, at most num_workers at a time.
+  Run n uses random seed base_seed + n. Worker slot i gives its controllers
+  ports from base_port + i * ports_per_worker upward.
+  '''
+  def __init__(self, config_name, results_dir, num_workers=None, num_runs=None,
+               base_seed=None, base_port=6633, ports_per_worker=100,
+               verbose=False, run_target=run_fuzzer):
+    if num_workers is None:
+      num_workers = multiprocessing.cpu_count()
+    if base_seed is None:
+      base_seed = random.randint(0, sys.maxint / 2)
+    self.config_name = config_name
+    self.results_dir = results_dir
+    self.num_workers = num_workers
+    # None means: run until interrupted
+    self.num_runs = num_runs
+    self.base_seed = base_seed
+    self.base_port = base_port
+    self.ports_per_worker = ports_per_worker
+    self.verbose = verbose
+    self.run_target = run_target
+    self.violation_index = ViolationIndex()
+    self.runs_completed = 0
+    self.total_rounds = 0
+    self.start_time = None
+
+  def run_dir(self, run):
+    return os.path.join(self.results_dir, "runs", "run_%d" % run)
+
+  def _start(self, run, slot):
+    run_dir = self.run_dir(run)
+    os.makedirs(run_dir)
+    seed = self.base_seed + run
+    port_base = self.base_port + slot * self.ports_per_worker
+    with open(os.path.join(run_dir, "farm_run.json"), 'w') as output:
+      json.dump({ 'seed' : seed, 'port_base' : port_base,
+                  'config' : self.config_name }, output)
+    process = multiprocessing.Process(target=self.run_target,
+                                      args=(self.config_name, run_dir, seed,
+                                            port_base, self.verbose),
+                                      name="farm_run_%d" % run)
+    process.start()
+    log.info("Started run %d (seed %d, ports %d+) [PID %d]" %
+             (run, seed, port_base, process.pid))
+    return process
+
+  def _finish(self, run, process):
+    ''' Collect the results of a finished run '''
+    run_dir = self.run_dir(run)
+    (violations, rounds) = read_run_violations(run_dir)
+    self.runs_completed += 1
+    self.total_rounds += rounds
+    run_info_path = os.path.join(run_dir, "farm_run.json")
+    with open(run_info_path) as run_info_file:
+      run_info = json.load(run_info_file)
+    run_info.update({ 'exit_code' : process.exitcode, 'rounds' : rounds,
+                      'violations' : len(violations) })
+    with open(run_info_path, 'w') as output:
+      json.dump(run_info, output)
+
+    for (invariant, run_violations, trace_dir) in violations:
+      (violation, new) = self.violation_index.add(invariant, run_violations,
+                                                  trace_dir)
+      if new:
+        log.info("Run %d found a new violation %s of %s: %s" %
+                 (run, violation['id'], invariant,
+                  violation['signature']))
+        self._save_violation(violation, trace_dir)
+    self.violation_index.dump(os.path.join(self.results_dir,
+                                           "violations.json"))
+
+  def _save_violation(self, violation, run_dir):
+    violation_dir = os.path.join(self.results_dir, "violations",
+                                 violation['id'])
+    os.makedirs(violation_dir)
+    for name in _violation_files:
+      path = os.path.join(run_dir, name)
+      if os.path.exists(path):
+        shutil.copy(path, violation_dir)
+    with open(os.path.join(violation_dir, "violation.json"), 'w') as output:
+      json.dump(violation, output, indent=2, sort_keys=True)
+
+  @property
+  def rounds_per_second(self):
+    elapsed = time.time() - self.start_time
+    return self.total_rounds / elapsed if elapsed > 0 else 0.0
+
+  def run(self, poll_interval=0.5):
+    ''' Run the farm. Return the ViolationIndex '''
+    # (Other run targets, e.g. in tests, don't boot controllers)
+    if self.num_workers > 1 and self.run_target is run_fuzzer:
+      check_isolation(self.config_name)
+    self.start_time = time.time()
+    next_run = 0
+    # slot -> (run, process)
+    running = {}
+    try:
+      while True:
+        for slot in range(self.num_workers):
+          if (slot not in running and
+              (self.num_runs is None or next_run < self.num_runs)):
+            running[slot] = (next_run, self._start(next_run, slot))
+            next_run += 1
+        if not running:
+          break
+        time.sleep(poll_interval)
+        for (slot, (run, process)) in running.items():
+          if not process.is_alive():
+            process.join()
+            del running[slot]
+            self._finish(run, process)
+            log.info("%d runs completed, %d distinct violations, %.1f rounds/s" %
+                     (self.runs_completed,
+                      len(self.violation_index.violations),
+                      self.rounds_per_second))
+    finally:
+      for (run, process) in running.values():
+        if process.is_alive():
+          process.terminate()
+        process.join()
+    return self.violation_index
@@ -0,0 +1,385 @@
+'''
+Automatic tuning of the Fuzzer's parameters (see config/fuzzer_params.py).
+
+Runs short fuzzing episodes of an experiment config with different vectors of
+fuzzer parameters, and keeps the vector that finds the most per wall-clock
+second. Candidates are chosen by successive halving, a bandit over randomly
+sampled vectors (plus the base vector: the parameters the config's Fuzzer
+loads, unchanged): in each stage every surviving candidate runs one more
+episode, and the best 1/eta of them go on to the next stage, until one is
+left. All candidates of a stage run with the same random seed, so that they
+are compared on the same traffic and failure draws as far as their
+parameters allow.
+
+An episode is scored by what it found per second:
+  - violations: the distinct invariant violations (as in the farm: by
+    invariant and violation signature)
+  - coverage: the controller states covered, for a CoverageGuidedFuzzer
+    (read from its coverage.json)
+Candidates are ranked by their total over all their episodes divided by the
+total time of those episodes, ties (e.g. no violations found by any) broken
+by how much they exercised the network: the number of distinct kinds of
+fuzzed inputs they injected, then fuzzed inputs injected per second. Seconds
+include booting the controllers, so parameter vectors that keep crashing (or
+that freeze the network until an episode times out) are penalized.
+
+Results tree:
+  <results_dir>/episodes/episode_<n>/   the results dir of each episode,
+                                        plus episode.json (candidate, seed,
+                                        ports, score)
+  <results_dir>/tuning.json             the candidates and their scores
+  <results_dir>/fuzzer_params.py        the base parameters, with the best
+                                        candidate's values
+'''
+
+from sts.experiments.farm import (read_run_violations, violation_signature,
+                                  run_trace_dirs, run_fuzzer, check_isolation,
+                                  _import_config)
+
+import json
+import math
+import os
+import random
+import sys
+import time
+import multiprocessing
+
+import logging
+log = logging.getLogger("tuning")
+
+# Parameters tuned by default, and the bounds they are sampled from
+# (log-uniformly)
+default_space = {
+  'switch_failure_rate' : (0.001, 0.5),
+  'switch_recovery_rate' : (0.01, 1.0),
+  'link_failure_rate' : (0.001, 0.5),
+  'link_recovery_rate' : (0.01, 1.0),
+  'controller_crash_rate' : (0.0001, 0.05),
+  'controller_recovery_rate' : (0.01, 1.0),
+  'dataplane_drop_rate' : (0.001, 0.3),
+  'traffic_generation_rate' : (0.01, 1.0),
+  'host_migration_rate' : (0.001, 0.3),
+}
+
+metrics = ["violations", "coverage"]
+
+# The inputs the Fuzzer injects at the rates set by its parameters. Others
+# (e.g. CheckInvariants, WaitTime) are logged whatever the parameters.
+fuzzed_inputs = ["SwitchFailure", "SwitchRecovery", "LinkFailure",
+                 "LinkRecovery", "ControllerFailure", "ControllerRecovery",
+                 "HostMigration", "TrafficInjection", "ControlChannelBlock",
+                 "ControlChannelUnblock", "DataplaneDrop", "LinkDiscovery"]
+
+def sample_parameters(space, random):
+  ''' Draw a parameter vector: each parameter log-uniformly between its
+  bounds, to 3 significant digits '''
+  params = {}
+  for (name, (low, high)) in sorted(space.iteritems()):
+    value = math.exp(random.uniform(math.log(low), math.log(high)))
+    params[name] = float("%.3g" % value)
+  return params
+
+def _read_fuzzer_config(config_name, pipe):
+  ''' Body of read_fuzzer_config's process '''
+  try:
+    simulator = _import_config(config_name).control_flow
+    params = dict((name, value)
+                  for (name, value) in vars(simulator.params).iteritems()
+                  if not name.startswith("_") and
+                     type(value) in (int, float))
+    # The Fuzzer generates no random traffic if it replays a dataplane trace
+    # or generates traffic matrices
+    ignored = []
+    if (simulator.simulation_cfg._dataplane_trace_path is not None or
+        getattr(simulator, "matrix_traffic_generator", None) is not None):
+      ignored.append('traffic_generation_rate')
+    result = (params, ignored)
+  except Exception as e:
+    result = "%s: %s" % (type(e).__name__, e)
+  pipe.send(result)
+  pipe.close()
+
+def read_fuzzer_config(config_name):
+  '''
+  Return the fuzzer parameters (see config/fuzzer_params.py) that the Fuzzer
+  of config_name runs with, as a dict, and the names of those it ignores. The
+  config is imported in a separate process, as in check_isolation.
+  '''
+  (receiver, sender) = multiprocessing.Pipe(False)
+  process = multiprocessing.Process(target=_read_fuzzer_config,
+                                    args=(config_name, sender))
+  process.start()
+  result = receiver.recv() if receiver.poll(60) else "no answer"
+  process.join()
+  if type(result) == str:
+    raise ValueError("Cannot read the fuzzer parameters of %s (%s)" %
+                     (config_name, result))
+  return result
+
+def read_run_activity(run_dir):
+  ''' Return the number of fuzzed inputs injected by the Fuzzer run in
+  run_dir, and the names of their classes '''
+  inputs = 0
+  input_types = set()
+  for (trace_dir, prefix_round) in run_trace_dirs(run_dir):
+    superlog_path = os.path.join(trace_dir, "events.trace")
+    if not os.path.exists(superlog_path):
+      continue
+    with open(superlog_path) as superlog:
+      for line in superlog:
+        try:
+          json_hash = json.loads(line)
+        except ValueError:
+          # Blank, or the run was killed in the middle of a write
+          continue
+        if json_hash['class'] not in fuzzed_inputs:
+          continue
+        if (prefix_round is not None and
+            json_hash.get('round', -1) <= prefix_round):
+          continue
+        # A TrafficInjection (or DataplaneDrop) may stand for several
+        inputs += json_hash.get('count', 1)
+        input_types.add(json_hash['class'])
+  return (inputs, sorted(input_types))
+
+def write_fuzzer_params(path, params, comment=None):
+  ''' Write params in the format of config/fuzzer_params.py '''
+  with open(path, 'w') as output:
+    if comment is not None:
+      output.write("# %s\n" % comment)
+    for name in sorted(params.keys()):
+      output.write("%s = %r\n" % (name, params[name]))
+
+def score_episode(episode_dir, seconds, metric="violations"):
+  ''' Return the score of the episode recorded in episode_dir, which took
+  seconds '''
+  (violations, rounds) = read_run_violations(episode_dir)
+  distinct = set((invariant, tuple(violation_signature(v)))
+                 for (invariant, v, _) in violations)
+  (inputs, input_types) = read_run_activity(episode_dir)
+  coverage = 0
+  coverage_path = os.path.join(episode_dir, "coverage.json")
+  if os.path.exists(coverage_path):
+    with open(coverage_path) as coverage_file:
+      coverage = json.load(coverage_file)['coverage']
+  return { 'violations' : len(distinct),
+           'coverage' : coverage,
+           'found' : len(distinct) if metric == "violations" else coverage,
+           'rounds' : rounds,
+           'inputs' : inputs,
+           'input_types' : input_types,
+           'seconds' : seconds }
+
+class Candidate(object):
+  ''' A parameter vector, and the episodes it has run '''
+  def __init__(self, id, params):
+    self.id = id
+    self.params = params
+    self.episodes = []
+
+  @property
+  def seconds(self):
+    return sum(e['seconds'] for e in self.episodes)
+
+  def _rate(self, key):
+    seconds = self.seconds
+    if seconds <= 0:
+      return 0.0
+    return sum(e[key] for e in self.episodes) / seconds
+
+  @property
+  def score(self):
+    ''' Found per second '''
+    return self._rate('found')
+
+  @property
+  def rounds_per_second(self):
+    return self._rate('rounds')
+
+  @property
+  def inputs_per_second(self):
+    return self._rate('inputs')
+
+  @property
+  def input_types(self):
+    ''' The kinds of fuzzed inputs injected in any episode '''
+    return set(t for e in self.episodes for t in e['input_types'])
+
+  def rank(self):
+    return (self.score, len(self.input_types), self.inputs_per_second)
+
+  def to_json(self):
+    return { 'id' : self.id, 'params' : self.params,
+             'episodes' : self.episodes, 'score' : self.score,
+             'rounds_per_second' : self.rounds_per_second,
+             'inputs_per_second' : self.inputs_per_second }
+
+class ParameterTuner(object):
+  '''
+  Tunes the fuzzer parameters of config_name by successive halving over
+  num_candidates parameter vectors (the first is the base vector, which the
+  config's Fuzzer loads; see read_fuzzer_config). Only the parameters in
+  space are tuned, less those the Fuzzer ignores (traffic_generation_rate,
+  if it generates no random traffic); the others are left as the config sets
+  them. Each episode runs episode_rounds rounds, or until episode_timeout
+  seconds have passed.
+
+  At most num_workers episodes run at a time, as in FuzzerFarm: worker slot i
+  gives its controllers ports from base_port + i * ports_per_worker upward.
+  Note that episodes running in parallel compete for the CPU, so num_workers
+  should leave room for the controllers under test.
+
+  config_reader is called as read_fuzzer_config is.
+  '''
+  def __init__(self, config_name, results_dir, space=default_space,
+               num_candidates=16, eta=2, episode_rounds=100,
+               episode_timeout=None, metric="violations", num_workers=None,
+               base_seed=None, base_port=6633, ports_per_worker=100,
+               verbose=False, run_target=run_fuzzer,
+               config_reader=read_fuzzer_config, clock=time.time):
+    if metric not in metrics:
+      raise ValueError("Unknown metric %s" % metric)
+    if eta <= 1:
+      raise ValueError("eta must be greater than 1")
+    if num_workers is None:
+      num_workers = multiprocessing.cpu_count()
+    if base_seed is None:
+      base_seed = random.randint(0, sys.maxint / 2)
+    self.config_name = config_name
+    self.results_dir = results_dir
+    self.space = space
+    self.num_candidates = num_candidates
+    self.eta = eta
+    self.episode_rounds = episode_rounds
+    self.episode_timeout = episode_timeout
+    self.metric = metric
+    # Read when the tuner is run
+    self.base_params = None
+    self.num_workers = num_workers
+    self.base_seed = base_seed
+    self.base_port = base_port
+    self.ports_per_worker = ports_per_worker
+    self.verbose = verbose
+    self.run_target = run_target
+    self.config_reader = config_reader
+    self.clock = clock
+    self.random = random.Random(base_seed)
+    self.candidates = []
+    self.episodes_run = 0
+
+  def episode_dir(self, episode):
+    return os.path.join(self.results_dir, "episodes", "episode_%d" % episode)
+
+  def _start(self, candidate, seed, slot):
+    episode = self.episodes_run
+    self.episodes_run += 1
+    episode_dir = self.episode_dir(episode)
+    os.makedirs(episode_dir)
+    port_base = self.base_port + slot * self.ports_per_worker
+    process = multiprocessing.Process(target=self.run_target,
+                                      args=(self.config_name, episode_dir,
+                                            seed, port_base, self.verbose,
+                                            candidate.params,
+                                            self.episode_rounds),
+                                      name="tuning_episode_%d" % episode)
+    start = self.clock()
+    process.start()
+    log.info("Started episode %d of candidate %d (seed %d, ports %d+) "
+             "[PID %d]" % (episode, candidate.id, seed, port_base,
+                           process.pid))
+    return (episode, candidate, seed, port_base, process, start)
+
+  def _finish(self, episode, candidate, seed, port_base, process, start):
+    seconds = self.clock() - start
+    episode_dir = self.episode_dir(episode)
+    result = score_episode(episode_dir, seconds, metric=self.metric)
+    result.update({ 'episode' : episode, 'seed' : seed,
+                    'exit_code' : process.exitcode })
+    candidate.episodes.append(result)
+    with open(os.path.join(episode_dir, "episode.json"), 'w') as output:
+      json.dump({ 'candidate' : candidate.id, 'params' : candidate.params,
+                  'port_base' : port_base, 'config' : self.config_name,
+                  'result' : result }, output, indent=2, sort_keys=True)
+    log.info("Episode %d of candidate %d: %d %s in %d rounds, %.1fs" %
+             (episode, candidate.id, result['found'], self.metric,
+              result['rounds'], seconds))
+
+  def _run_stage(self, candidates, seed, poll_interval):
+    ''' Run one episode of each candidate '''
+    pending = list(candidates)
+    # slot -> the arguments of _finish
+    running = {}
+    try:
+      while pending or running:
+        for slot in range(self.num_workers):
+          if slot not in running and pending:
+            running[slot] = self._start(pending.pop(0), seed, slot)
+        time.sleep(poll_interval)
+        for (slot, episode) in running.items():
+          process = episode[4]
+          timed_out = (self.episode_timeout is not None and
+                       self.clock() - episode[5] > self.episode_timeout)
+          if timed_out and process.is_alive():
+            log.info("Episode %d timed out" % episode[0])
+            process.terminate()
+          if not process.is_alive():
+            process.join()
+            del running[slot]
+            self._finish(*episode)
+    finally:
+      for episode in running.values():
+        process = episode[4]
+        if process.is_alive():
+          process.terminate()
+        process.join()
+
+  def dump(self, best=None):
+    with open(os.path.join(self.results_dir, "tuning.json"), 'w') as output:
+      json.dump({ 'config' : self.config_name,
+                  'metric' : self.metric,
+                  'episode_rounds' : self.episode_rounds,
+                  'base_seed' : self.base_seed,
+                  'best' : best.id if best is not None else None,
+                  'candidates' : [ c.to_json() for c in self.candidates ] },
+                output, indent=2, sort_keys=True)
+
+  def run(self, poll_interval=0.5):
+    ''' Run the tuner. Return the best Candidate '''
+    # (Other run targets, e.g. in tests, don't boot controllers)
+    if self.num_workers > 1 and self.run_target is run_fuzzer:
+      check_isolation(self.config_name)
+    (self.base_params, ignored) = self.config_reader(self.config_name)
+    space = dict((name, bounds) for (name, bounds) in self.space.iteritems()
+                 if name not in ignored)
+    if not os.path.exists(self.results_dir):
+      os.makedirs(self.results_dir)
+    base = dict((name, self.base_params[name]) for name in space
+                if name in self.base_params)
+    self.candidates = [Candidate(0, base)]
+    for i in range(1, self.num_candidates):
+      self.candidates.append(Candidate(i, sample_parameters(space,
+                                                            self.random)))
+    survivors = list(self.candidates)
+    stage = 0
+    while True:
+      log.info("Stage %d: %d candidates" % (stage, len(survivors)))
+      self._run_stage(survivors, self.base_seed + stage, poll_interval)
+      survivors.sort(key=lambda c: c.rank(), reverse=True)
+      survivors = survivors[:int(math.ceil(len(survivors) /
+                                           float(self.eta)))]
+      self.dump()
+      if len(survivors) <= 1:
+        break
+      stage += 1
+    best = survivors[0]
+    self.dump(best=best)
+    params = dict(self.base_params)
+    params.update(best.params)
+    write_fuzzer_params(os.path.join(self.results_dir, "fuzzer_params.py"),
+                        params,
+                        comment="Tuned for %s: candidate %d, %.4f per second" %
+                                (self.metric, best.id, best.score))
+    log.info("Best candidate %d: %.4f %s per second, %.1f rounds/s: %s" %
+             (best.id, best.score, self.metric, best.rounds_per_second,
+              best.params))
+    return best
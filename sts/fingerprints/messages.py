@@ -101,6 +101,11 @@ class OFFingerprint(Fingerprint):
       field2value[field] = value
     return OFFingerprint(field2value)
 
+  @property
+  def ofp_type(self):
+    ''' The name of the message type, e.g. "ofp_flow_mod" '''
+    return self._field2value["class"]
+
   def human_str(self):
     return "%s: " % self._field2value["class"] + \
         ", ".join("%s=%s" % (k, v) for (k,v) in self._field2value.iteritems() if k != "class" )
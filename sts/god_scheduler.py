@@ -1,6 +1,8 @@
 from collections import defaultdict, namedtuple
+import time
 from sts.fingerprints.messages import *
 import sts.replay_event
+from sts.log_processing.openflow_sidelog import RECEIVE, SEND
 from pox.lib.revent import Event, EventMixin
 import logging
 log = logging.getLogger("god_scheduler")
@@ -30,13 +32,13 @@ class GodScheduler(EventMixin):
     self.pendingreceive2conn_messages = defaultdict(list)
     # { pending send -> [(connection, pending ofp)_1, (connection, pending ofp)_2, ...] }
     self.pendingsend2conn_messages = defaultdict(list)
+    # Optional sts.log_processing.openflow_sidelog.OpenFlowSideLogWriter for
+    # the raw messages that are let through
+    self.openflow_sidelog = None
 
   def _pass_through_handler(self, message_event):
     ''' handler for pass-through mode '''
     pending_message = message_event.pending_message
-    # Pass through
-    self.schedule(pending_message)
-    # Record
     if message_event.send_event:
       replay_event_class = sts.replay_event.ControlMessageSend
     else:
@@ -45,6 +47,9 @@ class GodScheduler(EventMixin):
     replay_event = replay_event_class(pending_message.dpid,
                                       pending_message.controller_id,
                                       pending_message.fingerprint)
+    # Pass through
+    self.schedule(pending_message, label=replay_event.label)
+    # Record
     self.passed_through_events.append(replay_event)
 
   def set_pass_through(self):
@@ -73,10 +78,12 @@ class GodScheduler(EventMixin):
     '''
     return pending_message in self.pendingsend2conn_messages
 
-  def schedule(self, pending_message):
+  def schedule(self, pending_message, label=None):
     '''
     Cause the switch to process the pending message associated with
-    the fingerprint and controller connection.
+    the fingerprint and controller connection. label is the label of the
+    replay event logged for the message, recorded in the OpenFlow side-log
+    (if any).
     '''
     receive = type(pending_message) == PendingReceive
     if receive:
@@ -91,6 +98,11 @@ class GodScheduler(EventMixin):
     # Avoid memory leak:
     if multiset[pending_message] == []:
       del multiset[pending_message]
+    if self.openflow_sidelog is not None:
+      self.openflow_sidelog.write(label, pending_message.dpid,
+                                  pending_message.controller_id,
+                                  RECEIVE if receive else SEND, message,
+                                  time.time())
     if receive:
       conn.allow_message_receipt(message)
     else:
@@ -9,7 +9,10 @@
 #include "parse.h"
 #include "data.h"
 #include <dirent.h>
+#include <fcntl.h>
 #include <limits.h>
+#include <sys/mman.h>
+#include <unistd.h>
 
 #define MAX_ARR_SIZE 1024
 #define MAX_PREFIX 255
@@ -91,9 +94,132 @@ read_deps (char *s)
 }
 
 
+/* Binary TF files, as written by TF.save_binary_object_to_file() in
+   sts/headerspace/headerspace/tf.py. Keep these in sync. All integers are
+   little-endian. */
+#define TF_BIN_MAGIC "HSATFB\0\0"
+#define TF_BIN_VERSION 1
+
+enum { TF_BIN_LINK, TF_BIN_FWD, TF_BIN_RW };
+
+struct PACKED tf_bin_hdr {
+  char magic[8];
+  uint32_t version, len, flags, next_id;
+  uint32_t nrules, ndeps, narrs, nints;
+  uint32_t prefix, nibbles_ofs, nnibbles;
+  uint32_t rules_ofs, deps_ofs, arrs_ofs, ints_ofs, strs_ofs, strs_len;
+};
+
+struct PACKED tf_bin_rule {
+  uint32_t action;
+  uint32_t in_ofs, in_n, out_ofs, out_n;
+  /* Array index + 1, or 0 for none. */
+  uint32_t match, mask, rewrite, inv_match, inv_rewrite;
+  uint32_t deps_ofs, deps_n, influence_ofs, influence_n, lines_ofs, lines_n;
+  /* String offset + 1, or 0 for none. */
+  uint32_t file, id;
+};
+
+struct PACKED tf_bin_dep {
+  uint32_t rule, match, ports_ofs, ports_n;
+};
+
+static bool
+is_tf_bin (const char *name)
+{
+  char magic[sizeof TF_BIN_MAGIC - 1];
+  FILE *in = fopen (name, "r");
+  if (!in) err (1, "Can't read file \"%s\"", name);
+  bool res = fread (magic, sizeof magic, 1, in) == 1 &&
+             !memcmp (magic, TF_BIN_MAGIC, sizeof magic);
+  fclose (in);
+  return res;
+}
+
+/* Binary arrays are packed in python's byte order, which is the reverse of
+   ours. */
+static array_t *
+read_bin_array (const uint8_t *arrs, uint32_t idx, int len)
+{
+  if (!idx) return NULL;
+  const uint8_t *src = arrs + (idx - 1) * 2 * len;
+  array_t *res = array_create (len, BIT_UNDEF);
+  uint8_t *dst = (uint8_t *) res;
+  for (int i = 0; i < 2 * len; i++) dst[i] = src[2 * len - 1 - i];
+  return res;
+}
+
+static struct arr_ptr_uint32_t
+read_bin_ports (const uint32_t *ints, uint32_t ofs, uint32_t n)
+{
+  struct arr_ptr_uint32_t tmp = {0};
+  if (!n) return tmp;
+  ARR_ALLOC (tmp, n);
+  memcpy (ARR (tmp), ints + ofs, n * sizeof *ints);
+  qsort (ARR (tmp), n, sizeof *ints, int_cmp);
+  return tmp;
+}
+
+static struct parse_tf *
+parse_tf_bin (const char *name)
+{
+  int fd = open (name, O_RDONLY);
+  if (fd < 0) err (1, "open(%s) failed", name);
+  size_t size = lseek (fd, 0, SEEK_END);
+  const uint8_t *raw = mmap (NULL, size, PROT_READ, MAP_PRIVATE, fd, 0);
+  if (raw == MAP_FAILED) err (1, "mmap() failed");
+  close (fd);
+
+  const struct tf_bin_hdr *hdr = (const struct tf_bin_hdr *) raw;
+  if (size < sizeof *hdr || hdr->version != TF_BIN_VERSION)
+    errx (1, "Unsupported binary TF file \"%s\".", name);
+  const struct tf_bin_rule *rules = (const struct tf_bin_rule *) (raw + hdr->rules_ofs);
+  const struct tf_bin_dep *deps = (const struct tf_bin_dep *) (raw + hdr->deps_ofs);
+  const uint8_t *arrs = raw + hdr->arrs_ofs;
+  const uint32_t *ints = (const uint32_t *) (raw + hdr->ints_ofs);
+  const char *strs = (const char *) (raw + hdr->strs_ofs);
+
+  struct parse_tf *tf = xcalloc (1, sizeof *tf);
+  tf->len = hdr->len / 2; /* Convert to L */
+  /* As with the text format, an empty prefix means no prefix. */
+  if (hdr->prefix && strs[hdr->prefix - 1])
+    tf->prefix = xstrdup (strs + hdr->prefix - 1);
+
+  for (int i = 0; i < hdr->nrules; i++) {
+    const struct tf_bin_rule *br = &rules[i];
+    struct parse_rule *r = xcalloc (1, sizeof *r);
+    r->in = read_bin_ports (ints, br->in_ofs, br->in_n);
+    r->out = read_bin_ports (ints, br->out_ofs, br->out_n);
+
+    if (br->action != TF_BIN_LINK) {
+      r->match = read_bin_array (arrs, br->match, tf->len);
+      if (br->action == TF_BIN_RW) {
+        r->mask = read_bin_array (arrs, br->mask, tf->len);
+        r->rewrite = read_bin_array (arrs, br->rewrite, tf->len);
+      }
+    }
+    for (int j = 0; j < br->deps_n; j++) {
+      const struct tf_bin_dep *bd = &deps[br->deps_ofs + j];
+      struct parse_dep *tmp = xmalloc (sizeof *tmp + bd->ports_n * sizeof *ints);
+      tmp->rule = bd->rule + 1;
+      tmp->match = read_bin_array (arrs, bd->match, tf->len);
+      tmp->nports = bd->ports_n;
+      memcpy (tmp->ports, ints + bd->ports_ofs, bd->ports_n * sizeof *ints);
+      qsort (tmp->ports, tmp->nports, sizeof *ints, int_cmp);
+      list_append (&r->deps, tmp);
+    }
+    add_rule (tf, r);
+  }
+
+  munmap ((void *) raw, size);
+  return tf;
+}
+
 static struct parse_tf *
 parse_tf (const char *name)
 {
+  if (is_tf_bin (name)) return parse_tf_bin (name);
+
   FILE *in = fopen (name, "r");
   char *line = NULL;
   int len;
@@ -5,6 +5,7 @@ Created on Jan 27, 2011
 '''
 from sts.headerspace.headerspace.hs import *
 from sts.headerspace.headerspace.tf import *
+from sts.headerspace.headerspace.propagation import Propagator
 from sts.headerspace.config_parser.openflow_parser import get_uniq_port_id
 import sts.headerspace.config_parser.openflow_parser as of
 
@@ -17,7 +18,8 @@ log = logging.getLogger("headerspace")
 from collections import defaultdict
 
 # What is a p_node?
-# A hash apparently:
+# A PropagationNode (see propagation.py), which also supports the old hash
+# interface:
 #  hdr -> foo
 #  port -> foo
 #  visits -> foo
@@ -39,71 +41,31 @@ def translate_ports(ports):
     ports = port_nos
   return ports
 
-def find_reachability(NTF, TTF, edge_links, test_packet=None):
+def find_reachability(NTF, TTF, edge_links, test_packet=None, max_nodes=None):
     edge_ports = map(lambda access_link: get_uniq_port_id(access_link.switch, access_link.switch_port), edge_links)
     paths = defaultdict(list)
-    propagation = []
 
     if len(edge_ports) == 0:
       log.warn("No ports to check!")
       return []
 
+    propagator = Propagator(NTF, TTF, max_nodes=max_nodes)
     for in_port in edge_ports:
-      out_ports = list(set(edge_ports) - set([in_port]))
+      out_ports = set(edge_ports) - set([in_port])
 
       # put all-x test packet in propagation graph
       input_pkt = test_packet
       if input_pkt == None:
         input_pkt = get_all_x(NTF)
 
-      p_node = {}
-      p_node["hdr"] = input_pkt
-      p_node["port"] = in_port
-      p_node["visits"] = []
-      p_node["hs_history"] = []
-      propagation.append(p_node)
-
-      while len(propagation)>0:
-          #get the next node in propagation graph and apply it to NTF and TTF
-          log.debug("Propagation has length: %d"%len(propagation))
-          tmp_propagate = []
-          for p_node in propagation:
-              next_hp = NTF.T(p_node["hdr"],p_node["port"])
-              for (next_h,next_ps) in next_hp:
-                  for next_p in next_ps:
-                      if next_p in out_ports:
-                          reached = {}
-                          reached["hdr"] = next_h
-                          reached["port"] = next_p
-                          reached["visits"] = list(p_node["visits"])
-                          reached["visits"].append(p_node["port"])
-                          reached["hs_history"] = list(p_node["hs_history"])
-                          paths[in_port].append(reached)
-                      else:
-                          linked = TTF.T(next_h,next_p)
-                          for (linked_h,linked_ports) in linked:
-                              for linked_p in linked_ports:
-                                  new_p_node = {}
-                                  new_p_node["hdr"] = linked_h
-                                  new_p_node["port"] = linked_p
-                                  new_p_node["visits"] = list(p_node["visits"])
-                                  new_p_node["visits"].append(p_node["port"])
-                                  new_p_node["visits"].append(next_p)
-                                  new_p_node["hs_history"] = list(p_node["hs_history"])
-                                  new_p_node["hs_history"].append(p_node["hdr"])
-                                  if linked_p in out_ports:
-                                      paths[in_port].append(new_p_node)
-                                  elif linked_p in new_p_node["visits"]:
-                                      log.warn("WARNING: detected a loop - branch aborted: \nHeaderSpace: %s\n Visited Ports: %s\nLast Port %d "%(\
-                                          new_p_node["hdr"],new_p_node["visits"],new_p_node["port"]))
-                                  else:
-                                      tmp_propagate.append(new_p_node)
-          propagation = tmp_propagate
+      for (kind, p_node) in propagator.propagate(input_pkt, in_port, out_ports):
+        if kind == Propagator.REACHED:
+          paths[in_port].append(p_node)
 
+    log.debug("find_reachability: %s" % propagator.report)
     return paths
 
-# TODO(cs): highly redundant
-def find_blackholes(NTF, TTF, edge_links, test_packet=None):
+def find_blackholes(NTF, TTF, edge_links, test_packet=None, max_nodes=None):
   '''Do any switches:
        - send packets into a down link?
        - drop packets that are supposed to go out their in_port?
@@ -113,63 +75,27 @@ def find_blackholes(NTF, TTF, edge_links, test_packet=None):
   '''
   edge_ports = map(lambda access_link: get_uniq_port_id(access_link.switch, access_link.switch_port), edge_links)
   blackholes = []
-  propagation = []
 
   if len(edge_ports) == 0:
     log.warn("No ports to check!")
     return []
 
+  propagator = Propagator(NTF, TTF, max_nodes=max_nodes)
   for in_port in edge_ports:
-    out_ports = list(set(edge_ports) - set([in_port]))
+    out_ports = set(edge_ports) - set([in_port])
 
     # put all-x test packet in propagation graph
     input_pkt = test_packet
     if input_pkt == None:
       input_pkt = get_all_x(NTF)
 
-    p_node = {}
-    p_node["hdr"] = input_pkt
-    p_node["port"] = in_port
-    p_node["visits"] = []
-    p_node["hs_history"] = []
-    propagation.append(p_node)
-
-    while len(propagation)>0:
-        #get the next node in propagation graph and apply it to NTF and TTF
-        log.debug("Propagation has length: %d"%len(propagation))
-        tmp_propagate = []
-        for p_node in propagation:
-            next_hp = NTF.T(p_node["hdr"],p_node["port"])
-            propagated = False
-            for (next_h,next_ps) in next_hp:
-                propagated = True
-                for next_p in next_ps:
-                    if next_p in out_ports:
-                        pass
-                    else: # Is an internal port
-                        linked = TTF.T(next_h,next_p)
-                        for (linked_h,linked_ports) in linked:
-                            for linked_p in linked_ports:
-                                new_p_node = {}
-                                new_p_node["hdr"] = linked_h
-                                new_p_node["port"] = linked_p
-                                new_p_node["visits"] = list(p_node["visits"])
-                                new_p_node["visits"].append(p_node["port"])
-                                new_p_node["visits"].append(next_p)
-                                new_p_node["hs_history"] = list(p_node["hs_history"])
-                                new_p_node["hs_history"].append(p_node["hdr"])
-                                if linked_p in out_ports:
-                                    pass
-                                elif linked_p in new_p_node["visits"]:
-                                    log.warn("WARNING: detected a loop - branch aborted: \nHeaderSpace: %s\n Visited Ports: %s\nLast Port %d "%(\
-                                        new_p_node["hdr"],new_p_node["visits"],new_p_node["port"]))
-                                else:
-                                    tmp_propagate.append(new_p_node)
-            if not propagated and len(list(p_node["visits"])) != 0:
-              # Append a tuple: (last egress port, [preceding ports])
-              blackholes.append((next_p,list(p_node["visits"])))
-
-        propagation = tmp_propagate
+    for (kind, p_node) in propagator.propagate(input_pkt, in_port, out_ports):
+      if kind == Propagator.DEAD_END:
+        visits = p_node.visits
+        # Append a tuple: (last egress port, [preceding ports])
+        blackholes.append((visits[-1], visits))
+
+  log.debug("find_blackholes: %s" % propagator.report)
   return blackholes
 
 def get_all_x(NTF):
@@ -178,7 +104,7 @@ def get_all_x(NTF):
   test_pkt.add_hs(all_x)
   return test_pkt
 
-def detect_loop(NTF, TTF, ports, test_packet = None):
+def detect_loop(NTF, TTF, ports, test_packet=None, max_nodes=None):
     ports = list(ports)
     if len(ports) == 0:
       log.warn("No ports to check")
@@ -187,52 +113,23 @@ def detect_loop(NTF, TTF, ports, test_packet = None):
     ports = translate_ports(ports)
 
     loops = []
+    # Only ingress ports are recorded in each loop's visits
+    propagator = Propagator(NTF, TTF, max_nodes=max_nodes,
+                            record_egress_ports=False)
     for port in ports:
         log.debug("port %d is being checked"%port)
-        propagation = []
 
         # put all-x test packet in propagation graph
         test_pkt = test_packet
         if test_pkt == None:
           test_pkt = get_all_x(NTF)
 
-        p_node = {}
-        p_node["hdr"] = test_pkt
-        p_node["port"] = port
-        p_node["visits"] = []
-        p_node["hs_history"] = []
-
-        propagation.append(p_node)
-        while len(propagation)>0:
-            #get the next node in propagation graph and apply it to NTF and TTF
-            log.debug("Propagation has length: %d"%len(propagation))
-            tmp_propag = []
-            for p_node in propagation:
-                # hp is "header port"
-                next_hp = NTF.T(p_node["hdr"],p_node["port"])
-                for (next_h,next_ps) in next_hp:
-                    for next_p in next_ps:
-                        linked = TTF.T(next_h,next_p)
-                        for (linked_h,linked_ports) in linked:
-                            for linked_p in linked_ports:
-                                new_p_node = {}
-                                new_p_node["hdr"] = linked_h
-                                new_p_node["port"] = linked_p
-                                new_p_node["visits"] = list(p_node["visits"])
-                                new_p_node["visits"].append(p_node["port"])
-                                #new_p_node["visits"].append(next_p)
-                                new_p_node["hs_history"] = list(p_node["hs_history"])
-                                new_p_node["hs_history"].append(p_node["hdr"])
-                                #print new_p_node
-                                if len(new_p_node["visits"]) > 0 and new_p_node["visits"][0] == linked_p:
-                                    loops.append(new_p_node)
-                                    log.warn("loop detected")
-                                elif linked_p in new_p_node["visits"]:
-                                    if (linked_p not in ports):
-                                        print "WARNING: detected a loop whose port is not in checked ports - branch aborted:"
-                                else:
-                                    tmp_propag.append(new_p_node)
-            propagation = tmp_propag
+        for (kind, p_node) in propagator.propagate(test_pkt, port, detect_loops=True):
+            if kind == Propagator.LOOP:
+                loops.append(p_node)
+                log.warn("loop detected")
+
+    log.debug("detect_loop: %s" % propagator.report)
     return loops
 
 # TODO(cs): make this a parameter
@@ -250,10 +147,10 @@ def prepare_hassel_c(name_tf_pairs, TTF):
   for path in old_tfs:
     os.unlink(path)
 
-  # Write out TF for each switch, and TTF to object files
+  # Write out TF for each switch, and TTF to (binary) object files
   for name, tf in name_tf_pairs:
-    tf.save_object_to_file(HASSEL_TF_PATH + "/" + name + ".tf")
-  TTF.save_object_to_file(HASSEL_TF_PATH + "/topology.tf")
+    tf.save_binary_object_to_file(HASSEL_TF_PATH + "/" + name + ".tf")
+  TTF.save_binary_object_to_file(HASSEL_TF_PATH + "/topology.tf")
 
   # Generate the .dat file
   # Make sure we're in the right cwd
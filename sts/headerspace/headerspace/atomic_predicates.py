@@ -0,0 +1,300 @@
+'''
+Reachability over atomic predicates.
+
+The atomic predicates of a set of wildcard matches are the coarsest partition
+of the header space such that every match is a union of partition members
+("atoms"). All headers within an atom are forwarded identically by every
+rule, so each rule can be represented by the set of atoms it matches -- here
+an integer bitmask of atom IDs -- and reachability for every header at once
+becomes a graph search over bitmask intersections and unions, instead of
+pushing headerspaces through the network.
+
+Only forwarding rules are supported: a rewrite would move headers from one
+atom into another. Like TF.T, forwarding rules are applied independently of
+each other (no priority shadowing).
+'''
+
+from sts.headerspace.headerspace.hs import byte_array_get_all_x, byte_array_intersect
+
+import collections
+import logging
+log = logging.getLogger("headerspace")
+
+def cube_minus(a, b):
+  '''
+  Return a list of pairwise disjoint wildcard expressions ("cubes") whose
+  union is a - b.
+  '''
+  if len(byte_array_intersect(a, b)) == 0:
+    return [a]
+  result = []
+  current = bytearray(a)
+  for i in range(len(a)):
+    for j in range(4):
+      a_bit = (current[i] >> 2*j) & 0x03
+      b_bit = (b[i] >> 2*j) & 0x03
+      if a_bit == 0x03 and b_bit != 0x03:
+        # Split on this bit: the half that disagrees with b is outside b
+        piece = bytearray(current)
+        piece[i] = (piece[i] & ~(0x03 << 2*j) & 0xff) | ((b_bit ^ 0x03) << 2*j)
+        result.append(piece)
+        current[i] = (current[i] & ~(0x03 << 2*j) & 0xff) | (b_bit << 2*j)
+  # What remains of current is a n b
+  return result
+
+class AtomicPredicates(object):
+  '''
+  The partition of the header space induced by a set of predicates (wildcard
+  matches). Each atom is stored as a list of disjoint cubes.
+
+  Predicates are reference counted so that callers can add and release them
+  as rules come and go. Atoms are only ever refined, never merged, so after
+  many removals the partition may be finer than necessary; it remains
+  correct.
+  '''
+  def __init__(self, length):
+    # atom id -> list of disjoint cubes
+    self.atoms = [[byte_array_get_all_x(length)]]
+    # predicate key -> [atom bitmask, reference count]
+    self.predicates = {}
+
+  def __len__(self):
+    return len(self.atoms)
+
+  @property
+  def all_atoms(self):
+    return (1 << len(self.atoms)) - 1
+
+  def mask(self, match):
+    ''' Return the bitmask of atoms making up match, which must have been
+    added '''
+    return self.predicates[bytes(match)][0]
+
+  def add(self, match):
+    '''
+    Add a reference to predicate match. Return a list of (old atom id, new
+    atom id) splits, in order; any header set that contained the old atom
+    now also contains the new one.
+    '''
+    key = bytes(match)
+    if key in self.predicates:
+      self.predicates[key][1] += 1
+      return []
+
+    match = bytearray(match)
+    splits = []
+    mask = 0
+    for atom_id in range(len(self.atoms)):
+      inside = []
+      outside = []
+      for cube in self.atoms[atom_id]:
+        intersect = byte_array_intersect(cube, match)
+        if len(intersect) == 0:
+          outside.append(cube)
+        else:
+          inside.append(intersect)
+          outside.extend(cube_minus(cube, match))
+      if not inside:
+        continue
+      mask |= 1 << atom_id
+      if outside:
+        new_id = len(self.atoms)
+        self.atoms[atom_id] = inside
+        self.atoms.append(outside)
+        splits.append((atom_id, new_id))
+
+    for (old_id, new_id) in splits:
+      for entry in self.predicates.itervalues():
+        if entry[0] & (1 << old_id):
+          entry[0] |= 1 << new_id
+    self.predicates[key] = [mask, 1]
+    return splits
+
+  def release(self, match):
+    key = bytes(match)
+    entry = self.predicates[key]
+    entry[1] -= 1
+    if entry[1] == 0:
+      del self.predicates[key]
+
+def apply_splits(bitmask, splits):
+  for (old_id, new_id) in splits:
+    if bitmask & (1 << old_id):
+      bitmask |= 1 << new_id
+  return bitmask
+
+class ReachabilityEngine(object):
+  '''
+  Maintains an all-pairs reachability matrix between edge ports:
+    { source port -> { destination port -> bitmask of atoms that reach it } }
+
+  Switch transfer functions are added with update_switch(), which diffs the
+  switch's rules against the previous version. When only a few rules change
+  (e.g. after a single flow_mod) only the atoms those rules match are
+  recomputed.
+  '''
+  def __init__(self, length):
+    self.predicates = AtomicPredicates(length)
+    # switch name -> { (in_port, match key, out_ports) -> count }
+    self.switch2entries = {}
+    # in_port -> { (match key, out_ports) -> count }
+    self.port2rules = collections.defaultdict(dict)
+    # in_port -> [(atom bitmask, out_ports)], rebuilt lazily
+    self._port2masks = None
+    # port -> linked ports
+    self.links = {}
+    self.edge_ports = frozenset()
+    self.matrix = None
+
+  @staticmethod
+  def supports(tf):
+    ''' Return whether all rules in tf can be handled by the engine '''
+    return all(rule["action"] == "fwd" for rule in tf.rules) and not tf.custom_rules
+
+  @staticmethod
+  def _entries(tf):
+    if not ReachabilityEngine.supports(tf):
+      raise ValueError("Only forwarding rules are supported")
+    entries = collections.defaultdict(int)
+    for rule in tf.rules:
+      if len(rule["out_ports"]) == 0:
+        # Drops never forward anything
+        continue
+      out_ports = tuple(sorted(set(rule["out_ports"])))
+      for in_port in set(rule["in_ports"]):
+        entries[(in_port, bytes(rule["match"]), out_ports)] += 1
+    return entries
+
+  def set_topology(self, TTF, edge_ports):
+    ''' Set the links (a topology transfer function) and the edge ports.
+    Invalidates the matrix if either changed. '''
+    links = collections.defaultdict(set)
+    for rule in TTF.rules:
+      for in_port in rule["in_ports"]:
+        links[in_port].update(rule["out_ports"])
+    links = dict(links)
+    edge_ports = frozenset(edge_ports)
+    if links != self.links or edge_ports != self.edge_ports:
+      self.links = links
+      self.edge_ports = edge_ports
+      self.matrix = None
+
+  def update_switch(self, name, tf):
+    ''' Replace the rules of switch name with those of tf. Return the
+    bitmask of atoms whose reachability was recomputed. '''
+    return self._replace_entries(name, self._entries(tf))
+
+  def remove_switch(self, name):
+    return self._replace_entries(name, {})
+
+  def _replace_entries(self, name, new_entries):
+    old_entries = self.switch2entries.get(name, {})
+    changes = []
+    for key in set(old_entries) | set(new_entries):
+      delta = new_entries.get(key, 0) - old_entries.get(key, 0)
+      if delta != 0:
+        changes.append((key, delta))
+    if not changes:
+      return 0
+
+    splits = []
+    for ((in_port, match, out_ports), delta) in changes:
+      if delta > 0:
+        for _ in range(delta):
+          splits += self.predicates.add(match)
+    affected = 0
+    for ((in_port, match, out_ports), delta) in changes:
+      affected |= self.predicates.mask(match)
+      rules = self.port2rules[in_port]
+      count = rules.get((match, out_ports), 0) + delta
+      if count > 0:
+        rules[(match, out_ports)] = count
+      else:
+        del rules[(match, out_ports)]
+        if not rules:
+          del self.port2rules[in_port]
+    for ((in_port, match, out_ports), delta) in changes:
+      if delta < 0:
+        for _ in range(-delta):
+          self.predicates.release(match)
+
+    if new_entries:
+      self.switch2entries[name] = dict(new_entries)
+    elif name in self.switch2entries:
+      del self.switch2entries[name]
+    self._port2masks = None
+
+    if self.matrix is not None:
+      if splits:
+        for row in self.matrix.itervalues():
+          for dst in row:
+            row[dst] = apply_splits(row[dst], splits)
+      self._recompute(affected)
+    return affected
+
+  def _masks_at(self, port):
+    if self._port2masks is None:
+      self._port2masks = {}
+      for (in_port, rules) in self.port2rules.iteritems():
+        self._port2masks[in_port] = [ (self.predicates.mask(match), out_ports)
+                                      for (match, out_ports) in rules ]
+    return self._port2masks.get(port, ())
+
+  def _search(self, src, atoms):
+    ''' Return { edge port -> bitmask of atoms reaching it from src },
+    considering only the given atoms '''
+    reached = {}
+    seen = {src: atoms}
+    queue = collections.deque([(src, atoms)])
+
+    def reach(port, hit):
+      reached[port] = reached.get(port, 0) | hit
+
+    while queue:
+      (port, fresh) = queue.popleft()
+      for (mask, out_ports) in self._masks_at(port):
+        hit = fresh & mask
+        if not hit:
+          continue
+        for out_port in out_ports:
+          if out_port == port:
+            # OpenFlow switches don't send packets out their in_port
+            continue
+          if out_port != src and out_port in self.edge_ports:
+            reach(out_port, hit)
+            continue
+          for linked_port in self.links.get(out_port, ()):
+            if linked_port != src and linked_port in self.edge_ports:
+              reach(linked_port, hit)
+              continue
+            new = hit & ~seen.get(linked_port, 0)
+            if new:
+              seen[linked_port] = seen.get(linked_port, 0) | new
+              queue.append((linked_port, new))
+    return reached
+
+  def _recompute(self, atoms):
+    for src in self.edge_ports:
+      row = self.matrix.setdefault(src, {})
+      for dst in row:
+        row[dst] &= ~atoms
+      for (dst, mask) in self._search(src, atoms).iteritems():
+        row[dst] = row.get(dst, 0) | mask
+
+  def compute(self):
+    ''' Return the all-pairs reachability matrix, computing it if needed '''
+    if self.matrix is None:
+      self.matrix = {}
+      self._recompute(self.predicates.all_atoms)
+      log.debug("Computed reachability over %d atoms" % len(self.predicates))
+    return self.matrix
+
+  def reachable_pairs(self):
+    ''' Return the set of (source port, destination port) pairs between
+    which some header can travel '''
+    pairs = set()
+    for (src, row) in self.compute().iteritems():
+      for (dst, mask) in row.iteritems():
+        if mask:
+          pairs.add((src, dst))
+    return pairs
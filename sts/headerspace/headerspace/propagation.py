@@ -0,0 +1,243 @@
+'''
+A shared propagation engine for the python Hassel applications.
+
+Propagation nodes are parent-linked: each node stores only its own
+headerspace and port, and its path is recovered by walking back through its
+ancestors. Children therefore share their ancestors' history instead of
+copying it, so memory grows linearly rather than quadratically with path
+length.
+
+Within a single propagation, visits are memoized per (port, headerspace):
+equivalent headerspaces arriving at the same port are collapsed into a single
+node, and headerspaces subsumed by one already propagated from that port are
+pruned, as long as the path that propagated it didn't visit any port the
+pruned node's path didn't (see _VisitMemo).
+'''
+
+from sts.headerspace.headerspace.hs import byte_array_subset
+
+import logging
+log = logging.getLogger("headerspace")
+
+class PropagationNode(object):
+  '''
+  A headerspace located at a port, linked to the node it was propagated
+  from. egress_port is the port through which the parent's switch emitted
+  the headerspace, or None if it wasn't recorded.
+
+  Supports item access ("hdr", "port", "visits", "hs_history") for
+  compatibility with the old dict-based p_nodes.
+  '''
+  __slots__ = ["hdr", "port", "parent", "egress_port"]
+
+  def __init__(self, hdr, port, parent=None, egress_port=None):
+    self.hdr = hdr
+    self.port = port
+    self.parent = parent
+    self.egress_port = egress_port
+
+  @property
+  def visits(self):
+    ''' The ports traversed before arriving at self.port '''
+    visits = []
+    node = self
+    while node.parent is not None:
+      if node.egress_port is not None:
+        visits.append(node.egress_port)
+      visits.append(node.parent.port)
+      node = node.parent
+    visits.reverse()
+    return visits
+
+  @property
+  def hs_history(self):
+    ''' The headerspaces of each ancestor, oldest first '''
+    history = []
+    node = self.parent
+    while node is not None:
+      history.append(node.hdr)
+      node = node.parent
+    history.reverse()
+    return history
+
+  @property
+  def root(self):
+    node = self
+    while node.parent is not None:
+      node = node.parent
+    return node
+
+  def path_ports(self):
+    ''' The set of ports visited() checks '''
+    ports = set()
+    node = self
+    while node.parent is not None:
+      ports.add(node.egress_port)
+      ports.add(node.parent.port)
+      node = node.parent
+    ports.discard(None)
+    return frozenset(ports)
+
+  def visited(self, port):
+    ''' Return whether port is in self.visits, without building the list '''
+    node = self
+    while node.parent is not None:
+      if node.egress_port == port or node.parent.port == port:
+        return True
+      node = node.parent
+    return False
+
+  def __getitem__(self, key):
+    if key not in ("hdr", "port", "visits", "hs_history"):
+      raise KeyError(key)
+    return getattr(self, key)
+
+  def __repr__(self):
+    return "PropagationNode(port=%s, visits=%s)" % (str(self.port),
+                                                     str(self.visits))
+
+class PropagationReport(object):
+  ''' Counters describing the work done by a Propagator '''
+  def __init__(self):
+    # Nodes allocated (excluding roots)
+    self.nodes_created = 0
+    # Nodes dropped because an equal or larger headerspace was already
+    # propagated from the same port
+    self.nodes_subsumed = 0
+    # Branches aborted because they revisited a port on their own path
+    self.branches_looped = 0
+    # Whether propagation stopped early after reaching max_nodes
+    self.truncated = False
+
+  def __str__(self):
+    return ("%d nodes created, %d subsumed, %d looping branches aborted%s" %
+            (self.nodes_created, self.nodes_subsumed, self.branches_looped,
+             " (truncated)" if self.truncated else ""))
+
+class _VisitMemo(object):
+  '''
+  Headerspaces already propagated, per port, along with the ports on the path
+  that propagated them. A node is only pruned in favor of one whose path
+  visited no port the node's own path didn't: anywhere the pruned node could
+  still go without revisiting a port on its path, so can the other.
+  '''
+  def __init__(self):
+    # port -> { exact headerspace key -> [path port sets] }
+    self.port2keys = {}
+    # port -> list of (wildcard expression, path port set), from headerspaces
+    # without a lazy difference. Used for cheap subsumption checks.
+    self.port2exprs = {}
+
+  @staticmethod
+  def _key(hdr):
+    return (tuple(sorted(bytes(expr) for expr in hdr.hs_list)),
+            tuple(sorted(bytes(expr) for expr in hdr.hs_diff)))
+
+  def covered(self, hdr, port, path):
+    for visited in self.port2keys.get(port, {}).get(self._key(hdr), ()):
+      if visited <= path:
+        return True
+    if hdr.hs_diff or not hdr.hs_list:
+      return False
+    exprs = self.port2exprs.get(port, ())
+    return all(any(visited <= path and byte_array_subset(expr, other)
+                   for (other, visited) in exprs)
+               for expr in hdr.hs_list)
+
+  def add(self, hdr, port, path):
+    self.port2keys.setdefault(port, {}).setdefault(self._key(hdr),
+                                                   []).append(path)
+    if not hdr.hs_diff:
+      self.port2exprs.setdefault(port, []).extend((expr, path)
+                                                  for expr in hdr.hs_list)
+
+class _Truncated(Exception):
+  pass
+
+class Propagator(object):
+  '''
+  Pushes headerspaces through a network transfer function (NTF) and topology
+  transfer function (TTF), breadth first.
+
+  If max_nodes is given, stop propagating once that many nodes have been
+  created (across calls). self.report accumulates counters across calls.
+  '''
+  # Kinds of events yielded by propagate()
+  REACHED = "reached"
+  DEAD_END = "dead_end"
+  LOOP = "loop"
+
+  def __init__(self, NTF, TTF, max_nodes=None, record_egress_ports=True):
+    self.NTF = NTF
+    self.TTF = TTF
+    self.max_nodes = max_nodes
+    self.record_egress_ports = record_egress_ports
+    self.report = PropagationReport()
+
+  def _new_node(self, hdr, port, parent, egress_port):
+    if (self.max_nodes is not None and
+        self.report.nodes_created >= self.max_nodes):
+      if not self.report.truncated:
+        log.warn("Propagation truncated after %d nodes" %
+                 self.report.nodes_created)
+      self.report.truncated = True
+      raise _Truncated()
+    self.report.nodes_created += 1
+    if not self.record_egress_ports:
+      egress_port = None
+    return PropagationNode(hdr, port, parent, egress_port)
+
+  def propagate(self, hdr, in_port, out_ports=(), detect_loops=False):
+    '''
+    Push hdr from in_port through the network, yielding (kind, node) tuples:
+      - (REACHED, node) when a headerspace arrives at one of out_ports
+      - (DEAD_END, node) when a switch (other than the first) drops node
+      - (LOOP, node) when detect_loops is set and node returns to in_port
+    Branches that revisit a port on their own path are aborted.
+    '''
+    out_ports = set(out_ports)
+    memo = _VisitMemo()
+    root = PropagationNode(hdr, in_port)
+    memo.add(hdr, in_port, root.path_ports())
+    propagation = [root]
+
+    def subsumed(node):
+      path = node.path_ports()
+      if memo.covered(node.hdr, node.port, path):
+        self.report.nodes_subsumed += 1
+        return True
+      memo.add(node.hdr, node.port, path)
+      return False
+
+    try:
+      while len(propagation) > 0:
+        log.debug("Propagation has length: %d" % len(propagation))
+        tmp_propagate = []
+        for p_node in propagation:
+          next_hp = self.NTF.T(p_node.hdr, p_node.port)
+          if len(next_hp) == 0 and p_node.parent is not None:
+            yield (self.DEAD_END, p_node)
+          for (next_h, next_ps) in next_hp:
+            for next_p in next_ps:
+              if next_p in out_ports:
+                node = self._new_node(next_h, next_p, p_node, None)
+                if not subsumed(node):
+                  yield (self.REACHED, node)
+                continue
+              for (linked_h, linked_ports) in self.TTF.T(next_h, next_p):
+                for linked_p in linked_ports:
+                  node = self._new_node(linked_h, linked_p, p_node, next_p)
+                  if linked_p in out_ports:
+                    if not subsumed(node):
+                      yield (self.REACHED, node)
+                  elif detect_loops and linked_p == in_port:
+                    yield (self.LOOP, node)
+                  elif node.visited(linked_p):
+                    self.report.branches_looped += 1
+                    log.debug("Detected a loop - branch aborted: port %d" %
+                              linked_p)
+                  elif not subsumed(node):
+                    tmp_propagate.append(node)
+        propagation = tmp_propagate
+    except _Truncated:
+      return
@@ -8,9 +8,38 @@ from sts.headerspace.headerspace.hs import *
 from array import array
 from sts.headerspace.headerspace.wildcard_dictionary import wildcard_dictionary
 
+import mmap
+import struct
+import sys
 import logging
 log = logging.getLogger("headerspace")
 
+# Binary TF format. See save_binary_object_to_file() and hassel-c's
+# src/parse.c (parse_tf_bin), which must be kept in sync. All integers are
+# little-endian uint32s.
+BINARY_TF_MAGIC = "HSATFB\x00\x00"
+BINARY_TF_VERSION = 1
+# magic, version, length, flags, next_id, nrules, ndeps, narrs, nints,
+# prefix, nibbles_ofs, nnibbles, rules_ofs, deps_ofs, arrs_ofs, ints_ofs,
+# strs_ofs, strs_len
+_bin_header = struct.Struct("<8s17I")
+# action, in_ofs, in_n, out_ofs, out_n, match, mask, rewrite, inverse_match,
+# inverse_rewrite, deps_ofs, deps_n, influence_ofs, influence_n, lines_ofs,
+# lines_n, file, id
+_bin_rule = struct.Struct("<18I")
+# rule, match, ports_ofs, ports_n
+_bin_dep = struct.Struct("<4I")
+_bin_actions = ["link", "fwd", "rw"]
+_BIN_LAZY_EVAL_ACTIVE = 0x1
+_BIN_SEND_ON_RECEIVING_PORT = 0x2
+
+def is_binary_tf_file(file):
+  f = open(file, 'rb')
+  try:
+    return f.read(len(BINARY_TF_MAGIC)) == BINARY_TF_MAGIC
+  finally:
+    f.close()
+
 def ports_to_hex(ports):
   return map(port_to_hex, ports)
 
@@ -269,12 +298,12 @@ class TF(object):
     out_ports = self.rules[priority]["out_ports"]
     for p in in_ports:
       port = "%d"%p
-      if port not in self.inport_to_rule.keys():
+      if port not in self.inport_to_rule:
         self.inport_to_rule[port] = []
       self.inport_to_rule[port].append(new_rule)
     for p in out_ports:
       port = "%d"%p
-      if port not in self.outport_to_rule.keys():
+      if port not in self.outport_to_rule:
         self.outport_to_rule[port] = []
       self.outport_to_rule[port].append(new_rule)
     self.id_to_rule[new_rule["id"]] = new_rule
@@ -673,8 +702,11 @@ class TF(object):
 
   def load_object_from_file(self, file):
     '''
-    load object from file, and replace the current object.
+    load object from file, and replace the current object. Files written by
+    save_binary_object_to_file are detected and loaded as such.
     '''
+    if is_binary_tf_file(file):
+      return self.load_binary_object_from_file(file)
     log.debug("=== Loading transfer function from file %s ==="%file)
     f = open(file,'r')
     self.rules = []
@@ -774,6 +806,185 @@ class TF(object):
 
     log.debug("=== Transfer function loaded from file %s ==="%file)
 
+  def save_binary_object_to_file(self, file):
+    '''
+    saves all the non-custom transfer function rules to a compact binary file,
+    laid out as:
+      - a fixed-size header
+      - a rule table of fixed-size records
+      - a dependency (affected_by) table of fixed-size records
+      - a table of distinct wildcard arrays, each self.length bytes, packed
+        exactly as in our bytearrays. Rules refer to arrays by index + 1, with
+        0 meaning None.
+      - a pool of uint32s (ports, rule indices, line numbers, nibbles)
+      - a pool of NUL-terminated strings, referred to by offset + 1
+    '''
+    log.debug("=== Saving binary transfer function to file %s ==="%file)
+    arrs = []
+    arr2idx = {}
+    def add_arr(byte_array):
+      if byte_array is None:
+        return 0
+      key = bytes(byte_array)
+      if key not in arr2idx:
+        arrs.append(key)
+        arr2idx[key] = len(arrs)
+      return arr2idx[key]
+
+    ints = array('I')
+    def add_ints(values):
+      ofs = len(ints)
+      ints.extend(values)
+      return (ofs, len(values))
+
+    strs = []
+    strs_len = [0]
+    def add_str(string):
+      if string is None:
+        return 0
+      ofs = strs_len[0]
+      strs.append(string + "\x00")
+      strs_len[0] += len(string) + 1
+      return ofs + 1
+
+    rule2idx = { id(rule) : i for i, rule in enumerate(self.rules) }
+    rule_records = []
+    dep_records = []
+    for rule in self.rules:
+      if rule["action"] not in _bin_actions:
+        raise ValueError("Can't save %s rule %s in binary format" %
+                         (rule["action"], rule["id"]))
+      deps_ofs = len(dep_records)
+      for (affecting_rule, match, ports) in rule["affected_by"]:
+        dep_records.append(_bin_dep.pack(rule2idx[id(affecting_rule)],
+                                         add_arr(match), *add_ints(ports)))
+      influences = [ rule2idx[id(r)] for r in rule["influence_on"] ]
+      rule_records.append(_bin_rule.pack(
+        _bin_actions.index(rule["action"]),
+        *(add_ints(rule["in_ports"]) + add_ints(rule["out_ports"]) +
+          (add_arr(rule["match"]), add_arr(rule["mask"]),
+           add_arr(rule["rewrite"]), add_arr(rule["inverse_match"]),
+           add_arr(rule["inverse_rewrite"]), deps_ofs,
+           len(dep_records) - deps_ofs) +
+          add_ints(influences) + add_ints(rule["line"]) +
+          (add_str(rule["file"]), add_str(rule["id"])))))
+
+    (nibbles_ofs, nnibbles) = add_ints(self.lazy_eval_nibbles)
+    prefix = add_str(self.prefix_id)
+    flags = ((_BIN_LAZY_EVAL_ACTIVE if self.lazy_eval_active else 0) |
+             (_BIN_SEND_ON_RECEIVING_PORT if self.send_on_receiving_port else 0))
+    if sys.byteorder != "little":
+      ints.byteswap()
+
+    rules_ofs = _bin_header.size
+    deps_ofs = rules_ofs + len(rule_records) * _bin_rule.size
+    arrs_ofs = deps_ofs + len(dep_records) * _bin_dep.size
+    ints_ofs = arrs_ofs + len(arrs) * self.length
+    strs_ofs = ints_ofs + len(ints) * ints.itemsize
+    header = _bin_header.pack(BINARY_TF_MAGIC, BINARY_TF_VERSION, self.length,
+                              flags, self.next_id, len(rule_records),
+                              len(dep_records), len(arrs), len(ints), prefix,
+                              nibbles_ofs, nnibbles, rules_ofs, deps_ofs,
+                              arrs_ofs, ints_ofs, strs_ofs, strs_len[0])
+    f = open(file, 'wb')
+    f.write(header)
+    f.write("".join(rule_records))
+    f.write("".join(dep_records))
+    f.write("".join(arrs))
+    f.write(ints.tostring())
+    f.write("".join(strs))
+    f.close()
+    log.debug("=== Binary transfer function saved to file %s ==="%file)
+
+  def load_binary_object_from_file(self, file):
+    '''
+    load object from a file written by save_binary_object_to_file, and replace
+    the current object.
+    '''
+    log.debug("=== Loading binary transfer function from file %s ==="%file)
+    f = open(file, 'rb')
+    try:
+      data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+      f.close()
+    try:
+      (magic, version, self.length, flags, self.next_id, nrules, ndeps, narrs,
+       nints, prefix, nibbles_ofs, nnibbles, rules_ofs, deps_ofs, arrs_ofs,
+       ints_ofs, strs_ofs, strs_len) = _bin_header.unpack_from(data, 0)
+      if magic != BINARY_TF_MAGIC:
+        raise ValueError("%s is not a binary transfer function" % file)
+      if version != BINARY_TF_VERSION:
+        raise ValueError("Unsupported binary transfer function version %d" %
+                         version)
+      ints = array('I')
+      ints.fromstring(data[ints_ofs:ints_ofs + nints * ints.itemsize])
+      if sys.byteorder != "little":
+        ints.byteswap()
+      strs = data[strs_ofs:strs_ofs + strs_len]
+      arrs = [None] + [ bytes(data[ofs:ofs + self.length])
+                        for ofs in xrange(arrs_ofs, arrs_ofs + narrs * self.length,
+                                          self.length) ]
+      deps = [ _bin_dep.unpack_from(data, deps_ofs + i * _bin_dep.size)
+               for i in xrange(ndeps) ]
+      rule_records = [ _bin_rule.unpack_from(data, rules_ofs + i * _bin_rule.size)
+                       for i in xrange(nrules) ]
+    finally:
+      data.close()
+
+    def get_arr(idx):
+      if idx == 0:
+        return None
+      return bytearray(arrs[idx])
+
+    def get_ints(ofs, n):
+      # array('I') yields longs on some platforms
+      return map(int, ints[ofs:ofs + n])
+
+    def get_str(ofs):
+      if ofs == 0:
+        return None
+      return strs[ofs - 1:strs.index("\x00", ofs - 1)]
+
+    self.prefix_id = get_str(prefix) or ""
+    self.lazy_eval_active = bool(flags & _BIN_LAZY_EVAL_ACTIVE)
+    self.send_on_receiving_port = bool(flags & _BIN_SEND_ON_RECEIVING_PORT)
+    self.lazy_eval_nibbles = get_ints(nibbles_ofs, nnibbles)
+    self.rules = []
+    for (action, in_ofs, in_n, out_ofs, out_n, match, mask, rewrite,
+         inverse_match, inverse_rewrite, rule_deps_ofs, deps_n, influence_ofs,
+         influence_n, lines_ofs, lines_n, file_name, rule_id) in rule_records:
+      new_rule = {}
+      new_rule["action"] = _bin_actions[action]
+      new_rule["in_ports"] = get_ints(in_ofs, in_n)
+      new_rule["match"] = get_arr(match)
+      new_rule["mask"] = get_arr(mask)
+      new_rule["rewrite"] = get_arr(rewrite)
+      new_rule["inverse_match"] = get_arr(inverse_match)
+      new_rule["inverse_rewrite"] = get_arr(inverse_rewrite)
+      new_rule["out_ports"] = get_ints(out_ofs, out_n)
+      new_rule["affected_by"] = [ (dep_rule, get_arr(dep_match),
+                                   get_ints(ports_ofs, ports_n))
+                                  for (dep_rule, dep_match, ports_ofs, ports_n)
+                                  in deps[rule_deps_ofs:rule_deps_ofs + deps_n] ]
+      new_rule["influence_on"] = get_ints(influence_ofs, influence_n)
+      new_rule["file"] = get_str(file_name) or ""
+      new_rule["line"] = get_ints(lines_ofs, lines_n)
+      new_rule["id"] = get_str(rule_id)
+      self.rules.append(new_rule)
+
+    # now replace index in affected_by and influence_on fields to the pointer to rules.
+    self.inport_to_rule = {}
+    self.outport_to_rule = {}
+    self.id_to_rule = {}
+    for indx in range(len(self.rules)):
+      rule = self.rules[indx]
+      rule["influence_on"] = [ self.rules[idx] for idx in rule["influence_on"] ]
+      rule["affected_by"] = [ (self.rules[r[0]],r[1],r[2])
+                              for r in rule["affected_by"] ]
+      self.set_fast_lookup_pointers(indx)
+
+    log.debug("=== Binary transfer function loaded from file %s ==="%file)
+
   def __str__(self):
     strs = self.to_string()
     return "\n".join(strs)
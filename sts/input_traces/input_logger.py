@@ -1,10 +1,15 @@
 import os
+import shutil
 import time
+import atexit
+import threading
+import Queue
 import logging
 from sts.replay_event import WaitTime
 from sts.syncproto.base import SyncTime
 from sts.util.convenience import timestamp_string
-import sts.dataplane_traces.trace_generator as tg
+from sts.log_processing.openflow_sidelog import OpenFlowSideLogWriter, OPENFLOW_SIDELOG_SUFFIX
+from sts.dataplane_traces.trace import RawTraceWriter
 
 # TODO(cs): need to copy some optional params from Fuzzer ctor to Replayer
 # ctor
@@ -35,24 +40,119 @@ control_flow = EfficientMCSFinder(simulation_config, "%s",
                                   invariant_check_name=%s)
 '''
 
+prefix_config_template = '''
+from config.experiment_config_lib import ControllerConfig
+from sts.topology import *
+from sts.control_flow import PrefixFinder
+from sts.simulation_state import SimulationConfig
+
+simulation_config = %s
+
+control_flow = PrefixFinder(simulation_config, "%s",
+                            wait_on_deterministic_values=%s,
+                            invariant_check_name=%s)
+'''
+
 log = logging.getLogger("input_logger")
 
+class EventWriter(threading.Thread):
+  '''
+  Writes json encoded events to output on a background thread, so that
+  logging an event doesn't block the caller (usually the IOMaster thread) on
+  file I/O.
+
+  Writes are batched: the output is flushed whenever the queue drains, so an
+  interrupted run loses at most the events still queued. At most
+  max_queued_events may be queued; beyond that, write() blocks. Events still
+  queued at interpreter exit are written out before the output is closed.
+  '''
+  _stop_sentinel = object()
+
+  def __init__(self, output, max_queued_events=10000):
+    super(EventWriter, self).__init__(name="EventWriter")
+    self.daemon = True
+    self.output = output
+    self.queue = Queue.Queue(maxsize=max_queued_events)
+    self.error = None
+    self._closed = False
+    atexit.register(self.close)
+
+  def run(self):
+    while True:
+      batch = [self.queue.get()]
+      try:
+        while batch[-1] is not self._stop_sentinel:
+          batch.append(self.queue.get_nowait())
+      except Queue.Empty:
+        pass
+      try:
+        for line in batch:
+          if line is not self._stop_sentinel:
+            self.output.write(line + '\n')
+        self.output.flush()
+      except Exception as e:
+        log.error("Failed to write events to %s: %s" % (self.output.name, e))
+        self.error = e
+      for _ in batch:
+        self.queue.task_done()
+      if batch[-1] is self._stop_sentinel:
+        return
+
+  def write(self, line):
+    ''' Queue line (a json encoded event) to be written '''
+    if self.error is not None:
+      raise IOError("EventWriter failed: %s" % self.error)
+    self.queue.put(line)
+
+  def flush(self):
+    ''' Block until all queued events have been written out '''
+    if self.is_alive():
+      self.queue.join()
+
+  def close(self):
+    ''' Write out all queued events and close the output '''
+    if self._closed:
+      return
+    self._closed = True
+    if self.is_alive():
+      self.queue.put(self._stop_sentinel)
+      self.join()
+    self.output.close()
+
 class InputLogger(object):
   '''Log input events injected by a control_flow.Fuzzer'''
 
-  def __init__(self, output_path=None):
+  def __init__(self, output_path=None, max_queued_events=10000,
+               record_openflow=False):
     '''
     Automatically generate an output_path in input_traces/
     if one is not provided.
+
+    Events are written asynchronously; at most max_queued_events may be
+    waiting to be written at any time.
+
+    If record_openflow is set, the raw OpenFlow messages let through by the
+    GodScheduler are also logged, to output_path + OPENFLOW_SIDELOG_SUFFIX
+    (see sts.log_processing.openflow_sidelog).
     '''
     self.output_path = output_path
-    self.dp_events = []
+    self.max_queued_events = max_queued_events
+    self.record_openflow = record_openflow
+    self.openflow_sidelog = None
+    # Dataplane events are streamed to dp_trace_path as they are logged; the
+    # trace is only created once there is an event to write
+    self._dp_writer = None
     self.last_time = SyncTime.now()
     self._disallow_timeouts = False
     self._events_after_close = []
     self.output = None
+    self._writer = None
 
-  def open(self, results_dir=None):
+  def open(self, results_dir=None, prefix_path=None):
+    '''
+    Start a new trace. If prefix_path is given, the trace begins with a copy
+    of the events in that trace.
+    '''
     if results_dir != None:
       self.output_path = results_dir + "/events.trace"
       self.dp_trace_path = results_dir + "/dataplane.trace"
@@ -68,7 +168,40 @@ class InputLogger(object):
       self.replay_cfg_path = "./config/" + basename.replace(".trace", ".py")
       self.mcs_cfg_path = "./config/" + basename.replace(".trace", "") + "_mcs.py"
 
+    # May be reopened (e.g. by CoverageGuidedFuzzer) for a new run
+    self._dp_writer = None
+    self._events_after_close = []
     self.output = open(self.output_path, 'w')
+    if prefix_path is not None:
+      with open(prefix_path) as prefix:
+        shutil.copyfileobj(prefix, self.output)
+      self.output.flush()
+    self._writer = EventWriter(self.output, self.max_queued_events)
+    self._writer.start()
+    if self.record_openflow:
+      self.openflow_sidelog = OpenFlowSideLogWriter(self.output_path +
+                                                    OPENFLOW_SIDELOG_SUFFIX)
+
+  def flush(self):
+    ''' Block until the events logged so far have been written out '''
+    self._writer.flush()
+    if self._dp_writer is not None:
+      self._dp_writer.output.flush()
+
+  def branch(self, results_dir):
+    '''
+    Continue the trace in results_dir: e.g. in a forked copy of the fuzzer,
+    which can't use the writer thread of the process it was forked from. The
+    new trace (and dataplane trace) starts with the events logged so far,
+    which must have been flushed before forking.
+    '''
+    prefix_path = self.output_path
+    dp_writer = self._dp_writer
+    self.open(results_dir, prefix_path=prefix_path)
+    if dp_writer is not None:
+      # The original dataplane trace belongs to the process we were forked
+      # from, so leave it open
+      self._dp_writer = dp_writer.copy(self.dp_trace_path)
 
   def disallow_timeouts(self):
     self._disallow_timeouts = True
@@ -76,29 +209,44 @@ class InputLogger(object):
   def allow_timeouts(self):
     self._disallow_timeouts = False
 
-  def _serialize_event(self, event, output):
+  def _prepare_event(self, event):
     if self._disallow_timeouts and hasattr(event, "disallow_timeouts"):
       event.timeout_disallowed = True
     self.last_time = event.time
-    json_hash = event.to_json()
     log.debug("logging event %r" % event)
-    output.write(json_hash + '\n')
 
-  def log_input_event(self, event, dp_event=None):
+  def _serialize_event(self, event, output):
+    self._prepare_event(event)
+    output.write(event.to_json() + '\n')
+
+  def log_input_event(self, event, dp_event=None, dp_events=None):
     '''
     Log the event as a json hash. Note that we log dataplane events in a
-    separate pickle log, so we optionally allow a packet parameter to be
-    logged separately.
+    separate dataplane trace, so we optionally allow a packet parameter (or,
+    for TrafficInjections of several packets, a list of them) to be logged
+    separately.
     '''
     if not self.output:
       raise Exception("Not opened -- call InputLogger.open")
     if not self.output.closed:
-      self._serialize_event(event, self.output)
+      self._prepare_event(event)
+      # Encode here rather than on the writer thread: the event's json hash
+      # shares mutable members (e.g. dependent_labels) with the event, which
+      # may change before the writer gets to it
+      self._writer.write(event.to_json())
       if dp_event is not None:
-        self.dp_events.append(dp_event)
+        self._log_dp_events([dp_event])
+      if dp_events is not None:
+        self._log_dp_events(dp_events)
     else:
       self._events_after_close.append(event)
 
+  def _log_dp_events(self, dp_events):
+    if self._dp_writer is None:
+      self._dp_writer = RawTraceWriter(self.dp_trace_path)
+    for dp_event in dp_events:
+      self._dp_writer.write(dp_event)
+
   def dump_buffered_events(self, events):
     ''' If there were un-acknowledge message receives or state changes at the
     end of the run, dump them to a separate input trace ".unacked" '''
@@ -110,19 +258,25 @@ class InputLogger(object):
     # First, insert a WaitTime, in case there was a controller crash
     self.log_input_event(WaitTime(1.0, time=self.last_time))
     # Flush the json input log
-    self.output.close()
+    self._writer.close()
+    if self.openflow_sidelog is not None:
+      self.openflow_sidelog.close()
 
     # Grab the dataplane trace path (might be pre-defined, or Fuzzed)
-    if self.dp_events != []:
-      # If the Fuzzer was injecting random traffic, write the dataplane trace
-      tg.write_trace_log(self.dp_events, self.dp_trace_path)
+    if self._dp_writer is not None:
+      # If the Fuzzer was injecting random traffic, finish the dataplane trace
+      self._dp_writer.close()
       simulation_cfg.dataplane_trace_path = self.dp_trace_path
 
     # Write the config files
     path_templates = [(self.replay_cfg_path, replay_config_template)]
     if not skip_mcs_cfg:
       path_templates.append((self.mcs_cfg_path, mcs_config_template))
+    self._write_configs(control_flow, simulation_cfg, self.output_path,
+                        path_templates)
 
+  def _write_configs(self, control_flow, simulation_cfg, trace_path,
+                     path_templates):
     wait_on_deterministic_values = False
     if hasattr(control_flow.sync_callback, "record_deterministic_values"):
       wait_on_deterministic_values = control_flow.sync_callback.record_deterministic_values
@@ -130,7 +284,35 @@ class InputLogger(object):
     for path, template in path_templates:
       with open(path, 'w') as cfg_out:
         config_string = template % (str(simulation_cfg),
-                                    self.output_path,
+                                    trace_path,
                                     str(wait_on_deterministic_values),
                                     "'%s'" % str(control_flow.invariant_check_name))
         cfg_out.write(config_string)
+
+  def snapshot(self, results_dir, control_flow, simulation_cfg):
+    '''
+    Copy the trace so far into results_dir, with its dataplane trace and
+    replay and MCS configs, as close() would write them, and a config to find
+    its shortest violating prefix (see PrefixFinder). Logging continues in
+    the original trace.
+    '''
+    self.flush()
+    trace_path = os.path.join(results_dir, "events.trace")
+    shutil.copy(self.output_path, trace_path)
+    dataplane_trace_path = simulation_cfg._dataplane_trace_path
+    if self._dp_writer is not None:
+      dataplane_trace_path = os.path.join(results_dir, "dataplane.trace")
+      self._dp_writer.copy(dataplane_trace_path).close()
+    # Point the configs at the copies
+    (orig_dataplane_trace_path, simulation_cfg._dataplane_trace_path) = \
+        (simulation_cfg._dataplane_trace_path, dataplane_trace_path)
+    try:
+      self._write_configs(control_flow, simulation_cfg, trace_path,
+                          [(os.path.join(results_dir, "replay_config.py"),
+                            replay_config_template),
+                           (os.path.join(results_dir, "mcs_config.py"),
+                            mcs_config_template),
+                           (os.path.join(results_dir, "prefix_config.py"),
+                            prefix_config_template)])
+    finally:
+      simulation_cfg._dataplane_trace_path = orig_dataplane_trace_path
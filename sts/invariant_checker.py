@@ -2,17 +2,28 @@
 
 from pox.openflow.libopenflow_01 import *
 from entities import *
+from sts.topology import SwitchConnectivity
 import sts.headerspace.topology_loader.topology_loader as hsa_topo
 import sts.headerspace.headerspace.applications as hsa
-from sts.headerspace.config_parser.openflow_parser import get_uniq_port_id
+from sts.headerspace.headerspace.atomic_predicates import ReachabilityEngine
+from sts.headerspace.config_parser.openflow_parser import get_uniq_port_id, hs_format
 import logging
 import collections
 from sts.util.console import msg
 import json
 from collections import defaultdict
+import weakref
+import cPickle
+import os
+import select
+import signal
+import traceback
 
 log = logging.getLogger("invariant_checker")
 
+# topology -> ReachabilityEngine, for atomic_check_connectivity
+_reachability_engines = weakref.WeakKeyDictionary()
+
 class InvariantChecker(object):
   def __init__(self, snapshotService):
     self.snapshotService = snapshotService
@@ -87,11 +98,47 @@ class InvariantChecker(object):
     for in_port, p_nodes in paths.iteritems():
       for p_node in p_nodes:
         connected_pairs.add((in_port, p_node["port"]))
+    return InvariantChecker._unconnected_pairs(simulation, connected_pairs)
+
+  @staticmethod
+  def atomic_check_connectivity(simulation):
+    ''' Like python_check_connectivity, but computes reachability over the
+    atomic predicates of the switches' flow tables. The reachability matrix is
+    kept across calls and only recomputed for the rules that changed since the
+    previous check. '''
+    topology = simulation.topology
+    name_tf_pairs = hsa_topo.generate_tf_pairs(topology.live_switches)
+    if not all(ReachabilityEngine.supports(tf) for (_, tf) in name_tf_pairs):
+      log.info("Flow tables contain header rewrites; falling back to python Hassel")
+      return InvariantChecker.python_check_connectivity(simulation)
+
+    engine = _reachability_engines.get(topology)
+    if engine is None:
+      engine = ReachabilityEngine(hs_format["length"]*2)
+      _reachability_engines[topology] = engine
+    live_names = set()
+    for (name, tf) in name_tf_pairs:
+      live_names.add(name)
+      engine.update_switch(name, tf)
+    for name in set(engine.switch2entries) - live_names:
+      engine.remove_switch(name)
+    edge_ports = [ get_uniq_port_id(l.switch, l.switch_port)
+                   for l in topology.access_links ]
+    engine.set_topology(hsa_topo.generate_TTF(topology.live_links), edge_ports)
+
+    connected_pairs = engine.reachable_pairs()
+    return InvariantChecker._unconnected_pairs(simulation, connected_pairs)
+
+  @staticmethod
+  def _unconnected_pairs(simulation, connected_pairs):
+    ''' Return the access link pairs missing from connected_pairs that
+    aren't simply partitioned '''
     all_pairs = InvariantChecker._get_all_pairs(simulation)
     remaining_pairs = all_pairs - connected_pairs
     partitioned_pairs = check_partitions(simulation.topology.switches,
                                          simulation.topology.live_links,
-                                         simulation.topology.access_links)
+                                         simulation.topology.access_links,
+                                         connectivity=simulation.topology.connectivity)
     if len(partitioned_pairs) != 0:
       log.info("Partitioned pairs! %s" % str(partitioned_pairs))
     remaining_pairs -= partitioned_pairs
@@ -128,23 +175,7 @@ class InvariantChecker(object):
     for start_port, final_location_list in physical_omega.iteritems():
       for _, final_port in final_location_list:
         connected_pairs.add((start_port, final_port))
-    all_pairs = InvariantChecker._get_all_pairs(simulation)
-    remaining_pairs = all_pairs - connected_pairs
-    partitioned_pairs = check_partitions(simulation.topology.switches,
-                                         simulation.topology.live_links,
-                                         simulation.topology.access_links)
-    if len(partitioned_pairs) != 0:
-      log.info("Partitioned pairs! %s" % str(partitioned_pairs))
-    remaining_pairs -= partitioned_pairs
-
-    # TODO(cs): don't print results here
-    if len(remaining_pairs) > 0:
-      msg.fail("Not all %d pairs are connected! (%d missing)" %
-               (len(all_pairs),len(remaining_pairs)))
-      log.info("remaining_pairs: %s" % (str(remaining_pairs)))
-    else:
-      msg.success("Fully connected!")
-    return list(remaining_pairs)
+    return InvariantChecker._unconnected_pairs(simulation, connected_pairs)
 
   @staticmethod
   def check_blackholes(simulation):
@@ -181,13 +212,18 @@ class InvariantChecker(object):
 
     controllers_with_violations += InvariantChecker.check_liveness(simulation)
 
+    live_controllers = simulation.controller_manager.live_controllers
+    if not live_controllers:
+      return controllers_with_violations
+
     log.debug("Snapshotting live controllers...")
-    for controller in simulation.controller_manager.live_controllers:
-      controller_snapshot = controller.snapshot_service.fetchSnapshot(controller)
-      log.debug("Computing physical omega...")
-      physical_omega = InvariantChecker.compute_physical_omega(simulation.topology.live_switches,
-                                                               simulation.topology.live_links,
-                                                               simulation.topology.access_links)
+    controller2snapshot = InvariantChecker.fetch_snapshots(live_controllers)
+    log.debug("Computing physical omega...")
+    physical_omega = InvariantChecker.compute_physical_omega(simulation.topology.live_switches,
+                                                             simulation.topology.live_links,
+                                                             simulation.topology.access_links)
+    for controller in live_controllers:
+      controller_snapshot = controller2snapshot[controller]
       log.debug("Computing controller omega...")
       # note: using all_switches to compute the controller omega. The controller might still
       # reference switches in his omega that are currently dead, which should result in a
@@ -210,13 +246,53 @@ class InvariantChecker(object):
     physical_omega = hsa.compute_omega(name_tf_pairs, TTF, edge_links)
     return physical_omega
 
+  @staticmethod
+  def fetch_snapshots(controllers):
+    ''' Fetch snapshots from all controllers concurrently. Return a dict
+    { controller -> Snapshot } '''
+    # Controllers normally share a single snapshot service, but don't
+    # assume so
+    service2controllers = []
+    for controller in controllers:
+      for (service, members) in service2controllers:
+        if service is controller.snapshot_service:
+          members.append(controller)
+          break
+      else:
+        service2controllers.append((controller.snapshot_service, [controller]))
+
+    controller2snapshot = {}
+    for (service, members) in service2controllers:
+      controller2snapshot.update(service.fetchSnapshots(members))
+    return controller2snapshot
+
   @staticmethod
   def compute_controller_omega(controller_snapshot, live_switches, live_links, edge_links):
-    name_tf_pairs = hsa_topo.tf_pairs_from_snapshot(controller_snapshot, live_switches)
+    # If the controller versions its snapshots, the transfer functions and
+    # omega are cached on the snapshot object, which is reused for as long
+    # as the controller's NOM doesn't change.
+    cache = None
+    if getattr(controller_snapshot, "version", None) is not None:
+      cache = controller_snapshot.cache
+    switches_key = tuple(sw.dpid for sw in live_switches)
+    omega_key = (switches_key, frozenset(live_links), tuple(edge_links))
+    if cache is not None and "omega" in cache and cache["omega"][0] == omega_key:
+      log.debug("Controller snapshot unchanged; reusing controller omega")
+      return cache["omega"][1]
+
+    if cache is not None and "tf_pairs" in cache and cache["tf_pairs"][0] == switches_key:
+      name_tf_pairs = cache["tf_pairs"][1]
+    else:
+      name_tf_pairs = hsa_topo.tf_pairs_from_snapshot(controller_snapshot, live_switches)
+      if cache is not None:
+        cache["tf_pairs"] = (switches_key, name_tf_pairs)
     # Frenetic doesn't store any link or host information.
     # No virtualization though, so we can assume the same TTF. TODO(cs): for now...
     TTF = hsa_topo.generate_TTF(live_links)
-    return hsa.compute_omega(name_tf_pairs, TTF, edge_links)
+    omega = hsa.compute_omega(name_tf_pairs, TTF, edge_links)
+    if cache is not None:
+      cache["omega"] = (omega_key, omega)
+    return omega
 
   @staticmethod
   def _get_transfer_functions(live_switches, live_links):
@@ -266,77 +342,103 @@ class InvariantChecker(object):
                                                 controller_omega, physical_omega)
     return missing_routing_entries or missing_acl_entries
 
-def check_partitions(switches, live_links, access_links):
-  # TODO(cs): lifted directly from pox.forwarding.l2_multi. Highly
-  # redundant!
-
-  # Adjacency map.  [sw1][sw2] -> port from sw1 to sw2
-  adjacency = defaultdict(lambda:defaultdict(lambda:None))
-
-  for link in live_links:
-    # Make sure to disregard links that are adjacent to down switches
-    # (technically those links are still `live', but it's easier to treat it
-    #  this way)
-    if not (link.start_software_switch.failed or
-            link.end_software_switch.failed):
-      adjacency[link.start_software_switch][link.end_software_switch] = link
-
-  # Switches we know of.  [dpid] -> Switch
-  switches = { sw.dpid : sw for sw in switches }
-
-  # [sw1][sw2] -> (distance, intermediate)
-  path_map = defaultdict(lambda:defaultdict(lambda:(None,None)))
-
-  def _calc_paths ():
-    """
-    Essentially Floyd-Warshall algorithm
-    """
-    sws = switches.values()
-    path_map.clear()
-    for k in sws:
-      for j,port in adjacency[k].iteritems():
-        if port is None: continue
-        path_map[k][j] = (1,None)
-      path_map[k][k] = (0,None) # distance, intermediate
-
-    """
-    for i in sws:
-      for j in sws:
-        a = path_map[i][j][0]
-        #a = adjacency[i][j]
-        if a is None: a = "*"
-        print a,
-      print
-    """
-
-    for k in sws:
-      for i in sws:
-        for j in sws:
-          if path_map[i][k][0] is not None:
-            if path_map[k][j][0] is not None:
-              # i -> k -> j exists
-              ikj_dist = path_map[i][k][0]+path_map[k][j][0]
-              if path_map[i][j][0] is None or ikj_dist < path_map[i][j][0]:
-                # i -> k -> j is better than existing
-                path_map[i][j] = (ikj_dist, k)
-
-    """
-    print "--------------------"
-    for i in sws:
-      for j in sws:
-        print path_map[i][j][0],
-      print
-    """
-
-  all_link_pairs = [ (l1,l2) for l1 in access_links
-                                for l2 in access_links if l1 != l2 ]
-
-  _calc_paths()
+def check_partitions(switches, live_links, access_links, connectivity=None):
+  ''' Return the (uniq port id, uniq port id) pairs of access links that
+  can't reach each other over live links, regardless of routing state.
+
+  If connectivity (a SwitchConnectivity) is given, reuse its incrementally
+  maintained components rather than recomputing them from scratch. '''
+  if connectivity is None:
+    connectivity = SwitchConnectivity(switches, live_links)
+
   partioned_pairs = set()
-  for link_pair in all_link_pairs:
-    if path_map[link_pair[0].switch][link_pair[1].switch] == (None,None):
-      id1 = get_uniq_port_id(link_pair[0].switch, link_pair[0].switch_port)
-      id2 = get_uniq_port_id(link_pair[1].switch, link_pair[1].switch_port)
-      partioned_pairs.add((id1,id2))
+  for l1 in access_links:
+    for l2 in access_links:
+      if l1 != l2 and not connectivity.reachable(l1.switch, l2.switch):
+        id1 = get_uniq_port_id(l1.switch, l1.switch_port)
+        id2 = get_uniq_port_id(l2.switch, l2.switch_port)
+        partioned_pairs.add((id1,id2))
   return partioned_pairs
 
+class AsyncInvariantCheck(object):
+  '''
+  Runs an invariant check against a snapshot of the simulation, taken now,
+  while the simulation moves on.
+
+  The snapshot is a fork of this process: the worker sees the flow tables and
+  topology exactly as they are now, and runs the (possibly slow) HSA
+  computations without blocking the parent. The worker must not talk to the
+  controllers, whose sockets it shares with the parent, so controller liveness
+  (and, if fetch_controller_snapshots, the controllers' snapshots) are
+  fetched here before forking, and handed to the check.
+  '''
+  def __init__(self, invariant_check, simulation, round,
+               fetch_controller_snapshots=False):
+    self.round = round
+    controller_manager = simulation.controller_manager
+    dead_controllers = controller_manager.check_controller_processes_alive()
+    controller2snapshot = {}
+    if fetch_controller_snapshots and controller_manager.live_controllers:
+      controller2snapshot = InvariantChecker.fetch_snapshots(
+                              controller_manager.live_controllers)
+
+    (read_fd, write_fd) = os.pipe()
+    self.pid = os.fork()
+    if self.pid == 0:
+      os.close(read_fd)
+      # Leave ^C to the parent
+      signal.signal(signal.SIGINT, signal.SIG_IGN)
+      controller_manager.check_controller_processes_alive = \
+          lambda: dead_controllers
+      InvariantChecker.fetch_snapshots = \
+          staticmethod(lambda controllers: controller2snapshot)
+      try:
+        result = ("violations",
+                  [ str(v) for v in invariant_check(simulation) ])
+      except SystemExit as e:
+        result = ("exit", e.code)
+      except BaseException:
+        result = ("error", traceback.format_exc())
+      with os.fdopen(write_fd, 'wb') as output:
+        cPickle.dump(result, output, cPickle.HIGHEST_PROTOCOL)
+      # Skip the parent's atexit handlers and buffered output
+      os._exit(0)
+    os.close(write_fd)
+    self._input = os.fdopen(read_fd, 'rb')
+    self._result = None
+
+  def done(self):
+    ''' Return whether the result is ready, without blocking '''
+    if self._result is not None:
+      return True
+    return select.select([self._input], [], [], 0)[0] != []
+
+  def result(self):
+    '''
+    Block until the check has finished, and return its violations (as
+    strings). A check that called sys.exit() does so here too.
+    '''
+    if self._result is None:
+      try:
+        self._result = cPickle.load(self._input)
+      except EOFError:
+        self._result = ("error", "Invariant check worker %d died" % self.pid)
+      self._input.close()
+      os.waitpid(self.pid, 0)
+    (kind, value) = self._result
+    if kind == "exit":
+      raise SystemExit(value)
+    if kind == "error":
+      raise RuntimeError("Invariant check of round %d failed:\n%s" %
+                         (self.round, value))
+    return value
+
+  def kill(self):
+    if self._result is None:
+      try:
+        os.kill(self.pid, signal.SIGKILL)
+        os.waitpid(self.pid, 0)
+      except OSError:
+        pass
+      self._input.close()
+      self._result = ("error", "killed")
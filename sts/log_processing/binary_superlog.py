@@ -0,0 +1,490 @@
+'''
+A compact binary encoding of `superlog's, with random access.
+
+Each event becomes a typed record: the fields every event has (class, label,
+round, time) are packed into a fixed-size header, and the remaining fields
+are encoded in the order given by the record's layout -- the interned list of
+keys for that event type -- so key names are not repeated per event.
+Strings, layouts and fingerprints are interned in tables, so the thousands of
+identical ControlMessageReceive/DataplanePermit fingerprints in a large trace
+are stored once.
+
+The file also contains an index of records by label and by round, so
+individual events can be found and decoded without touching the rest of the
+file.
+
+File layout (all integers little-endian):
+  - a fixed-size header (_header)
+  - the records, one after the other
+  - the string table: (n+1) uint32 offsets into a blob of UTF-8 strings
+  - the layout table: one encoded value per layout
+  - the fingerprint table: (n+1) uint32 offsets into a blob of JSON texts
+  - the record table: one uint64 offset per record
+  - the label index: (label string id, record) pairs, sorted by label
+  - the round index: (round, record) pairs, sorted by round then record
+
+Conversion to and from the JSON format is lossless: decoding a record yields
+the same JSON value, with the same key order, as the original line.
+'''
+
+from array import array
+import bisect
+import json
+import mmap
+import struct
+import sys
+from collections import OrderedDict
+
+BINARY_SUPERLOG_MAGIC = "STSLOGB\x00"
+BINARY_SUPERLOG_VERSION = 1
+
+_header = struct.Struct("<8sIIIII6Q")
+_record_layout = struct.Struct("<I")
+# label string id, round, time seconds, time microseconds
+_record_typed = struct.Struct("<Iiqq")
+_u32 = struct.Struct("<I")
+_i64 = struct.Struct("<q")
+_f64 = struct.Struct("<d")
+_label_entry = struct.Struct("<II")
+_round_entry = struct.Struct("<iI")
+
+# Fields packed into the typed record header
+_typed_fields = ("class", "label", "round", "time")
+# Fields whose values are interned in the fingerprint table
+_fingerprint_fields = ("fingerprint", "_fingerprint")
+
+_INT64_MIN = -(1 << 63)
+_INT64_MAX = (1 << 63) - 1
+_INT32_MIN = -(1 << 31)
+_INT32_MAX = (1 << 31) - 1
+
+def is_binary_superlog(path):
+  with open(path, 'rb') as f:
+    return f.read(len(BINARY_SUPERLOG_MAGIC)) == BINARY_SUPERLOG_MAGIC
+
+def _is_int(value):
+  return type(value) in (int, long)
+
+def _fits_int64(value):
+  return _is_int(value) and _INT64_MIN <= value <= _INT64_MAX
+
+def _is_typed(json_hash):
+  ''' Can json_hash's common fields be packed into a typed record header? '''
+  if not all(field in json_hash for field in _typed_fields):
+    return False
+  time = json_hash['time']
+  return (isinstance(json_hash['class'], basestring) and
+          isinstance(json_hash['label'], basestring) and
+          _is_int(json_hash['round']) and
+          _INT32_MIN <= json_hash['round'] <= _INT32_MAX and
+          type(time) == list and len(time) == 2 and
+          all(_fits_int64(t) for t in time))
+
+class BinarySuperlogWriter(object):
+  ''' Writes json hashes (one per event) to a binary superlog '''
+  def __init__(self, path):
+    self.path = path
+    self.output = open(path, 'w+b')
+    self.output.write("\x00" * _header.size)
+    self._position = _header.size
+    self._strings = []
+    self._string2id = {}
+    self._layouts = []
+    self._layout2id = {}
+    self._fingerprints = []
+    self._fingerprint2id = {}
+    self._record_offsets = []
+    # (label string id, record)
+    self._labels = []
+    # (round, record)
+    self._rounds = []
+
+  def _string_id(self, string):
+    if type(string) != unicode:
+      string = string.decode('utf-8')
+    if string not in self._string2id:
+      self._string2id[string] = len(self._strings)
+      self._strings.append(string)
+    return self._string2id[string]
+
+  def _fingerprint_id(self, value):
+    text = json.dumps(value)
+    if text not in self._fingerprint2id:
+      self._fingerprint2id[text] = len(self._fingerprints)
+      self._fingerprints.append(text)
+    return self._fingerprint2id[text]
+
+  def _layout_id(self, typed, class_name, keys):
+    layout = (typed, class_name, keys)
+    if layout not in self._layout2id:
+      self._layout2id[layout] = len(self._layouts)
+      self._layouts.append(layout)
+    return self._layout2id[layout]
+
+  def _encode(self, value, chunks):
+    ''' Append the encoding of JSON value to chunks '''
+    if value is None:
+      chunks.append("n")
+    elif value is True:
+      chunks.append("t")
+    elif value is False:
+      chunks.append("f")
+    elif _fits_int64(value):
+      chunks.append("i" + _i64.pack(value))
+    elif _is_int(value):
+      chunks.append("L" + _u32.pack(self._string_id(str(value))))
+    elif type(value) == float:
+      chunks.append("d" + _f64.pack(value))
+    elif isinstance(value, basestring):
+      chunks.append("s" + _u32.pack(self._string_id(value)))
+    elif type(value) in (list, tuple):
+      chunks.append("l" + _u32.pack(len(value)))
+      for item in value:
+        self._encode(item, chunks)
+    elif isinstance(value, dict):
+      chunks.append("m" + _u32.pack(len(value)))
+      for (key, item) in value.iteritems():
+        chunks.append(_u32.pack(self._string_id(key)))
+        self._encode(item, chunks)
+    else:
+      raise ValueError("Can't encode %s (type %s)" % (repr(value), type(value)))
+
+  def write(self, json_hash):
+    ''' Append an event. To preserve key order, pass an OrderedDict '''
+    record = len(self._record_offsets)
+    keys = tuple(json_hash.keys())
+    typed = _is_typed(json_hash)
+    chunks = []
+    if typed:
+      class_name = json_hash['class']
+      if type(class_name) != unicode:
+        class_name = class_name.decode('utf-8')
+      body_keys = [ key for key in keys if key not in _typed_fields ]
+      label_id = self._string_id(json_hash['label'])
+      layout_id = self._layout_id(True, class_name, keys)
+      chunks.append(_record_layout.pack(layout_id))
+      chunks.append(_record_typed.pack(label_id, json_hash['round'],
+                                       *json_hash['time']))
+      self._labels.append((label_id, record))
+      self._rounds.append((json_hash['round'], record))
+    else:
+      body_keys = keys
+      layout_id = self._layout_id(False, None, keys)
+      chunks.append(_record_layout.pack(layout_id))
+      if isinstance(json_hash.get('label'), basestring):
+        self._labels.append((self._string_id(json_hash['label']), record))
+    for key in body_keys:
+      value = json_hash[key]
+      if key in _fingerprint_fields and value is not None:
+        chunks.append("p" + _u32.pack(self._fingerprint_id(value)))
+      else:
+        self._encode(value, chunks)
+
+    data = "".join(chunks)
+    self._record_offsets.append(self._position)
+    self.output.write(data)
+    self._position += len(data)
+
+  def _write_blob_table(self, blobs):
+    offsets = array('I')
+    total = 0
+    for blob in blobs:
+      offsets.append(total)
+      total += len(blob)
+    offsets.append(total)
+    if sys.byteorder != "little":
+      offsets.byteswap()
+    self.output.write(offsets.tostring())
+    self.output.write("".join(blobs))
+    self._position += len(offsets) * offsets.itemsize + total
+
+  def close(self):
+    strings_ofs = self._position
+    # Layout keys must be interned before the string table is written
+    layouts = []
+    for (typed, class_name, keys) in self._layouts:
+      chunks = []
+      self._encode([typed, class_name, list(keys)], chunks)
+      layouts.append("".join(chunks))
+    self._write_blob_table([ s.encode('utf-8') for s in self._strings ])
+
+    layouts_ofs = self._position
+    self._write_blob_table(layouts)
+
+    fingerprints_ofs = self._position
+    self._write_blob_table(self._fingerprints)
+
+    records_ofs = self._position
+    self.output.write("".join(_i64.pack(ofs) for ofs in self._record_offsets))
+    self._position += _i64.size * len(self._record_offsets)
+
+    labels_ofs = self._position
+    strings = self._strings
+    self._labels.sort(key=lambda (label_id, record):
+                      (strings[label_id].encode('utf-8'), record))
+    self.output.write("".join(_label_entry.pack(*entry) for entry in self._labels))
+    self._position += _label_entry.size * len(self._labels)
+
+    rounds_ofs = self._position
+    self._rounds.sort()
+    self.output.write("".join(_round_entry.pack(*entry) for entry in self._rounds))
+    self._position += _round_entry.size * len(self._rounds)
+
+    self.output.seek(0)
+    self.output.write(_header.pack(BINARY_SUPERLOG_MAGIC,
+                                   BINARY_SUPERLOG_VERSION,
+                                   len(self._record_offsets),
+                                   len(self._strings), len(self._layouts),
+                                   len(self._fingerprints), strings_ofs,
+                                   layouts_ofs, fingerprints_ofs, records_ofs,
+                                   labels_ofs, rounds_ofs))
+    self.output.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+class BinarySuperlog(object):
+  '''
+  Random access to the records of a binary superlog. Nothing is decoded
+  until it is asked for.
+  '''
+  def __init__(self, path):
+    self.path = path
+    f = open(path, 'rb')
+    try:
+      self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+      f.close()
+    (magic, version, self.num_records, num_strings, num_layouts,
+     num_fingerprints, strings_ofs, layouts_ofs, fingerprints_ofs,
+     self._records_ofs, self._labels_ofs,
+     self._rounds_ofs) = _header.unpack_from(self.data, 0)
+    if magic != BINARY_SUPERLOG_MAGIC:
+      raise ValueError("%s is not a binary superlog" % path)
+    if version != BINARY_SUPERLOG_VERSION:
+      raise ValueError("Unsupported binary superlog version %d" % version)
+    self._strings = self._blob_table(strings_ofs, num_strings)
+    self._string_cache = {}
+    self._fingerprints = self._blob_table(fingerprints_ofs, num_fingerprints)
+    (layout_offsets, layout_blobs_ofs) = self._blob_table(layouts_ofs,
+                                                          num_layouts)
+    self._layouts = []
+    for i in xrange(num_layouts):
+      (typed, class_name, keys) = self._decode(layout_blobs_ofs +
+                                               layout_offsets[i], dict)[0]
+      body_keys = keys
+      if typed:
+        body_keys = [ key for key in keys if key not in _typed_fields ]
+      self._layouts.append((typed, class_name, keys, body_keys))
+    self._num_labels = (self._rounds_ofs - self._labels_ofs) / _label_entry.size
+
+  def close(self):
+    self.data.close()
+
+  def __len__(self):
+    return self.num_records
+
+  def _blob_table(self, ofs, n):
+    offsets = array('I')
+    offsets.fromstring(self.data[ofs:ofs + (n + 1) * offsets.itemsize])
+    if sys.byteorder != "little":
+      offsets.byteswap()
+    return (offsets, ofs + (n + 1) * offsets.itemsize)
+
+  def _string(self, string_id):
+    if string_id not in self._string_cache:
+      (offsets, blob_ofs) = self._strings
+      self._string_cache[string_id] = \
+          self.data[blob_ofs + offsets[string_id]:
+                    blob_ofs + offsets[string_id + 1]].decode('utf-8')
+    return self._string_cache[string_id]
+
+  def _fingerprint(self, fingerprint_id, dict_class):
+    (offsets, blob_ofs) = self._fingerprints
+    text = self.data[blob_ofs + offsets[fingerprint_id]:
+                     blob_ofs + offsets[fingerprint_id + 1]]
+    if dict_class is dict:
+      return json.loads(text)
+    return json.loads(text, object_pairs_hook=dict_class)
+
+  def _decode(self, ofs, dict_class):
+    ''' Decode the value at ofs. Return (value, offset past the value) '''
+    data = self.data
+    tag = data[ofs]
+    ofs += 1
+    if tag == "n":
+      return (None, ofs)
+    if tag == "t":
+      return (True, ofs)
+    if tag == "f":
+      return (False, ofs)
+    if tag == "i":
+      return (_i64.unpack_from(data, ofs)[0], ofs + _i64.size)
+    if tag == "d":
+      return (_f64.unpack_from(data, ofs)[0], ofs + _f64.size)
+    if tag == "s":
+      return (self._string(_u32.unpack_from(data, ofs)[0]), ofs + _u32.size)
+    if tag == "L":
+      return (long(self._string(_u32.unpack_from(data, ofs)[0])),
+              ofs + _u32.size)
+    if tag == "p":
+      return (self._fingerprint(_u32.unpack_from(data, ofs)[0], dict_class),
+              ofs + _u32.size)
+    if tag == "l":
+      n = _u32.unpack_from(data, ofs)[0]
+      ofs += _u32.size
+      items = []
+      for _ in xrange(n):
+        (item, ofs) = self._decode(ofs, dict_class)
+        items.append(item)
+      return (items, ofs)
+    if tag == "m":
+      n = _u32.unpack_from(data, ofs)[0]
+      ofs += _u32.size
+      items = dict_class()
+      for _ in xrange(n):
+        key = self._string(_u32.unpack_from(data, ofs)[0])
+        (items[key], ofs) = self._decode(ofs + _u32.size, dict_class)
+      return (items, ofs)
+    raise ValueError("Corrupt binary superlog %s: unknown tag %s at %d" %
+                     (self.path, repr(tag), ofs - 1))
+
+  def _record_offset(self, index):
+    if index < 0:
+      index += self.num_records
+    if not 0 <= index < self.num_records:
+      raise IndexError("record index out of range")
+    return _i64.unpack_from(self.data, self._records_ofs + index * _i64.size)[0]
+
+  def _header(self, index):
+    ''' Return (layout, typed header or None, body offset) for record index '''
+    ofs = self._record_offset(index)
+    layout = self._layouts[_record_layout.unpack_from(self.data, ofs)[0]]
+    ofs += _record_layout.size
+    if layout[0]:
+      return (layout, _record_typed.unpack_from(self.data, ofs),
+              ofs + _record_typed.size)
+    return (layout, None, ofs)
+
+  def json_hash(self, index, dict_class=dict):
+    '''
+    Decode record index into the json hash it was written from. Pass
+    dict_class=OrderedDict to preserve the original key order.
+    '''
+    ((typed, class_name, keys, body_keys), header, ofs) = self._header(index)
+    values = {}
+    for key in body_keys:
+      (values[key], ofs) = self._decode(ofs, dict_class)
+    if typed:
+      (label_id, round, seconds, micro_seconds) = header
+      values['class'] = class_name
+      values['label'] = self._string(label_id)
+      values['round'] = round
+      values['time'] = [seconds, micro_seconds]
+    if dict_class is dict:
+      return values
+    return dict_class((key, values[key]) for key in keys)
+
+  def class_name(self, index):
+    ''' The event class of record index, without decoding the record '''
+    ((typed, class_name, _, _), _, _) = self._header(index)
+    if typed:
+      return class_name
+    return self.json_hash(index).get('class')
+
+  def label(self, index):
+    ((typed, _, _, _), header, _) = self._header(index)
+    if typed:
+      return self._string(header[0])
+    return self.json_hash(index).get('label')
+
+  def round(self, index):
+    ((typed, _, _, _), header, _) = self._header(index)
+    if typed:
+      return header[1]
+    return self.json_hash(index).get('round')
+
+  def index_of_label(self, label):
+    ''' Return the index of the record with the given label, or None '''
+    if type(label) != unicode:
+      label = label.decode('utf-8')
+    target = label.encode('utf-8')
+    lo = 0
+    hi = self._num_labels
+    while lo < hi:
+      mid = (lo + hi) / 2
+      (label_id, record) = _label_entry.unpack_from(self.data,
+          self._labels_ofs + mid * _label_entry.size)
+      mid_label = self._string(label_id).encode('utf-8')
+      if mid_label < target:
+        lo = mid + 1
+      elif mid_label > target:
+        hi = mid
+      else:
+        return record
+    return None
+
+  def _round_entry(self, i):
+    return _round_entry.unpack_from(self.data,
+                                    self._rounds_ofs + i * _round_entry.size)
+
+  def indices_for_round(self, round):
+    ''' Return the indices of the records logged in round, in order '''
+    entries = _RoundEntries(self)
+    start = bisect.bisect_left(entries, (round, 0))
+    end = bisect.bisect_left(entries, (round + 1, 0))
+    return [ entries[i][1] for i in xrange(start, end) ]
+
+  def rounds(self):
+    ''' Return the sorted list of distinct rounds '''
+    entries = _RoundEntries(self)
+    rounds = []
+    i = 0
+    while i < len(entries):
+      round = entries[i][0]
+      rounds.append(round)
+      i = bisect.bisect_left(entries, (round + 1, 0), i)
+    return rounds
+
+  def __iter__(self):
+    for i in xrange(self.num_records):
+      yield self.json_hash(i)
+
+class _RoundEntries(object):
+  ''' Sequence view of the round index, for bisect '''
+  def __init__(self, superlog):
+    self.superlog = superlog
+    self.n = ((len(superlog.data) - superlog._rounds_ofs) / _round_entry.size)
+
+  def __len__(self):
+    return self.n
+
+  def __getitem__(self, i):
+    return self.superlog._round_entry(i)
+
+def json_to_binary(json_path, binary_path):
+  ''' Convert a JSON superlog to a binary one. Return the number of events '''
+  count = 0
+  with open(json_path) as logfile:
+    with BinarySuperlogWriter(binary_path) as writer:
+      for line in logfile:
+        line = line.strip()
+        if line == "":
+          continue
+        writer.write(json.loads(line, object_pairs_hook=OrderedDict))
+        count += 1
+  return count
+
+def binary_to_json(binary_path, json_path):
+  ''' Convert a binary superlog to a JSON one. Return the number of events '''
+  superlog = BinarySuperlog(binary_path)
+  try:
+    with open(json_path, 'w') as output:
+      for i in xrange(len(superlog)):
+        output.write(json.dumps(superlog.json_hash(i, OrderedDict)) + '\n')
+    return len(superlog)
+  finally:
+    superlog.close()
@@ -0,0 +1,162 @@
+'''
+A side-log of the raw OpenFlow messages exchanged during a recording.
+
+The superlog only keeps OpenFlow fingerprints. When enabled (see
+sts.input_traces.input_logger.InputLogger), the GodScheduler also appends
+every message it lets through to a side-log next to the superlog, tagged with
+the label of the ControlMessageReceive/ControlMessageSend event that was
+logged for it, so that full message contents can be recovered without
+re-running the experiment.
+
+File layout (all integers little-endian):
+  - OPENFLOW_SIDELOG_MAGIC
+  - the records: (_record_header, label, raw message) triples
+  - the connection table, a json list of [dpid, controller id] pairs
+  - the record table: one uint64 offset per record
+  - _footer: connection table offset, record table offset, number of
+    records, OPENFLOW_SIDELOG_MAGIC
+
+Writes go through a large file buffer, so recording pays little more than
+packing each message.
+'''
+
+from array import array
+import json
+import mmap
+import struct
+from collections import namedtuple
+
+OPENFLOW_SIDELOG_MAGIC = "STSOFL1\x00"
+OPENFLOW_SIDELOG_SUFFIX = ".of"
+
+# connection id, timestamp (seconds since the epoch), direction, label length,
+# message length
+_record_header = struct.Struct("<IdBHI")
+# connection table offset, record table offset, number of records, magic
+_footer = struct.Struct("<QQQ8s")
+_u64 = struct.Struct("<Q")
+
+# Directions, named after the corresponding replay events
+RECEIVE = 0   # controller -> switch (ControlMessageReceive)
+SEND = 1      # switch -> controller (ControlMessageSend)
+
+OpenFlowRecord = namedtuple('OpenFlowRecord', ['label', 'dpid', 'controller_id',
+                                               'direction', 'time', 'raw'])
+
+def _hashable(value):
+  if type(value) == list:
+    return tuple(_hashable(v) for v in value)
+  return value
+
+class OpenFlowSideLogWriter(object):
+  ''' Appends raw OpenFlow messages to a side-log '''
+  def __init__(self, path, buffer_size=1 << 20):
+    self.path = path
+    self.output = open(path, 'wb', buffer_size)
+    self.output.write(OPENFLOW_SIDELOG_MAGIC)
+    self._position = len(OPENFLOW_SIDELOG_MAGIC)
+    self.connections = []
+    self._connection2id = {}
+    self._record_offsets = array('L')
+    self.closed = False
+
+  def write_raw(self, label, dpid, controller_id, direction, raw, time):
+    ''' Append a packed message. label is the label of the replay event that
+    the message was logged as (or None) '''
+    connection = (dpid, controller_id)
+    if connection not in self._connection2id:
+      self._connection2id[connection] = len(self.connections)
+      self.connections.append(connection)
+    label = "" if label is None else label.encode('utf-8')
+    self._record_offsets.append(self._position)
+    data = "".join((_record_header.pack(self._connection2id[connection], time,
+                                        direction, len(label), len(raw)),
+                    label, raw))
+    self.output.write(data)
+    self._position += len(data)
+
+  def write(self, label, dpid, controller_id, direction, ofp_message, time):
+    self.write_raw(label, dpid, controller_id, direction, ofp_message.pack(),
+                   time)
+
+  def close(self):
+    if self.closed:
+      return
+    self.closed = True
+    connections_ofs = self._position
+    connections = json.dumps([ list(connection)
+                               for connection in self.connections ])
+    self.output.write(connections)
+    records_ofs = connections_ofs + len(connections)
+    self.output.write("".join(_u64.pack(ofs) for ofs in self._record_offsets))
+    self.output.write(_footer.pack(connections_ofs, records_ofs,
+                                   len(self._record_offsets),
+                                   OPENFLOW_SIDELOG_MAGIC))
+    self.output.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+class OpenFlowSideLog(object):
+  ''' Random access to the records of a memory-mapped side-log '''
+  def __init__(self, path):
+    with open(path, 'rb') as sidelog:
+      self.data = mmap.mmap(sidelog.fileno(), 0, access=mmap.ACCESS_READ)
+    if self.data[:len(OPENFLOW_SIDELOG_MAGIC)] != OPENFLOW_SIDELOG_MAGIC:
+      raise ValueError("%s is not an OpenFlow side-log" % path)
+    magic = None
+    if len(self.data) >= len(OPENFLOW_SIDELOG_MAGIC) + _footer.size:
+      (connections_ofs, self._records_ofs, self.num_records, magic) = \
+          _footer.unpack_from(self.data, len(self.data) - _footer.size)
+    if magic != OPENFLOW_SIDELOG_MAGIC:
+      raise ValueError("%s is not a complete OpenFlow side-log" % path)
+    self.connections = [ tuple(_hashable(c) for c in connection)
+                         for connection in
+                         json.loads(self.data[connections_ofs:
+                                              self._records_ofs]) ]
+    self._label2index = None
+
+  def __len__(self):
+    return self.num_records
+
+  def close(self):
+    self.data.close()
+
+  def record(self, index):
+    ''' Return record index as an OpenFlowRecord '''
+    if not 0 <= index < self.num_records:
+      raise IndexError("record index out of range")
+    ofs = _u64.unpack_from(self.data, self._records_ofs + index * _u64.size)[0]
+    (connection_id, time, direction, label_length, length) = \
+        _record_header.unpack_from(self.data, ofs)
+    ofs += _record_header.size
+    label = self.data[ofs:ofs + label_length].decode('utf-8') or None
+    ofs += label_length
+    (dpid, controller_id) = self.connections[connection_id]
+    return OpenFlowRecord(label, dpid, controller_id, direction, time,
+                          self.data[ofs:ofs + length])
+
+  def __iter__(self):
+    for i in xrange(self.num_records):
+      yield self.record(i)
+
+  def record_for_label(self, label):
+    ''' Return the record logged for the replay event with the given label, or
+    None '''
+    if self._label2index is None:
+      self._label2index = {}
+      for i in xrange(self.num_records):
+        ofs = _u64.unpack_from(self.data, self._records_ofs + i * _u64.size)[0]
+        label_length = _record_header.unpack_from(self.data, ofs)[3]
+        if label_length > 0:
+          ofs += _record_header.size
+          self._label2index[self.data[ofs:ofs + label_length]] = i
+    if isinstance(label, unicode):
+      label = label.encode('utf-8')
+    index = self._label2index.get(label)
+    if index is None:
+      return None
+    return self.record(index)
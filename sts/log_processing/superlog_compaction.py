@@ -0,0 +1,87 @@
+'''
+Run-length compaction of dataplane events in `superlog's.
+
+Traffic-heavy recordings contain long runs of consecutive DataplanePermit (or
+DataplaneDrop) events that differ only in their labels and timestamps. A run
+is replaced by its first event, annotated with:
+  'count':    the number of events in the run
+  'end_time': the timestamp of the last event in the run
+
+sts.control_flow.replayer.DataplaneChecker treats a compacted event as count
+identical events. Events are only merged within a round, so the checker's
+round-based window is unchanged. Note that a compacted DataplaneDrop is an
+input event, so it is pruned as a unit.
+'''
+
+import json
+
+compactable_classes = set(["DataplanePermit", "DataplaneDrop"])
+# Fields that may differ between the events of a run
+_run_fields = set(["label", "time", "count", "end_time"])
+
+def _run_key(json_hash):
+  ''' Return the fields that must be equal for json_hash to join a run '''
+  return json.dumps(dict((k, v) for (k, v) in json_hash.iteritems()
+                         if k not in _run_fields), sort_keys=True)
+
+def referenced_labels(json_hashes):
+  ''' Return the set of labels that some event depends on '''
+  labels = set()
+  for json_hash in json_hashes:
+    labels.update(json_hash.get('dependent_labels', ()))
+  return labels
+
+def compact_dataplane_runs(json_hashes, keep_labels=frozenset()):
+  '''
+  Given an iterable of event json hashes, yield them with runs of identical
+  dataplane events merged. Events whose labels are in keep_labels (e.g. the
+  result of referenced_labels()) are never merged into a preceding run.
+  '''
+  run = None
+  run_key = None
+  for json_hash in json_hashes:
+    if (json_hash.get('class') in compactable_classes and
+        not json_hash.get('dependent_labels')):
+      key = _run_key(json_hash)
+      if (run is not None and key == run_key and
+          json_hash['label'] not in keep_labels):
+        run['count'] = run.get('count', 1) + json_hash.get('count', 1)
+        run['end_time'] = json_hash.get('end_time') or json_hash['time']
+        continue
+      if run is not None:
+        yield run
+      run = dict(json_hash)
+      run_key = key
+      continue
+    if run is not None:
+      yield run
+      run = None
+    yield json_hash
+  if run is not None:
+    yield run
+
+def compact_superlog(input_path, output_path):
+  '''
+  Compact the JSON superlog at input_path into output_path. Return
+  (number of events read, number of events written).
+  '''
+  def read_json_hashes():
+    with open(input_path) as input_file:
+      for line in input_file:
+        line = line.strip()
+        if line != "":
+          yield json.loads(line)
+
+  keep_labels = referenced_labels(read_json_hashes())
+  counts = {"read" : 0, "written" : 0}
+  def count_read(json_hashes):
+    for json_hash in json_hashes:
+      counts["read"] += 1
+      yield json_hash
+
+  with open(output_path, 'w') as output:
+    for json_hash in compact_dataplane_runs(count_read(read_json_hashes()),
+                                            keep_labels):
+      output.write(json.dumps(json_hash) + '\n')
+      counts["written"] += 1
+  return (counts["read"], counts["written"])
@@ -0,0 +1,290 @@
+'''
+Aligns two `superlog's (e.g. an original run and a replay of it) and reports
+the events that are missing, extra, or reordered in the second.
+
+Events are compared by class and fingerprint (or, for events that don't log a
+fingerprint, by all of their fields other than label, time and round).
+Alignment works like patience diff: events that occur exactly once in both
+logs are used as anchors, and the gaps between anchors are aligned
+recursively. Once no unique events are left, a gap is aligned with a bounded
+Myers diff if it is small, and otherwise with a greedy banded alignment. Long
+logs that mostly agree are therefore aligned in close to linear time.
+
+Events that are unmatched in both logs but have the same key are reported as
+reordered rather than as missing and extra.
+'''
+
+import bisect
+import json
+from collections import deque
+
+from sts.log_processing.binary_superlog import BinarySuperlog, is_binary_superlog
+
+# Fields that are expected to differ between runs
+_volatile_fields = set(["label", "time", "round", "dependent_labels",
+                        "prunable", "timeout_disallowed", "count", "end_time"])
+
+def _freeze(value):
+  ''' A hashable equivalent of a json value '''
+  if type(value) == dict:
+    return tuple(sorted((k, _freeze(v)) for (k, v) in value.iteritems()))
+  if type(value) == list:
+    return tuple(_freeze(v) for v in value)
+  return value
+
+def event_key(json_hash):
+  ''' The identity of an event for the purposes of alignment '''
+  if 'fingerprint' in json_hash:
+    return (json_hash['class'], _freeze(json_hash['fingerprint']))
+  return tuple(sorted((k, _freeze(v)) for (k, v) in json_hash.iteritems()
+                      if k not in _volatile_fields))
+
+def is_internal(json_hash):
+  ''' Internal events are labeled i<n> (see sts.replay_event.InternalEvent) '''
+  return json_hash['label'].startswith("i")
+
+class LoggedEvent(object):
+  ''' The parts of an event json hash needed for alignment and reporting '''
+  __slots__ = ["index", "label", "class_name", "round", "key", "internal"]
+
+  def __init__(self, index, json_hash, key_id):
+    self.index = index
+    self.label = json_hash['label']
+    self.class_name = json_hash['class']
+    self.round = json_hash.get('round', -1)
+    self.key = key_id
+    self.internal = is_internal(json_hash)
+
+  def __str__(self):
+    return "round %d: %s %s" % (self.round, self.label, self.class_name)
+
+def read_superlog(path, key2id):
+  ''' Return the LoggedEvents of the superlog at path. key2id interns event
+  keys into small integers, and is shared between the logs being compared. '''
+  def read_json_hashes():
+    if is_binary_superlog(path):
+      superlog = BinarySuperlog(path)
+      try:
+        for json_hash in superlog:
+          yield json_hash
+      finally:
+        superlog.close()
+    else:
+      with open(path) as logfile:
+        for line in logfile:
+          if line.strip() != "":
+            yield json.loads(line)
+
+  events = []
+  for json_hash in read_json_hashes():
+    key = event_key(json_hash)
+    key_id = key2id.setdefault(key, len(key2id))
+    events.append(LoggedEvent(len(events), json_hash, key_id))
+  return events
+
+def _myers(a, b, max_edits):
+  '''
+  Return the (i, j) index pairs of a longest common subsequence of sequences a
+  and b, or None if more than max_edits insertions and deletions are needed.
+  '''
+  n = len(a)
+  m = len(b)
+  v = {1 : 0}
+  trace = []
+  for d in xrange(max_edits + 1):
+    trace.append(dict(v))
+    for k in xrange(-d, d + 1, 2):
+      if k == -d or (k != d and v[k - 1] < v[k + 1]):
+        x = v[k + 1]
+      else:
+        x = v[k - 1] + 1
+      y = x - k
+      while x < n and y < m and a[x] == b[y]:
+        x += 1
+        y += 1
+      v[k] = x
+      if x >= n and y >= m:
+        return _myers_backtrack(trace, n, m)
+  return None
+
+def _myers_backtrack(trace, x, y):
+  matches = []
+  for d in xrange(len(trace) - 1, -1, -1):
+    v = trace[d]
+    k = x - y
+    if k == -d or (k != d and v[k - 1] < v[k + 1]):
+      prev_k = k + 1
+    else:
+      prev_k = k - 1
+    prev_x = v[prev_k]
+    prev_y = prev_x - prev_k
+    while x > prev_x and y > prev_y:
+      x -= 1
+      y -= 1
+      matches.append((x, y))
+    x = prev_x
+    y = prev_y
+  matches.reverse()
+  return matches
+
+def _longest_increasing(pairs):
+  ''' Given (i, j) pairs sorted by i, return a longest subsequence that is
+  increasing in j '''
+  tails = []
+  tail_indices = []
+  predecessors = [None] * len(pairs)
+  for (n, (_, j)) in enumerate(pairs):
+    position = bisect.bisect_left(tails, j)
+    if position > 0:
+      predecessors[n] = tail_indices[position - 1]
+    if position == len(tails):
+      tails.append(j)
+      tail_indices.append(n)
+    else:
+      tails[position] = j
+      tail_indices[position] = n
+  result = []
+  n = tail_indices[-1] if tail_indices else None
+  while n is not None:
+    result.append(pairs[n])
+    n = predecessors[n]
+  result.reverse()
+  return result
+
+def align(a, b, max_edits=1000, band=1000):
+  '''
+  Align lists of keys a and b. Return the list of matched (i, j) index
+  pairs, in increasing order. Gaps without unique anchors that need more than
+  max_edits edits are aligned greedily, looking up to band events ahead.
+  '''
+  matches = []
+  # Gaps still to align: (a_lo, a_hi, b_lo, b_hi)
+  gaps = [(0, len(a), 0, len(b))]
+  while gaps:
+    (a_lo, a_hi, b_lo, b_hi) = gaps.pop()
+    # Common prefix and suffix
+    while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+      matches.append((a_lo, b_lo))
+      a_lo += 1
+      b_lo += 1
+    while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+      a_hi -= 1
+      b_hi -= 1
+      matches.append((a_hi, b_hi))
+    if a_lo == a_hi or b_lo == b_hi:
+      continue
+
+    # Anchor on keys that occur exactly once on each side
+    a_counts = {}
+    for i in xrange(a_lo, a_hi):
+      a_counts[a[i]] = a_counts.get(a[i], 0) + 1
+    b_unique = {}
+    b_counts = {}
+    for j in xrange(b_lo, b_hi):
+      b_counts[b[j]] = b_counts.get(b[j], 0) + 1
+      b_unique[b[j]] = j
+    anchors = [ (i, b_unique[a[i]]) for i in xrange(a_lo, a_hi)
+                if a_counts[a[i]] == 1 and b_counts.get(a[i]) == 1 ]
+    anchors = _longest_increasing(anchors)
+    if anchors:
+      (prev_i, prev_j) = (a_lo, b_lo)
+      for (i, j) in anchors:
+        matches.append((i, j))
+        gaps.append((prev_i, i, prev_j, j))
+        (prev_i, prev_j) = (i + 1, j + 1)
+      gaps.append((prev_i, a_hi, prev_j, b_hi))
+      continue
+
+    lcs = None
+    if (a_hi - a_lo) + (b_hi - b_lo) <= 10 * max_edits:
+      lcs = _myers(a[a_lo:a_hi], b[b_lo:b_hi], max_edits)
+    if lcs is not None:
+      matches.extend((a_lo + i, b_lo + j) for (i, j) in lcs)
+    else:
+      matches.extend(_banded(a, b, a_lo, a_hi, b_lo, b_hi, band))
+  matches.sort()
+  return matches
+
+def _banded(a, b, a_lo, a_hi, b_lo, b_hi, band):
+  '''
+  Greedily align a[a_lo:a_hi] with b[b_lo:b_hi], looking at most band events
+  ahead for the next match. Linear time for logs that mostly agree.
+  '''
+  matches = []
+  i = a_lo
+  j = b_lo
+  while i < a_hi and j < b_hi:
+    if a[i] == b[j]:
+      matches.append((i, j))
+      i += 1
+      j += 1
+      continue
+    try:
+      skip_b = b.index(a[i], j + 1, min(b_hi, j + band)) - j
+    except ValueError:
+      skip_b = None
+    try:
+      skip_a = a.index(b[j], i + 1, min(a_hi, i + band)) - i
+    except ValueError:
+      skip_a = None
+    if skip_a is None and skip_b is None:
+      # Neither event occurs nearby on the other side
+      i += 1
+      j += 1
+    elif skip_a is None or (skip_b is not None and skip_b <= skip_a):
+      j += skip_b
+    else:
+      i += skip_a
+  return matches
+
+class SuperlogDiff(object):
+  ''' The result of aligning an original superlog with a new one '''
+  def __init__(self, original, new, max_edits=1000):
+    self.original = original
+    self.new = new
+    self.matches = align([ e.key for e in original ],
+                         [ e.key for e in new ], max_edits=max_edits)
+    matched_original = set(i for (i, _) in self.matches)
+    matched_new = set(j for (_, j) in self.matches)
+    unmatched_original = [ e for e in original if e.index not in matched_original ]
+    unmatched_new = [ e for e in new if e.index not in matched_new ]
+
+    # Unmatched events with the same key on both sides were reordered
+    key2new = {}
+    for e in unmatched_new:
+      key2new.setdefault(e.key, deque()).append(e)
+    # [(original event, new event)]
+    self.reordered = []
+    self.missing = []
+    for e in unmatched_original:
+      if key2new.get(e.key):
+        self.reordered.append((e, key2new[e.key].popleft()))
+      else:
+        self.missing.append(e)
+    reordered_new = set(new_event.index for (_, new_event) in self.reordered)
+    self.extra = [ e for e in unmatched_new if e.index not in reordered_new ]
+
+  def report(self, include_inputs=False):
+    ''' Return a human readable report. Only internal events are listed
+    unless include_inputs is set. '''
+    def listed(e):
+      return include_inputs or e.internal
+
+    missing = [ e for e in self.missing if listed(e) ]
+    extra = [ e for e in self.extra if listed(e) ]
+    reordered = [ (o, n) for (o, n) in self.reordered if listed(o) ]
+    lines = ["Aligned %d of %d original events with %d new events" %
+             (len(self.matches), len(self.original), len(self.new))]
+    lines.append("Missing (%d):" % len(missing))
+    lines += [ "  %s" % e for e in missing ]
+    lines.append("Extra (%d):" % len(extra))
+    lines += [ "  %s" % e for e in extra ]
+    lines.append("Reordered (%d):" % len(reordered))
+    lines += [ "  %s -> round %d: %s" % (o, n.round, n.label)
+               for (o, n) in reordered ]
+    return "\n".join(lines)
+
+def diff_superlogs(original_path, new_path, max_edits=1000):
+  key2id = {}
+  return SuperlogDiff(read_superlog(original_path, key2id),
+                      read_superlog(new_path, key2id), max_edits=max_edits)
@@ -0,0 +1,306 @@
+'''
+A sidecar index of a `superlog', for filtering, counting and histogramming
+events without reparsing the superlog.
+
+The index is built with one pass over the superlog (JSON or binary), and
+stored next to it (see INDEX_SUFFIX). It holds, per event:
+  - where the event is stored (a byte offset for JSON superlogs, a record
+    index for binary ones)
+  - its class, round, time and label
+and posting lists of the events that mention each dpid and controller id.
+Events are only decoded when they are printed.
+
+The index is rebuilt whenever the superlog's size or modification time
+changes.
+'''
+
+from array import array
+import cPickle
+import json
+import os
+
+from sts.log_processing.binary_superlog import BinarySuperlog, is_binary_superlog
+import logging
+log = logging.getLogger("superlog_index")
+
+# Bump whenever the index contents change
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".idx"
+
+histogram_fields = ["class", "round", "dpid", "controller", "time"]
+
+# Classes whose fingerprints are (class, message fingerprint, dpid, _)
+_fingerprint_dpid_classes = set(["DataplanePermit", "DataplaneDrop",
+                                 "ControlMessageReceive", "ControlMessageSend"])
+
+def _dpids(json_hash):
+  ''' The dpids an event refers to '''
+  dpids = set(value for (key, value) in json_hash.iteritems()
+              if key.endswith("dpid") and value is not None)
+  if json_hash.get('class') in _fingerprint_dpid_classes:
+    fingerprint = json_hash.get('fingerprint')
+    if type(fingerprint) == list and len(fingerprint) == 4:
+      dpids.add(fingerprint[2])
+  return dpids
+
+def controller_id_to_str(controller_id):
+  ''' Controller ids are either names or (address, port) lists '''
+  if type(controller_id) in (list, tuple):
+    return ":".join(str(part) for part in controller_id)
+  return str(controller_id)
+
+def _controller_ids(json_hash):
+  ''' The controller ids (see controller_id_to_str) an event refers to '''
+  controller_ids = set()
+  if json_hash.get('controller_id') is not None:
+    controller_ids.add(controller_id_to_str(json_hash['controller_id']))
+  if json_hash.get('class') in ("ControlMessageReceive", "ControlMessageSend"):
+    # (class, OFFingerprint, dpid, controller id)
+    fingerprint = json_hash.get('fingerprint')
+    if type(fingerprint) == list and len(fingerprint) == 4:
+      controller_ids.add(controller_id_to_str(fingerprint[3]))
+  return controller_ids
+
+def _time_to_float(time):
+  if type(time) == list and len(time) == 2:
+    return time[0] + time[1] / 1e6
+  return float("nan")
+
+def _file_signature(path):
+  stat = os.stat(path)
+  return (INDEX_VERSION, stat.st_size, stat.st_mtime)
+
+class SuperlogIndex(object):
+  ''' An index of the events of the superlog at path '''
+  def __init__(self, path):
+    self.path = path
+    self.binary = is_binary_superlog(path)
+    # Where each event is stored
+    self.locations = array('L')
+    # Index into self.classes
+    self.class_ids = array('H')
+    self.classes = []
+    self.rounds = array('i')
+    # Seconds since the epoch, NaN if not logged
+    self.times = array('d')
+    # The labels, newline separated
+    self.labels = ""
+    # dpid -> array of event indices
+    self.dpid_postings = {}
+    # controller id (see controller_id_to_str) -> array of event indices
+    self.controller_postings = {}
+    self._label_list = None
+    self._label2index = None
+    self._superlog = None
+    self._logfile = None
+
+  def __len__(self):
+    return len(self.locations)
+
+  def _json_hashes(self):
+    ''' Yield (location, json hash) for each event of the superlog '''
+    if self.binary:
+      superlog = BinarySuperlog(self.path)
+      try:
+        for i in xrange(len(superlog)):
+          yield (i, superlog.json_hash(i))
+      finally:
+        superlog.close()
+    else:
+      offset = 0
+      with open(self.path, 'rb') as logfile:
+        for line in logfile:
+          if line.strip() != "":
+            yield (offset, json.loads(line))
+          offset += len(line)
+
+  def build(self):
+    class2id = {}
+    labels = []
+    for (location, json_hash) in self._json_hashes():
+      index = len(self.locations)
+      self.locations.append(location)
+      class_name = json_hash.get('class', "")
+      if class_name not in class2id:
+        class2id[class_name] = len(self.classes)
+        self.classes.append(class_name)
+      self.class_ids.append(class2id[class_name])
+      self.rounds.append(json_hash.get('round', -1))
+      self.times.append(_time_to_float(json_hash.get('time')))
+      labels.append(json_hash.get('label', ""))
+      for dpid in _dpids(json_hash):
+        self.dpid_postings.setdefault(dpid, array('L')).append(index)
+      for controller in _controller_ids(json_hash):
+        self.controller_postings.setdefault(controller,
+                                            array('L')).append(index)
+    self.labels = "\n".join(labels)
+
+  _stored_fields = ["locations", "class_ids", "classes", "rounds", "times",
+                    "labels", "dpid_postings", "controller_postings"]
+
+  def store(self, index_path):
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, 'wb') as index_file:
+      pickler = cPickle.Pickler(index_file, cPickle.HIGHEST_PROTOCOL)
+      pickler.dump(_file_signature(self.path))
+      pickler.dump(dict((field, getattr(self, field))
+                        for field in self._stored_fields))
+    os.rename(tmp_path, index_path)
+
+  def load(self, index_path):
+    ''' Load the index stored at index_path. Return whether it was up to
+    date '''
+    if not os.path.exists(index_path):
+      return False
+    try:
+      with open(index_path, 'rb') as index_file:
+        unpickler = cPickle.Unpickler(index_file)
+        if unpickler.load() != _file_signature(self.path):
+          return False
+        self.__dict__.update(unpickler.load())
+    except Exception as e:
+      log.warn("Ignoring unreadable superlog index %s: %s" % (index_path, e))
+      return False
+    return True
+
+  def close(self):
+    if self._superlog is not None:
+      self._superlog.close()
+      self._superlog = None
+    if self._logfile is not None:
+      self._logfile.close()
+      self._logfile = None
+
+  # ------------------------------ Queries ------------------------------ #
+
+  def class_name(self, index):
+    return self.classes[self.class_ids[index]]
+
+  def label(self, index):
+    self._split_labels()
+    return self._label_list[index]
+
+  def index_of_label(self, label):
+    self._split_labels()
+    return self._label2index.get(label)
+
+  def _split_labels(self):
+    if self._label_list is None:
+      self._label_list = self.labels.split("\n") if self.locations else []
+      self._label2index = dict((label, i) for (i, label)
+                               in enumerate(self._label_list))
+
+  def json_hash(self, index):
+    ''' Decode event index from the superlog '''
+    if self.binary:
+      if self._superlog is None:
+        self._superlog = BinarySuperlog(self.path)
+      return self._superlog.json_hash(self.locations[index])
+    if self._logfile is None:
+      self._logfile = open(self.path, 'rb')
+    self._logfile.seek(self.locations[index])
+    return json.loads(self._logfile.readline())
+
+  def select(self, classes=None, dpids=None, controller_ids=None,
+             rounds=None, labels=None, time_range=None):
+    '''
+    Return the sorted indices of the events that match all of the given
+    filters. Each filter is optional:
+      classes:        event class names
+      dpids:          dpids that the event refers to
+      controller_ids: controller ids (see controller_id_to_str)
+      rounds:         (first round, last round), inclusive
+      labels:         event labels
+      time_range:     (start, end) in seconds since the epoch, inclusive
+    '''
+    candidates = None
+    def restrict(indices):
+      if candidates is None:
+        return set(indices)
+      return candidates.intersection(indices)
+
+    if labels is not None:
+      candidates = restrict(i for i in (self.index_of_label(l) for l in labels)
+                            if i is not None)
+    if dpids is not None:
+      candidates = restrict(i for dpid in dpids
+                            for i in self.dpid_postings.get(dpid, ()))
+    if controller_ids is not None:
+      candidates = restrict(i for controller in controller_ids
+                            for i in self.controller_postings.get(controller, ()))
+    if candidates is None:
+      indices = xrange(len(self))
+    else:
+      indices = sorted(candidates)
+
+    if classes is not None:
+      class_ids = set(i for (i, name) in enumerate(self.classes)
+                      if name in classes)
+      event_class_ids = self.class_ids
+      indices = [ i for i in indices if event_class_ids[i] in class_ids ]
+    if rounds is not None:
+      (first_round, last_round) = rounds
+      event_rounds = self.rounds
+      indices = [ i for i in indices
+                  if first_round <= event_rounds[i] <= last_round ]
+    if time_range is not None:
+      (start, end) = time_range
+      event_times = self.times
+      indices = [ i for i in indices if start <= event_times[i] <= end ]
+    return list(indices)
+
+  def histogram(self, indices, field, bucket=1.0):
+    '''
+    Return a sorted list of (value, count) pairs: the number of events in
+    indices with each value of field (one of histogram_fields). Times are
+    grouped into buckets of the given number of seconds.
+    '''
+    counts = {}
+    if field in ("dpid", "controller"):
+      postings = (self.dpid_postings if field == "dpid"
+                  else self.controller_postings)
+      selected = set(indices)
+      for (value, posting) in postings.iteritems():
+        count = sum(1 for i in posting if i in selected)
+        if count > 0:
+          counts[value] = count
+      return sorted(counts.iteritems())
+
+    if field == "time":
+      for i in indices:
+        t = self.times[i]
+        if t == t:
+          # Not NaN
+          t = (t // bucket) * bucket
+        counts[t] = counts.get(t, 0) + 1
+      return sorted(counts.iteritems())
+
+    if field == "class":
+      values = self.class_ids
+    elif field == "round":
+      values = self.rounds
+    else:
+      raise ValueError("Unknown histogram field %s" % field)
+    for i in indices:
+      value = values[i]
+      counts[value] = counts.get(value, 0) + 1
+    if field == "class":
+      return sorted((self.classes[class_id], count)
+                    for (class_id, count) in counts.iteritems())
+    return sorted(counts.iteritems())
+
+def load_index(superlog_path, rebuild=False):
+  '''
+  Return the SuperlogIndex of superlog_path, building (and storing) it if
+  there is no up to date index next to the superlog
+  '''
+  index = SuperlogIndex(superlog_path)
+  index_path = superlog_path + INDEX_SUFFIX
+  if rebuild or not index.load(index_path):
+    log.info("Indexing %s" % superlog_path)
+    index.build()
+    try:
+      index.store(index_path)
+    except (IOError, OSError) as e:
+      log.warn("Could not store superlog index %s: %s" % (index_path, e))
+  return index
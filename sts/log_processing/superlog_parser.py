@@ -14,10 +14,32 @@ Hashes may have additional custom keys. For example, external input events
 must the following key:
   'dependent_labels': list of dependent labels (internal events that will not occur if this
                       event is pruned)
+
+`superlog's may also be stored in the binary format of
+sts.log_processing.binary_superlog, in which case events are decoded lazily,
+as they are accessed.
+
+Parsed JSON superlogs are cached next to the superlog (see
+PARSED_CACHE_SUFFIX), keyed by the superlog's hash and PARSER_VERSION, so that
+loading the same superlog again skips json parsing and Event.from_json.
+
+Large JSON superlogs (see PARALLEL_PARSE_THRESHOLD) are split into
+line-aligned chunks that are decoded by a pool of worker processes. The
+sanity checks, label registration and fingerprint interning are applied to
+the decoded chunks in order, in the parent process. iter_parse_path() yields
+events as soon as they are checked, without waiting for the rest of the
+superlog.
 '''
 
 import json
+import collections
+import cPickle
+import hashlib
+import multiprocessing
+import os
 import sts.replay_event as event
+from sts.fingerprints.base import Fingerprint
+from sts.log_processing.binary_superlog import BinarySuperlog, is_binary_superlog
 import logging
 log = logging.getLogger("superlog_parser")
 
@@ -31,6 +53,16 @@ internal_event_name_to_class = {
   for klass in event.all_internal_events
 }
 
+# Bump whenever parse() or the Event classes change in a way that would make
+# previously cached traces stale
+PARSER_VERSION = 2
+PARSED_CACHE_SUFFIX = ".parsed"
+
+# JSON superlogs at least this large (in bytes) are parsed in parallel
+PARALLEL_PARSE_THRESHOLD = 64 << 20
+# Approximate size of the chunks handed to each worker process
+PARALLEL_CHUNK_SIZE = 8 << 20
+
 def check_unique_label(event_label, existing_event_labels):
   '''Check to make sure that event_label is not in existing_event_labels.
   Throw an exception if this invariant does not hold.
@@ -60,14 +92,105 @@ def sanity_check_internal_event(existing_event_labels, dependent_labels,
   '''
   dependent_labels.discard(json_hash['label'])
 
-def parse_path(logfile_path):
+def parse_path(logfile_path, use_cache=True, processes=None):
   '''Input: path to a logfile.
 
   Output: A list of all the internal and external events in the order in which
   they exist in the logfile. Each internal event is annotated with the set of
-  source events that are necessary conditions for its occurence.'''
-  with open(logfile_path) as logfile:
-    return parse(logfile)
+  source events that are necessary conditions for its occurence.
+
+  If use_cache is set, JSON logfiles are loaded from (and, on a miss,
+  stored to) the parsed-trace cache. See iter_parse_path for processes.'''
+  if is_binary_superlog(logfile_path):
+    return parse_binary(BinarySuperlog(logfile_path))
+  if use_cache:
+    trace = load_cached_trace(logfile_path)
+    if trace is not None:
+      return trace
+  trace = list(iter_parse_path(logfile_path, processes=processes))
+  if use_cache:
+    store_cached_trace(logfile_path, trace)
+  return trace
+
+def iter_parse_path(logfile_path, processes=None):
+  '''Generator version of parse_path (without the parsed-trace cache): yields
+  each event as soon as it and all events before it have been parsed.
+
+  JSON logfiles of at least PARALLEL_PARSE_THRESHOLD bytes are parsed by
+  processes worker processes (default: one per CPU). Pass processes=1 to
+  always parse in this process.'''
+  if is_binary_superlog(logfile_path):
+    for e in parse_binary(BinarySuperlog(logfile_path)):
+      yield e
+  elif (processes != 1 and
+        os.path.getsize(logfile_path) >= PARALLEL_PARSE_THRESHOLD):
+    for e in iter_parse_parallel(logfile_path, processes=processes):
+      yield e
+  else:
+    with open(logfile_path) as logfile:
+      for e in iter_parse(logfile):
+        yield e
+
+def trace_digest(logfile_path):
+  ''' The cache key of a logfile: its hash and the parser version '''
+  digest = hashlib.sha1()
+  with open(logfile_path, 'rb') as logfile:
+    for chunk in iter(lambda: logfile.read(1 << 20), ""):
+      digest.update(chunk)
+  return "%d:%s" % (PARSER_VERSION, digest.hexdigest())
+
+def load_cached_trace(logfile_path):
+  '''Return the cached events of logfile_path, or None if there are no
+  (up to date) cached events.'''
+  cache_path = logfile_path + PARSED_CACHE_SUFFIX
+  if not os.path.exists(cache_path):
+    return None
+  try:
+    with open(cache_path, 'rb') as cache_file:
+      unpickler = cPickle.Unpickler(cache_file)
+      if unpickler.load() != trace_digest(logfile_path):
+        return None
+      trace = unpickler.load()
+  except Exception as e:
+    log.warn("Ignoring unreadable parsed-trace cache %s: %s" % (cache_path, e))
+    return None
+  # Unpickling doesn't call Event.__init__, so register the labels by hand to
+  # keep newly generated labels unique
+  for e in trace:
+    event.Event._all_label_ids.add(int(e.label[1:]))
+  return trace
+
+def store_cached_trace(logfile_path, trace):
+  '''Cache the parsed events of logfile_path. Failures to write the cache
+  are logged and otherwise ignored.'''
+  cache_path = logfile_path + PARSED_CACHE_SUFFIX
+  tmp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+  # Intern fingerprints, so that each distinct fingerprint is pickled once
+  fingerprints = {}
+  for e in trace:
+    intern_fingerprints(e, fingerprints)
+  try:
+    with open(tmp_path, 'wb') as cache_file:
+      pickler = cPickle.Pickler(cache_file, cPickle.HIGHEST_PROTOCOL)
+      pickler.dump(trace_digest(logfile_path))
+      pickler.dump(trace)
+    os.rename(tmp_path, cache_path)
+  except Exception as e:
+    log.warn("Could not write parsed-trace cache %s: %s" % (cache_path, e))
+    if os.path.exists(tmp_path):
+      os.unlink(tmp_path)
+
+def intern_fingerprints(e, fingerprints):
+  '''Replace the Fingerprints in e's fingerprint with equal ones from
+  fingerprints (a dict, updated with any new ones), so that events with equal
+  fingerprints share them.'''
+  # Many events compute their fingerprint in a property; only stored
+  # fingerprints can hold Fingerprint objects
+  fingerprint = e.__dict__.get('fingerprint')
+  if type(fingerprint) == tuple:
+    e.fingerprint = tuple(fingerprints.setdefault(f, f)
+                          if isinstance(f, Fingerprint) else f
+                          for f in fingerprint)
 
 def check_legacy_format(json_hash):
   if (hasattr(json_hash, 'controller_id') and
@@ -78,39 +201,215 @@ def check_legacy_format(json_hash):
     # Insert a dummy round number
     json_hash['round'] = -1
 
+class _TraceChecker(object):
+  '''Applies parse()'s sanity checks to the events of a superlog, one at a
+  time and in order.'''
+  def __init__(self):
+    # a set of all event labels
+    self.event_labels = set()
+    # dependent labels that must be present somewhere in the log.
+    self.dependent_labels = set()
+
+  def check(self, json_hash):
+    '''Check the next event. Return False if its class is unknown (and the
+    event should be skipped)'''
+    check_unique_label(json_hash['label'], self.event_labels)
+    if json_hash['class'] in input_name_to_class:
+      sanity_check_external_input_event(self.event_labels,
+                                        self.dependent_labels,
+                                        json_hash)
+    elif json_hash['class'] in internal_event_name_to_class:
+      sanity_check_internal_event(self.event_labels, self.dependent_labels,
+                                  json_hash)
+    else:
+      print "Warning: Unknown class type %s" % json_hash['class']
+      return False
+    return True
+
+  def finish(self):
+    # all the foward dependencies should be satisfied!
+    assert(len(self.dependent_labels) == 0)
+
+def _decode_line(line):
+  '''Return (the fields of the line's json hash needed by _TraceChecker,
+  the event). The event is None if its class is unknown.'''
+  json_hash = json.loads(line.rstrip())
+  check_legacy_format(json_hash)
+  class_name = json_hash['class']
+  fields = { 'label' : json_hash['label'], 'class' : class_name }
+  if class_name in input_name_to_class:
+    fields['dependent_labels'] = json_hash['dependent_labels']
+    return (fields, input_name_to_class[class_name].from_json(json_hash))
+  if class_name in internal_event_name_to_class:
+    return (fields, internal_event_name_to_class[class_name].from_json(json_hash))
+  return (fields, None)
+
 def parse(logfile):
   '''Input: logfile.
 
   Output: A list of all the internal and external events in the order in which
   they exist in the logfile. Each internal event is annotated with the set of
   source events that are necessary conditions for its occurence.'''
+  return list(iter_parse(logfile))
 
-  # the return value of the parsed log
-  trace = []
-  # a set of all event labels
-  event_labels = set()
-  # dependent labels that must be present somewhere in the log.
-  dependent_labels = set()
-
+def iter_parse(logfile):
+  '''Generator version of parse(). The forward dependency check is only
+  made once the whole logfile has been read.'''
+  checker = _TraceChecker()
   for line in logfile:
-    json_hash = json.loads(line.rstrip())
-    check_unique_label(json_hash['label'], event_labels)
-    check_legacy_format(json_hash)
-    if json_hash['class'] in input_name_to_class:
-      sanity_check_external_input_event(event_labels,
-                                        dependent_labels,
-                                        json_hash)
-      event = input_name_to_class[json_hash['class']].from_json(json_hash)
-    elif json_hash['class'] in internal_event_name_to_class:
-      sanity_check_internal_event(event_labels, dependent_labels,
-                                  json_hash)
-      event = internal_event_name_to_class[json_hash['class']].from_json(json_hash)
-    else:
-      print "Warning: Unknown class type %s" % json_hash['class']
-      continue
-    trace.append(event)
+    (fields, e) = _decode_line(line)
+    if checker.check(fields):
+      yield e
+  checker.finish()
 
-  # all the foward dependencies should be satisfied!
-  assert(len(dependent_labels) == 0)
+def line_aligned_chunks(logfile_path, chunk_size=PARALLEL_CHUNK_SIZE):
+  '''Split logfile_path into (start, end) byte ranges of about chunk_size
+  bytes, each ending at the end of a line'''
+  size = os.path.getsize(logfile_path)
+  chunks = []
+  start = 0
+  with open(logfile_path, 'rb') as logfile:
+    while start < size:
+      logfile.seek(start + chunk_size)
+      logfile.readline()
+      end = min(logfile.tell(), size)
+      chunks.append((start, end))
+      start = end
+  return chunks
 
-  return trace
+def _parse_chunk(args):
+  '''Worker process side of iter_parse_parallel. Events are returned as their
+  (pickled) state dicts: unpickling a dict is about twice as fast as
+  unpickling the equivalent object.'''
+  (logfile_path, start, end) = args
+  with open(logfile_path, 'rb') as logfile:
+    logfile.seek(start)
+    data = logfile.read(end - start)
+  decoded = []
+  for line in data.splitlines():
+    (fields, e) = _decode_line(line)
+    if e is not None:
+      e = e.__getstate__() if hasattr(e, '__getstate__') else e.__dict__
+    decoded.append((fields, e))
+  return decoded
+
+def _event_from_state(class_name, state):
+  klass = (input_name_to_class.get(class_name) or
+           internal_event_name_to_class[class_name])
+  e = klass.__new__(klass)
+  if hasattr(e, '__setstate__'):
+    e.__setstate__(state)
+  else:
+    e.__dict__.update(state)
+  return e
+
+def iter_parse_parallel(logfile_path, processes=None,
+                        chunk_size=PARALLEL_CHUNK_SIZE):
+  '''Like iter_parse, but decode line-aligned chunks of the logfile in a pool
+  of processes worker processes (default: one per CPU). Chunks are checked
+  and yielded in order.'''
+  checker = _TraceChecker()
+  fingerprints = {}
+  pool = multiprocessing.Pool(processes)
+  try:
+    chunks = [ (logfile_path, start, end) for (start, end)
+               in line_aligned_chunks(logfile_path, chunk_size) ]
+    for decoded in pool.imap(_parse_chunk, chunks):
+      for (fields, state) in decoded:
+        if not checker.check(fields):
+          continue
+        e = _event_from_state(fields['class'], state)
+        # The workers registered the labels in their own processes
+        event.Event._all_label_ids.add(int(e.label[1:]))
+        # Unpickling gave each chunk its own copies of shared fingerprints
+        intern_fingerprints(e, fingerprints)
+        yield e
+    checker.finish()
+    pool.close()
+  finally:
+    pool.terminate()
+    pool.join()
+
+class LazyEventList(collections.MutableSequence):
+  '''A list of the events in a binary superlog. Each event is decoded the
+  first time it is accessed.'''
+  def __init__(self, superlog, indices):
+    self.superlog = superlog
+    # position in this list -> record index in superlog
+    self._indices = indices
+    self._events = [None] * len(indices)
+    self._fully_decoded = False
+
+  def _decode(self, i):
+    if self._events[i] is None:
+      json_hash = self.superlog.json_hash(self._indices[i])
+      check_legacy_format(json_hash)
+      klass = (input_name_to_class.get(json_hash['class']) or
+               internal_event_name_to_class[json_hash['class']])
+      self._events[i] = klass.from_json(json_hash)
+    return self._events[i]
+
+  def _decode_all(self):
+    if not self._fully_decoded:
+      for i in xrange(len(self._events)):
+        self._decode(i)
+      self._fully_decoded = True
+
+  def __len__(self):
+    return len(self._events)
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      return [ self._decode(j) for j in xrange(*i.indices(len(self))) ]
+    if i < 0:
+      i += len(self)
+    if not 0 <= i < len(self):
+      raise IndexError("event index out of range")
+    return self._decode(i)
+
+  def __iter__(self):
+    for i in xrange(len(self._events)):
+      yield self._decode(i)
+
+  def __setitem__(self, i, value):
+    # Other positions may shift afterwards, so decode everything first
+    self._decode_all()
+    self._events[i] = value
+
+  def __delitem__(self, i):
+    self._decode_all()
+    del self._events[i]
+
+  def insert(self, i, value):
+    self._decode_all()
+    self._events.insert(i, value)
+
+def parse_binary(superlog):
+  '''Input: a BinarySuperlog.
+
+  Output: A LazyEventList of all the internal and external events in the
+  order in which they exist in the superlog. Applies the same sanity checks
+  as parse(), but only decodes the input events to do so.'''
+  indices = []
+  event_labels = set()
+  for i in xrange(len(superlog)):
+    label = superlog.label(i)
+    check_unique_label(label, event_labels)
+    # Events are only decoded (and so construct their labels) on demand, so
+    # register the labels up front to keep newly generated labels unique
+    event.Event._all_label_ids.add(int(label[1:]))
+    class_name = superlog.class_name(i)
+    if class_name in input_name_to_class:
+      # can't have dependents that have already happened!
+      for label in superlog.json_hash(i)['dependent_labels']:
+        dependent = superlog.index_of_label(label)
+        assert(dependent is not None and dependent > i)
+        # all the foward dependencies should be satisfied!
+        dependent_class = superlog.class_name(dependent)
+        assert(dependent_class in input_name_to_class or
+               dependent_class in internal_event_name_to_class)
+    elif class_name not in internal_event_name_to_class:
+      print "Warning: Unknown class type %s" % class_name
+      continue
+    indices.append(i)
+  return LazyEventList(superlog, indices)
@@ -39,11 +39,7 @@ class Event(object):
   def __init__(self, prefix="e", label=None, round=-1, time=None, dependent_labels=None,
                prunable=True):
     if label is None:
-      label_id = Event._label_gen.next()
-      label = prefix + str(label_id)
-      while label_id in Event._all_label_ids:
-        label_id = Event._label_gen.next()
-        label = prefix + str(label_id)
+      label = Event.new_label(prefix)
     if time is None:
       # TODO(cs): compress time for interactive mode?
       time = SyncTime.now()
@@ -58,6 +54,15 @@ class Event(object):
     # inputs are not pruned.
     self.prunable = True
 
+  @staticmethod
+  def new_label(prefix="e"):
+    ''' Return a label that no other event has, and reserve it '''
+    label_id = Event._label_gen.next()
+    while label_id in Event._all_label_ids:
+      label_id = Event._label_gen.next()
+    Event._all_label_ids.add(label_id)
+    return prefix + str(label_id)
+
   @abc.abstractmethod
   def proceed(self, simulation):
     '''Executes a single `round'. Returns a boolean that is true if the
@@ -65,7 +70,8 @@ class Event(object):
     later.'''
     pass
 
-  def to_json(self):
+  def to_json_hash(self):
+    ''' Return the json hash of this event, i.e. to_json() before encoding '''
     fields = dict(self.__dict__)
     fields['class'] = self.__class__.__name__
     if ('fingerprint' in fields and
@@ -73,7 +79,10 @@ class Event(object):
       fingerprint = list(fields['fingerprint'])
       fingerprint[1] = fingerprint[1].to_dict()
       fields['fingerprint'] = tuple(fingerprint)
-    return json.dumps(fields)
+    return fields
+
+  def to_json(self):
+    return json.dumps(self.to_json_hash())
 
   def __hash__(self):
     ''' Assumption: labels are unique '''
@@ -153,6 +162,20 @@ def extract_label_time(json_hash):
   round = json_hash['round']
   return (label, time, round)
 
+def extract_run(json_hash):
+  ''' Return (count, end_time) of a possibly compacted dataplane event '''
+  count = json_hash.get('count', 1)
+  end_time = json_hash.get('end_time')
+  if end_time is not None:
+    end_time = SyncTime(end_time[0], end_time[1])
+  return (count, end_time)
+
+def remove_singleton_run(fields):
+  ''' Uncompacted dataplane events are logged without run fields '''
+  if fields['count'] == 1:
+    del fields['count']
+    del fields['end_time']
+
 class SwitchFailure(InputEvent):
   def __init__(self, dpid, label=None, round=-1, time=None):
     super(SwitchFailure, self).__init__(label=label, round=round, time=time)
@@ -378,23 +401,37 @@ class PolicyChange(InputEvent):
     return PolicyChange(request_type, round=round, label=label, time=time)
 
 class TrafficInjection(InputEvent):
-  def __init__(self, label=None, round=-1, time=None, prunable=True):
+  def __init__(self, label=None, round=-1, time=None, prunable=True, count=1):
     super(TrafficInjection, self).__init__(label=label, round=round, time=time,
                                            prunable=prunable)
+    # How many consecutive dataplane trace events were injected at once (e.g.
+    # a batch of a MatrixTrafficGenerator)
+    self.count = count
 
   def proceed(self, simulation):
     if simulation.dataplane_trace is None:
       raise RuntimeError("No dataplane trace specified!")
-    simulation.dataplane_trace.inject_trace_event()
+    for _ in xrange(self.count):
+      simulation.dataplane_trace.inject_trace_event()
     return True
 
+  def to_json_hash(self):
+    fields = dict(self.__dict__)
+    fields['class'] = self.__class__.__name__
+    # Single injections are logged as they were before batches existed
+    if fields['count'] == 1:
+      del fields['count']
+    return fields
+
   @staticmethod
   def from_json(json_hash):
     (label, time, round) = extract_label_time(json_hash)
     prunable = True
     if 'prunable' in json_hash:
       prunable = json_hash['prunable']
-    return TrafficInjection(label=label, time=time, round=round, prunable=prunable)
+    count = json_hash.get('count', 1)
+    return TrafficInjection(label=label, time=time, round=round,
+                            prunable=prunable, count=count)
 
 class WaitTime(InputEvent):
   def __init__(self, wait_time, label=None, round=-1, time=None):
@@ -454,7 +491,7 @@ class CheckInvariants(InputEvent):
       msg.interactive("No correctness violations!")
     return True
 
-  def to_json(self):
+  def to_json_hash(self):
     fields = dict(self.__dict__)
     fields['class'] = self.__class__.__name__
     if self.legacy_invariant_check:
@@ -464,7 +501,19 @@ class CheckInvariants(InputEvent):
     else:
       fields['invariant_name'] = self.invariant_check_name
       fields['invariant_check'] = None
-    return json.dumps(fields)
+    return fields
+
+  def __getstate__(self):
+    # Invariant checks are looked up by name, and functions can't be pickled
+    state = dict(self.__dict__)
+    if not self.legacy_invariant_check:
+      del state['invariant_check']
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    if not self.legacy_invariant_check:
+      self.invariant_check = name_to_invariant_check[self.invariant_check_name]
 
   @staticmethod
   def from_json(json_hash):
@@ -541,8 +590,13 @@ class ControlChannelUnblock(InputEvent):
     return ControlChannelUnblock(dpid, controller_id, round=round, label=label, time=time)
 
 class DataplaneDrop(InputEvent):
-  def __init__(self, fingerprint, label=None, round=-1, time=None):
+  ''' count > 1 represents a run of identical drops, logged between time and
+  end_time (see sts.log_processing.superlog_compaction). '''
+  def __init__(self, fingerprint, label=None, round=-1, time=None, count=1,
+               end_time=None):
     super(DataplaneDrop, self).__init__(label=label, round=round, time=time)
+    self.count = count
+    self.end_time = end_time
     if fingerprint[0] != self.__class__.__name__:
       fingerprint = list(fingerprint)
       fingerprint.insert(0, self.__class__.__name__)
@@ -560,14 +614,17 @@ class DataplaneDrop(InputEvent):
     (label, time, round) = extract_label_time(json_hash)
     assert_fields_exist(json_hash, 'fingerprint')
     fingerprint = json_hash['fingerprint']
-    return DataplaneDrop(fingerprint, round=round, label=label, time=time)
+    (count, end_time) = extract_run(json_hash)
+    return DataplaneDrop(fingerprint, round=round, label=label, time=time,
+                         count=count, end_time=end_time)
 
-  def to_json(self):
+  def to_json_hash(self):
     fields = dict(self.__dict__)
     fields['class'] = self.__class__.__name__
     fields['fingerprint'] = (self.fingerprint[0], self.fingerprint[1].to_dict(),
                              self.fingerprint[2], self.fingerprint[3])
-    return json.dumps(fields)
+    remove_singleton_run(fields)
+    return fields
 
 # TODO(cs): Temporary hack until we figure out determinism
 class LinkDiscovery(InputEvent):
@@ -826,8 +883,13 @@ class DataplanePermit(InternalEvent):
   ''' We basically just keep this around for bookkeeping purposes. During
   replay, this let's us know which packets to let through, and which to drop.
   '''
-  def __init__(self, fingerprint, label=None, round=-1, time=None):
+  def __init__(self, fingerprint, label=None, round=-1, time=None, count=1,
+               end_time=None):
     super(DataplanePermit, self).__init__(label=label, round=round, time=time, )
+    # count > 1 represents a run of identical permits, logged between time and
+    # end_time (see sts.log_processing.superlog_compaction)
+    self.count = count
+    self.end_time = end_time
     if fingerprint[0] != self.__class__.__name__:
       fingerprint = list(fingerprint)
       fingerprint.insert(0, self.__class__.__name__)
@@ -844,14 +906,17 @@ class DataplanePermit(InternalEvent):
     (label, time, round) = extract_label_time(json_hash)
     assert_fields_exist(json_hash, 'fingerprint')
     fingerprint = json_hash['fingerprint']
-    return DataplanePermit(fingerprint, label=label, round=round, time=time)
+    (count, end_time) = extract_run(json_hash)
+    return DataplanePermit(fingerprint, label=label, round=round, time=time,
+                           count=count, end_time=end_time)
 
-  def to_json(self):
+  def to_json_hash(self):
     fields = dict(self.__dict__)
     fields['class'] = self.__class__.__name__
     fields['fingerprint'] = (self.fingerprint[0], self.fingerprint[1].to_dict(),
                              self.fingerprint[2], self.fingerprint[3])
-    return json.dumps(fields)
+    remove_singleton_run(fields)
+    return fields
 
 all_internal_events = [ControlMessageReceive, ControlMessageSend,
                        ConnectToControllers, ControllerStateChange,
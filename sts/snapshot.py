@@ -3,6 +3,7 @@ import urllib2
 import logging
 import json
 import string
+import threading
 import time
 from pox.lib.graph.util import NOMDecoder
 from pox.openflow.topology import OpenFlowSwitch
@@ -19,12 +20,18 @@ class Snapshot(object):
   into a Snapshot object in order to be fed to HSA
   """
 
-  def __int__(self):
+  def __init__(self):
     self.time = None
     self.switches = []
     # The debugger doesn't use the next two (for now anyway)
     self.hosts = []
     self.links = []
+    # Opaque version reported by the controller, or None if the controller
+    # doesn't support change detection
+    self.version = None
+    # Data derived from this snapshot (e.g. transfer functions). Stays valid
+    # for as long as the controller reports the same version.
+    self.cache = {}
 
   def __repr__(self):
     return "<Snapshot object: (%i switches)>"%len(self.switches)
@@ -42,6 +49,27 @@ class SnapshotService(object):
   def fetchSnapshot(self, controller):
     pass
 
+  def fetchSnapshots(self, controllers):
+    ''' Fetch snapshots from all of controllers concurrently. Return a dict
+    { controller -> Snapshot } '''
+    controller2snapshot = {}
+    errors = []
+    def fetch(controller):
+      try:
+        controller2snapshot[controller] = self.fetchSnapshot(controller)
+      except Exception as e:
+        errors.append(e)
+
+    threads = [ threading.Thread(target=fetch, args=(controller,))
+                for controller in controllers ]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    if errors:
+      raise errors[0]
+    return controller2snapshot
+
 class FlexibleNOMDecoder:
   def __init__(self):
     self.pox_nom_decoder = NOMDecoder()
@@ -82,20 +110,69 @@ class FlexibleNOMDecoder:
     return a
 
 class SyncProtoSnapshotService(SnapshotService):
+  '''
+  Fetches snapshots over the sync protocol.
+
+  Controllers that support change detection tag their NOM with a version.
+  We hand back the version of the last snapshot we decoded, and if the NOM
+  hasn't changed the controller replies without the NOM, and we return the
+  cached Snapshot object (along with anything cached on it).
+  '''
   def __init__(self):
     SnapshotService.__init__(self)
     self.myNOMDecoder = FlexibleNOMDecoder()
+    # controller -> last versioned Snapshot fetched from it
+    self.controller2snapshot = {}
 
   def fetchSnapshot(self, controller):
-    jsonNOM = controller.sync_connection.get_nom_snapshot()
+    return self.fetchSnapshots([controller])[controller]
+
+  def fetchSnapshots(self, controllers):
+    # All controllers share the same io_master, so rather than using
+    # threads, put all of the requests in flight before waiting on any
+    # of the replies.
+    controller2request = {}
+    for controller in controllers:
+      known_version = None
+      if controller in self.controller2snapshot:
+        known_version = self.controller2snapshot[controller].version
+      controller2request[controller] = \
+          controller.sync_connection.request_nom_snapshot(known_version)
+
+    controller2snapshot = {}
+    for controller in controllers:
+      request = controller2request[controller]
+      jsonNOM = None
+      if request is not None:
+        jsonNOM = controller.sync_connection.wait_for_nom_snapshot(request)
+      controller2snapshot[controller] = self._update_snapshot(controller,
+                                                              jsonNOM)
+    return controller2snapshot
+
+  def _update_snapshot(self, controller, jsonNOM):
+    if jsonNOM is None:
+      raise RuntimeError("Could not fetch a NOM snapshot from %s" %
+                         controller.label)
+    version = jsonNOM.get("version")
+    cached = self.controller2snapshot.get(controller)
+    if (jsonNOM.get("unchanged") and cached is not None and
+        cached.version == version):
+      log.debug("NOM of %s unchanged (version %s)" % (controller.label, version))
+      self.snapshot = cached
+      return cached
 
-    # Update local Snapshot object
-    self.snapshot.switches = [self.myNOMDecoder.decode(s) for s in jsonNOM["switches"]]
-    self.snapshot.hosts = [self.myNOMDecoder.decode(h) for h in jsonNOM["hosts"]]
-    self.snapshot.links = [self.myNOMDecoder.decode(l) for l in jsonNOM["links"]]
-    self.snapshot.time = time.time()
-
-    return self.snapshot
+    snapshot = Snapshot()
+    snapshot.switches = [self.myNOMDecoder.decode(s) for s in jsonNOM["switches"]]
+    snapshot.hosts = [self.myNOMDecoder.decode(h) for h in jsonNOM["hosts"]]
+    snapshot.links = [self.myNOMDecoder.decode(l) for l in jsonNOM["links"]]
+    snapshot.time = time.time()
+    snapshot.version = version
+    if version is not None:
+      self.controller2snapshot[controller] = snapshot
+    elif controller in self.controller2snapshot:
+      del self.controller2snapshot[controller]
+    self.snapshot = snapshot
+    return snapshot
 
 class PoxSnapshotService(SnapshotService):
   def __init__(self):
@@ -122,11 +199,14 @@ class PoxSnapshotService(SnapshotService):
 
     jsonNOM = json.loads(jsonstr) # (json string with the NOM)
 
-    # Update local Snapshot object
-    self.snapshot.switches = [self.myNOMDecoder.decode(s) for s in jsonNOM["switches"]]
-    self.snapshot.hosts = [self.myNOMDecoder.decode(h) for h in jsonNOM["hosts"]]
-    self.snapshot.links = [self.myNOMDecoder.decode(l) for l in jsonNOM["links"]]
-    self.snapshot.time = time.time()
+    # Create a fresh Snapshot object, since snapshots may be fetched
+    # concurrently
+    snapshot = Snapshot()
+    snapshot.switches = [self.myNOMDecoder.decode(s) for s in jsonNOM["switches"]]
+    snapshot.hosts = [self.myNOMDecoder.decode(h) for h in jsonNOM["hosts"]]
+    snapshot.links = [self.myNOMDecoder.decode(l) for l in jsonNOM["links"]]
+    snapshot.time = time.time()
+    self.snapshot = snapshot
 
     return self.snapshot
 
@@ -126,8 +126,24 @@ class SyncProtocolSpeaker(object):
   def sync_request(self, messageClass, name, timeout=None):
     ''' Send a message you expect a response from.
     Note: Blocks this thread until a response is recieved!'''
+    message = self.async_request(messageClass, name)
+    return self.wait_for_response(message, timeout)
+
+  def async_request(self, messageClass, name):
+    ''' Send a message you expect a response from, without waiting for it.
+    Collect the response later with wait_for_response(). Lets the caller
+    keep several requests in flight at once (e.g. to multiple controllers
+    sharing the same io_master).'''
     message = self.message_with_xid(SyncMessage(type="REQUEST", messageClass=messageClass, name=name))
+    # Register before sending: the response may be dispatched while we're
+    # waiting on some other transaction
+    self.listener.expect_response(message)
     self.send(message)
+    return message
+
+  def wait_for_response(self, message, timeout=None):
+    ''' Block until the response to a message sent with async_request()
+    arrives, and return its value '''
     return self.listener.wait_for_xaction(message, timeout)
 
 class SyncProtocolListener(object):
@@ -156,9 +172,13 @@ class SyncProtocolListener(object):
     # dispatch message
     self.handlers[key](message)
 
+  def expect_response(self, message):
+    self.waiting_xids[message.xid] = message
+
   def wait_for_xaction(self, message, timeout=None):
     xid = message.xid
-    self.waiting_xids[xid] = message
+    if xid not in self.received_responses:
+      self.waiting_xids[xid] = message
 
     start = unpatched_time()
 
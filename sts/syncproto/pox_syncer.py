@@ -5,6 +5,9 @@ import logging
 import time
 import os
 import socket
+import random
+import hashlib
+import json
 
 from pox.core import core, UpEvent
 from pox.lib.graph.nom import Switch, Host, Link
@@ -155,15 +158,35 @@ class POXSyncProtocolSpeaker(SyncProtocolSpeaker):
 
     handlers = {
       ("REQUEST", "NOMSnapshot"): self._get_nom_snapshot,
+      ("REQUEST", "Fork"): self._fork,
       ("ASYNC", "LinkDiscovery"): self._link_discovery
     }
     SyncProtocolSpeaker.__init__(self, handlers, io_delegate)
 
   def _get_nom_snapshot(self, message):
+    # message.name carries the version of the last snapshot STS fetched, if
+    # any. If nothing has changed since, spare ourselves the transfer.
     snapshot = self.snapshotter.get_snapshot()
+    if message.name and message.name == snapshot["version"]:
+      snapshot = {"version": snapshot["version"], "unchanged": True}
     response = SyncMessage(type="RESPONSE", messageClass="NOMSnapshot", time=SyncTime.now(), xid = message.xid, value=snapshot)
     self.send(response)
 
+  def _fork(self, message):
+    ''' STS is checkpointing the simulation. Fork: the child carries on,
+    sharing our sockets with a forked copy of STS, while we wait without
+    touching them. Once STS is done with the branch, it kills the child and
+    we pick up from the checkpoint. (Blocking here blocks the whole POX
+    process, since recoco tasks are cooperative.) '''
+    pid = os.fork()
+    if pid == 0:
+      response = SyncMessage(type="RESPONSE", messageClass="Fork",
+                             time=SyncTime.now(), xid=message.xid,
+                             value=os.getpid())
+      self.send(response)
+      return
+    os.waitpid(pid, 0)
+
   def _link_discovery(self, message):
     link = message.value
     core.openflow_discovery.install_link(link[0], link[1], link[2], link[3])
@@ -171,6 +194,12 @@ class POXSyncProtocolSpeaker(SyncProtocolSpeaker):
 class POXNomSnapshotter(object):
   def __init__(self):
     self.encoder = NOMEncoder()
+    # Versions are "<epoch>:<change counter>". The epoch distinguishes this
+    # process from earlier incarnations of the controller, so that STS
+    # never mistakes a restarted controller's NOM for one it has cached.
+    self.epoch = "%d.%x" % (os.getpid(), random.getrandbits(32))
+    self.change_counter = 0
+    self.last_digest = None
 
   def get_snapshot(self):
     nom = {"switches":[], "hosts":[], "links":[]}
@@ -180,6 +209,11 @@ class POXNomSnapshotter(object):
       nom["hosts"].append(self.encoder.encode(h))
     for l in core.topology.getEntitiesOfType(Link):
       nom["links"].append(self.encoder.encode(l))
+    digest = hashlib.sha1(json.dumps(nom, sort_keys=True)).hexdigest()
+    if digest != self.last_digest:
+      self.last_digest = digest
+      self.change_counter += 1
+    nom["version"] = "%s:%d" % (self.epoch, self.change_counter)
     return nom
 
 
@@ -68,12 +68,37 @@ class STSSyncConnection(object):
   def close(self):
     self.disconnect()
 
-  def get_nom_snapshot(self):
+  def get_nom_snapshot(self, known_version=None):
+    ''' Fetch the controller's NOM. If known_version is given and the
+    controller's NOM hasn't changed since, the reply is just
+    {"version": known_version, "unchanged": True} '''
+    request = self.request_nom_snapshot(known_version)
+    if request is not None:
+      return self.wait_for_nom_snapshot(request)
+
+  def request_nom_snapshot(self, known_version=None):
+    ''' Like get_nom_snapshot, but don't wait for the reply. Pass the
+    returned request to wait_for_nom_snapshot to collect it. '''
     if self.speaker:
-      return self.speaker.sync_request("NOMSnapshot", "", timeout=10)
+      return self.speaker.async_request("NOMSnapshot", known_version or "")
     else:
       log.warn("STSSyncConnection: not connected. cannot handle requests")
 
+  def wait_for_nom_snapshot(self, request, timeout=10):
+    return self.speaker.wait_for_response(request, timeout=timeout)
+
+  def request_fork(self):
+    ''' Ask the controller to fork (see POXSyncProtocolSpeaker._fork), without
+    waiting for the reply. Pass the returned request to wait_for_fork to
+    collect the PID of the child. '''
+    if self.speaker:
+      return self.speaker.async_request("Fork", "")
+    else:
+      log.warn("STSSyncConnection: not connected. cannot handle requests")
+
+  def wait_for_fork(self, request, timeout=10):
+    return self.speaker.wait_for_response(request, timeout=timeout)
+
   def send_link_notification(self, link_attrs):
     # Link attrs must be a list of the form:
     # [dpid1, port1, dpid2, port2]
@@ -22,6 +22,7 @@ from pox.openflow.software_switch import DpPacketOut, SoftwareSwitch
 from pox.openflow.libopenflow_01 import *
 from pox.lib.revent import EventMixin
 from sts.util.console import msg
+from sts.util.union_find import UnionFind
 import itertools
 import logging
 import time
@@ -338,6 +339,111 @@ class LinkTracker(object):
     self.port2access_link[new_ingress_port] = new_access_link
     self.interface2access_link[interface] = new_access_link
 
+class SwitchConnectivity(object):
+  '''
+  Tracks which switches can reach each other over live network links.
+
+  Links are directed, but in the common case every live link has a live
+  reverse link, so reachability reduces to connected components. We keep
+  those in a union-find: link and switch recoveries are merged in
+  incrementally, while failures invalidate the structure, which is lazily
+  rebuilt in O(V+E) on the next query. If any usable link lacks a usable
+  reverse link we fall back to (memoized) directed BFS.
+
+  Links adjacent to failed switches are disregarded (technically those links
+  are still `live', but it's easier to treat it this way).
+  '''
+  def __init__(self, switches, live_links):
+    self.switches = list(switches)
+    self.failed_switches = set(sw for sw in self.switches if sw.failed)
+    self.live_links = set(live_links)
+    # switch -> all links that start or end at the switch
+    self.switch2links = defaultdict(set)
+    for link in self.live_links:
+      self._add_incident_link(link)
+    self._invalidate()
+
+  def _add_incident_link(self, link):
+    self.switch2links[link.start_software_switch].add(link)
+    self.switch2links[link.end_software_switch].add(link)
+
+  def _invalidate(self):
+    self._components = None
+    # Usable links whose reverse link isn't usable
+    self._unpaired_links = set()
+    # src switch -> set of switches reachable via directed links
+    self._reachable_from = {}
+
+  def _usable(self, link):
+    return (link in self.live_links and
+            link.start_software_switch not in self.failed_switches and
+            link.end_software_switch not in self.failed_switches)
+
+  def _merge_link(self, link):
+    ''' Pre: self._components is not None and link is usable '''
+    reverse = link.reversed_link()
+    if self._usable(reverse):
+      self._components.union(link.start_software_switch,
+                             link.end_software_switch)
+      self._unpaired_links.discard(reverse)
+    else:
+      self._unpaired_links.add(link)
+    self._reachable_from = {}
+
+  def _rebuild(self):
+    self._invalidate()
+    self._components = UnionFind(self.switches)
+    for link in self.live_links:
+      if self._usable(link):
+        self._merge_link(link)
+
+  # Incremental updates. These are idempotent, so they may safely be applied
+  # to state that already reflects them.
+  def link_down(self, link):
+    self.live_links.discard(link)
+    self._invalidate()
+
+  def link_up(self, link):
+    self.live_links.add(link)
+    self._add_incident_link(link)
+    if self._components is not None and self._usable(link):
+      self._merge_link(link)
+
+  def switch_down(self, software_switch):
+    self.failed_switches.add(software_switch)
+    self._invalidate()
+
+  def switch_up(self, software_switch):
+    self.failed_switches.discard(software_switch)
+    if self._components is not None:
+      for link in self.switch2links[software_switch]:
+        if self._usable(link):
+          self._merge_link(link)
+
+  def reachable(self, src_switch, dst_switch):
+    ''' Return whether packets can flow from src_switch to dst_switch '''
+    if src_switch == dst_switch:
+      return True
+    if self._components is None:
+      self._rebuild()
+    if not self._unpaired_links:
+      return self._components.connected(src_switch, dst_switch)
+    if src_switch not in self._reachable_from:
+      self._reachable_from[src_switch] = self._directed_bfs(src_switch)
+    return dst_switch in self._reachable_from[src_switch]
+
+  def _directed_bfs(self, src_switch):
+    visited = set([src_switch])
+    frontier = [src_switch]
+    while frontier:
+      switch = frontier.pop()
+      for link in self.switch2links[switch]:
+        if (link.start_software_switch == switch and self._usable(link) and
+            link.end_software_switch not in visited):
+          visited.add(link.end_software_switch)
+          frontier.append(link.end_software_switch)
+    return visited
+
 class Topology(object):
   '''
   Abstract base class of all topology types. Wraps the edges and vertices of
@@ -352,6 +458,8 @@ class Topology(object):
     # SoftwareSwitch objects
     self.failed_switches = set()
     self.link_tracker = None
+    # Lazily constructed, since subclasses populate links after __init__
+    self._connectivity = None
 
   def _populate_dpid2switch(self, switches):
     self.dpid2switch = {
@@ -387,6 +495,13 @@ class Topology(object):
       raise RuntimeError("unknown hid %d" % hid)
     return self.hid2host[hid]
 
+  @property
+  def connectivity(self):
+    """ Return a SwitchConnectivity tracking reachability between switches """
+    if self._connectivity is None:
+      self._connectivity = SwitchConnectivity(self.switches, self.live_links)
+    return self._connectivity
+
   @property
   def live_switches(self):
     """ Return the software_switchs which are currently up """
@@ -421,6 +536,7 @@ class Topology(object):
     msg.event("Crashing software_switch %s" % str(software_switch))
     software_switch.fail()
     self.failed_switches.add(software_switch)
+    self.connectivity.switch_down(software_switch)
 
   def recover_switch(self, software_switch, down_controller_ids=None):
     msg.event("Rebooting software_switch %s" % str(software_switch))
@@ -433,6 +549,7 @@ class Topology(object):
                                  .recover(down_controller_ids=down_controller_ids)
     if connected_to_at_least_one:
       self.failed_switches.remove(software_switch)
+      self.connectivity.switch_up(software_switch)
     return connected_to_at_least_one
 
   @property
@@ -441,9 +558,11 @@ class Topology(object):
 
   def sever_link(self, link):
     self.link_tracker.sever_link(link)
+    self.connectivity.link_down(link)
 
   def repair_link(self, link):
     self.link_tracker.repair_link(link)
+    self.connectivity.link_up(link)
 
   @property
   def blocked_controller_connections(self):
@@ -2,9 +2,13 @@
 from pox.lib.packet.ethernet import *
 from pox.lib.packet.ipv4 import *
 from pox.lib.packet.icmp import *
+from pox.lib.packet.icmp import echo
 from sts.dataplane_traces.trace import DataplaneEvent
+import copy
 import random
+from random import Random
 import itertools
+import time
 
 class TrafficGenerator (object):
   """
@@ -75,3 +79,195 @@ class TrafficGenerator (object):
     e.payload = ipp
     return e
 
+
+class TrafficMatrix (object):
+  """
+  The rates, in packets per second, at which each (source host, destination
+  host) pair sends traffic
+  """
+
+  def __init__(self, pair2rate):
+    self.pair2rate = dict((pair, rate) for (pair, rate) in pair2rate.iteritems()
+                          if rate > 0)
+
+  @property
+  def total_rate(self):
+    return sum(self.pair2rate.values())
+
+  @staticmethod
+  def _pairs(hosts):
+    return [ (src, dst) for src in hosts for dst in hosts if src != dst ]
+
+  @staticmethod
+  def _normalized(pair2weight, total_rate):
+    total_weight = float(sum(pair2weight.values()))
+    if total_weight == 0:
+      return TrafficMatrix({})
+    return TrafficMatrix(dict((pair, total_rate * weight / total_weight)
+                              for (pair, weight) in pair2weight.iteritems()))
+
+  @staticmethod
+  def all_to_all(hosts, total_rate, random=random):
+    """ Every pair sends at the same rate """
+    return TrafficMatrix._normalized(
+        dict((pair, 1.0) for pair in TrafficMatrix._pairs(hosts)), total_rate)
+
+  @staticmethod
+  def gravity(hosts, total_rate, weights=None, random=random):
+    """
+    Each pair sends at a rate proportional to the product of the source's
+    and the destination's weights. weights maps hosts to weights; by default,
+    each host gets an exponentially distributed random weight.
+    """
+    if weights is None:
+      weights = dict((host, random.expovariate(1.0)) for host in hosts)
+    return TrafficMatrix._normalized(
+        dict(((src, dst), weights[src] * weights[dst])
+             for (src, dst) in TrafficMatrix._pairs(hosts)), total_rate)
+
+  @staticmethod
+  def hotspot(hosts, total_rate, hotspots=None, hotspot_fraction=0.8,
+              random=random):
+    """
+    hotspot_fraction of the traffic is sent (all-to-all) to the hotspot hosts,
+    by default a single random host, and the rest all-to-all
+    """
+    hosts = list(hosts)
+    if hotspots is None:
+      hotspots = [ random.choice(hosts) ] if hosts else []
+    pairs = TrafficMatrix._pairs(hosts)
+    if pairs == []:
+      return TrafficMatrix({})
+    hot_pairs = [ (src, dst) for (src, dst) in pairs if dst in hotspots ]
+    pair2weight = dict((pair, (1.0 - hotspot_fraction) / len(pairs))
+                       for pair in pairs)
+    for pair in hot_pairs:
+      pair2weight[pair] += hotspot_fraction / len(hot_pairs)
+    return TrafficMatrix._normalized(pair2weight, total_rate)
+
+  @staticmethod
+  def from_name(name, hosts, total_rate, random=random):
+    """ Build the named model ("all_to_all", "gravity" or "hotspot") """
+    models = {
+      "all_to_all" : TrafficMatrix.all_to_all,
+      "gravity" : TrafficMatrix.gravity,
+      "hotspot" : TrafficMatrix.hotspot
+    }
+    if name not in models:
+      raise ValueError("Unknown traffic matrix %s" % str(name))
+    return models[name](hosts, total_rate, random=random)
+
+class PacketTemplate (object):
+  """
+  A prebuilt ICMP echo request from one interface to another. Each packet
+  instantiated from it only differs in its IP id and ICMP sequence number, and
+  shares everything else with the template.
+  """
+
+  def __init__(self, interface, destination_interface, random=random):
+    self.interface = interface
+    e = ethernet()
+    e.src = interface.hw_addr
+    e.dst = destination_interface.hw_addr
+    e.type = ethernet.IP_TYPE
+    ipp = ipv4()
+    ipp.protocol = ipv4.ICMP_PROTOCOL
+    if getattr(interface, 'ips', []):
+      ipp.srcip = interface.ips[0]
+    else:
+      ipp.srcip = IPAddr(random.randint(0,0xFFFFFFFF))
+    if getattr(destination_interface, 'ips', []):
+      ipp.dstip = destination_interface.ips[0]
+    else:
+      ipp.dstip = IPAddr(random.randint(0,0xFFFFFFFF))
+    ping = icmp()
+    ping.type = TYPE_ECHO_REQUEST
+    request = echo()
+    request.payload = "PingPing" * 6
+    ping.payload = request
+    ipp.payload = ping
+    e.payload = ipp
+    self._layers = (e, ipp, ping, request)
+    self.seq = 0
+
+  def packets(self, count):
+    """ Instantiate the next count packets """
+    (e, ipp, ping, request) = self._layers
+    packets = []
+    for _ in xrange(count):
+      self.seq = (self.seq + 1) & 0xFFFF
+      new_request = copy.copy(request)
+      new_request.seq = self.seq
+      new_ping = copy.copy(ping)
+      new_ping.payload = new_request
+      new_ipp = copy.copy(ipp)
+      new_ipp.id = self.seq
+      new_ipp.payload = new_ping
+      new_e = copy.copy(e)
+      new_e.payload = new_ipp
+      packets.append(new_e)
+    return packets
+
+class MatrixTrafficGenerator (object):
+  """
+  Generate traffic following a TrafficMatrix, in batches: each call to
+  generate_batch() sends, for every pair, the packets that its rate accrued
+  since the previous call, instantiated from a per-pair PacketTemplate.
+  """
+
+  def __init__(self, traffic_matrix, random=None, max_batch_seconds=1.0):
+    self.traffic_matrix = traffic_matrix
+    if random is None:
+      random = Random()
+    self.random = random
+    # Don't make up for long pauses (e.g. in the interactive console) with a
+    # huge burst
+    self.max_batch_seconds = max_batch_seconds
+    # In a deterministic order, so that runs can be reproduced from the seed
+    self._pairs = sorted(
+        [ ((src, dst), rate) for ((src, dst), rate)
+          in traffic_matrix.pair2rate.iteritems()
+          if len(src.interfaces) > 0 and len(dst.interfaces) > 0 ],
+        key=lambda ((src, dst), _): (src.name, dst.name))
+    # The fraction of a packet each pair is owed. Random initial phases keep
+    # the pairs from sending in lockstep
+    self._credits = dict((pair, self.random.random())
+                         for (pair, _) in self._pairs)
+    self._templates = {}
+    self._last_time = None
+    self.packets_sent = 0
+
+  def _template(self, pair):
+    if pair not in self._templates:
+      (src, dst) = pair
+      self._templates[pair] = PacketTemplate(self.random.choice(src.interfaces),
+                                             self.random.choice(dst.interfaces),
+                                             random=self.random)
+    return self._templates[pair]
+
+  def generate_batch(self, now=None):
+    """
+    Send the packets accrued since the last call (nothing on the first call).
+    Return a list with the DataplaneEvents of each pair that sent packets.
+    """
+    if now is None:
+      now = time.time()
+    if self._last_time is None:
+      elapsed = 0.0
+    else:
+      elapsed = min(max(0.0, now - self._last_time), self.max_batch_seconds)
+    self._last_time = now
+    batches = []
+    for (pair, rate) in self._pairs:
+      credit = self._credits[pair] + rate * elapsed
+      count = int(credit)
+      self._credits[pair] = credit - count
+      if count == 0:
+        continue
+      template = self._template(pair)
+      packets = template.packets(count)
+      pair[0].send_batch(template.interface, packets)
+      batches.append([ DataplaneEvent(template.interface, packet)
+                       for packet in packets ])
+      self.packets_sent += count
+    return batches
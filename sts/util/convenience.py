@@ -1,3 +1,4 @@
+import math
 import time
 
 def is_sorted(l):
@@ -21,3 +22,22 @@ def find_index(f, seq):
     if f(item):
       return index
 
+def sample_independently(random, seq, probability):
+  """Return the items of seq (in order) that independent trials, each
+  succeeding with the given probability, select. Rather than drawing once per
+  item, draw the geometrically distributed gap to the next selected item, so
+  that the cost is proportional to the number of items selected."""
+  if probability <= 0.0:
+    return []
+  items = list(seq)
+  if probability >= 1.0:
+    return items
+  log_miss = math.log1p(-probability)
+  selected = []
+  index = -1
+  while True:
+    # 1 - random() is in (0, 1]
+    index += 1 + int(math.log(1.0 - random.random()) / log_miss)
+    if index >= len(items):
+      return selected
+    selected.append(items[index])
@@ -147,6 +147,28 @@ class IOMaster(object):
         break
       self.select(remaining)
 
+  def sleep_until_idle(self, timeout, idle_interval):
+    '''
+    Handle IO until no socket has been ready for idle_interval seconds, or
+    until timeout seconds have passed. Return whether the sockets went idle.
+    '''
+    deadline = time.time() + timeout
+    while not self.closed:
+      remaining = deadline - time.time()
+      if remaining <= 0:
+        return False
+      if remaining < idle_interval:
+        self.select(remaining)
+      elif self.select(idle_interval) == 0:
+        return True
+    return False
+
+  def buffers_empty(self):
+    ''' Return whether no worker has data left to send, or has received part
+    of a message '''
+    return all(worker.send_buf == "" and worker.receive_buf == ""
+               for worker in self._workers)
+
   def grab_workers_rwe(self):
     # Now grab workers
     read_sockets = list(self._workers) + [ self.pinger ]
@@ -155,6 +177,7 @@ class IOMaster(object):
     return (read_sockets, write_sockets, exception_sockets)
 
   def select(self, timeout=0):
+    ''' Handle any ready sockets. Return how many workers were ready '''
     self._in_select += 1
     try:
       read_sockets, write_sockets, exception_sockets = self.grab_workers_rwe()
@@ -164,6 +187,8 @@ class IOMaster(object):
       self._in_select -= 1
     if self._in_select == 0 and self._close_requested and not self.closed:
       self._do_close_all()
+    # (handle_workers_rwe removes the pinger from rlist)
+    return len(rlist) + len(wlist) + len(elist)
 
   def handle_workers_rwe(self, rlist, wlist, elist):
     if self.pinger in rlist:
@@ -0,0 +1,46 @@
+class UnionFind(object):
+  ''' Disjoint-set forest with path compression and union by rank. Elements
+  are added lazily the first time they are referenced. '''
+  def __init__(self, elements=()):
+    self.parent = {}
+    self.rank = {}
+    for element in elements:
+      self.add(element)
+
+  def __contains__(self, element):
+    return element in self.parent
+
+  def add(self, element):
+    if element not in self.parent:
+      self.parent[element] = element
+      self.rank[element] = 0
+
+  def find(self, element):
+    ''' Return the representative of element's set '''
+    self.add(element)
+    root = element
+    while self.parent[root] != root:
+      root = self.parent[root]
+    # Path compression
+    while self.parent[element] != root:
+      next_element = self.parent[element]
+      self.parent[element] = root
+      element = next_element
+    return root
+
+  def union(self, left, right):
+    ''' Merge the sets containing left and right. Return whether they were
+    previously disjoint '''
+    left_root = self.find(left)
+    right_root = self.find(right)
+    if left_root == right_root:
+      return False
+    if self.rank[left_root] < self.rank[right_root]:
+      left_root, right_root = right_root, left_root
+    self.parent[right_root] = left_root
+    if self.rank[left_root] == self.rank[right_root]:
+      self.rank[left_root] += 1
+    return True
+
+  def connected(self, left, right):
+    return self.find(left) == self.find(right)
@@ -0,0 +1,257 @@
+'''
+Online bucketing of the invariant violations a Fuzzer finds, so that a new
+bug can be told from yet another copy of one already found.
+
+Violations are bucketed by a fingerprint of:
+  - the invariant check that found them
+  - their shape: each violation (an unconnected pair of ports, a loop, a
+    dead controller...) with the identifiers in it (numbers, hex strings)
+    abstracted away, and the order of magnitude of how many there were
+  - the kinds of input events injected in the rounds before the check
+    (failures, recoveries, migrations...; not the traffic, packet and message
+    deliveries of every round)
+
+The first violation of each bucket gets a snapshot of the superlog so far
+(with its dataplane trace, and replay, MCS and prefix configs) in
+<results_dir>/buckets/<id>/; later ones only count towards their bucket in
+<results_dir>/buckets.json. Optionally, a background truncation pass (a
+PrefixFinder run of the snapshot's prefix config, in a separate simulator.py
+process) finds the shortest prefix of the snapshot's inputs that still
+causes the violation, written to <results_dir>/buckets/<id>/truncation/.
+Truncation passes run while the Fuzzer's own controllers still do, so their
+controllers are moved to sockets of their own: free ports, and Unix domain
+socket paths suffixed with _truncation_<id> (see ControllerConfig.relocate).
+Violations of configs whose controllers can't be moved are not truncated.
+'''
+
+from collections import deque
+import copy
+import hashlib
+import itertools
+import json
+import math
+import os
+import re
+import subprocess
+import sys
+
+import logging
+log = logging.getLogger("violation_buckets")
+
+default_simulator_path = os.path.join(os.path.dirname(os.path.dirname(
+                                        os.path.abspath(__file__))),
+                                      "simulator.py")
+
+# Input events the Fuzzer injects every round, which say nothing about what
+# led to a violation
+_routine_inputs = set(["TrafficInjection", "DataplanePermit", "DataplaneDrop",
+                       "ControlMessageReceive", "ControlMessageSend",
+                       "CheckInvariants", "InvariantViolation", "WaitTime",
+                       "ConnectToControllers", "LinkDiscovery"])
+
+# Hex strings, MAC addresses and numbers
+_identifier = re.compile(r'0x[0-9a-fA-F]+|'
+                         r'[0-9a-fA-F]{2}(?:[:-][0-9a-fA-F]{2}){5}|'
+                         r'\d+')
+
+# Appended to the prefix config of a truncation pass (see _start_truncation)
+_relocation_template = '''
+# Don't collide with the controllers of the fuzzer that found the violation
+from config.experiment_config_lib import free_ports
+for controller_config in simulation_config.controller_configs:
+  controller_config.relocate(free_ports(), "_truncation_%s")
+'''
+
+def violation_shape(violations):
+  ''' Return the distinct violations with their identifiers abstracted away,
+  and the order of magnitude (base 2) of how many violations there were '''
+  shapes = sorted(set(_identifier.sub("N", str(v)) for v in violations))
+  magnitude = int(math.log(len(violations), 2)) if violations else 0
+  return (shapes, magnitude)
+
+class ViolationBuckets(object):
+  '''
+  The buckets of the violations found so far. Each is a dict with keys:
+    id:             a short hash of the fingerprint
+    invariant:      the name of the invariant check
+    shape:          see violation_shape
+    magnitude:      see violation_shape
+    recent_inputs:  the kinds of (non-routine) input events injected in the
+                    recent_rounds rounds up to the check
+    count:          the number of violations in the bucket
+    first_round:    the round of the first of them
+    last_round:     the round of the last of them
+    example:        the violations of the first of them
+    snapshot:       the directory of its snapshot (None without a results
+                    dir)
+    truncation:     the state of its truncation pass: None (not requested),
+                    "queued", "running", "done" or "failed"
+
+  If truncate is set, at most max_truncations truncation passes run at a
+  time; the others are queued.
+  '''
+  def __init__(self, recent_rounds=10, max_recent_inputs=1000,
+               truncate=False, max_truncations=1, wait_for_truncations=True,
+               simulator_path=default_simulator_path):
+    self.recent_rounds = recent_rounds
+    self.truncate = truncate
+    self.max_truncations = max_truncations
+    # Whether close() waits for the truncation passes to finish (or leaves
+    # the running ones to finish in the background, and drops the queued)
+    self.wait_for_truncations = wait_for_truncations
+    self.simulator_path = simulator_path
+    self.results_dir = None
+    self.buckets = []
+    self._id2bucket = {}
+    # (round, input event class name) of the recent non-routine inputs
+    self._recent_inputs = deque(maxlen=max_recent_inputs)
+    self._queued_truncations = []
+    # (bucket, process) of the running truncation passes
+    self._running_truncations = []
+
+  @staticmethod
+  def bucket_id(fingerprint):
+    return hashlib.sha1(json.dumps(fingerprint)).hexdigest()[:12]
+
+  def init_results(self, results_dir):
+    self.results_dir = results_dir
+
+  def branch(self, results_dir):
+    '''
+    Continue in results_dir: e.g. in a forked copy of the fuzzer. The buckets
+    found so far are kept, so that only what is new to the branch is
+    snapshotted; the truncation passes are left to the process that started
+    them.
+    '''
+    self.results_dir = results_dir
+    self._queued_truncations = []
+    self._running_truncations = []
+
+  def observe_input(self, event, round):
+    ''' Record an input event injected in the given round '''
+    name = type(event).__name__
+    if name not in _routine_inputs:
+      self._recent_inputs.append((round, name))
+    self.poll()
+
+  def recent_inputs(self, round):
+    ''' The kinds of inputs injected in the recent_rounds up to round (which
+    may be in the past, for an asynchronous invariant check) '''
+    return sorted(set(name for (input_round, name) in self._recent_inputs
+                      if round - self.recent_rounds < input_round <= round))
+
+  def add(self, invariant, violations, round):
+    ''' Record violations found by invariant in round. Return (bucket,
+    whether it is new) '''
+    (shape, magnitude) = violation_shape(violations)
+    recent_inputs = self.recent_inputs(round)
+    bucket_id = self.bucket_id([invariant, shape, magnitude, recent_inputs])
+    if bucket_id in self._id2bucket:
+      bucket = self._id2bucket[bucket_id]
+      bucket['count'] += 1
+      bucket['last_round'] = round
+      self.dump()
+      return (bucket, False)
+    bucket = { 'id' : bucket_id, 'invariant' : invariant, 'shape' : shape,
+               'magnitude' : magnitude, 'recent_inputs' : recent_inputs,
+               'count' : 1, 'first_round' : round, 'last_round' : round,
+               'example' : sorted(set(str(v) for v in violations)),
+               'snapshot' : None, 'truncation' : None }
+    self.buckets.append(bucket)
+    self._id2bucket[bucket_id] = bucket
+    return (bucket, True)
+
+  def snapshot(self, bucket, control_flow, input_logger, simulation_cfg):
+    ''' Snapshot the superlog for a new bucket, and queue its truncation
+    pass '''
+    if self.results_dir is not None and input_logger is not None:
+      buckets_dir = os.path.join(self.results_dir, "buckets")
+      snapshot_dir = os.path.join(buckets_dir, bucket['id'])
+      os.makedirs(snapshot_dir)
+      # So that the snapshot's configs can be run as modules
+      for module_dir in [buckets_dir, snapshot_dir]:
+        module_init_py = os.path.join(module_dir, "__init__.py")
+        if not os.path.exists(module_init_py):
+          open(module_init_py, "a").close()
+      input_logger.snapshot(snapshot_dir, control_flow, simulation_cfg)
+      bucket['snapshot'] = snapshot_dir
+      if self.truncate:
+        error = self._relocation_error(simulation_cfg)
+        if error is None:
+          bucket['truncation'] = "queued"
+          self._queued_truncations.append(bucket)
+          self.poll()
+        else:
+          log.warn("Not truncating violation bucket %s: %s" %
+                   (bucket['id'], error))
+    self.dump()
+
+  @staticmethod
+  def _relocation_error(simulation_cfg):
+    ''' Return why the controllers of simulation_cfg can't be moved to
+    sockets of their own, or None if they can '''
+    for controller_config in simulation_cfg.controller_configs:
+      try:
+        copy.copy(controller_config).relocate(itertools.count(1),
+                                              "_truncation")
+      except ValueError as e:
+        return str(e)
+    return None
+
+  def _start_truncation(self, bucket):
+    snapshot_dir = bucket['snapshot']
+    config_path = os.path.join(snapshot_dir, "prefix_config.py")
+    with open(config_path, 'a') as config:
+      config.write('results_dir = "%s"\n' %
+                   os.path.join(snapshot_dir, "truncation"))
+      config.write('exp_name = "truncation_%s"\n' % bucket['id'])
+      config.write(_relocation_template % bucket['id'])
+    with open(os.path.join(snapshot_dir, "truncation.out"), 'w') as output:
+      process = subprocess.Popen([sys.executable, self.simulator_path,
+                                  "-c", os.path.relpath(config_path)],
+                                 stdout=output, stderr=subprocess.STDOUT)
+    log.info("Started truncation pass for violation bucket %s [PID %d]" %
+             (bucket['id'], process.pid))
+    bucket['truncation'] = "running"
+    self._running_truncations.append((bucket, process))
+
+  def poll(self, block=False):
+    ''' Collect finished truncation passes, and start queued ones. If block,
+    wait until all have finished '''
+    changed = False
+    while True:
+      for (bucket, process) in list(self._running_truncations):
+        if process.poll() is not None:
+          self._running_truncations.remove((bucket, process))
+          bucket['truncation'] = "done" if process.returncode == 0 else "failed"
+          log.info("Truncation pass for violation bucket %s %s" %
+                   (bucket['id'], bucket['truncation']))
+          changed = True
+      while (self._queued_truncations != [] and
+             len(self._running_truncations) < self.max_truncations):
+        self._start_truncation(self._queued_truncations.pop(0))
+        changed = True
+      if not block or self._running_truncations == []:
+        break
+      self._running_truncations[0][1].wait()
+    if changed:
+      self.dump()
+
+  def close(self):
+    if self.wait_for_truncations:
+      if self._running_truncations != [] or self._queued_truncations != []:
+        log.info("Waiting for %d truncation passes" %
+                 (len(self._running_truncations) +
+                  len(self._queued_truncations)))
+      self.poll(block=True)
+    else:
+      for bucket in self._queued_truncations:
+        bucket['truncation'] = None
+      self._queued_truncations = []
+    self.dump()
+
+  def dump(self):
+    if self.results_dir is None:
+      return
+    with open(os.path.join(self.results_dir, "buckets.json"), 'w') as output:
+      json.dump(self.buckets, output, indent=2, sort_keys=True)
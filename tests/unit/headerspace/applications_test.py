@@ -14,12 +14,35 @@ from pox.openflow.software_switch import SoftwareSwitch
 from pox.openflow.libopenflow_01 import *
 import sts.headerspace.topology_loader.topology_loader as hsa_topo
 import sts.headerspace.headerspace.applications as hsa
+from sts.headerspace.headerspace.hs import headerspace, hs_string_to_byte_array
+from sts.headerspace.headerspace.tf import TF
+from sts.headerspace.headerspace.atomic_predicates import ReachabilityEngine
+from sts.headerspace.config_parser.openflow_parser import get_uniq_port_id, hs_format
 
 class MockAccessLink(object):
   def __init__(self, switch, switch_port):
     self.switch = switch
     self.switch_port = switch_port
 
+def all_x():
+  hs = headerspace(2)
+  hs.add_hs(hs_string_to_byte_array("xxxxxxxx"))
+  return hs
+
+def fwd_tf(rules):
+  ''' rules: list of (in port, [out ports]) '''
+  NTF = TF(2)
+  for (in_port, out_ports) in rules:
+    NTF.add_fwd_rule(TF.create_standard_rule([in_port], "xxxxxxxx", out_ports,
+                                             None, None))
+  return NTF
+
+def link_tf(port_pairs):
+  TTF = TF(2)
+  for (src, dst) in port_pairs:
+    TTF.add_link_rule(TF.create_standard_rule([src], None, [dst], None, None))
+  return TTF
+
 class applications_test(unittest.TestCase):
   def test_blackhole(self):
     switch1 = create_switch(1, 2)
@@ -51,5 +74,66 @@ class applications_test(unittest.TestCase):
     blackholes = hsa.find_blackholes(NTF, TTF, access_links)
     self.assertEqual([], blackholes)
 
+  def test_reachability_ignores_dead_ends(self):
+    # Switch 1 forwards from edge port 1 to switches 2 (which drops
+    # everything) and 3 (which forwards to its edge port 1)
+    NTF = fwd_tf([(100001, [100002, 100003]), (300002, [300001])])
+    TTF = link_tf([(100002, 200002), (100003, 300002)])
+    access_links = [MockAccessLink(1, 1), MockAccessLink(2, 1),
+                    MockAccessLink(3, 1)]
+    paths = hsa.find_reachability(NTF, TTF, access_links,
+                                  test_packet=all_x())
+    self.assertEqual([(300001, [100001, 100003, 300002])],
+                     [ (p["port"], p["visits"]) for p in paths[100001] ])
+
+  def test_dropped_branch_is_not_a_loop(self):
+    # 1 -> 2 -> 3, where switch 3 drops the packet
+    NTF = fwd_tf([(100001, [100002]), (200001, [200002])])
+    TTF = link_tf([(100002, 200001), (200002, 300001)])
+    self.assertEqual([], hsa.detect_loop(NTF, TTF, [100001],
+                                         test_packet=all_x()))
+    # Switch 3 sends it back to 1
+    NTF = fwd_tf([(100001, [100002]), (200001, [200002]), (300001, [300002])])
+    TTF = link_tf([(100002, 200001), (200002, 300001), (300002, 100001)])
+    loops = hsa.detect_loop(NTF, TTF, [100001], test_packet=all_x())
+    self.assertEqual([[100001, 200001, 300001]],
+                     [ loop["visits"] for loop in loops ])
+
+  def test_atomic_predicates_match_reachability(self):
+    switch1 = create_switch(1, 2)
+    flow_mod = ofp_flow_mod(xid=124, priority=1, match=ofp_match(in_port=1, nw_src="1.2.3.4"), action=ofp_action_output(port=2))
+    switch1.table.process_flow_mod(flow_mod)
+    switch2 = create_switch(2, 2)
+    network_links = [Link(switch1, switch1.ports[2], switch2, switch2.ports[2]),
+                     Link(switch2, switch2.ports[2], switch1, switch1.ports[2])]
+    access_links = [MockAccessLink(switch1, switch1.ports[1]),
+                    MockAccessLink(switch2, switch2.ports[1])]
+    edge_ports = [ get_uniq_port_id(l.switch, l.switch_port) for l in access_links ]
+    TTF = hsa_topo.generate_TTF(network_links)
+
+    def hassel_pairs():
+      NTF = hsa_topo.generate_NTF([switch1, switch2])
+      paths = hsa.find_reachability(NTF, TTF, access_links)
+      return set((in_port, p_node["port"])
+                 for (in_port, p_nodes) in paths.iteritems()
+                 for p_node in p_nodes)
+
+    engine = ReachabilityEngine(hs_format["length"]*2)
+    engine.set_topology(TTF, edge_ports)
+    def update_engine():
+      for (name, tf) in hsa_topo.generate_tf_pairs([switch1, switch2]):
+        engine.update_switch(name, tf)
+
+    update_engine()
+    self.assertEqual(set(), hassel_pairs())
+    self.assertEqual(hassel_pairs(), engine.reachable_pairs())
+
+    # A single flow_mod completes the path
+    flow_mod = ofp_flow_mod(xid=125, priority=1, match=ofp_match(in_port=2, nw_src="1.2.3.4"), action=ofp_action_output(port=1))
+    switch2.table.process_flow_mod(flow_mod)
+    update_engine()
+    self.assertEqual(set([(edge_ports[0], edge_ports[1])]), hassel_pairs())
+    self.assertEqual(hassel_pairs(), engine.reachable_pairs())
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os.path
+import itertools
+import random
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.headerspace.headerspace.hs import *
+from sts.headerspace.headerspace.tf import *
+from sts.headerspace.headerspace.propagation import Propagator
+from sts.headerspace.headerspace.atomic_predicates import *
+
+def all_headers():
+  ''' Every concrete header of a length-2 (8 bit) headerspace '''
+  return [ "".join(bits) for bits in itertools.product("01", repeat=8) ]
+
+def contains(cube, header):
+  return len(byte_array_intersect(cube, hs_string_to_byte_array(header))) > 0
+
+def switch_tf(rules):
+  tf = TF(2)
+  for (in_ports, match, out_ports) in rules:
+    tf.add_fwd_rule(TF.create_standard_rule(in_ports, match, out_ports, None, None))
+  return tf
+
+def wire_tf(port_pairs):
+  TTF = TF(2)
+  for (a, b) in port_pairs:
+    TTF.add_link_rule(TF.create_standard_rule([a], None, [b], None, None))
+    TTF.add_link_rule(TF.create_standard_rule([b], None, [a], None, None))
+  return TTF
+
+def hassel_pairs(switch2rules, TTF, edge_ports):
+  NTF = switch_tf([ rule for rules in switch2rules.values() for rule in rules ])
+  propagator = Propagator(NTF, TTF)
+  pairs = set()
+  for src in edge_ports:
+    hs = headerspace(2)
+    hs.add_hs(byte_array_get_all_x(2))
+    for (kind, node) in propagator.propagate(hs, src, set(edge_ports) - set([src])):
+      if kind == Propagator.REACHED:
+        pairs.add((src, node.port))
+  return pairs
+
+def engine_for(switch2rules, TTF, edge_ports):
+  engine = ReachabilityEngine(2)
+  for (name, rules) in switch2rules.iteritems():
+    engine.update_switch(name, switch_tf(rules))
+  engine.set_topology(TTF, edge_ports)
+  return engine
+
+class atomic_predicates_test(unittest.TestCase):
+  def test_cube_minus(self):
+    a = hs_string_to_byte_array("1xxxxxxx")
+    b = hs_string_to_byte_array("x0x1xxxx")
+    pieces = cube_minus(a, b)
+    for header in all_headers():
+      expected = contains(a, header) and not contains(b, header)
+      matches = [ piece for piece in pieces if contains(piece, header) ]
+      self.assertEqual(1 if expected else 0, len(matches))
+
+  def test_atoms_partition_header_space(self):
+    predicates = AtomicPredicates(2)
+    matches = ["1xxxxxxx", "x0x1xxxx", "10xxxxx1", "1xxxxxxx"]
+    for match in matches:
+      predicates.add(hs_string_to_byte_array(match))
+    # Duplicate predicates don't create new atoms
+    self.assertEqual(6, len(predicates))
+    for header in all_headers():
+      atoms = [ atom_id for (atom_id, cubes) in enumerate(predicates.atoms)
+                if any(contains(cube, header) for cube in cubes) ]
+      self.assertEqual(1, len(atoms))
+      for match in matches:
+        in_mask = bool(predicates.mask(hs_string_to_byte_array(match)) & (1 << atoms[0]))
+        self.assertEqual(contains(hs_string_to_byte_array(match), header), in_mask)
+
+  def test_matches_hassel(self):
+    # Edge ports 1, 11, 21 on a triangle of switches 0, 1, 2
+    switch2rules = {
+      0 : [([1], "1xxxxxxx", [2]), ([1], "0xxxxxxx", [3]), ([2, 3], "xxxxxxxx", [1])],
+      1 : [([12], "1xxxxxxx", [11]), ([11], "xxxxxxxx", [13])],
+      2 : [([23], "xxxxxxxx", [21]), ([22], "xx1xxxxx", [21])],
+    }
+    TTF = wire_tf([(2, 12), (3, 23), (13, 22)])
+    edge_ports = [1, 11, 21]
+    engine = engine_for(switch2rules, TTF, edge_ports)
+    expected = hassel_pairs(switch2rules, TTF, edge_ports)
+    self.assertEqual(set([(1, 11), (1, 21), (11, 21)]), expected)
+    self.assertEqual(expected, engine.reachable_pairs())
+
+  def test_incremental_update(self):
+    r = random.Random(1)
+    ports = range(1, 5)
+    def random_rule(sw):
+      in_ports = [ sw*10 + p for p in ports if r.random() < 0.5 ] or [sw*10 + 1]
+      out_ports = [ sw*10 + p for p in ports if r.random() < 0.4 ]
+      match = "".join(r.choice("01xxx") for _ in range(8))
+      return (in_ports, match, out_ports)
+
+    def random_rules(sw):
+      return [ random_rule(sw) for _ in range(r.randint(0, 4)) ]
+
+    for _ in range(30):
+      switch2rules = dict((sw, random_rules(sw)) for sw in range(4))
+      TTF = wire_tf([(2, 12), (3, 23), (13, 32), (24, 33), (14, 4)])
+      edge_ports = [1, 11, 21, 31]
+      engine = engine_for(switch2rules, TTF, edge_ports)
+      engine.reachable_pairs()
+      for _ in range(4):
+        # A single flow_mod: add or remove one rule
+        sw = r.randrange(4)
+        rules = list(switch2rules[sw])
+        if rules and r.random() < 0.5:
+          rules.pop(r.randrange(len(rules)))
+        else:
+          rules.append(random_rule(sw))
+        switch2rules[sw] = rules
+        engine.update_switch(sw, switch_tf(rules))
+        expected = hassel_pairs(switch2rules, TTF, edge_ports)
+        self.assertEqual(expected, engine.reachable_pairs())
+        self.assertEqual(expected,
+                         engine_for(switch2rules, TTF, edge_ports).reachable_pairs())
+
+  def test_topology_change(self):
+    switch2rules = {
+      0 : [([1], "xxxxxxxx", [2, 3])],
+      1 : [([12], "xxxxxxxx", [11])],
+      2 : [([23], "xxxxxxxx", [21])],
+    }
+    engine = engine_for(switch2rules, wire_tf([(2, 12), (3, 23)]), [1, 11, 21])
+    self.assertEqual(set([(1, 11), (1, 21)]), engine.reachable_pairs())
+    engine.set_topology(wire_tf([(2, 12)]), [1, 11, 21])
+    self.assertEqual(set([(1, 11)]), engine.reachable_pairs())
+    engine.remove_switch(1)
+    self.assertEqual(set(), engine.reachable_pairs())
+
+  def test_rewrites_unsupported(self):
+    tf = TF(2)
+    tf.add_rewrite_rule(TF.create_standard_rule([1], "xxxxxxxx", [2],
+                                                "11111100", "00000001"))
+    self.assertFalse(ReachabilityEngine.supports(tf))
+    self.assertRaises(ValueError, ReachabilityEngine(2).update_switch, 0, tf)
+
+if __name__ == '__main__':
+  unittest.main()
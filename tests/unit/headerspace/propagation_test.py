@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.headerspace.headerspace.hs import *
+from sts.headerspace.headerspace.tf import *
+from sts.headerspace.headerspace.propagation import *
+
+def all_x():
+  hs = headerspace(2)
+  hs.add_hs(hs_string_to_byte_array("xxxxxxxx"))
+  return hs
+
+def link_tf(port_pairs):
+  TTF = TF(2)
+  for (src, dst) in port_pairs:
+    TTF.add_link_rule(TF.create_standard_rule([src], None, [dst], None, None))
+  return TTF
+
+def old_reachability(NTF, TTF, in_port, out_ports, hdr):
+  ''' The dict-based propagation find_reachability used to do: return the
+  nodes reaching out_ports '''
+  reached_nodes = []
+  propagation = [{ "hdr" : hdr, "port" : in_port, "visits" : [] }]
+  while len(propagation) > 0:
+    tmp_propagate = []
+    for p_node in propagation:
+      for (next_h, next_ps) in NTF.T(p_node["hdr"], p_node["port"]):
+        for next_p in next_ps:
+          if next_p in out_ports:
+            reached_nodes.append({ "hdr" : next_h, "port" : next_p,
+                                   "visits" : p_node["visits"] + [p_node["port"]] })
+            continue
+          for (linked_h, linked_ports) in TTF.T(next_h, next_p):
+            for linked_p in linked_ports:
+              new_p_node = { "hdr" : linked_h, "port" : linked_p,
+                             "visits" : p_node["visits"] + [p_node["port"], next_p] }
+              if linked_p in out_ports:
+                reached_nodes.append(new_p_node)
+              elif linked_p not in new_p_node["visits"]:
+                tmp_propagate.append(new_p_node)
+    propagation = tmp_propagate
+  return reached_nodes
+
+def old_loops(NTF, TTF, port, hdr):
+  ''' The dict-based propagation detect_loop used to do: return the nodes
+  returning to port '''
+  loops = []
+  propagation = [{ "hdr" : hdr, "port" : port, "visits" : [] }]
+  while len(propagation) > 0:
+    tmp_propag = []
+    for p_node in propagation:
+      for (next_h, next_ps) in NTF.T(p_node["hdr"], p_node["port"]):
+        for next_p in next_ps:
+          for (linked_h, linked_ports) in TTF.T(next_h, next_p):
+            for linked_p in linked_ports:
+              new_p_node = { "hdr" : linked_h, "port" : linked_p,
+                             "visits" : p_node["visits"] + [p_node["port"]] }
+              if new_p_node["visits"][0] == linked_p:
+                loops.append(new_p_node)
+              elif linked_p not in new_p_node["visits"]:
+                tmp_propag.append(new_p_node)
+    propagation = tmp_propag
+  return loops
+
+def union(hdrs):
+  hs = headerspace(2)
+  for hdr in hdrs:
+    hs.add_hs(hdr)
+  return hs
+
+def same_headerspace(hdrs1, hdrs2):
+  (hs1, hs2) = (union(hdrs1), union(hdrs2))
+  return hs1.is_subset_of(hs2) and hs2.is_subset_of(hs1)
+
+class propagation_test(unittest.TestCase):
+  def test_node_history(self):
+    root = PropagationNode("h0", 1)
+    child = PropagationNode("h1", 3, parent=root, egress_port=2)
+    grandchild = PropagationNode("h2", 5, parent=child, egress_port=4)
+    self.assertEqual([1, 2, 3, 4], grandchild.visits)
+    self.assertEqual(["h0", "h1"], grandchild["hs_history"])
+    self.assertEqual(5, grandchild["port"])
+    self.assertTrue(grandchild.visited(2))
+    self.assertFalse(grandchild.visited(5))
+    self.assertEqual(root, grandchild.root)
+
+  def test_reachability(self):
+    # Port 1 -> switch A -> port 2 -> link -> port 3 -> switch B -> port 4
+    NTF = TF(2)
+    NTF.add_fwd_rule(TF.create_standard_rule([1], "1xxxxxxx", [2], None, None))
+    NTF.add_fwd_rule(TF.create_standard_rule([3], "xxxxxxxx", [4], None, None))
+    TTF = link_tf([(2, 3), (3, 2)])
+    propagator = Propagator(NTF, TTF)
+    results = list(propagator.propagate(all_x(), 1, [4]))
+    self.assertEqual(1, len(results))
+    (kind, node) = results[0]
+    self.assertEqual(Propagator.REACHED, kind)
+    self.assertEqual(4, node.port)
+    self.assertEqual([1, 2, 3], node.visits)
+
+  def test_dead_end(self):
+    NTF = TF(2)
+    NTF.add_fwd_rule(TF.create_standard_rule([1], "xxxxxxxx", [2], None, None))
+    TTF = link_tf([(2, 3)])
+    propagator = Propagator(NTF, TTF)
+    results = list(propagator.propagate(all_x(), 1, [4]))
+    self.assertEqual([Propagator.DEAD_END], [kind for (kind, _) in results])
+    self.assertEqual([1, 2], results[0][1].visits)
+
+  def test_loop_and_subsumption(self):
+    # Two switches bouncing everything back and forth, with two parallel
+    # links (2->3 and 5->3) carrying identical headerspaces
+    NTF = TF(2)
+    NTF.add_fwd_rule(TF.create_standard_rule([1], "xxxxxxxx", [2, 5], None, None))
+    NTF.add_fwd_rule(TF.create_standard_rule([3], "xxxxxxxx", [6], None, None))
+    NTF.add_fwd_rule(TF.create_standard_rule([7], "xxxxxxxx", [8], None, None))
+    TTF = link_tf([(2, 3), (5, 3), (6, 7), (8, 1)])
+    propagator = Propagator(NTF, TTF, record_egress_ports=False)
+    results = list(propagator.propagate(all_x(), 1, detect_loops=True))
+    self.assertEqual([Propagator.LOOP], [kind for (kind, _) in results])
+    self.assertEqual([1, 3, 7], results[0][1].visits)
+    self.assertEqual(1, propagator.report.nodes_subsumed)
+
+  def test_max_nodes(self):
+    NTF = TF(2)
+    NTF.add_fwd_rule(TF.create_standard_rule([1], "xxxxxxxx", [2], None, None))
+    NTF.add_fwd_rule(TF.create_standard_rule([3], "xxxxxxxx", [4], None, None))
+    TTF = link_tf([(2, 3), (4, 5)])
+    propagator = Propagator(NTF, TTF, max_nodes=1)
+    results = list(propagator.propagate(all_x(), 1, [5]))
+    self.assertEqual([], results)
+    self.assertTrue(propagator.report.truncated)
+
+  def test_max_nodes_fan_out(self):
+    NTF = TF(2)
+    NTF.add_fwd_rule(TF.create_standard_rule([1], "xxxxxxxx", range(10, 20),
+                                             None, None))
+    propagator = Propagator(NTF, link_tf([]), max_nodes=3)
+    results = list(propagator.propagate(all_x(), 1, range(10, 20)))
+    self.assertEqual(3, len(results))
+    self.assertEqual(3, propagator.report.nodes_created)
+    self.assertTrue(propagator.report.truncated)
+
+  def test_subsumed_branch_not_lost(self):
+    # Switch S1 sends everything out of ports 2 and 4. Both branches arrive at
+    # port 11 of switch P: directly from port 2, and via switch Y (ports
+    # 5 -> 6). P sends them back to S1's port 2, which only the second branch
+    # hasn't visited, and from which S1 forwards to port 7.
+    NTF = TF(2)
+    NTF.add_fwd_rule(TF.create_standard_rule([1], "xxxxxxxx", [2, 4], None, None))
+    NTF.add_fwd_rule(TF.create_standard_rule([2], "xxxxxxxx", [7], None, None))
+    NTF.add_fwd_rule(TF.create_standard_rule([5], "xxxxxxxx", [6], None, None))
+    NTF.add_fwd_rule(TF.create_standard_rule([11], "xxxxxxxx", [12], None, None))
+    TTF = link_tf([(2, 11), (4, 5), (6, 11), (12, 2)])
+    propagator = Propagator(NTF, TTF)
+    results = list(propagator.propagate(all_x(), 1, [7]))
+    self.assertEqual([(Propagator.REACHED, [1, 4, 5, 6, 11, 12, 2])],
+                     [ (kind, node.visits) for (kind, node) in results ])
+    self.assertEqual(1, len(old_reachability(NTF, TTF, 1, [7], all_x())))
+
+  def test_matches_old_propagation(self):
+    # Port 1 -> S1, which clears the first bit of 1xxxxxxx headers -> S2,
+    # which sends 0xxxxxxx headers to S3 (which sets the first bit again, and
+    # sends them back to S1) and to edge port 11, and 1xxxxxxx headers to edge
+    # port 6 (unreachable)
+    NTF = TF(2)
+    NTF.add_rewrite_rule(TF.create_standard_rule([1], "1xxxxxxx", [2],
+                                                 "01111111", "00000000"))
+    NTF.add_fwd_rule(TF.create_standard_rule([1], "0xxxxxxx", [2], None, None))
+    NTF.add_fwd_rule(TF.create_standard_rule([3], "0xxxxxxx", [4, 11], None, None))
+    NTF.add_fwd_rule(TF.create_standard_rule([3], "1xxxxxxx", [6], None, None))
+    NTF.add_rewrite_rule(TF.create_standard_rule([7], "xxxxxxxx", [8],
+                                                 "01111111", "10000000"))
+    TTF = link_tf([(2, 3), (4, 7), (8, 1)])
+    for (in_port, out_ports) in [(1, [6, 11]), (7, [1, 6, 11])]:
+      old = old_reachability(NTF, TTF, in_port, out_ports, all_x())
+      new = [ node for (kind, node) in
+              Propagator(NTF, TTF).propagate(all_x(), in_port, out_ports)
+              if kind == Propagator.REACHED ]
+      self.assertTrue(len(new) > 0)
+      for out_port in out_ports:
+        self.assertTrue(same_headerspace(
+          [ n["hdr"] for n in old if n["port"] == out_port ],
+          [ n.hdr for n in new if n.port == out_port ]))
+      old_visits = [ n["visits"] for n in old ]
+      for node in new:
+        self.assertTrue(node.visits in old_visits)
+
+      old = old_loops(NTF, TTF, in_port, all_x())
+      propagator = Propagator(NTF, TTF, record_egress_ports=False)
+      new = [ node for (kind, node) in
+              propagator.propagate(all_x(), in_port, detect_loops=True)
+              if kind == Propagator.LOOP ]
+      self.assertTrue(len(new) > 0)
+      self.assertTrue(same_headerspace([ n["hdr"] for n in old ],
+                                       [ n.hdr for n in new ]))
+      old_visits = [ n["visits"] for n in old ]
+      for node in new:
+        self.assertTrue(node.visits in old_visits)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os
+import os.path
+import tempfile
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.headerspace.headerspace.hs import *
+from sts.headerspace.headerspace.tf import *
+
+class tf_test(unittest.TestCase):
+  def setUp(self):
+    self.tf = TF(4)
+    self.tf.set_prefix_id("sw1")
+    self.tf.add_rewrite_rule(TF.create_standard_rule([1,2,3], "100100xx10101010", [5],
+                                                     "0011111111111111", "0111111100000000"))
+    self.tf.add_rewrite_rule(TF.create_standard_rule([1,2], "1001xxxx1x1x1x1x", [5,6],
+                                                     "0000111111111111", "0110111100000000",
+                                                     "sw1.cfg", [3,4]))
+    self.tf.add_fwd_rule(TF.create_standard_rule([2,4], "10xxxxxxxxxxxxxx", [5], None, None))
+    (fd, self.text_path) = tempfile.mkstemp(suffix=".tf")
+    os.close(fd)
+    (fd, self.binary_path) = tempfile.mkstemp(suffix=".tf")
+    os.close(fd)
+
+  def tearDown(self):
+    os.unlink(self.text_path)
+    os.unlink(self.binary_path)
+
+  def test_binary_round_trip(self):
+    self.tf.save_object_to_file(self.text_path)
+    self.tf.save_binary_object_to_file(self.binary_path)
+    self.assertFalse(is_binary_tf_file(self.text_path))
+    self.assertTrue(is_binary_tf_file(self.binary_path))
+
+    loaded = TF(1)
+    # Binary files are detected by load_object_from_file
+    loaded.load_object_from_file(self.binary_path)
+    self.assertEqual(self.tf.length, loaded.length)
+    self.assertEqual(len(self.tf.rules), len(loaded.rules))
+    self.assertEqual([1, 2], loaded.rules[1]["in_ports"])
+    self.assertEqual([3, 4], loaded.rules[1]["line"])
+    self.assertEqual("sw1.cfg", loaded.rules[1]["file"])
+    self.assertEqual(None, loaded.rules[2]["mask"])
+    self.assertTrue(loaded.rules[1]["affected_by"][0][0] is loaded.rules[0])
+
+    # Saving the loaded TF as text should yield exactly the original text
+    loaded.save_object_to_file(self.binary_path)
+    self.assertEqual(open(self.text_path).read(), open(self.binary_path).read())
+
+  def test_binary_transfer(self):
+    self.tf.save_binary_object_to_file(self.binary_path)
+    loaded = TF(1)
+    loaded.load_binary_object_from_file(self.binary_path)
+    hs = headerspace(4)
+    hs.add_hs(hs_string_to_byte_array("100xxxxxxxxxxxxx"))
+    self.assertEqual(str(self.tf.T(hs, 2)), str(loaded.T(hs, 2)))
+
+if __name__ == '__main__':
+  unittest.main()
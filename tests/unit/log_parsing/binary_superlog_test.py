@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os
+import json
+import tempfile
+from collections import OrderedDict
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.log_processing.binary_superlog import *
+
+fingerprint = ["OFFingerprint", {"class": "ofp_flow_mod", "match": "nw_src: 1.1.1.1"}]
+
+json_lines = [
+  '''{"dependent_labels": ["e2"], "start_dpid": 1, "class": "LinkFailure", "start_port_no": 1, "end_dpid": 2, "end_port_no": 1, "label": "e1", "time": [0, 0], "round": 0}''',
+  '''{"dependent_labels": [], "start_dpid": 1, "class": "LinkRecovery", "start_port_no": 1, "end_dpid": 2, "end_port_no": 1, "label": "e2", "time": [1, 500], "round": 1}''',
+  '''{"class": "ControlMessageReceive", "label": "i3", "time": [2, 7], "round": 1, "dpid": 1, "controller_id": "c1", "fingerprint": %s, "timeout_disallowed": false}''' % json.dumps(fingerprint),
+  '''{"class": "ControlMessageReceive", "label": "i4", "time": [3, 7], "round": 2, "dpid": 2, "controller_id": "c1", "fingerprint": %s, "timeout_disallowed": true}''' % json.dumps(fingerprint),
+  # Not a typed record: no round
+  '''{"class": "WaitTime", "label": "e5", "time": [4, 0], "wait_time": 0.25, "big": 123456789012345678901234567890, "unicode": "\\u00e9", "null": null}''',
+]
+
+class binary_superlog_test(unittest.TestCase):
+  def setUp(self):
+    (fd, self.json_path) = tempfile.mkstemp()
+    os.close(fd)
+    (fd, self.binary_path) = tempfile.mkstemp()
+    os.close(fd)
+    with open(self.json_path, 'w') as f:
+      f.write("\n".join(json_lines) + "\n")
+    json_to_binary(self.json_path, self.binary_path)
+    self.superlog = BinarySuperlog(self.binary_path)
+
+  def tearDown(self):
+    self.superlog.close()
+    os.unlink(self.json_path)
+    os.unlink(self.binary_path)
+
+  def test_round_trip(self):
+    self.assertTrue(is_binary_superlog(self.binary_path))
+    self.assertFalse(is_binary_superlog(self.json_path))
+    self.assertEqual(len(json_lines), len(self.superlog))
+    for (i, line) in enumerate(json_lines):
+      self.assertEqual(json.loads(line), self.superlog.json_hash(i))
+    (fd, path) = tempfile.mkstemp()
+    os.close(fd)
+    try:
+      binary_to_json(self.binary_path, path)
+      with open(path) as f:
+        # Key order is preserved too
+        self.assertEqual([ json.dumps(json.loads(line, object_pairs_hook=OrderedDict))
+                           for line in json_lines ],
+                         [ line.rstrip() for line in f ])
+    finally:
+      os.unlink(path)
+
+  def test_fingerprints_interned(self):
+    self.assertEqual(fingerprint, self.superlog.json_hash(2)['fingerprint'])
+    # Decoded values are not shared between records
+    self.assertFalse(self.superlog.json_hash(2)['fingerprint'] is
+                     self.superlog.json_hash(3)['fingerprint'])
+
+  def test_smaller_than_json(self):
+    lines = [ json_lines[2].replace('"i3"', '"i%d"' % i) for i in range(100) ]
+    (fd, path) = tempfile.mkstemp()
+    os.close(fd)
+    try:
+      with BinarySuperlogWriter(path) as writer:
+        for line in lines:
+          writer.write(json.loads(line, object_pairs_hook=OrderedDict))
+      self.assertTrue(os.path.getsize(path) * 2 < len("\n".join(lines)))
+    finally:
+      os.unlink(path)
+
+  def test_random_access(self):
+    self.assertEqual(3, self.superlog.index_of_label("i4"))
+    self.assertEqual(4, self.superlog.index_of_label(u"e5"))
+    self.assertEqual(None, self.superlog.index_of_label("e6"))
+    self.assertEqual("ControlMessageReceive", self.superlog.class_name(3))
+    self.assertEqual("WaitTime", self.superlog.class_name(4))
+    self.assertEqual("e2", self.superlog.label(1))
+    self.assertEqual(2, self.superlog.round(3))
+    self.assertEqual([1, 2], self.superlog.indices_for_round(1))
+    self.assertEqual([], self.superlog.indices_for_round(5))
+    self.assertEqual([0, 1, 2], self.superlog.rounds())
+    self.assertEqual(json.loads(json_lines[-1]), self.superlog.json_hash(-1))
+    self.assertRaises(IndexError, self.superlog.json_hash, len(json_lines))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os
+import tempfile
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.log_processing.openflow_sidelog import *
+
+class MockMessage(object):
+  def __init__(self, raw):
+    self.raw = raw
+
+  def pack(self):
+    return self.raw
+
+class openflow_sidelog_test(unittest.TestCase):
+  def setUp(self):
+    (fd, self.path) = tempfile.mkstemp()
+    os.close(fd)
+
+  def tearDown(self):
+    os.unlink(self.path)
+
+  def test_round_trip(self):
+    with OpenFlowSideLogWriter(self.path) as writer:
+      writer.write("i1", 1, "c1", RECEIVE, MockMessage("\x01\x0e\x00\x08abcd"),
+                   100.5)
+      writer.write("i2", 2, ("127.0.0.1", 6633), SEND,
+                   MockMessage("\x01\x0a" + "x" * 1000), 101.0)
+      # Passed through without a logged event
+      writer.write(None, 1, "c1", SEND, MockMessage(""), 102.0)
+
+    sidelog = OpenFlowSideLog(self.path)
+    self.assertEqual(len(sidelog), 3)
+    records = list(sidelog)
+    self.assertEqual(records[0], OpenFlowRecord("i1", 1, "c1", RECEIVE, 100.5,
+                                                "\x01\x0e\x00\x08abcd"))
+    self.assertEqual(records[1].controller_id, ("127.0.0.1", 6633))
+    self.assertEqual(records[1].direction, SEND)
+    self.assertEqual(len(records[1].raw), 1002)
+    self.assertEqual(records[2].label, None)
+    self.assertEqual(records[2].raw, "")
+    self.assertEqual(sidelog.record_for_label("i2"), records[1])
+    self.assertEqual(sidelog.record_for_label(u"i1"), records[0])
+    self.assertEqual(sidelog.record_for_label("i3"), None)
+    self.assertRaises(IndexError, sidelog.record, 3)
+    sidelog.close()
+
+  def test_incomplete_sidelog(self):
+    writer = OpenFlowSideLogWriter(self.path)
+    writer.write("i1", 1, "c1", RECEIVE, MockMessage("abc"), 0.0)
+    writer.output.flush()
+    self.assertRaises(ValueError, OpenFlowSideLog, self.path)
+    writer.close()
+
+if __name__ == '__main__':
+  unittest.main()
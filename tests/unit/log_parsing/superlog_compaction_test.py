@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.log_processing.superlog_compaction import *
+
+def permit(label, time, round=0, nw_src="1.1.1.1", klass="DataplanePermit"):
+  return {"class": klass, "label": label, "time": [time, 0], "round": round,
+          "dependent_labels": [], "timeout_disallowed": False,
+          "fingerprint": [klass, {"nw_src": nw_src}, 1, 2]}
+
+class superlog_compaction_test(unittest.TestCase):
+  def test_runs_merged(self):
+    events = [permit("i1", 1), permit("i2", 2), permit("i3", 3),
+              permit("i4", 4, nw_src="2.2.2.2"),
+              permit("e5", 5, klass="DataplaneDrop"),
+              permit("e6", 6, klass="DataplaneDrop"),
+              {"class": "WaitTime", "label": "e7", "time": [7, 0], "round": 0},
+              permit("i8", 8, nw_src="2.2.2.2")]
+    compacted = list(compact_dataplane_runs(events))
+    self.assertEqual(["i1", "i4", "e5", "e7", "i8"],
+                     [ e["label"] for e in compacted ])
+    self.assertEqual(3, compacted[0]["count"])
+    self.assertEqual([3, 0], compacted[0]["end_time"])
+    self.assertEqual([1, 0], compacted[0]["time"])
+    self.assertFalse("count" in compacted[1])
+    self.assertEqual(2, compacted[2]["count"])
+    # The input isn't modified
+    self.assertFalse("count" in events[0])
+
+  def test_runs_split(self):
+    # Different rounds, referenced labels and already compacted events
+    first = permit("i1", 1)
+    first["count"] = 2
+    first["end_time"] = [1, 5]
+    events = [first, permit("i2", 2), permit("i3", 3, round=1),
+              permit("i4", 4, round=1)]
+    compacted = list(compact_dataplane_runs(events, keep_labels=set(["i4"])))
+    self.assertEqual(["i1", "i3", "i4"], [ e["label"] for e in compacted ])
+    self.assertEqual(3, compacted[0]["count"])
+    self.assertEqual([2, 0], compacted[0]["end_time"])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os
+import random
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.log_processing.superlog_diff import *
+from sts.log_processing.superlog_diff import _myers
+
+def lcs_length(a, b):
+  previous = [0] * (len(b) + 1)
+  for x in a:
+    current = [0]
+    for (j, y) in enumerate(b):
+      current.append(previous[j] + 1 if x == y else max(previous[j + 1], current[j]))
+    previous = current
+  return previous[-1]
+
+def event(index, label, key, round=0):
+  return LoggedEvent(index, {"label": label, "class": "C%d" % key,
+                             "round": round}, key)
+
+class superlog_diff_test(unittest.TestCase):
+  def check_alignment(self, a, b, matches):
+    self.assertEqual(sorted(matches), matches)
+    for (i, j) in matches:
+      self.assertEqual(a[i], b[j])
+    self.assertEqual(len(set(i for (i, _) in matches)), len(matches))
+    self.assertEqual(sorted(j for (_, j) in matches), [ j for (_, j) in matches ])
+
+  def test_myers_is_optimal(self):
+    r = random.Random(2)
+    for _ in range(200):
+      a = [ r.randrange(4) for _ in range(r.randrange(12)) ]
+      b = [ r.randrange(4) for _ in range(r.randrange(12)) ]
+      matches = _myers(a, b, len(a) + len(b))
+      self.check_alignment(a, b, matches)
+      self.assertEqual(lcs_length(a, b), len(matches))
+      # Patience anchoring may settle for a shorter common subsequence
+      self.check_alignment(a, b, align(a, b))
+
+  def test_long_logs(self):
+    r = random.Random(3)
+    a = [ r.randrange(100000) for _ in range(20000) ]
+    b = list(a)
+    for _ in range(50):
+      del b[r.randrange(len(b))]
+      b.insert(r.randrange(len(b)), r.randrange(100000))
+    matches = align(a, b)
+    self.check_alignment(a, b, matches)
+    self.assertTrue(len(matches) >= len(a) - 50)
+
+  def test_report(self):
+    original = [event(0, "e1", 1), event(1, "i2", 2, round=1),
+                event(2, "i3", 3, round=2), event(3, "i4", 4, round=3),
+                event(4, "e5", 5, round=4)]
+    new = [event(0, "e1", 1), event(1, "i3", 3, round=1),
+           event(2, "i4", 4, round=2), event(3, "i2", 2, round=3),
+           event(4, "i6", 6, round=3), event(5, "e5", 5, round=4)]
+    diff = SuperlogDiff(original, new)
+    self.assertEqual([], diff.missing)
+    self.assertEqual(["i6"], [ e.label for e in diff.extra ])
+    self.assertEqual([("i2", "i2")], [ (o.label, n.label) for (o, n) in diff.reordered ])
+    report = diff.report()
+    self.assertTrue("round 3: i6 C6" in report)
+    self.assertTrue("round 1: i2 C2 -> round 3: i2" in report)
+
+if __name__ == '__main__':
+  unittest.main()
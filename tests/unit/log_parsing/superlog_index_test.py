@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os
+import json
+import shutil
+import tempfile
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.log_processing.superlog_index import *
+from sts.log_processing.binary_superlog import json_to_binary
+
+def events():
+  yield {"class": "SwitchFailure", "dpid": 1, "label": "e1", "round": 0,
+         "time": [100, 0], "dependent_labels": []}
+  for i in range(2, 12):
+    yield {"class": "ControlMessageReceive", "dpid": 1 + i % 2,
+           "controller_id": "c1", "label": "i%d" % i, "round": i / 3,
+           "time": [100 + i, 500000],
+           "fingerprint": ["ControlMessageReceive", {"class": "ofp_packet_in"},
+                           1 + i % 2, "c1"]}
+  yield {"class": "ControllerStateChange", "controller_id": ["127.0.0.1", 6633],
+         "label": "i12", "round": 5, "time": [120, 0],
+         "_fingerprint": ["ControllerStateChange", "role"],
+         "name": "role", "value": "master"}
+  yield {"class": "LinkFailure", "start_dpid": 2, "start_port_no": 1,
+         "end_dpid": 3, "end_port_no": 1, "label": "e13", "round": 6,
+         "time": [121, 0], "dependent_labels": []}
+
+class superlog_index_test(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmpdir, "superlog.json")
+    with open(self.path, 'w') as logfile:
+      for json_hash in events():
+        logfile.write(json.dumps(json_hash) + "\n")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def check_queries(self, index):
+    self.assertEqual(len(index), 13)
+    self.assertEqual(index.select(), range(13))
+    self.assertEqual(index.select(classes=["SwitchFailure", "LinkFailure"]),
+                     [0, 12])
+    self.assertEqual(index.select(dpids=[2]), [2, 4, 6, 8, 10, 12])
+    self.assertEqual(index.select(dpids=[2], rounds=(1, 2)), [2, 4, 6])
+    self.assertEqual(index.select(controller_ids=["127.0.0.1:6633"]), [11])
+    self.assertEqual(len(index.select(controller_ids=["c1"])), 10)
+    self.assertEqual(index.select(labels=["i5", "e13", "x"]), [4, 12])
+    self.assertEqual(index.select(time_range=(110, 120)), [9, 10, 11])
+    self.assertEqual(index.histogram(index.select(), "class"),
+                     [("ControlMessageReceive", 10),
+                      ("ControllerStateChange", 1),
+                      ("LinkFailure", 1), ("SwitchFailure", 1)])
+    self.assertEqual(index.histogram(index.select(dpids=[2]), "round"),
+                     [(1, 2), (2, 1), (3, 2), (6, 1)])
+    self.assertEqual(index.histogram(index.select(dpids=[2, 3]), "dpid"),
+                     [(2, 6), (3, 1)])
+    self.assertEqual(index.histogram(range(5), "time", bucket=2),
+                     [(100.0, 1), (102.0, 2), (104.0, 2)])
+    self.assertEqual(index.label(4), "i5")
+    self.assertEqual(index.json_hash(12)["end_dpid"], 3)
+    index.close()
+
+  def test_json_superlog(self):
+    self.check_queries(load_index(self.path))
+    self.assertTrue(os.path.exists(self.path + INDEX_SUFFIX))
+    # Loaded from the stored index
+    index = SuperlogIndex(self.path)
+    self.assertTrue(index.load(self.path + INDEX_SUFFIX))
+    self.check_queries(index)
+
+  def test_binary_superlog(self):
+    binary_path = os.path.join(self.tmpdir, "superlog.bin")
+    json_to_binary(self.path, binary_path)
+    self.check_queries(load_index(binary_path))
+
+  def test_stale_index(self):
+    load_index(self.path).close()
+    with open(self.path, 'a') as logfile:
+      logfile.write(json.dumps({"class": "SwitchRecovery", "dpid": 1,
+                                "label": "e14", "round": 7,
+                                "time": [130, 0]}) + "\n")
+    index = SuperlogIndex(self.path)
+    self.assertFalse(index.load(self.path + INDEX_SUFFIX))
+    index = load_index(self.path)
+    self.assertEqual(len(index), 14)
+    self.assertEqual(index.select(dpids=[1], rounds=(7, 7)), [13])
+    index.close()
+
+if __name__ == '__main__':
+  unittest.main()
@@ -7,11 +7,13 @@ import itertools
 from copy import copy
 import types
 import tempfile
+import json
 
 sys.path.append(os.path.dirname(__file__) + "/../../..")
 
 import sts.log_processing.superlog_parser as superlog_parser
-from sts.replay_event import LinkFailure, LinkRecovery
+from sts.log_processing.binary_superlog import BinarySuperlog, json_to_binary
+from sts.replay_event import Event, LinkFailure, LinkRecovery, TrafficInjection
 
 class superlog_parser_test(unittest.TestCase):
   tmpfile = '/tmp/superlog.tmp'
@@ -39,5 +41,100 @@ class superlog_parser_test(unittest.TestCase):
       if name is not None:
         os.unlink(name)
 
+  def test_parsed_cache(self):
+    cache_path = self.tmpfile + superlog_parser.PARSED_CACHE_SUFFIX
+    try:
+      self.open_simple_superlog()
+      if os.path.exists(cache_path):
+        os.unlink(cache_path)
+      events = superlog_parser.parse_path(self.tmpfile)
+      self.assertTrue(os.path.exists(cache_path))
+      cached = superlog_parser.load_cached_trace(self.tmpfile)
+      self.assertEqual(events, cached)
+      self.assertEqual([e.dependent_labels for e in events],
+                       [e.dependent_labels for e in cached])
+      # The cache is invalidated when the superlog changes
+      with open(self.tmpfile, 'a') as superlog:
+        superlog.write('\n')
+      self.assertEqual(None, superlog_parser.load_cached_trace(self.tmpfile))
+    finally:
+      if os.path.exists(cache_path):
+        os.unlink(cache_path)
+
+  def write_link_flaps(self, n, first_label=1):
+    with open(self.tmpfile, 'w') as superlog:
+      for i in range(n):
+        failure = 'e%d' % (2 * i + first_label)
+        recovery = 'e%d' % (2 * i + first_label + 1)
+        superlog.write('''{"dependent_labels": ["%s"], "start_dpid": 1, "class": "LinkFailure",'''
+                       ''' "start_port_no": 1, "end_dpid": 2, "end_port_no": 1, "label": "%s", "time": [%d,0], "round": %d}\n''' %
+                       (recovery, failure, i, i))
+        superlog.write('''{"dependent_labels": [], "start_dpid": 1, "class": "LinkRecovery",'''
+                       ''' "start_port_no": 1, "end_dpid": 2, "end_port_no": 1, "label": "%s", "time": [%d,0], "round": %d}\n''' %
+                       (recovery, i, i))
+
+  def test_parallel_parse(self):
+    self.write_link_flaps(500)
+    with open(self.tmpfile) as logfile:
+      serial = superlog_parser.parse(logfile)
+    chunks = superlog_parser.line_aligned_chunks(self.tmpfile, chunk_size=1000)
+    self.assertTrue(len(chunks) > 10)
+    self.assertEqual(chunks[0][0], 0)
+    self.assertEqual(chunks[-1][1], os.path.getsize(self.tmpfile))
+    parallel = list(superlog_parser.iter_parse_parallel(self.tmpfile,
+                                                        processes=2,
+                                                        chunk_size=1000))
+    self.assertEqual(1000, len(parallel))
+    self.assertEqual([(type(e), e.label) for e in serial],
+                     [(type(e), e.label) for e in parallel])
+
+  def test_parallel_parse_checks_labels(self):
+    self.write_link_flaps(500)
+    with open(self.tmpfile) as superlog:
+      first_line = superlog.readline()
+    with open(self.tmpfile, 'a') as superlog:
+      superlog.write(first_line)
+    events = superlog_parser.iter_parse_parallel(self.tmpfile, processes=2,
+                                                 chunk_size=1000)
+    self.assertRaises(RuntimeError, list, events)
+
+  def test_iter_parse(self):
+    self.write_link_flaps(10)
+    with open(self.tmpfile) as logfile:
+      events = superlog_parser.iter_parse(logfile)
+      self.assertEqual(type(events), types.GeneratorType)
+      self.assertEqual(LinkFailure, type(events.next()))
+      self.assertEqual(19, len(list(events)))
+
+  def test_traffic_injection_round_trip(self):
+    # Superlogs from before batched injections have no count field
+    old_format = str('''{"dependent_labels": [], "prunable": true, "class": "TrafficInjection",'''
+                     ''' "label": "e1", "time": [0, 0], "round": 0}''')
+    event = TrafficInjection.from_json(json.loads(old_format))
+    self.assertEqual(1, event.count)
+    self.assertEqual(json.loads(old_format), json.loads(event.to_json()))
+    batch = TrafficInjection(round=1, count=3)
+    self.assertEqual(3, json.loads(batch.to_json())['count'])
+
+  def test_binary_labels_registered(self):
+    # Write out the labels that would be generated next
+    next_label_id = int(Event.new_label()[1:]) + 1
+    self.write_link_flaps(5, first_label=next_label_id)
+    (fd, binary_path) = tempfile.mkstemp()
+    os.close(fd)
+    try:
+      json_to_binary(self.tmpfile, binary_path)
+      superlog = BinarySuperlog(binary_path)
+      try:
+        events = superlog_parser.parse_binary(superlog)
+        labels = set(superlog.label(i) for i in xrange(len(superlog)))
+        # None of the events have been decoded yet
+        self.assertTrue(Event.new_label() not in labels)
+        self.assertEqual(10, len(set(e.label for e in events) & labels))
+      finally:
+        superlog.close()
+    finally:
+      os.unlink(binary_path)
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.experiments.benchmark import PhaseTimer, find_regressions
+
+class MockClock(object):
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+class PhaseTimerTest(unittest.TestCase):
+  def test_nested_phases(self):
+    clock = MockClock()
+    timer = PhaseTimer(clock=clock)
+    def log():
+      clock.now += 1
+    def check():
+      clock.now += 2
+      timed_log()
+      clock.now += 3
+    timed_log = timer.timed("logging", log)
+    timed_check = timer.timed("checks", check)
+    timed_check()
+    timed_log()
+    self.assertEqual(dict(timer.seconds), { "checks" : 5, "logging" : 2 })
+
+  def test_exceptions(self):
+    timer = PhaseTimer(clock=MockClock())
+    def fail():
+      raise ValueError()
+    self.assertRaises(ValueError, timer.timed("failing", fail))
+    self.assertEqual(timer._phases, [])
+
+class FindRegressionsTest(unittest.TestCase):
+  def case(self, topology, size, rounds_per_second):
+    return { 'topology' : topology, 'size' : size,
+             'rounds_per_second' : rounds_per_second,
+             'messages_per_second' : 100.0, 'packets_per_second' : 10.0 }
+
+  def test_regressions(self):
+    baseline = { 'cases' : [self.case("mesh", 2, 100.0),
+                            self.case("mesh", 4, 50.0)] }
+    results = { 'cases' : [self.case("mesh", 2, 95.0),
+                           self.case("mesh", 4, 40.0),
+                           self.case("fat_tree", 4, 1.0)] }
+    self.assertEqual(find_regressions(baseline, results, tolerance=0.1),
+                     [("mesh", 4, "rounds_per_second", 50.0, 40.0)])
+    self.assertEqual(find_regressions(baseline, results, tolerance=0.3), [])
+
+if __name__ == '__main__':
+  unittest.main()
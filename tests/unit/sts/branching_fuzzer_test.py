@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os
+import random
+import signal
+import time
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.control_flow.branching_fuzzer import BranchingFuzzer, exploration_throughput, ForkedControllerProcess
+
+class MockSimulationConfig(object):
+  _dataplane_trace_path = None
+
+class MockIOMaster(object):
+  def sleep_until_idle(self, timeout, idle_interval):
+    return True
+
+  def buffers_empty(self):
+    return True
+
+class MockSyncConnection(object):
+  ''' Forks like POXSyncProtocolSpeaker._fork: the copy of the controller
+  runs until STS kills it '''
+  def __init__(self):
+    self.fork_pids = []
+
+  def request_fork(self):
+    pid = os.fork()
+    if pid == 0:
+      while True:
+        time.sleep(1)
+    self.fork_pids.append(pid)
+    return pid
+
+  def wait_for_fork(self, request, timeout=10):
+    return request
+
+class MockController(object):
+  def __init__(self, cid):
+    self.cid = cid
+    self.sync_connection = MockSyncConnection()
+    self.process = object()
+
+class MockControllerManager(object):
+  def __init__(self, controllers):
+    self.live_controllers = controllers
+
+class MockSimulation(object):
+  def __init__(self, controllers):
+    self.io_master = MockIOMaster()
+    self.controller_manager = MockControllerManager(controllers)
+    self.exit_code = 0
+
+class ExplorationThroughputTest(unittest.TestCase):
+  def test_throughput(self):
+    checkpoints = [{ 'round' : 50, 'branches' : [{ 'rounds' : 20 },
+                                                 { 'rounds' : 10 }] },
+                   { 'round' : 100, 'branches' : [{ 'rounds' : 20 }] }]
+    throughput = exploration_throughput(100, 10.0, checkpoints, 2.5)
+    self.assertEqual(throughput['main_run']['rounds_per_second'], 10.0)
+    self.assertEqual(throughput['with_checkpointing']['rounds'], 50)
+    self.assertEqual(throughput['with_checkpointing']['rounds_per_second'],
+                     20.0)
+    # Restarting would replay 50 + 50 + 100 rounds before the branches
+    without = throughput['without_checkpointing']
+    self.assertEqual(without['replayed_rounds'], 200)
+    self.assertEqual(without['seconds'], 25.0)
+    self.assertEqual(without['rounds_per_second'], 2.0)
+
+  def test_no_branches(self):
+    throughput = exploration_throughput(0, 0.0, [], 0.0)
+    self.assertEqual(throughput['with_checkpointing']['rounds_per_second'], None)
+    self.assertEqual(throughput['without_checkpointing']['rounds_per_second'],
+                     None)
+
+class ForkedControllerProcessTest(unittest.TestCase):
+  def test_poll(self):
+    self.assertEqual(ForkedControllerProcess(os.getpid()).poll(), None)
+    pid = os.fork()
+    if pid == 0:
+      os._exit(0)
+    os.waitpid(pid, 0)
+    self.assertEqual(ForkedControllerProcess(pid).poll(), -1)
+
+class BranchingFuzzerTest(unittest.TestCase):
+  def test_explore_branch(self):
+    controller = MockController("c1")
+    process = controller.process
+    simulation = MockSimulation([controller])
+    fuzzer = BranchingFuzzer(MockSimulationConfig(), checkpoint_interval=5,
+                             num_branches=1, branch_rounds=3, delay=0,
+                             random_seed=1)
+    fuzzer.simulation = simulation
+    fuzzer.logical_time = 5
+    fuzzer._end_time = 100
+    random_state = fuzzer.random.getstate()
+
+    fuzzer._wait_for_next_round()
+    if fuzzer._branch is not None:
+      # We're the forked copy of STS: run the branch, and report back
+      try:
+        while fuzzer.logical_time < fuzzer._end_time:
+          fuzzer.logical_time += 1
+        fuzzer._handle_violations(["c1"])
+        fuzzer._end_branch(simulation)
+      finally:
+        os._exit(1)
+
+    # The main run picks up from the checkpoint
+    self.assertEqual(None, fuzzer._branch)
+    self.assertEqual(5, fuzzer.logical_time)
+    self.assertEqual(100, fuzzer._end_time)
+    self.assertEqual([], fuzzer._violations)
+    self.assertTrue(controller.process is process)
+    self.assertTrue(fuzzer._checkpointing)
+    # The branch's seed was the main run's only draw
+    expected_random = random.Random()
+    expected_random.setstate(random_state)
+    seed = expected_random.randint(0, sys.maxint)
+    self.assertEqual(expected_random.getstate(), fuzzer.random.getstate())
+
+    self.assertEqual(1, len(fuzzer.checkpoints))
+    self.assertEqual(5, fuzzer.checkpoints[0]['round'])
+    (result,) = fuzzer.checkpoints[0]['branches']
+    self.assertEqual(0, result['branch'])
+    self.assertEqual(seed, result['seed'])
+    self.assertEqual(5, result['checkpoint_round'])
+    self.assertEqual(3, result['rounds'])
+    self.assertEqual([(8, ["c1"])], result['violations'])
+    self.assertEqual(0, result['exit_code'])
+    self.assertTrue(result['quiescent'])
+
+    # The branch killed the controller's copy
+    (copy_pid,) = controller.sync_connection.fork_pids
+    (_, status) = os.waitpid(copy_pid, 0)
+    self.assertTrue(os.WIFSIGNALED(status))
+    self.assertEqual(signal.SIGKILL, os.WTERMSIG(status))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os
+import random
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.control_flow.coverage_fuzzer import Coverage, Corpus, fresh_copy
+from sts.replay_event import *
+
+class CoverageTest(unittest.TestCase):
+  def test_state_changes(self):
+    coverage = Coverage()
+    self.assertTrue(coverage.observe_state_change(("c1",), "fp1", "name", 1))
+    self.assertFalse(coverage.observe_state_change(("c2",), "fp1", "name", 2))
+    self.assertTrue(coverage.observe_state_change(("c1",), "fp2", "name", 1))
+    self.assertEqual(coverage.take_new(), 2)
+    self.assertEqual(coverage.take_new(), 0)
+    with_values = Coverage(include_state_values=True)
+    with_values.observe_state_change(("c1",), "fp1", "name", 1)
+    self.assertTrue(with_values.observe_state_change(("c1",), "fp1", "name", 2))
+
+  def test_openflow_sequences(self):
+    self.assertFalse(Coverage().observe_openflow(1, "c1", "send", "ofp_hello"))
+    coverage = Coverage(openflow_sequence_length=2)
+    self.assertTrue(coverage.observe_openflow(1, "c1", "send", "ofp_hello"))
+    self.assertTrue(coverage.observe_openflow(1, "c1", "send", "ofp_hello"))
+    # Both sequences have been seen on switch 1
+    self.assertFalse(coverage.observe_openflow(2, "c1", "send", "ofp_hello"))
+    self.assertFalse(coverage.observe_openflow(2, "c1", "send", "ofp_hello"))
+    coverage.reset_connections()
+    self.assertFalse(coverage.observe_openflow(1, "c1", "send", "ofp_hello"))
+    self.assertEqual(len(coverage), 2)
+
+class CorpusTest(unittest.TestCase):
+  def inputs(self):
+    failure = LinkFailure(1, 1, 2, 1, round=1)
+    traffic = TrafficInjection(round=2)
+    recovery = LinkRecovery(1, 1, 2, 1, round=3)
+    switch_failure = SwitchFailure(3, round=4)
+    return [failure, traffic, recovery, switch_failure]
+
+  def test_mutations_keep_failures_with_recoveries(self):
+    corpus = Corpus(random.Random(0))
+    inputs = self.inputs()
+    corpus.add(inputs, {}, 3, 0)
+    for i in range(50):
+      entry = corpus.choose()
+      mutant = corpus.mutate(entry)
+      self.assertTrue(len(mutant) >= 1)
+      types = [ type(e) for e in mutant ]
+      self.assertEqual(LinkFailure in types, LinkRecovery in types)
+      labels = [ e.label for e in mutant ]
+      self.assertEqual(labels, sorted(labels, key=lambda l: int(l[1:])))
+    # The stored inputs are left untouched
+    self.assertEqual(inputs[0].dependent_labels, [])
+    self.assertEqual(entry.picks, 50)
+
+  def test_choose(self):
+    corpus = Corpus(random.Random(0))
+    self.assertEqual(corpus.choose(), None)
+    productive = corpus.add(self.inputs(), {}, 100, 0)
+    corpus.add(self.inputs(), {}, 1, 1)
+    picks = [ corpus.choose() for i in range(20) ]
+    self.assertTrue(picks.count(productive) > 10)
+
+  def test_fresh_copy(self):
+    failure = SwitchFailure(1, round=3)
+    failure.dependent_labels.append("e0")
+    clone = fresh_copy(failure)
+    self.assertNotEqual(clone.label, failure.label)
+    self.assertEqual(clone.fingerprint, failure.fingerprint)
+    self.assertEqual(clone.dependent_labels, [])
+    self.assertEqual(failure.dependent_labels, ["e0"])
+
+if __name__ == '__main__':
+  unittest.main()
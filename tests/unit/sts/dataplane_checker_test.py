@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.control_flow.replayer import DataplaneChecker
+from sts.replay_event import DataplaneDrop, DataplanePermit
+from sts.event_dag import EventDag
+
+class MockPacket(object):
+  ''' Fingerprinted by its ethernet type only (see DPFingerprint.from_pkt) '''
+  def __init__(self, dl_type):
+    self.type = dl_type
+    self.next = "payload"
+
+class MockNode(object):
+  def __init__(self, dpid):
+    self.dpid = dpid
+
+class MockPort(object):
+  def __init__(self, port_no):
+    self.port_no = port_no
+
+class MockDpEvent(object):
+  def __init__(self, dl_type, dpid=1, port_no=2):
+    self.packet = MockPacket(dl_type)
+    self.node = MockNode(dpid)
+    self.port = MockPort(port_no)
+
+class MockPatchPanel(object):
+  def __init__(self, queued_dataplane_events):
+    self.queued_dataplane_events = queued_dataplane_events
+    self.decisions = []
+
+  def drop_dp_event(self, dp_event):
+    self.decisions.append((dp_event.packet.type, "drop"))
+
+  def permit_dp_event(self, dp_event):
+    self.decisions.append((dp_event.packet.type, "permit"))
+
+class MockSimulation(object):
+  def __init__(self, queued_dataplane_events):
+    self.patch_panel = MockPatchPanel(queued_dataplane_events)
+
+def fingerprint(dl_type):
+  return [{'dl_type' : dl_type}, 1, 2]
+
+class dataplane_checker_test(unittest.TestCase):
+  def traces(self):
+    ''' Return the same trace, with its run of three drops compacted and
+    uncompacted '''
+    uncompacted = [ DataplaneDrop(fingerprint(1), round=0) for _ in range(3) ]
+    compacted = [ DataplaneDrop(fingerprint(1), round=0, count=3) ]
+    tail = [ DataplanePermit(fingerprint(2), round=0),
+             DataplaneDrop(fingerprint(3), round=2) ]
+    return (uncompacted + tail, compacted + tail)
+
+  def replay(self, events, rounds_of_dp_events):
+    checker = DataplaneChecker(EventDag(events), slop_buffer=1)
+    decisions = []
+    for (current_round, dl_types) in rounds_of_dp_events:
+      simulation = MockSimulation([ MockDpEvent(t) for t in dl_types ])
+      checker.check_dataplane(current_round, simulation)
+      decisions.append(simulation.patch_panel.decisions)
+    return (decisions, checker.stats)
+
+  def assert_same_replay(self, rounds_of_dp_events):
+    (uncompacted, compacted) = self.traces()
+    (decisions, stats) = self.replay(uncompacted, rounds_of_dp_events)
+    (compacted_decisions, compacted_stats) = self.replay(compacted,
+                                                         rounds_of_dp_events)
+    self.assertEqual(decisions, compacted_decisions)
+    self.assertEqual(4, len(stats.expected_drops))
+    self.assertEqual(stats.expected_drops, compacted_stats.expected_drops)
+    self.assertEqual(stats.actual_drops, compacted_stats.actual_drops)
+    self.assertEqual(str(stats), str(compacted_stats))
+    return decisions
+
+  def test_whole_run_in_one_window(self):
+    decisions = self.assert_same_replay([(1, [1, 2, 1, 1, 1])])
+    self.assertEqual([[(1, "drop"), (2, "permit"), (1, "drop"), (1, "drop"),
+                       (1, "permit")]], decisions)
+
+  def test_run_partly_matched_before_next_window(self):
+    decisions = self.assert_same_replay([(1, [1]), (1, [2, 1, 1, 1]),
+                                         (2, [3])])
+    self.assertEqual([[(1, "drop")],
+                      [(2, "permit"), (1, "drop"), (1, "drop"), (1, "permit")],
+                      [(3, "drop")]], decisions)
+
+if __name__ == '__main__':
+  unittest.main()
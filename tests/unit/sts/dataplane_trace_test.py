@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os
+import tempfile
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.lib.packet.ethernet import ethernet
+from pox.lib.addresses import EthAddr, IPAddr
+from sts.entities import HostInterface
+from sts.dataplane_traces.trace import *
+from sts.dataplane_traces.trace_generator import write_trace_log
+
+class MockHost(object):
+  def __init__(self, interfaces):
+    self.interfaces = interfaces
+    self.sent = []
+
+  def send(self, interface, packet):
+    self.sent.append((interface, packet))
+
+class MockTopology(object):
+  def __init__(self, hosts):
+    self.hosts = hosts
+
+class DataplaneTraceTest(unittest.TestCase):
+  def setUp(self):
+    (fd, self.path) = tempfile.mkstemp()
+    os.close(fd)
+    self.interfaces = [ HostInterface(EthAddr("00:00:00:00:00:0%d" % i),
+                                      IPAddr("10.0.0.%d" % i), name="eth%d" % i)
+                        for i in (1, 2) ]
+    self.host = MockHost(self.interfaces)
+
+  def tearDown(self):
+    os.unlink(self.path)
+
+  def make_event(self, i, time=None):
+    src = self.interfaces[i % 2]
+    dst = self.interfaces[(i + 1) % 2]
+    packet = ethernet(src=src.hw_addr, dst=dst.hw_addr, type=ethernet.IP_TYPE)
+    packet.payload = "payload %d" % i
+    return DataplaneEvent(src, packet, time=time)
+
+  def test_raw_round_trip(self):
+    events = [ self.make_event(i) for i in range(10) ]
+    events.append(self.make_event(10, time=1234.5))
+    write_trace_log(events, self.path)
+    self.assertTrue(is_raw_trace(self.path))
+    trace = Trace(self.path, MockTopology([self.host]))
+    self.assertEqual(len(events), trace.remaining)
+    for event in events:
+      injected = trace.inject_trace_event()
+      self.assertEqual(event.interface, injected.interface)
+      self.assertEqual(event.packet.pack(), injected.packet.pack())
+      self.assertEqual(event.time, injected.time)
+    self.assertEqual(0, trace.remaining)
+    self.assertEqual(None, trace.inject_trace_event())
+    self.assertEqual(len(events), len(self.host.sent))
+
+  def test_copy(self):
+    events = [ self.make_event(i) for i in range(3) ]
+    (fd, copy_path) = tempfile.mkstemp()
+    os.close(fd)
+    try:
+      writer = RawTraceWriter(self.path)
+      writer.write(events[0])
+      writer.write(events[1])
+      copy = writer.copy(copy_path)
+      writer.write(events[2])
+      writer.close()
+      copy.write(events[0])
+      copy.close()
+      for (path, expected) in [(self.path, events),
+                               (copy_path, events[:2] + events[:1])]:
+        reader = RawTraceReader(path)
+        self.assertEqual(len(expected), reader.remaining)
+        for event in expected:
+          (interface, raw, _) = reader.next_frame()
+          self.assertEqual(event.interface, interface)
+          self.assertEqual(event.packet.pack(), raw)
+        reader.close()
+    finally:
+      os.unlink(copy_path)
+
+  def test_type_check(self):
+    write_trace_log([ self.make_event(0) ], self.path)
+    other_host = MockHost([ HostInterface(EthAddr("00:00:00:00:00:03"),
+                                          IPAddr("10.0.0.3"), name="eth3") ])
+    self.assertRaises(RuntimeError, Trace, self.path, MockTopology([other_host]))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -77,6 +77,19 @@ class event_dag_test(unittest.TestCase):
     event_dag.mark_invalid_input_sequences()
     self.assertEqual(2, len(event_dag))
 
+  def test_indices_built_on_first_use(self):
+    class IterationCountingList(list):
+      def __iter__(self):
+        self.iterations = getattr(self, 'iterations', 0) + 1
+        return list.__iter__(self)
+    events = IterationCountingList([MockInputEvent(), MockInputEvent()])
+    dag = EventDag(events)
+    self.assertEqual(2, len(dag))
+    self.assertTrue(dag.events is events)
+    self.assertFalse(hasattr(events, 'iterations'))
+    self.assertEqual(1, dag.get_original_index_for_event(events[1]))
+    self.assertTrue(hasattr(events, 'iterations'))
+
   def test_event_dag_subset(self):
     mockInputEvent = MockInputEvent()
     mockInputEvent2 = MockInputEvent()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os
+import itertools
+import json
+import shutil
+import tempfile
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.experiments.farm import *
+
+def write_superlog(path, violations_per_round):
+  ''' violations_per_round: list of (invariant name, violations) '''
+  with open(path, 'w') as superlog:
+    for (i, (invariant, violations)) in enumerate(violations_per_round):
+      superlog.write(json.dumps({ 'class' : "CheckInvariants",
+                                  'invariant_check_name' : invariant,
+                                  'label' : "e%d" % (2 * i + 1), 'round' : i }) + "\n")
+      if violations:
+        superlog.write(json.dumps({ 'class' : "InvariantViolation",
+                                    'violations' : violations,
+                                    'label' : "i%d" % (2 * i + 2),
+                                    'round' : i }) + "\n")
+
+def mock_run(config_name, results_dir, seed, port_base, verbose):
+  ''' Even seeds find a loop, seeds divisible by 3 a blackhole '''
+  rounds = [("check_for_loops", ["loop"] if seed % 2 == 0 else [])]
+  if seed % 3 == 0:
+    rounds.append(("check_for_blackholes", ["bh2", "bh1"]))
+  write_superlog(os.path.join(results_dir, "events.trace"), rounds)
+
+class FarmTest(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test_read_violations(self):
+    path = os.path.join(self.tmpdir, "events.trace")
+    write_superlog(path, [("check_for_loops", []),
+                          ("check_for_loops", ["a", "b"])])
+    with open(path, 'a') as superlog:
+      superlog.write('{"class": "Inv')
+    (violations, rounds) = read_violations(path)
+    self.assertEqual(rounds, 1)
+    self.assertEqual(violations, [("check_for_loops", ["a", "b"], "i4", 1)])
+    self.assertEqual(read_violations(path + ".missing"), ([], 0))
+
+  def test_violation_index(self):
+    index = ViolationIndex()
+    (violation, new) = index.add("check_for_loops", ["b", "a", "a"], "run_0")
+    self.assertTrue(new)
+    self.assertEqual(violation['signature'], ["a", "b"])
+    (same, new) = index.add("check_for_loops", ["a", "b"], "run_1")
+    self.assertFalse(new)
+    self.assertEqual(same['id'], violation['id'])
+    self.assertEqual(same['count'], 2)
+    (_, new) = index.add("check_for_blackholes", ["a", "b"], "run_1")
+    self.assertTrue(new)
+    self.assertEqual(len(index.violations), 2)
+
+  def test_branch_traces(self):
+    def branching_run(config_name, results_dir, seed, port_base, verbose):
+      write_superlog(os.path.join(results_dir, "events.trace"),
+                     [("check_for_loops", ["loop"])])
+      # Branch traces start with the main run's, up to the checkpoint
+      branch_dir = os.path.join(results_dir, "checkpoint_0", "branch_0")
+      os.makedirs(branch_dir)
+      write_superlog(os.path.join(branch_dir, "events.trace"),
+                     [("check_for_loops", ["loop"]),
+                      ("check_for_blackholes", ["bh"])])
+    farm = FuzzerFarm("config.none", os.path.join(self.tmpdir, "farm"),
+                      num_workers=1, num_runs=1, run_target=branching_run)
+    violation_index = farm.run(poll_interval=0.01)
+    counts = dict((v['invariant'], v['count'])
+                  for v in violation_index.violations)
+    self.assertEqual(counts, { "check_for_loops" : 1,
+                               "check_for_blackholes" : 1 })
+    self.assertEqual(farm.total_rounds, 1)
+
+  def test_farm(self):
+    results_dir = os.path.join(self.tmpdir, "farm")
+    farm = FuzzerFarm("config.none", results_dir, num_workers=2, num_runs=6,
+                      base_seed=0, base_port=7000, ports_per_worker=10,
+                      run_target=mock_run)
+    violation_index = farm.run(poll_interval=0.01)
+    self.assertEqual(farm.runs_completed, 6)
+    # Seeds 0, 2, 4 find the loop; 0 and 3 the blackhole
+    counts = dict((v['invariant'], v['count'])
+                  for v in violation_index.violations)
+    self.assertEqual(counts, { "check_for_loops" : 3,
+                               "check_for_blackholes" : 2 })
+    with open(os.path.join(results_dir, "violations.json")) as summary:
+      self.assertEqual(json.load(summary), violation_index.violations)
+    for violation in violation_index.violations:
+      self.assertTrue(os.path.exists(os.path.join(results_dir, "violations",
+                                                  violation['id'],
+                                                  "events.trace")))
+    with open(os.path.join(farm.run_dir(1), "farm_run.json")) as run_info:
+      run_info = json.load(run_info)
+    self.assertEqual(run_info['seed'], 1)
+    self.assertEqual(run_info['port_base'], 7010)
+    self.assertEqual(run_info['exit_code'], 0)
+
+  def test_isolate_controllers(self):
+    from config.experiment_config_lib import ControllerConfig
+    pipe = ControllerConfig("./pox.py openflow.of_01 --address=../sts_socket_pipe",
+                            address="sts_socket_pipe", cwd="pox",
+                            sync="tcp:localhost:18899")
+    tcp = ControllerConfig("./pox.py openflow.of_01 --address=__address__ --port=6633",
+                           address="127.0.0.1", port=6633, cwd="pox",
+                           sync="tcp:localhost:18899", try_new_ports=False)
+    ControllerConfig._port_gen = itertools.count(7000)
+    isolate_controllers([pipe, tcp], 7000)
+    self.assertEqual(pipe.address, "sts_socket_pipe_7000")
+    self.assertEqual(pipe.server_info, "sts_socket_pipe_7000")
+    self.assertEqual(pipe.expanded_cmdline,
+                     ["./pox.py", "openflow.of_01",
+                      "--address=../sts_socket_pipe_7000"])
+    self.assertEqual(pipe.sync, "tcp:localhost:7000")
+    self.assertEqual(tcp.port, 7001)
+    self.assertEqual(tcp.server_info, ("127.0.0.1", 7001))
+    self.assertEqual(tcp.expanded_cmdline,
+                     ["./pox.py", "openflow.of_01", "--address=127.0.0.1",
+                      "--port=7001"])
+    self.assertEqual(tcp.sync, "tcp:localhost:7002")
+
+    # The socket is named in a way that can't be rewritten
+    unknown = ControllerConfig("./ctrl --listen ../sts_socket_pipe",
+                               address="sts_socket_pipe", cwd="pox")
+    self.assertRaises(ValueError, isolate_controllers, [unknown], 7000)
+    self.assertEqual(unknown.address, "sts_socket_pipe")
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os
+import json
+import tempfile
+import shutil
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.input_traces.input_logger import InputLogger, EventWriter
+
+class MockEvent(object):
+  def __init__(self, label):
+    self.label = label
+    self.time = [0, 0]
+    self.timeout_disallowed = False
+
+  def disallow_timeouts(self):
+    self.timeout_disallowed = True
+
+  def to_json_hash(self):
+    return dict(self.__dict__)
+
+  def to_json(self):
+    return json.dumps(self.to_json_hash())
+
+class MockAddr(object):
+  def __init__(self, addr):
+    self.addr = addr
+
+  def toStr(self):
+    return self.addr
+
+class MockInterface(object):
+  hw_addr = MockAddr("00:00:00:00:00:01")
+  ips = []
+  name = "eth1"
+
+class MockPacket(object):
+  def __init__(self, raw):
+    self.raw = raw
+
+  def pack(self):
+    return self.raw
+
+class MockDpEvent(object):
+  interface = MockInterface()
+
+  def __init__(self, raw):
+    self.packet = MockPacket(raw)
+    self.time = None
+
+class InputLoggerTest(unittest.TestCase):
+  def setUp(self):
+    (fd, self.path) = tempfile.mkstemp()
+    os.close(fd)
+
+  def tearDown(self):
+    os.unlink(self.path)
+
+  def read_labels(self):
+    with open(self.path) as f:
+      return [ json.loads(line)['label'] for line in f ]
+
+  def test_events_written_in_order(self):
+    logger = InputLogger(output_path=self.path, max_queued_events=10)
+    logger.open()
+    logger.disallow_timeouts()
+    labels = [ "e%d" % i for i in range(100) ]
+    for label in labels:
+      logger.log_input_event(MockEvent(label))
+    logger._writer.close()
+    self.assertEqual(labels, self.read_labels())
+    with open(self.path) as f:
+      self.assertTrue(json.loads(f.readline())['timeout_disallowed'])
+
+  def test_dp_events_streamed(self):
+    logger = InputLogger(output_path=self.path)
+    logger.open()
+    logger.log_input_event(MockEvent("e1"))
+    self.assertEqual(None, logger._dp_writer)
+    logger.log_input_event(MockEvent("e2"), dp_events=[MockDpEvent("frame1"),
+                                                       MockDpEvent("frame2")])
+    logger.flush()
+    try:
+      with open(logger.dp_trace_path) as f:
+        dp_trace = f.read()
+      self.assertTrue("frame1" in dp_trace and "frame2" in dp_trace)
+      self.assertEqual(2, logger._dp_writer.num_events)
+    finally:
+      logger._writer.close()
+      logger._dp_writer.close()
+      os.unlink(logger.dp_trace_path)
+
+  def test_branch(self):
+    logger = InputLogger(output_path=self.path)
+    logger.open()
+    logger.log_input_event(MockEvent("e1"), dp_event=MockDpEvent("frame1"))
+    logger.flush()
+    orig_dp_trace_path = logger.dp_trace_path
+    orig_dp_writer = logger._dp_writer
+    branch_dir = tempfile.mkdtemp()
+    try:
+      logger.branch(branch_dir)
+      logger.log_input_event(MockEvent("e2"), dp_event=MockDpEvent("frame2"))
+      logger._writer.close()
+      logger._dp_writer.close()
+      with open(os.path.join(branch_dir, "events.trace")) as f:
+        self.assertEqual([ json.loads(line)['label'] for line in f ],
+                         ["e1", "e2"])
+      self.assertEqual(2, logger._dp_writer.num_events)
+      with open(os.path.join(branch_dir, "dataplane.trace")) as f:
+        dp_trace = f.read()
+      self.assertTrue("frame1" in dp_trace and "frame2" in dp_trace)
+      # The original dataplane trace is untouched
+      self.assertFalse(orig_dp_writer.output.closed)
+      self.assertEqual(1, orig_dp_writer.num_events)
+    finally:
+      shutil.rmtree(branch_dir)
+      orig_dp_writer.close()
+      os.unlink(orig_dp_trace_path)
+    self.assertEqual(self.read_labels(), ["e1"])
+
+  def test_snapshot(self):
+    class MockSimulationConfig(object):
+      _dataplane_trace_path = "orig.trace"
+      def __str__(self):
+        return "SimulationConfig(%r)" % self._dataplane_trace_path
+    control_flow = type("MockControlFlow", (object,),
+                        { 'sync_callback' : None,
+                          'invariant_check_name' : "check_for_loops" })
+    simulation_cfg = MockSimulationConfig()
+    logger = InputLogger(output_path=self.path)
+    logger.open()
+    logger.log_input_event(MockEvent("e1"))
+    snapshot_dir = tempfile.mkdtemp()
+    try:
+      logger.snapshot(snapshot_dir, control_flow, simulation_cfg)
+      logger.log_input_event(MockEvent("e2"))
+      logger._writer.close()
+      trace_path = os.path.join(snapshot_dir, "events.trace")
+      with open(trace_path) as f:
+        self.assertEqual([ json.loads(line)['label'] for line in f ], ["e1"])
+      for name in ["replay_config.py", "mcs_config.py", "prefix_config.py"]:
+        with open(os.path.join(snapshot_dir, name)) as f:
+          config = f.read()
+        self.assertTrue(trace_path in config)
+        self.assertTrue("orig.trace" in config)
+    finally:
+      shutil.rmtree(snapshot_dir)
+    self.assertEqual(simulation_cfg._dataplane_trace_path, "orig.trace")
+    self.assertEqual(self.read_labels(), ["e1", "e2"])
+
+  def test_events_snapshotted_when_logged(self):
+    logger = InputLogger(output_path=self.path)
+    logger.open()
+    event = MockEvent("e1")
+    event.dependent_labels = []
+    logger.log_input_event(event)
+    event.dependent_labels.append("e2")
+    logger._writer.close()
+    with open(self.path) as f:
+      self.assertEqual([], json.loads(f.readline())['dependent_labels'])
+
+  def test_write_errors_are_reported(self):
+    writer = EventWriter(open(self.path, 'w'))
+    writer.start()
+    writer.write('{"label": "e1"}')
+    writer.flush()
+    writer.output.close()
+    writer.write('{"label": "e2"}')
+    writer.close()
+    self.assertTrue(writer.error is not None)
+    self.assertRaises(IOError, writer.write, '{"label": "e3"}')
+    # Closing again is a no-op
+    writer.close()
+
+if __name__ == '__main__':
+  unittest.main()
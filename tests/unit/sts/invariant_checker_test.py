@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.invariant_checker import InvariantChecker, AsyncInvariantCheck
+
+class MockControllerManager(object):
+  def __init__(self):
+    self.live_controllers = []
+    self.liveness_checks = 0
+
+  def check_controller_processes_alive(self):
+    self.liveness_checks += 1
+    return []
+
+class MockSimulation(object):
+  def __init__(self):
+    self.controller_manager = MockControllerManager()
+    self.links = ["l1", "l2"]
+
+def check_links(simulation):
+  # Only the worker's copy of the simulation is modified
+  links = list(simulation.links)
+  simulation.links = []
+  simulation.controller_manager.check_controller_processes_alive()
+  return links
+
+def slow_check(simulation):
+  time.sleep(0.5)
+  return []
+
+def exiting_check(simulation):
+  sys.exit(3)
+
+def failing_check(simulation):
+  raise ValueError("boom")
+
+class AsyncInvariantCheckTest(unittest.TestCase):
+  def test_violations(self):
+    simulation = MockSimulation()
+    check = AsyncInvariantCheck(check_links, simulation, 7)
+    simulation.links.append("l3")
+    self.assertEqual(check.result(), ["l1", "l2"])
+    self.assertTrue(check.done())
+    self.assertEqual(check.round, 7)
+    self.assertEqual(simulation.links, ["l1", "l2", "l3"])
+    # Liveness is checked in the parent, before forking
+    self.assertEqual(simulation.controller_manager.liveness_checks, 1)
+
+  def test_does_not_block(self):
+    check = AsyncInvariantCheck(slow_check, MockSimulation(), 1)
+    self.assertFalse(check.done())
+    self.assertEqual(check.result(), [])
+    check = AsyncInvariantCheck(slow_check, MockSimulation(), 2)
+    check.kill()
+
+  def test_exit_and_errors(self):
+    check = AsyncInvariantCheck(exiting_check, MockSimulation(), 1)
+    self.assertRaises(SystemExit, check.result)
+    check = AsyncInvariantCheck(failing_check, MockSimulation(), 1)
+    self.assertRaises(RuntimeError, check.result)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -11,7 +11,7 @@ import signal
 import tempfile
 
 from config.experiment_config_lib import ControllerConfig
-from sts.control_flow import Replayer, MCSFinder, EfficientMCSFinder
+from sts.control_flow import Replayer, MCSFinder, EfficientMCSFinder, PrefixFinder
 from sts.topology import FatTree, MeshTopology
 from sts.simulation_state import Simulation, SimulationConfig
 from sts.replay_event import Event, InternalEvent, InputEvent
@@ -59,6 +59,11 @@ class MockEfficientMCSFinder(MockMCSFinderBase, EfficientMCSFinder):
     MockMCSFinderBase.__init__(self, event_dag, mcs)
     self._log = logging.getLogger("mock_efficient_mcs_finder")
 
+class MockPrefixFinder(MockMCSFinderBase, PrefixFinder):
+  def __init__(self, event_dag, mcs):
+    MockMCSFinderBase.__init__(self, event_dag, mcs)
+    self._log = logging.getLogger("mock_prefix_finder")
+
 class MockInputEvent(InputEvent):
   def __init__(self, fingerprint=None, **kws):
     super(MockInputEvent, self).__init__(**kws)
@@ -127,5 +132,24 @@ class MCSFinderTest(unittest.TestCase):
       shutil.rmtree(mcs_results_path)
     self.assertEqual(mcs, mcs_finder.dag.input_events)
 
+  def test_prefix(self):
+    trace = [ MockInputEvent(fingerprint=("class",f)) for f in range(1,7) ]
+    dag = EventDag(trace)
+    mcs = [trace[1],trace[3]]
+    mcs_finder = MockPrefixFinder(dag, mcs)
+    # Left over from earlier replays
+    Replayer.total_replays = 3
+    Replayer.total_inputs_replayed = 12
+    try:
+      os.makedirs(mcs_results_path)
+      mcs_finder.init_results(mcs_results_path)
+      mcs_finder.simulate()
+    finally:
+      shutil.rmtree(mcs_results_path)
+    self.assertEqual(trace[:4], mcs_finder.dag.input_events)
+    # Reset after the reproduction check (the mock replays aren't counted)
+    self.assertEqual(0, Replayer.total_replays)
+    self.assertEqual(0, Replayer.total_inputs_replayed)
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os
+import struct
+import tempfile
+from StringIO import StringIO
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.dataplane_traces.pcap_reader import *
+
+def mac(i):
+  return "\x00\x00\x00\x00\x00" + chr(i)
+
+def ip(i):
+  return "\x0a\x00\x00" + chr(i)
+
+def checksum(data):
+  if len(data) % 2:
+    data += "\x00"
+  total = sum(struct.unpack("!%dH" % (len(data) / 2), data))
+  while total >> 16:
+    total = (total & 0xffff) + (total >> 16)
+  return ~total & 0xffff
+
+def udp_frame(src, dst, payload="hello"):
+  udp_length = 8 + len(payload)
+  ip_header = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + udp_length, 1, 0, 64,
+                          17, 0, ip(src), ip(dst))
+  ip_header = ip_header[:10] + struct.pack("!H", checksum(ip_header)) + ip_header[12:]
+  pseudo = ip(src) + ip(dst) + struct.pack("!BBH", 0, 17, udp_length)
+  udp = struct.pack("!HHHH", 1000, 2000, udp_length, 0) + payload
+  udp = udp[:6] + struct.pack("!H", checksum(pseudo + udp)) + udp[8:]
+  return mac(dst) + mac(src) + "\x08\x00" + ip_header + udp
+
+def pcap(frames):
+  data = struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)
+  for (i, frame) in enumerate(frames):
+    data += struct.pack("<IIII", 100 + i, 500000, len(frame), len(frame)) + frame
+  return data
+
+def pcapng_block(block_type, body):
+  padded = body + "\x00" * (-len(body) % 4)
+  length = 12 + len(padded)
+  return struct.pack(">II", block_type, length) + padded + struct.pack(">I", length)
+
+def pcapng(frames):
+  data = pcapng_block(0x0a0d0d0a, struct.pack(">IHHq", 0x1a2b3c4d, 1, 0, -1))
+  # tsresol = 10^-3
+  options = struct.pack(">HHB3x", 9, 1, 3) + struct.pack(">HH", 0, 0)
+  data += pcapng_block(1, struct.pack(">HHI", 1, 0, 65535) + options)
+  for (i, frame) in enumerate(frames):
+    data += pcapng_block(6, struct.pack(">IIIII", 0, 0, 1000 * (100 + i),
+                                        len(frame), len(frame)) + frame)
+  return data
+
+class MockAddress(object):
+  def __init__(self, raw):
+    self.raw = raw
+
+  def toRaw(self):
+    return self.raw
+
+class MockInterface(object):
+  def __init__(self, i):
+    self.hw_addr = MockAddress(mac(100 + i))
+    self.ips = [MockAddress(ip(100 + i))]
+
+class MockHost(object):
+  def __init__(self, i):
+    self.interfaces = [MockInterface(i)]
+
+class MockWriter(object):
+  def __init__(self):
+    self.frames = []
+
+  def write_frame(self, interface, frame, time=None):
+    self.frames.append((interface, frame, time))
+
+class PcapReaderTest(unittest.TestCase):
+  frames = [ udp_frame(1, 2), udp_frame(2, 1, "world!"), udp_frame(3, 1) ]
+
+  def test_read_pcap(self):
+    records = list(read_capture(StringIO(pcap(self.frames))))
+    self.assertEqual([ (100 + i + 0.5, LINKTYPE_ETHERNET, frame)
+                       for (i, frame) in enumerate(self.frames) ], records)
+
+  def test_read_pcapng(self):
+    records = list(read_capture(StringIO(pcapng(self.frames))))
+    self.assertEqual(self.frames, [ frame for (_, _, frame) in records ])
+    self.assertEqual([100.0, 101.0, 102.0],
+                     [ round(timestamp, 6) for (timestamp, _, _) in records ])
+
+  def test_mapping_rewrites_addresses_and_checksums(self):
+    hosts = [ MockHost(i) for i in range(2) ]
+    mapper = HostMapper(hosts)
+    (interface, frame) = mapper.map_frame(self.frames[0])
+    self.assertTrue(interface is hosts[0].interfaces[0])
+    self.assertEqual(mac(101) + mac(100), frame[0:12])
+    self.assertEqual(ip(100) + ip(101), frame[26:34])
+    # The IP header checksums to zero, and so does the UDP pseudo header
+    self.assertEqual(0, checksum(frame[14:34]))
+    udp = frame[34:]
+    pseudo = frame[26:34] + struct.pack("!BBH", 0, 17, len(udp))
+    self.assertEqual(0, checksum(pseudo + udp))
+    (interface, frame) = mapper.map_frame(self.frames[1])
+    self.assertTrue(interface is hosts[1].interfaces[0])
+    # Capture host 3 maps onto the same interface as capture host 1
+    self.assertEqual(None, mapper.map_frame(self.frames[2]))
+
+  def test_import_capture(self):
+    (fd, path) = tempfile.mkstemp()
+    os.close(fd)
+    try:
+      with open(path, 'wb') as capture:
+        capture.write(pcap(self.frames))
+      writer = MockWriter()
+      stats = import_capture(path, [ MockHost(i) for i in range(2) ], writer)
+      self.assertEqual(3, stats.packets_read)
+      self.assertEqual(2, stats.packets_written)
+      self.assertEqual(1, stats.unmappable)
+      self.assertEqual([100.5, 101.5], [ time for (_, _, time) in writer.frames ])
+    finally:
+      os.unlink(path)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.snapshot import SyncProtoSnapshotService
+
+class MockSyncConnection(object):
+  def __init__(self, version):
+    self.version = version
+    self.known_versions = []
+
+  def request_nom_snapshot(self, known_version=None):
+    self.known_versions.append(known_version)
+    return ("NOMSnapshot", known_version)
+
+  def wait_for_nom_snapshot(self, request, timeout=10):
+    if self.version is not None and request[1] == self.version:
+      return {"version": self.version, "unchanged": True}
+    nom = {"switches": [], "hosts": [], "links": []}
+    if self.version is not None:
+      nom["version"] = self.version
+    return nom
+
+class MockController(object):
+  def __init__(self, label, version):
+    self.label = label
+    self.sync_connection = MockSyncConnection(version)
+
+class SyncProtoSnapshotServiceTest(unittest.TestCase):
+  def test_unchanged_snapshot_is_reused(self):
+    service = SyncProtoSnapshotService()
+    c1 = MockController("c1", "a:1")
+    first = service.fetchSnapshot(c1)
+    first.cache["omega"] = "cached"
+    second = service.fetchSnapshot(c1)
+    self.assertTrue(first is second)
+    self.assertEqual("cached", second.cache["omega"])
+    self.assertEqual([None, "a:1"], c1.sync_connection.known_versions)
+
+  def test_changed_snapshot_is_refetched(self):
+    service = SyncProtoSnapshotService()
+    c1 = MockController("c1", "a:1")
+    first = service.fetchSnapshot(c1)
+    c1.sync_connection.version = "a:2"
+    second = service.fetchSnapshot(c1)
+    self.assertFalse(first is second)
+    self.assertEqual("a:2", second.version)
+    self.assertEqual({}, second.cache)
+
+  def test_unversioned_snapshots_are_not_cached(self):
+    service = SyncProtoSnapshotService()
+    c1 = MockController("c1", None)
+    first = service.fetchSnapshot(c1)
+    second = service.fetchSnapshot(c1)
+    self.assertFalse(first is second)
+    self.assertEqual([None, None], c1.sync_connection.known_versions)
+
+  def test_multiple_controllers(self):
+    service = SyncProtoSnapshotService()
+    c1 = MockController("c1", "a:1")
+    c2 = MockController("c2", "b:1")
+    controller2snapshot = service.fetchSnapshots([c1, c2])
+    self.assertEqual("a:1", controller2snapshot[c1].version)
+    self.assertEqual("b:1", controller2snapshot[c2].version)
+
+if __name__ == '__main__':
+  unittest.main()
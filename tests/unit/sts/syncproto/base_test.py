@@ -48,5 +48,33 @@ class SyncMessageTest(unittest.TestCase):
         ):
       self.assertRaises(Exception, SyncMessage, **invalid_hash)
 
+class MockIODelegate(object):
+  def __init__(self):
+    self.sends = []
+    self.inbox = []
+    self.on_message_received = None
+  def send(self, msg):
+    self.sends.append(msg)
+  def wait_for_message(self, timeout=None):
+    self.on_message_received(self.inbox.pop(0))
+
+class SyncProtocolSpeakerTest(unittest.TestCase):
+  def response_hash(self, request, value):
+    return SyncMessage(type="RESPONSE", messageClass=request.messageClass,
+                       xid=request.xid, value=value)._asdict()
+
+  def test_pipelined_requests(self):
+    io = MockIODelegate()
+    speaker = SyncProtocolSpeaker({}, io)
+    first = speaker.async_request("NOMSnapshot", "")
+    second = speaker.async_request("NOMSnapshot", "")
+    self.assertEqual(2, len(io.sends))
+    # Replies arrive out of order
+    io.inbox.append(self.response_hash(second, "two"))
+    io.inbox.append(self.response_hash(first, "one"))
+    self.assertEqual("one", speaker.wait_for_response(first))
+    self.assertEqual("two", speaker.wait_for_response(second))
+    self.assertEqual([], io.inbox)
+
 if __name__ == '__main__':
   unittest.main()
@@ -94,6 +94,51 @@ class topology_test(unittest.TestCase):
       self.assertTrue((link.start_software_switch, link.start_port) in sw_port_pairs)
       self.assertTrue((link.end_software_switch, link.end_port) in sw_port_pairs)
 
+class SwitchConnectivityTest(unittest.TestCase):
+  def setUp(self):
+    self.mesh = MeshTopology(3)
+    self.s1, self.s2, self.s3 = self.mesh.switches
+
+  def _links_between(self, sw1, sw2):
+    return [ link for link in self.mesh.network_links
+             if set([link.start_software_switch, link.end_software_switch]) ==
+                set([sw1, sw2]) ]
+
+  def test_fully_connected(self):
+    for sw1 in self.mesh.switches:
+      for sw2 in self.mesh.switches:
+        self.assertTrue(self.mesh.connectivity.reachable(sw1, sw2))
+
+  def test_link_failure_and_recovery(self):
+    for sw in (self.s2, self.s3):
+      for link in self._links_between(self.s1, sw):
+        self.mesh.sever_link(link)
+    self.assertFalse(self.mesh.connectivity.reachable(self.s1, self.s2))
+    self.assertFalse(self.mesh.connectivity.reachable(self.s3, self.s1))
+    self.assertTrue(self.mesh.connectivity.reachable(self.s2, self.s3))
+    for link in self._links_between(self.s1, self.s2):
+      self.mesh.repair_link(link)
+    self.assertTrue(self.mesh.connectivity.reachable(self.s1, self.s3))
+
+  def test_unidirectional_failure(self):
+    (link_1_to_2,) = [ link for link in self._links_between(self.s1, self.s2)
+                       if link.start_software_switch == self.s1 ]
+    for link in self._links_between(self.s1, self.s3):
+      self.mesh.sever_link(link)
+    self.mesh.sever_link(link_1_to_2)
+    self.assertFalse(self.mesh.connectivity.reachable(self.s1, self.s2))
+    self.assertTrue(self.mesh.connectivity.reachable(self.s2, self.s1))
+
+  def test_switch_failure_and_recovery(self):
+    connectivity = SwitchConnectivity(self.mesh.switches, self.mesh.live_links)
+    for link in self._links_between(self.s1, self.s2):
+      connectivity.link_down(link)
+    self.assertTrue(connectivity.reachable(self.s1, self.s2))
+    connectivity.switch_down(self.s3)
+    self.assertFalse(connectivity.reachable(self.s1, self.s2))
+    connectivity.switch_up(self.s3)
+    self.assertTrue(connectivity.reachable(self.s1, self.s2))
+
 class FullyMeshedLinkTest(unittest.TestCase):
   _io_loop = RecocoIOLoop()
   _io_ctor = _io_loop.create_worker_for_socket
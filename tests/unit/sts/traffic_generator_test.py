@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os
+import random
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.lib.addresses import EthAddr, IPAddr
+from sts.entities import HostInterface
+from sts.traffic_generator import TrafficMatrix, MatrixTrafficGenerator
+
+class MockHost(object):
+  def __init__(self, name, hw_addr, ip):
+    self.name = name
+    self.interfaces = [HostInterface(EthAddr(hw_addr), [IPAddr(ip)],
+                                     name=name + "-eth0")]
+    self.batches = []
+
+  def send_batch(self, interface, packets):
+    self.batches.append((interface, packets))
+
+def mock_hosts(n):
+  return [ MockHost("h%d" % i, "00:00:00:00:00:%02x" % i, "10.0.0.%d" % i)
+           for i in range(1, n + 1) ]
+
+class TrafficMatrixTest(unittest.TestCase):
+  def test_all_to_all(self):
+    hosts = mock_hosts(3)
+    matrix = TrafficMatrix.all_to_all(hosts, 600)
+    self.assertEqual(len(matrix.pair2rate), 6)
+    for rate in matrix.pair2rate.values():
+      self.assertAlmostEqual(rate, 100)
+
+  def test_gravity(self):
+    (h1, h2, h3) = mock_hosts(3)
+    matrix = TrafficMatrix.gravity([h1, h2, h3], 1000,
+                                   weights={ h1 : 1, h2 : 2, h3 : 3 })
+    self.assertAlmostEqual(matrix.total_rate, 1000)
+    self.assertAlmostEqual(matrix.pair2rate[(h1, h3)] /
+                           matrix.pair2rate[(h1, h2)], 1.5)
+    self.assertAlmostEqual(matrix.pair2rate[(h2, h3)],
+                           matrix.pair2rate[(h3, h2)])
+
+  def test_hotspot(self):
+    hosts = mock_hosts(4)
+    matrix = TrafficMatrix.hotspot(hosts, 1000, hotspots=[hosts[0]],
+                                   hotspot_fraction=0.5)
+    to_hotspot = sum(rate for ((_, dst), rate) in matrix.pair2rate.iteritems()
+                     if dst == hosts[0])
+    # Half the traffic, plus its share of the rest (3 of 12 pairs)
+    self.assertAlmostEqual(to_hotspot, 500 + 500 * 3 / 12.0)
+    self.assertEqual(TrafficMatrix.hotspot([], 1000).pair2rate, {})
+    self.assertRaises(ValueError, TrafficMatrix.from_name, "unknown", hosts, 1)
+
+class MatrixTrafficGeneratorTest(unittest.TestCase):
+  def test_batches(self):
+    (h1, h2) = mock_hosts(2)
+    generator = MatrixTrafficGenerator(TrafficMatrix({ (h1, h2) : 100,
+                                                       (h2, h1) : 10 }),
+                                       random.Random(0))
+    self.assertEqual(generator.generate_batch(now=0), [])
+    batches = generator.generate_batch(now=1.0)
+    self.assertEqual(sorted(len(b) for b in batches), [10, 100])
+    self.assertEqual(len(h1.batches[0][1]), 100)
+    self.assertTrue(h1.batches[0][0] is h1.interfaces[0])
+    for dp_event in batches[0] + batches[1]:
+      self.assertTrue(dp_event.interface in h1.interfaces + h2.interfaces)
+    # Long pauses don't turn into huge bursts
+    generator.generate_batch(now=100.0)
+    self.assertEqual(generator.packets_sent, 220)
+    # Fractions of packets carry over
+    sent = generator.packets_sent
+    for i in range(10):
+      generator.generate_batch(now=100.0 + (i + 1) * 0.01)
+    self.assertTrue(10 <= generator.packets_sent - sent <= 12)
+
+  def test_default_random_not_shared(self):
+    (h1, h2) = mock_hosts(2)
+    matrix = TrafficMatrix({ (h1, h2) : 100 })
+    self.assertFalse(MatrixTrafficGenerator(matrix).random is
+                     MatrixTrafficGenerator(matrix).random)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os
+import json
+import random
+import shutil
+import tempfile
+import itertools
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.experiments.tuning import *
+
+def write_superlog(path, violations_per_round):
+  ''' violations_per_round: list of (invariant name, violations) '''
+  with open(path, 'w') as superlog:
+    for (i, (invariant, violations)) in enumerate(violations_per_round):
+      superlog.write(json.dumps({ 'class' : "CheckInvariants",
+                                  'invariant_check_name' : invariant,
+                                  'label' : "e%d" % (2 * i + 1), 'round' : i }) + "\n")
+      if violations:
+        superlog.write(json.dumps({ 'class' : "InvariantViolation",
+                                    'violations' : violations,
+                                    'label' : "i%d" % (2 * i + 2),
+                                    'round' : i }) + "\n")
+
+def mock_run(config_name, results_dir, seed, port_base, verbose,
+             fuzzer_params, steps):
+  ''' The more links fail, the more distinct loops are found '''
+  found = int(fuzzer_params['link_failure_rate'] * 10)
+  rounds = [ ("check_for_loops", ["loop%d" % i] if i < found else [])
+             for i in range(steps) ]
+  write_superlog(os.path.join(results_dir, "events.trace"), rounds)
+
+def mock_config_reader(config_name):
+  ''' A Fuzzer that replays a dataplane trace '''
+  return ({ 'link_failure_rate' : 0.05, 'switch_failure_rate' : 0.02,
+            'traffic_generation_rate' : 0.3 }, ['traffic_generation_rate'])
+
+class TuningTest(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test_sample_parameters(self):
+    r = random.Random(0)
+    for i in range(100):
+      params = sample_parameters(default_space, r)
+      self.assertEqual(set(params.keys()), set(default_space.keys()))
+      for (name, value) in params.iteritems():
+        (low, high) = default_space[name]
+        self.assertTrue(low * 0.99 <= value <= high * 1.01)
+
+  def test_write_fuzzer_params(self):
+    path = os.path.join(self.tmpdir, "params.py")
+    params = { 'link_failure_rate' : 0.25, 'switch_failure_rate' : 0.0 }
+    write_fuzzer_params(path, params, comment="tuned")
+    module = {}
+    execfile(path, module)
+    self.assertEqual(module['link_failure_rate'], 0.25)
+    self.assertEqual(module['switch_failure_rate'], 0.0)
+
+  def test_score_episode(self):
+    write_superlog(os.path.join(self.tmpdir, "events.trace"),
+                   [("check_for_loops", ["a"]),
+                    ("check_for_loops", ["a"]),
+                    ("check_for_blackholes", ["a"])])
+    with open(os.path.join(self.tmpdir, "coverage.json"), 'w') as output:
+      json.dump({ 'coverage' : 7 }, output)
+    result = score_episode(self.tmpdir, 2.0)
+    self.assertEqual(result['found'], 2)
+    self.assertEqual(result['rounds'], 2)
+    result = score_episode(self.tmpdir, 2.0, metric="coverage")
+    self.assertEqual(result['found'], 7)
+
+  def test_activity_breaks_ties(self):
+    with open(os.path.join(self.tmpdir, "events.trace"), 'w') as superlog:
+      for (i, event) in enumerate([{ 'class' : "LinkFailure" },
+                                   { 'class' : "TrafficInjection", 'count' : 3 },
+                                   { 'class' : "WaitTime" },
+                                   { 'class' : "CheckInvariants" }]):
+        event.update({ 'label' : "e%d" % i, 'round' : i })
+        superlog.write(json.dumps(event) + "\n")
+    result = score_episode(self.tmpdir, 2.0)
+    self.assertEqual(result['found'], 0)
+    self.assertEqual(result['inputs'], 4)
+    self.assertEqual(result['input_types'], ["LinkFailure", "TrafficInjection"])
+    # Neither finds anything, but only one of them injects anything
+    active = Candidate(0, {})
+    active.episodes.append(result)
+    idle = Candidate(1, {})
+    idle.episodes.append({ 'found' : 0, 'rounds' : 100, 'inputs' : 0,
+                           'input_types' : [], 'seconds' : 1.0 })
+    self.assertTrue(active.rank() > idle.rank())
+
+  def test_tuner(self):
+    results_dir = os.path.join(self.tmpdir, "tuning")
+    # Every episode takes one second
+    clock = itertools.count().next
+    tuner = ParameterTuner("config.none", results_dir,
+                           space={ 'link_failure_rate' : (0.01, 1.0) },
+                           num_candidates=8, eta=2, episode_rounds=10,
+                           num_workers=1, base_seed=0, run_target=mock_run,
+                           config_reader=mock_config_reader, clock=clock)
+    best = tuner.run(poll_interval=0.01)
+    # 8 + 4 + 2 episodes
+    self.assertEqual(tuner.episodes_run, 14)
+    self.assertEqual(len(best.episodes), 3)
+    rates = [ c.params['link_failure_rate'] for c in tuner.candidates ]
+    self.assertEqual(int(best.params['link_failure_rate'] * 10),
+                     int(max(rates) * 10))
+    module = {}
+    execfile(os.path.join(results_dir, "fuzzer_params.py"), module)
+    self.assertEqual(module['link_failure_rate'],
+                     best.params['link_failure_rate'])
+    # The base vector is what the config's Fuzzer runs with
+    self.assertEqual(tuner.candidates[0].params, { 'link_failure_rate' : 0.05 })
+    # Untuned parameters are copied from the base parameters
+    self.assertEqual(module['switch_failure_rate'], 0.02)
+    with open(os.path.join(results_dir, "tuning.json")) as summary:
+      summary = json.load(summary)
+    self.assertEqual(summary['best'], best.id)
+    self.assertEqual(len(summary['candidates']), 8)
+
+  def test_ignored_parameters_not_tuned(self):
+    tuner = ParameterTuner("config.none", os.path.join(self.tmpdir, "tuning"),
+                           space={ 'link_failure_rate' : (0.01, 1.0),
+                                   'traffic_generation_rate' : (0.01, 1.0) },
+                           num_candidates=4, episode_rounds=2, num_workers=1,
+                           base_seed=0, run_target=mock_run,
+                           config_reader=mock_config_reader,
+                           clock=itertools.count().next)
+    tuner.run(poll_interval=0.01)
+    for candidate in tuner.candidates:
+      self.assertEqual(candidate.params.keys(), ['link_failure_rate'])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os.path
+import random
+
+sys.path.append(os.path.dirname(__file__) + "/../../../..")
+
+from sts.util.convenience import sample_independently
+
+class CountingRandom(random.Random):
+  def __init__(self, seed):
+    random.Random.__init__(self, seed)
+    self.draws = 0
+
+  def random(self):
+    self.draws += 1
+    return random.Random.random(self)
+
+class sample_independently_test(unittest.TestCase):
+  def test_edge_probabilities(self):
+    r = random.Random(0)
+    items = range(10)
+    self.assertEqual(sample_independently(r, items, 0.0), [])
+    self.assertEqual(sample_independently(r, items, 1.0), items)
+    self.assertEqual(sample_independently(r, [], 0.5), [])
+    self.assertEqual(sample_independently(r, set([1]), 1.0), [1])
+
+  def test_probability_per_item(self):
+    r = random.Random(0)
+    items = range(10)
+    counts = [0] * len(items)
+    trials = 20000
+    for i in xrange(trials):
+      selected = sample_independently(r, items, 0.2)
+      self.assertEqual(selected, sorted(selected))
+      for item in selected:
+        counts[item] += 1
+    for count in counts:
+      self.assertAlmostEqual(count / float(trials), 0.2, delta=0.02)
+
+  def test_draws_proportional_to_selected(self):
+    r = CountingRandom(0)
+    selected = sample_independently(r, xrange(100000), 1e-3)
+    self.assertTrue(50 < len(selected) < 200)
+    self.assertEqual(r.draws, len(selected) + 1)
+
+if __name__ == '__main__':
+  unittest.main()
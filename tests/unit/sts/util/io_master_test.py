@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os.path
+import socket
+import threading
+import time
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.util.io_master import IOMaster
+
+class io_master_test(unittest.TestCase):
+  def setUp(self):
+    self.io_master = IOMaster()
+    (self.local, self.remote) = socket.socketpair()
+    self.worker = self.io_master.create_worker_for_socket(self.local)
+
+  def tearDown(self):
+    self.io_master.close_all()
+    self.remote.close()
+
+  def test_sleep_until_idle_returns_early(self):
+    self.remote.send("foo")
+    start = time.time()
+    self.assertTrue(self.io_master.sleep_until_idle(5, 0.1))
+    elapsed = time.time() - start
+    # At least one select to read "foo", then one idle interval
+    self.assertTrue(0.1 <= elapsed < 1, elapsed)
+
+  def test_sleep_until_idle_times_out_under_traffic(self):
+    done = threading.Event()
+    def send_traffic():
+      while not done.is_set():
+        self.remote.send("foo")
+        done.wait(0.02)
+    sender = threading.Thread(target=send_traffic)
+    sender.start()
+    try:
+      start = time.time()
+      self.assertFalse(self.io_master.sleep_until_idle(0.5, 0.2))
+      elapsed = time.time() - start
+      self.assertTrue(0.5 <= elapsed < 1.5, elapsed)
+    finally:
+      done.set()
+      sender.join()
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.util.union_find import *
+
+class union_find_test(unittest.TestCase):
+  def test_singletons(self):
+    u = UnionFind([1,2,3])
+    self.assertTrue(1 in u)
+    self.assertFalse(4 in u)
+    self.assertTrue(u.connected(1,1))
+    self.assertFalse(u.connected(1,2))
+
+  def test_union(self):
+    u = UnionFind()
+    self.assertTrue(u.union(1,2))
+    self.assertTrue(u.union(3,4))
+    self.assertFalse(u.union(2,1))
+    self.assertTrue(u.connected(1,2))
+    self.assertFalse(u.connected(1,3))
+    self.assertTrue(u.union(2,4))
+    self.assertTrue(u.connected(1,3))
+    self.assertEqual(u.find(1), u.find(4))
+
+if __name__ == '__main__':
+  unittest.main()
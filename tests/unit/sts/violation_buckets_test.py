@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+import unittest
+import sys
+import os
+import json
+import shutil
+import tempfile
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from sts.violation_buckets import ViolationBuckets, violation_shape
+from config.experiment_config_lib import ControllerConfig
+
+class LinkFailure(object):
+  pass
+
+class SwitchFailure(object):
+  pass
+
+class TrafficInjection(object):
+  pass
+
+class MockSimulationConfig(object):
+  def __init__(self, controller_configs):
+    self.controller_configs = controller_configs
+
+def pipe_controller_config():
+  return ControllerConfig("./pox.py openflow.of_01 --address=../sts_socket_pipe",
+                          address="sts_socket_pipe", cwd="pox",
+                          sync="tcp:localhost:18899")
+
+class MockInputLogger(object):
+  def snapshot(self, results_dir, control_flow, simulation_cfg):
+    for name in ["events.trace", "prefix_config.py"]:
+      open(os.path.join(results_dir, name), 'w').close()
+
+# Stands in for simulator.py: records its config and exits
+mock_simulator = '''
+import sys
+open(sys.argv[2] + ".ran", "w").close()
+sys.exit(0)
+'''
+
+class ViolationBucketsTest(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test_violation_shape(self):
+    (shape, magnitude) = violation_shape([(1001, 2003), (1002, 3001),
+                                          "c1 at 0x7f3e2a"])
+    self.assertEqual(shape, ["(N, N)", "cN at N"])
+    self.assertEqual(magnitude, 1)
+    self.assertEqual(violation_shape([])[1], 0)
+
+  def test_buckets(self):
+    buckets = ViolationBuckets(recent_rounds=5)
+    buckets.observe_input(LinkFailure(), 1)
+    buckets.observe_input(TrafficInjection(), 3)
+    (first, new) = buckets.add("check_for_loops", [(1, 2)], 4)
+    self.assertTrue(new)
+    self.assertEqual(first['recent_inputs'], ["LinkFailure"])
+    # Different pairs, same shape and recent inputs
+    (same, new) = buckets.add("check_for_loops", [(3, 4)], 5)
+    self.assertFalse(new)
+    self.assertEqual(same['count'], 2)
+    # The link failure is no longer recent
+    (_, new) = buckets.add("check_for_loops", [(3, 4)], 6)
+    self.assertTrue(new)
+    buckets.observe_input(SwitchFailure(), 7)
+    (_, new) = buckets.add("check_for_loops", [(3, 4)], 8)
+    self.assertTrue(new)
+    (_, new) = buckets.add("check_for_blackholes", [(3, 4)], 8)
+    self.assertTrue(new)
+    self.assertEqual(len(buckets.buckets), 4)
+
+  def test_snapshots_and_truncation(self):
+    simulator_path = os.path.join(self.tmpdir, "simulator.py")
+    with open(simulator_path, 'w') as simulator:
+      simulator.write(mock_simulator)
+    results_dir = os.path.join(self.tmpdir, "results")
+    os.makedirs(results_dir)
+    buckets = ViolationBuckets(truncate=True, simulator_path=simulator_path)
+    buckets.init_results(results_dir)
+    logger = MockInputLogger()
+    simulation_cfg = MockSimulationConfig([pipe_controller_config()])
+    for violations in [["v1"], ["v2"], [1, 2]]:
+      (bucket, new) = buckets.add("check_for_loops", violations, 1)
+      if new:
+        buckets.snapshot(bucket, None, logger, simulation_cfg)
+    buckets.close()
+    self.assertEqual(len(buckets.buckets), 2)
+    with open(os.path.join(results_dir, "buckets.json")) as summary:
+      summary = json.load(summary)
+    self.assertEqual([ b['count'] for b in summary ], [2, 1])
+    for bucket in summary:
+      self.assertEqual(bucket['truncation'], "done")
+      config_path = os.path.join(bucket['snapshot'], "prefix_config.py")
+      self.assertTrue(os.path.exists(config_path + ".ran"))
+      with open(config_path) as config:
+        config = config.read()
+      self.assertTrue("truncation" in config)
+      # The truncation pass runs its controllers on sockets of its own
+      namespace = { 'simulation_config' : simulation_cfg }
+      exec config in namespace
+      controller_config = simulation_cfg.controller_configs[0]
+      self.assertEqual(controller_config.address,
+                       "sts_socket_pipe_truncation_%s" % bucket['id'])
+      self.assertEqual(controller_config.expanded_cmdline[-1],
+                       "--address=../sts_socket_pipe_truncation_%s" %
+                       bucket['id'])
+      self.assertNotEqual(controller_config.sync, "tcp:localhost:18899")
+      simulation_cfg.controller_configs = [pipe_controller_config()]
+
+  def test_no_truncation_without_relocation(self):
+    results_dir = os.path.join(self.tmpdir, "results")
+    os.makedirs(results_dir)
+    buckets = ViolationBuckets(truncate=True,
+                               simulator_path="/nonexistent/simulator.py")
+    buckets.init_results(results_dir)
+    # The socket is named in a way that can't be rewritten
+    unknown = ControllerConfig("./ctrl --listen ../sts_socket_pipe",
+                               address="sts_socket_pipe", cwd="pox")
+    (bucket, _) = buckets.add("check_for_loops", ["v1"], 1)
+    buckets.snapshot(bucket, None, MockInputLogger(),
+                     MockSimulationConfig([unknown]))
+    buckets.close()
+    self.assertEqual(bucket['truncation'], None)
+    self.assertTrue(os.path.exists(os.path.join(bucket['snapshot'],
+                                                "prefix_config.py")))
+
+if __name__ == '__main__':
+  unittest.main()
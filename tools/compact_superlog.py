@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+
+# Merge runs of identical DataplanePermit/DataplaneDrop events in a JSON
+# superlog into single events with a count.
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sts.log_processing.superlog_compaction import compact_superlog
+
+parser = argparse.ArgumentParser()
+parser.add_argument('input', metavar="INPUT",
+                    help='The superlog to compact')
+parser.add_argument('output', metavar="OUTPUT",
+                    help='Where to write the compacted superlog')
+args = parser.parse_args()
+
+(read, written) = compact_superlog(args.input, args.output)
+print "Compacted %s -> %s: %d events -> %d events" % \
+      (args.input, args.output, read, written)
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+
+# Convert superlogs between the JSON format and the compact binary format.
+# The output format is the opposite of the input's, unless specified.
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sts.log_processing.binary_superlog import is_binary_superlog, json_to_binary, binary_to_json
+
+parser = argparse.ArgumentParser()
+parser.add_argument('input', metavar="INPUT",
+                    help='The superlog to convert')
+parser.add_argument('output', metavar="OUTPUT",
+                    help='Where to write the converted superlog')
+parser.add_argument('-t', '--to', choices=['binary', 'json'], default=None,
+                    help='Output format (default: the opposite of the input)')
+args = parser.parse_args()
+
+binary_input = is_binary_superlog(args.input)
+to = args.to
+if to is None:
+  to = "json" if binary_input else "binary"
+
+if binary_input:
+  if to == "binary":
+    parser.error("%s is already a binary superlog" % args.input)
+  count = binary_to_json(args.input, args.output)
+else:
+  if to == "json":
+    parser.error("%s is already a JSON superlog" % args.input)
+  count = json_to_binary(args.input, args.output)
+print "Converted %s (%s) -> %s (%s): %d events" % \
+      (args.input, "binary" if binary_input else "json", args.output, to,
+       count)
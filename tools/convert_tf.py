@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+
+# Convert hassel transfer function files between the text format and the
+# compact binary format. The output format is the opposite of the input's,
+# unless specified.
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sts.headerspace.headerspace.tf import TF, is_binary_tf_file
+
+parser = argparse.ArgumentParser()
+parser.add_argument('input', metavar="INPUT",
+                    help='The .tf file to convert')
+parser.add_argument('output', metavar="OUTPUT",
+                    help='Where to write the converted .tf file')
+parser.add_argument('-t', '--to', choices=['binary', 'text'], default=None,
+                    help='Output format (default: the opposite of the input)')
+args = parser.parse_args()
+
+binary_input = is_binary_tf_file(args.input)
+to = args.to
+if to is None:
+  to = "text" if binary_input else "binary"
+
+# The length is read from the file
+tf = TF(1)
+tf.load_object_from_file(args.input)
+if to == "binary":
+  tf.save_binary_object_to_file(args.output)
+else:
+  tf.save_object_to_file(args.output)
+print "Converted %s (%s) -> %s (%s): %d rules" % \
+      (args.input, "binary" if binary_input else "text", args.output, to,
+       len(tf.rules))
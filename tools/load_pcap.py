@@ -1,21 +1,42 @@
 #!/usr/bin/env python
 
-# Installed from: http://dirtbags.net/py-pcap.html
-import pcap
+# Convert a pcap or pcapng capture into a dataplane trace for a given
+# topology. MAC and IP addresses in the capture are mapped onto the
+# topology's hosts. The capture is streamed, so arbitrarily large captures
+# can be converted in constant memory.
+
 import argparse
 import sys
 import os
-sys.path.append(os.path.join(os.path.dirname(__file__), "..", "pox"))
-from pox.lib.packet.ethernet import *
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sts.topology import *
+from sts.dataplane_traces.trace import RawTraceWriter
+from sts.dataplane_traces.pcap_reader import import_capture
 
 parser = argparse.ArgumentParser()
-parser.add_argument('-i', '--input')
-parser.add_argument('-o', '--output', default="pcap.trace")
+parser.add_argument('-i', '--input', required=True,
+                    help='The pcap or pcapng capture to convert')
+parser.add_argument('-o', '--output', default="pcap.trace",
+                    help='Where to write the dataplane trace')
+parser.add_argument('-t', '--topology', default="MeshTopology",
+                    help='The sts.topology class whose hosts packets are mapped onto')
+parser.add_argument('-p', '--topology-params', default="",
+                    help='''Arguments to the topology's constructor, specified '''
+                         '''just as you would type them within the parens''')
+parser.add_argument('-n', '--max-packets', type=int, default=None,
+                    help='Stop after reading this many packets')
 
 args = parser.parse_args()
 
-p = pcap.open(args.input)
-for i in p:
-  e = ethernet(raw=i[1])
-  import pdb; pdb.set_trace()
-  print e
+topology = eval("%s(%s)" % (args.topology, args.topology_params))
+start = time.time()
+with RawTraceWriter(args.output) as writer:
+  stats = import_capture(args.input, topology.hosts, writer,
+                         max_packets=args.max_packets)
+elapsed = time.time() - start
+print "Converted %s -> %s: %s (%.1f packets/s)" % \
+      (args.input, args.output, stats,
+       stats.packets_read / elapsed if elapsed > 0 else 0.0)
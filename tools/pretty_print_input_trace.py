@@ -11,6 +11,7 @@ import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
 import sts.replay_event as replay_events
+import sts.log_processing.superlog_parser as superlog_parser
 
 parser = argparse.ArgumentParser()
 parser.add_argument('input', metavar="INPUT",
@@ -161,19 +162,28 @@ def main(args):
   # All events are printed with a fixed number of lines, and (optionally)
   # separated by delimiter lines of the form:
   # ----------------------------------
-  with open(args.input) as input_file:
-    for line in input_file:
-      try:
-        json_hash = json.loads(line.rstrip())
-        event = name_to_class[json_hash['class']].from_json(json_hash)
-        if type(event) not in filtered_classes:
-          for field in fields:
-            if field not in field_formatters:
-              raise ValueError("Unknown field %s" % field)
-            field_formatters[field](event)
-        stats.update(event)
-      except:
-        print >> sys.stderr, "Corrupt json hash found %s" % line
+  def print_event(event):
+    if type(event) not in filtered_classes:
+      for field in fields:
+        if field not in field_formatters:
+          raise ValueError("Unknown field %s" % field)
+        field_formatters[field](event)
+    stats.update(event)
+
+  # Use the parsed-trace cache if the trace has been loaded before
+  events = superlog_parser.load_cached_trace(args.input)
+  if events is not None:
+    for event in events:
+      print_event(event)
+  else:
+    with open(args.input) as input_file:
+      for line in input_file:
+        try:
+          json_hash = json.loads(line.rstrip())
+          event = name_to_class[json_hash['class']].from_json(json_hash)
+          print_event(event)
+        except:
+          print >> sys.stderr, "Corrupt json hash found %s" % line
 
   if args.stats:
     print "Stats: %s" % stats
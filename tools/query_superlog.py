@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+# Filter, count and histogram the events of a (JSON or binary) superlog.
+# The first query builds an index next to the superlog (INPUT.idx); later
+# queries only read the index and the events they print.
+#
+# Examples:
+#   query_superlog.py trace.json -c ControlMessageReceive -d 3 --count
+#   query_superlog.py trace.json -r 10-20 -H class
+#   query_superlog.py trace.json -t 1357000000-1357000060 -H time -b 10
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sts.log_processing.superlog_index import load_index, histogram_fields
+
+def int_or_str(value):
+  try:
+    return int(value)
+  except ValueError:
+    return value
+
+def range_of(convert):
+  ''' Parse "x" or "x-y" into an inclusive (x, y) range '''
+  def parse(value):
+    (start, sep, end) = value.partition("-")
+    try:
+      return (convert(start), convert(end if sep else start))
+    except ValueError:
+      raise argparse.ArgumentTypeError("Invalid range %s" % value)
+  return parse
+
+parser = argparse.ArgumentParser()
+parser.add_argument('input', metavar="INPUT",
+                    help='The superlog to query')
+parser.add_argument('-c', '--class', dest="classes", action="append",
+                    help='Only events of this class (may be repeated)')
+parser.add_argument('-d', '--dpid', dest="dpids", action="append",
+                    type=int_or_str,
+                    help='Only events that refer to this dpid (may be repeated)')
+parser.add_argument('-C', '--controller', dest="controller_ids",
+                    action="append",
+                    help='''Only events of this controller id, e.g. c1 or '''
+                         '''127.0.0.1:6633 (may be repeated)''')
+parser.add_argument('-r', '--rounds', type=range_of(int),
+                    help='Only events in this round, or range of rounds (e.g. 10-20)')
+parser.add_argument('-l', '--label', dest="labels", action="append",
+                    help='Only the event with this label (may be repeated)')
+parser.add_argument('-t', '--time-range', type=range_of(float),
+                    help='''Only events logged in this range of seconds since '''
+                         '''the epoch (e.g. 1357000000-1357000060)''')
+parser.add_argument('-n', '--count', action="store_true", default=False,
+                    help="Only print the number of matching events")
+parser.add_argument('-H', '--histogram', choices=histogram_fields,
+                    help="Print a histogram of the matching events by this field")
+parser.add_argument('-b', '--bucket', type=float, default=1.0,
+                    help="Bucket size in seconds for time histograms")
+parser.add_argument('-j', '--json', action="store_true", default=False,
+                    help="Print matching events as json, one per line")
+parser.add_argument('-m', '--max-events', type=int, default=None,
+                    help="Print at most this many events")
+parser.add_argument('--reindex', action="store_true", default=False,
+                    help="Rebuild the index even if it is up to date")
+args = parser.parse_args()
+
+start = time.time()
+index = load_index(args.input, rebuild=args.reindex)
+indices = index.select(classes=args.classes, dpids=args.dpids,
+                       controller_ids=args.controller_ids, rounds=args.rounds,
+                       labels=args.labels, time_range=args.time_range)
+matched = len(indices)
+
+if args.count:
+  print len(indices)
+elif args.histogram:
+  for (value, count) in index.histogram(indices, args.histogram,
+                                        bucket=args.bucket):
+    print "%-30s %d" % (value, count)
+else:
+  if args.max_events is not None:
+    indices = indices[:args.max_events]
+  for i in indices:
+    if args.json:
+      print json.dumps(index.json_hash(i))
+    else:
+      json_hash = index.json_hash(i)
+      fingerprint = json_hash.get('fingerprint', json_hash.get('_fingerprint'))
+      print "%s round %d %s %s" % (index.label(i), index.rounds[i],
+                                   index.class_name(i),
+                                   json.dumps(fingerprint) if fingerprint else "")
+index.close()
+print >> sys.stderr, "(%d of %d events, %.2fs)" % \
+      (matched, len(index), time.time() - start)
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+
+# Align two superlogs (e.g. an original run and its replay, or its .unacked
+# trace) and report missing, extra and reordered events.
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from sts.log_processing.superlog_diff import diff_superlogs
+
+parser = argparse.ArgumentParser()
+parser.add_argument('original', metavar="ORIGINAL",
+                    help='The original superlog')
+parser.add_argument('new', metavar="NEW",
+                    help='The superlog to compare against the original')
+parser.add_argument('-a', '--all', action="store_true", default=False,
+                    help='Report input events too, not just internal events')
+parser.add_argument('-e', '--max-edits', type=int, default=1000,
+                    help='''Give up aligning a stretch of events without '''
+                         '''unique anchors after this many edits''')
+args = parser.parse_args()
+
+diff = diff_superlogs(args.original, args.new, max_edits=args.max_edits)
+print diff.report(include_inputs=args.all)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python2.7
+
+from sts.experiments.tuning import ParameterTuner, metrics
+from sts.util.convenience import timestamp_string
+
+import signal
+import sys
+import argparse
+import logging
+import logging.config
+
+description = """
+Tune the fuzzer parameters of a config for the most distinct violations (or
+coverage) per second: run short fuzzing episodes with different parameter
+vectors, and write the best to <results dir>/fuzzer_params.py.
+Example usage:
+
+$ %s -c config.fuzz_pox_fattree -n 16 -r 200 -j 2
+""" % (sys.argv[0])
+
+parser = argparse.ArgumentParser(formatter_class=argparse.RawDescriptionHelpFormatter,
+                                 description=description)
+
+parser.add_argument('-c', '--config',
+                    default='config.fuzz_pox_fattree',
+                    help='''experiment config module in the config/ '''
+                         '''subdirectory, e.g. config.fat_tree''')
+
+parser.add_argument('-v', '--verbose', action="count", default=0,
+                    help='''increase verbosity''')
+
+parser.add_argument('-L', '--log-config',
+                    metavar="FILE", dest="log_config",
+                    help='''choose a python log configuration file''')
+
+parser.add_argument('-m', '--metric', choices=metrics, default="violations",
+                    help='''what episodes are scored by, per second''')
+
+parser.add_argument('-n', '--candidates', type=int, default=16,
+                    help='''number of parameter vectors to try''')
+
+parser.add_argument('-e', '--eta', type=int, default=2,
+                    help='''keep the best 1/eta candidates after each stage''')
+
+parser.add_argument('-r', '--rounds', type=int, default=100,
+                    help='''rounds per episode''')
+
+parser.add_argument('-t', '--timeout', type=float, default=None,
+                    help='''seconds after which an episode is stopped''')
+
+parser.add_argument('-j', '--workers', type=int, default=None,
+                    help='''number of episodes at a time (default: number '''
+                         '''of CPUs)''')
+
+parser.add_argument('-s', '--seed', type=int, default=None,
+                    help='''random seed of the first stage; stage n uses '''
+                         '''seed + n''')
+
+parser.add_argument('-P', '--base-port', dest="base_port", type=int,
+                    default=6633,
+                    help='''first controller port''')
+
+parser.add_argument('--ports-per-worker', dest="ports_per_worker", type=int,
+                    default=100,
+                    help='''controller ports reserved for each worker''')
+
+parser.add_argument('-o', '--results-dir', dest="results_dir", default=None,
+                    help='''tuning results directory (default: '''
+                         '''experiments/tuning_<timestamp>)''')
+
+args = parser.parse_args()
+
+if args.log_config:
+  logging.config.fileConfig(args.log_config)
+else:
+  logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+
+results_dir = args.results_dir
+if results_dir is None:
+  results_dir = "experiments/tuning_%s" % timestamp_string()
+
+tuner = ParameterTuner(args.config, results_dir,
+                       num_candidates=args.candidates, eta=args.eta,
+                       episode_rounds=args.rounds,
+                       episode_timeout=args.timeout, metric=args.metric,
+                       num_workers=args.workers, base_seed=args.seed,
+                       base_port=args.base_port,
+                       ports_per_worker=args.ports_per_worker,
+                       verbose=args.verbose)
+
+def handle_int(signal, frame):
+  print >> sys.stderr, "Caught signal %d, stopping the tuner" % signal
+  sys.exit(13)
+
+signal.signal(signal.SIGINT, handle_int)
+signal.signal(signal.SIGTERM, handle_int)
+
+best = tuner.run()
+print "%d episodes; best: %.4f %s per second (see %s/fuzzer_params.py)" % \
+      (tuner.episodes_run, best.score, args.metric, results_dir)